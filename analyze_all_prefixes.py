@@ -3,6 +3,11 @@ Comprehensive Subject Code Prefix Analyzer
 Analyzes the ZIP file to find ALL subject code prefixes for each branch
 """
 import re
+import sys
+
+sys.path.insert(0, 'backend')
+
+from subject_prefixes import get_prefix_registry
 
 # Simulate analyzing a sample of filenames from your screenshots
 # In reality, this would scan the actual ZIP file
@@ -89,7 +94,7 @@ print(f"ALL UNIQUE PREFIXES: {sorted(all_prefixes)}")
 print(f"Total: {len(all_prefixes)}")
 
 # Current valid prefixes in system
-current_valid = ['BSC', 'ESC', 'PCC', 'HSMC', 'MC', 'OEC', 'PEC', 'ST', 'SE', 'TEE', 'BE', 'UB', 'PS', 'US', 'MMCS', 'STUG', 'STPG', 'BP', 'MPG', 'MPH', 'MED', 'IN', 'ET', 'PSES', 'PEPS', 'PECS', 'PCSS']
+current_valid = get_prefix_registry()
 
 print(f"\n{'=' * 80}")
 print("COVERAGE CHECK")
@@ -99,13 +104,13 @@ missing = []
 for prefix in all_prefixes:
     if prefix not in current_valid:
         # Check if it starts with any valid prefix
-        covered = any(prefix.startswith(v) for v in current_valid)
+        covered = current_valid.matches(prefix)
         if not covered:
             missing.append(prefix)
 
 if missing:
     print(f"\n⚠️  MISSING PREFIXES: {sorted(missing)}")
-    print(f"   These should be added to valid_prefixes list!")
+    print(f"   These should be added to backend/subject_prefixes.json!")
 else:
     print(f"\n✅ All prefixes are covered by current valid_prefixes list!")
 
@@ -10,9 +10,9 @@ import threading
 import time
 from werkzeug.utils import secure_filename
 
-from config import UPLOAD_FOLDER, PDF_STORAGE_PATH, ALLOWED_EXTENSIONS, MAX_FILE_SIZE
+from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, UPLOAD_PAUSE_MAX_WAIT
 from database import (
-    init_database, insert_pyq_file, get_exam_sessions, 
+    init_database, insert_pyq_files_bulk, get_exam_sessions, 
     get_branches_by_session, get_subjects, get_paper_details, get_file_by_id
 )
 from zip_processor import ZIPProcessor
@@ -31,6 +31,10 @@ app.register_blueprint(auth_bp)
 # Global task storage
 upload_tasks = {}
 
+# Jobs with a background download thread (when the ingest worker is off)
+fetch_threads = set()
+fetch_threads_lock = threading.Lock()
+
 # Initialize database on startup
 try:
     init_database()
@@ -39,6 +43,12 @@ except Exception as e:
     print(f"⚠️ Database initialization error: {e}")
     print("Continuing without database initialization...")
 
+# Load known subject codes for the filename parser
+from config import SUBJECT_INDEX_ENABLED
+if SUBJECT_INDEX_ENABLED:
+    from subject_index import get_subject_index
+    get_subject_index()
+
 # Create directories after database init
 from config import ensure_directories
 ensure_directories()
@@ -49,6 +59,37 @@ try:
 except Exception as e:
     print(f"⚠️ Admin user initialization error: {e}")
 
+def start_background_workers():
+    """
+    Start the background workers the config enables: ingest (jobs resume
+    from the database), storage sync and storage scrub
+    Called by the server entry point (wsgi.py, or running app.py), so
+    scripts that import the app start no threads
+    """
+    from config import INGEST_WORKER_ENABLED, SYNC_ENABLED, SCRUB_ENABLED
+    if INGEST_WORKER_ENABLED:
+        try:
+            from ingest_worker import start_ingest_worker
+            start_ingest_worker()
+        except Exception as e:
+            print(f"⚠️ Ingest worker start error: {e}")
+    
+    # Copies papers into SYNC_TARGET
+    if SYNC_ENABLED:
+        try:
+            from storage_sync import start_sync_worker
+            start_sync_worker()
+        except Exception as e:
+            print(f"⚠️ Storage sync start error: {e}")
+    
+    # Checks stored papers, repairs broken blobs
+    if SCRUB_ENABLED:
+        try:
+            from storage_scrubber import start_scrub_worker
+            start_scrub_worker()
+        except Exception as e:
+            print(f"⚠️ Storage scrub start error: {e}")
+
 # Add security headers to all responses
 @app.after_request
 def apply_security_headers(response):
@@ -60,16 +101,24 @@ def allowed_file(filename):
 
 # ==================== ADMIN ENDPOINTS ====================
 
-def process_zip_background(task_id, zip_path, exam_type, exam_year):
-    """Background task to process ZIP file and upload to Cloudinary"""
+def process_zip_background(task_id, zip_path, exam_type, exam_year, members=None):
+    """
+    Background task to process ZIP file and upload to Cloudinary
+    While storage is paused the remaining PDFs are retried after its
+    retry_after, for up to UPLOAD_PAUSE_MAX_WAIT seconds in all; then the
+    task ends 'paused' with the ZIP kept and its 'resume' arguments (call
+    again with them to store the rest)
+    members: only these member names (resuming a paused task)
+    """
     try:
         upload_tasks[task_id]['status'] = 'processing'
+        for key in ('error', 'resume'):
+            upload_tasks[task_id].pop(key, None)
         
         # Initialize processor
         processor = ZIPProcessor(zip_path, exam_type, int(exam_year)) # Keep int(exam_year) as per original
         
-        # Process ZIP - this now uploads to Cloudinary incrementally
-        result = processor.process(progress_callback=lambda current, total: 
+        def report_progress(current, total):
             upload_tasks[task_id].update({
                 'progress': {
                     'current': current,
@@ -77,26 +126,56 @@ def process_zip_background(task_id, zip_path, exam_type, exam_year):
                     'percentage': int((current / total) * 100) if total > 0 else 0
                 }
             })
-        )
+        
+        # Process ZIP - this now uploads to Cloudinary incrementally
+        result = processor.process(progress_callback=report_progress, members=members)
         
         if result['success']:
-            # Insert valid papers into database
+            total_pdfs = result['total_pdfs']
+            valid_papers = 0
             inserted_count = 0
-            for paper in result['papers']:
+            conflicts = []
+            waited = 0
+            while True:
+                # Insert valid papers into database in one transaction
+                valid_papers += result['valid_papers']
                 try:
-                    insert_pyq_file(paper)
-                    inserted_count += 1
+                    bulk = insert_pyq_files_bulk(result['papers'])
+                    inserted_count += bulk['inserted']
+                    conflicts += bulk['conflicts']
                 except Exception as e:
-                    print(f"Error inserting paper: {e}")
-            
+                    print(f"Error inserting papers: {e}")
+                if not result.get('left'):
+                    break
+                if waited + result['retry_after'] > UPLOAD_PAUSE_MAX_WAIT:
+                    # Storage stays paused; the ZIP is kept so the rest can be resumed
+                    print(f"⚠️ Storage still paused after {waited:.0f}s; {len(result['left'])} PDFs left to resume")
+                    upload_tasks[task_id].update({
+                        'status': 'paused',
+                        'error': f"Storage paused; {len(result['left'])} PDFs not stored yet",
+                        'inserted': inserted_count,
+                        'resume': {'zip_path': zip_path, 'exam_type': exam_type, 'exam_year': exam_year,
+                                   'members': result['left']}
+                    })
+                    return
+                # Storage paused uploads; store the rest once it takes them again
+                print(f"↻ Retrying {len(result['left'])} PDFs in {result['retry_after']:.0f}s")
+                time.sleep(result['retry_after'])
+                waited += result['retry_after']
+                result = processor.process(progress_callback=report_progress, members=result['left'])
+                if not result['success']:
+                    break
+        
+        if result['success']:
             upload_tasks[task_id].update({
                 'status': 'completed',
                 'result': {
                     'success': True,
                     'message': f'Successfully processed {inserted_count} papers',
-                    'total_pdfs': result['total_pdfs'],
-                    'valid_papers': result['valid_papers'],
-                    'inserted': inserted_count
+                    'total_pdfs': total_pdfs,
+                    'valid_papers': valid_papers,
+                    'inserted': inserted_count,
+                    'conflicts': len(conflicts)
                 }
             })
         else:
@@ -120,6 +199,7 @@ def admin_upload():
     """
     try:
         from database import create_upload_job
+        from batch_processor import BatchProcessor
         
         # Validate request
         if 'file' not in request.files:
@@ -148,14 +228,18 @@ def admin_upload():
             os.remove(zip_path)
             return jsonify({'success': False, 'error': 'File too large (max 1GB)'}), 400
         
-        # Create job record (extraction will happen on first batch process)
+        # Create job record and pre-classify the archive's central directory
+        # so the work list only holds accepted engineering papers
         job_id = create_upload_job(filename, zip_path, exam_type, int(exam_year), 0)
+        processor = BatchProcessor(job_id)
+        total_pdfs = processor.prepare_work_list()
         
         return jsonify({
             'success': True,
             'job_id': job_id,
             'filename': filename,
-            'total_pdfs': 0,  # Will be counted on first batch
+            'total_pdfs': total_pdfs,
+            'changes': processor.change_summary,
             'status': 'UPLOADED',
             'message': f'Upload complete! Click "Process Next Batch" to start.'
         }), 200
@@ -163,24 +247,62 @@ def admin_upload():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def start_background_fetch(job_id):
+    """
+    Download a FETCHING job's ZIP in the background
+    A running ingest worker picks FETCHING jobs up itself; without one a
+    thread runs the (resumable) download
+    """
+    from ingest_worker import get_ingest_worker
+    if get_ingest_worker():
+        return
+    
+    from zip_fetcher import fetch_job_zip
+    
+    # One download per job at a time
+    with fetch_threads_lock:
+        if job_id in fetch_threads:
+            return
+        fetch_threads.add(job_id)
+    
+    def download_in_background():
+        try:
+            fetch_job_zip(job_id)
+        except Exception as e:
+            # The job stays FETCHING (unless the error is permanent); the
+            # next process-batch call resumes the download
+            print(f"Background download failed for job {job_id}: {e}")
+        finally:
+            with fetch_threads_lock:
+                fetch_threads.discard(job_id)
+    
+    thread = threading.Thread(target=download_in_background)
+    thread.daemon = True
+    thread.start()
+
 @app.route('/api/admin/fetch-zip', methods=['POST'])
 @require_auth
 def fetch_zip():
     """
     NEW: Fetch ZIP from URL (server-side download)
     Downloads asynchronously to avoid worker timeout
+    With "remote": true only the central directory and the accepted
+    members are read, with range requests; the archive is downloaded
+    whole if the server doesn't support them
+    A URL whose cached archive is unchanged and was already fetched for the
+    same exam session isn't queued again; the earlier job is returned
     Returns: job_id immediately
     """
     try:
         from database import create_upload_job
-        from zip_fetcher import fetch_zip_from_url, validate_zip_url
-        import threading
+        from zip_fetcher import validate_zip_url, find_unchanged_job
         
         # Get request data
         data = request.get_json()
         zip_url = data.get('url')
         exam_type = data.get('exam_type')
         exam_year = data.get('exam_year')
+        remote = bool(data.get('remote', False))
         
         # Validate inputs
         if not zip_url or not exam_type or not exam_year:
@@ -189,48 +311,27 @@ def fetch_zip():
         if not validate_zip_url(zip_url):
             return jsonify({'success': False, 'error': 'Invalid URL format'}), 400
         
+        existing = find_unchanged_job(zip_url, exam_type, int(exam_year))
+        if existing:
+            return jsonify({
+                'success': True,
+                'duplicate': True,
+                'job_id': existing['id'],
+                'filename': existing['filename'],
+                'status': existing['status'],
+                'remote': existing['remote'],
+                'message': f"This archive hasn't changed since job {existing['id']} fetched it. "
+                           f"Showing that job instead."
+            }), 200
+        
         # Generate filename
         filename = f"{exam_type}_{exam_year}.zip"
         
-        # Create job record immediately with status FETCHING
-        job_id = create_upload_job(filename, '', exam_type, int(exam_year), 0, zip_url=zip_url, status='FETCHING')
-        
-        # Download ZIP in background thread
-        def download_in_background():
-            try:
-                print(f"Background download starting for job {job_id}: {zip_url}")
-                zip_path, file_size = fetch_zip_from_url(zip_url, filename)
-                
-                # Check file size
-                if file_size > MAX_FILE_SIZE:
-                    os.remove(zip_path)
-                    # Update job status to FAILED
-                    update_job_progress(job_id, 0, 'FAILED')
-                    print(f"Job {job_id} failed: File too large")
-                    return
-                
-                # Update job with zip_path and status UPLOADED
-                from database import Session, UploadJob
-                session = Session()
-                try:
-                    job = session.query(UploadJob).filter(UploadJob.id == job_id).first()
-                    if job:
-                        job.zip_path = zip_path
-                        job.status = 'UPLOADED'
-                        session.commit()
-                finally:
-                    session.close()
-                print(f"Job {job_id} download complete: {file_size / (1024*1024):.2f} MB")
-                
-            except Exception as e:
-                print(f"Background download failed for job {job_id}: {e}")
-                # Update job status to FAILED
-                update_job_progress(job_id, 0, 'FAILED')
-        
-        # Start background thread
-        thread = threading.Thread(target=download_in_background)
-        thread.daemon = True
-        thread.start()
+        # Create job record immediately with status FETCHING; the download
+        # resumes from its partial file if the server restarts meanwhile
+        job_id = create_upload_job(filename, '', exam_type, int(exam_year), 0, zip_url=zip_url, status='FETCHING',
+                                   remote=remote)
+        start_background_fetch(job_id)
         
         # Return immediately
         return jsonify({
@@ -238,7 +339,10 @@ def fetch_zip():
             'job_id': job_id,
             'filename': filename,
             'status': 'FETCHING',
-            'message': f'Download started! The server is fetching the ZIP file. Check status in a few moments.'
+            'remote': remote,
+            'message': 'Reading the archive index! Only the needed PDFs will be fetched. Check status in a few moments.'
+                       if remote else
+                       'Download started! The server is fetching the ZIP file. Check status in a few moments.'
         }), 200
     
     except Exception as e:
@@ -250,15 +354,26 @@ def fetch_zip():
 def process_batch(job_id):
     """
     Process next batch of PDFs for a job
-    Query params: batch_size (default: 15)
+    Manual override - the background ingest worker normally does this
+    Query params: batch_size (default: 15, or BATCH_MAX_MEMBERS per round with budget_ms)
+                  budget_ms (wall-clock budget; the batch is sized to fit it)
+                  mode ('stream' or 'extract', default from INGEST_STREAMING)
     """
     try:
-        from batch_processor import BatchProcessor
+        from batch_processor import BatchProcessor, ArchiveNotReady
+        from config import BATCH_MAX_MEMBERS
         
-        batch_size = request.args.get('batch_size', 15, type=int)
+        budget_ms = request.args.get('budget_ms', type=int)
+        batch_size = request.args.get('batch_size', BATCH_MAX_MEMBERS if budget_ms else 15, type=int)
+        mode = request.args.get('mode')
+        streaming = None if mode is None else mode == 'stream'
         
-        processor = BatchProcessor(job_id)
-        result = processor.process_batch(batch_size)
+        try:
+            processor = BatchProcessor(job_id)
+        except ArchiveNotReady as e:
+            start_background_fetch(job_id)
+            return jsonify({'success': True, 'job_id': job_id, 'status': 'FETCHING', 'message': str(e)}), 202
+        result = processor.process_batch(batch_size, streaming=streaming, budget_ms=budget_ms)
         
         return jsonify(result), 200
     
@@ -268,6 +383,92 @@ def process_batch(job_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/admin/reclassify', methods=['POST'])
+@require_auth
+def reclassify_papers():
+    """
+    Re-run the current filename rules over stored papers in the background
+    (see reclassifier.py); poll /api/admin/reclassify-status for the result
+    Query params: apply ('true' to update rows, default: dry run)
+                  limit (changes listed in the result, default: 200)
+    """
+    from reclassifier import get_reclassify_worker, start_reclassify_worker
+    
+    dry_run = request.args.get('apply', 'false').lower() != 'true'
+    limit = request.args.get('limit', 200, type=int)
+    
+    worker = get_reclassify_worker() or start_reclassify_worker()
+    worker.request(dry_run=dry_run, limit=limit)
+    return jsonify({'success': True, 'reclassify': worker.status()}), 202
+
+@app.route('/api/admin/reclassify-status', methods=['GET'])
+@require_auth
+def get_reclassify_status():
+    """Get status and last result of the reclassification"""
+    from reclassifier import get_reclassify_worker
+    
+    worker = get_reclassify_worker()
+    if not worker:
+        return jsonify({'success': True, 'enabled': False}), 200
+    
+    return jsonify({'success': True, 'enabled': True, 'reclassify': worker.status()}), 200
+
+@app.route('/api/admin/worker-status', methods=['GET'])
+@require_auth
+def get_worker_status():
+    """Get status of the background ingest worker"""
+    from ingest_worker import get_ingest_worker
+    
+    worker = get_ingest_worker()
+    if not worker:
+        return jsonify({'success': True, 'enabled': False}), 200
+    
+    return jsonify({'success': True, 'enabled': True, 'worker': worker.status()}), 200
+
+@app.route('/api/admin/sync', methods=['POST'])
+@require_auth
+def start_storage_sync():
+    """Run a storage sync in the background now (see storage_sync.py)"""
+    from storage_sync import get_sync_worker, start_sync_worker
+    
+    worker = get_sync_worker() or start_sync_worker(interval_seconds=0)
+    worker.run_now()
+    return jsonify({'success': True, 'sync': worker.status()}), 202
+
+@app.route('/api/admin/sync-status', methods=['GET'])
+@require_auth
+def get_sync_status():
+    """Get status and last result of the storage sync"""
+    from storage_sync import get_sync_worker
+    
+    worker = get_sync_worker()
+    if not worker:
+        return jsonify({'success': True, 'enabled': False}), 200
+    
+    return jsonify({'success': True, 'enabled': True, 'sync': worker.status()}), 200
+
+@app.route('/api/admin/scrub', methods=['POST'])
+@require_auth
+def start_storage_scrub():
+    """Run a storage scrub in the background now (see storage_scrubber.py)"""
+    from storage_scrubber import get_scrub_worker, start_scrub_worker
+    
+    worker = get_scrub_worker() or start_scrub_worker(interval_seconds=0)
+    worker.run_now()
+    return jsonify({'success': True, 'scrub': worker.status()}), 202
+
+@app.route('/api/admin/scrub-status', methods=['GET'])
+@require_auth
+def get_scrub_status():
+    """Get status and last result of the storage scrub (missing, corrupt and orphaned blobs)"""
+    from storage_scrubber import get_scrub_worker
+    
+    worker = get_scrub_worker()
+    if not worker:
+        return jsonify({'success': True, 'enabled': False}), 200
+    
+    return jsonify({'success': True, 'enabled': True, 'scrub': worker.status()}), 200
+
 @app.route('/api/admin/recent-job', methods=['GET'])
 @require_auth
 def get_recent_job():
@@ -302,7 +503,7 @@ def get_recent_job():
 def get_job_status(job_id):
     """Get current status of an upload job"""
     try:
-        from database import get_upload_job
+        from database import get_upload_job, count_job_members, get_job_change_summary
         
         job = get_upload_job(job_id)
         
@@ -317,8 +518,12 @@ def get_job_status(job_id):
             'filename': job['filename'],
             'processed': job['processed_pdfs'],
             'total': job['total_pdfs'],
+            'failed': count_job_members(job_id, 'FAILED'),
+            'changes': get_job_change_summary(job_id),
             'percentage': percentage,
             'status': job['status'],
+            'remote': job['remote'],
+            'download': {'bytes': job['download_bytes'], 'total': job['download_total']},
             'created_at': job['created_at'],
             'updated_at': job['updated_at']
         }), 200
@@ -433,6 +638,34 @@ def get_paper():
 
 # ==================== PDF ENDPOINTS ====================
 
+def _send_pdf(file_data, **send_options):
+    """
+    Respond with a paper's PDF from wherever it is stored
+    Links (Cloudinary, Drive) and backends with URLs (S3) are redirected
+    to; local blobs are sent by the app
+    """
+    from storage import get_storage
+    
+    location = file_data['file_path']
+    if location.startswith('http'):
+        return redirect(location)
+    
+    storage = get_storage()
+    url = storage.url(location)
+    if url:
+        return redirect(url)
+    
+    pdf_path = storage.local_path(location)
+    if pdf_path:
+        if not os.path.exists(pdf_path):
+            return jsonify({'success': False, 'error': 'PDF file not found on server'}), 404
+        return send_file(pdf_path, mimetype='application/pdf', **send_options)
+    
+    try:
+        return send_file(storage.get(location), mimetype='application/pdf', **send_options)
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'PDF file not found on server'}), 404
+
 @app.route('/api/pdf/view/<int:file_id>', methods=['GET'])
 def view_pdf(file_id):
     """View PDF in browser"""
@@ -441,17 +674,7 @@ def view_pdf(file_id):
         if not file_data:
             return jsonify({'success': False, 'error': 'File not found'}), 404
         
-        # If it's a Cloudinary URL (starts with http), redirect to it
-        if file_data['file_path'].startswith('http'):
-            return redirect(file_data['file_path'])
-        
-        # Fallback for local files (legacy support)
-        pdf_path = os.path.join(PDF_STORAGE_PATH, file_data['file_path'])
-        
-        if not os.path.exists(pdf_path):
-            return jsonify({'success': False, 'error': 'PDF file not found on server'}), 404
-        
-        return send_file(pdf_path, mimetype='application/pdf')
+        return _send_pdf(file_data)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -463,20 +686,10 @@ def download_pdf(file_id):
         if not file_data:
             return jsonify({'success': False, 'error': 'File not found'}), 404
         
-        # If it's a Cloudinary URL (starts with http), redirect to it
-        if file_data['file_path'].startswith('http'):
-            return redirect(file_data['file_path'])
-        
-        # Fallback for local files (legacy support)
-        pdf_path = os.path.join(PDF_STORAGE_PATH, file_data['file_path'])
-        
-        if not os.path.exists(pdf_path):
-            return jsonify({'success': False, 'error': 'PDF file not found on server'}), 404
-        
         # Generate download filename
         download_name = f"{file_data['subject_code']}_{file_data['subject_name'].replace(' ', '_')}.pdf"
         
-        return send_file(pdf_path, as_attachment=True, download_name=download_name)
+        return _send_pdf(file_data, as_attachment=True, download_name=download_name)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -512,4 +725,6 @@ def health_check():
     return jsonify({'status': 'ok', 'message': 'PYQ Management System API is running'}), 200
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    start_background_workers()
+    # The reloader would run the workers in two processes
+    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
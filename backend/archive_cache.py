@@ -0,0 +1,144 @@
+"""
+Archive Cache - Keeps fetched ZIPs on the volume, by source URL
+Each URL's entry stores the ETag / Last-Modified it was downloaded with and
+the archive's SHA-256. Files are named by hash, so URLs serving the same
+archive share one file. A re-fetch revalidates with If-None-Match /
+If-Modified-Since; on 304 the cached file is used as is. The cache is
+bounded by ARCHIVE_CACHE_MAX_BYTES: least recently used files go first,
+but never one a job still needs
+"""
+import os
+import shutil
+import hashlib
+import requests
+from config import ARCHIVE_CACHE_PATH, ARCHIVE_CACHE_MAX_BYTES
+from database import (
+    get_cached_archive, save_cached_archive, touch_cached_archive, list_cached_archives,
+    delete_cached_archives, get_active_archive_paths
+)
+
+_HASH_CHUNK = 4 * 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 of a file, hex"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArchiveCache:
+    """Size-bounded LRU cache of downloaded archives"""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or ARCHIVE_CACHE_PATH
+        self.max_bytes = ARCHIVE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def lookup(self, url):
+        """
+        Get a URL's cache entry if its file is still there
+        Returns: dict with url, etag, last_modified, sha256, size, path; or None
+        """
+        entry = get_cached_archive(url)
+        if entry and not os.path.exists(entry['path']):
+            delete_cached_archives([entry['path']])
+            return None
+        return entry
+
+    def revalidate(self, url, timeout=15):
+        """
+        Ask the server whether a URL's cached archive is still current
+        (conditional GET with If-None-Match / If-Modified-Since)
+        Returns: the entry on 304 Not Modified, None if the archive changed,
+                 isn't cached, has no validators or the server can't be asked
+        """
+        entry = self.lookup(url)
+        if not entry or not (entry['etag'] or entry['last_modified']):
+            return None
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout, allow_redirects=True) as response:
+                if response.status_code != 304:
+                    return None
+        except requests.RequestException as e:
+            print(f"⚠️ Could not revalidate cached archive for {url}: {e}")
+            return None
+        touch_cached_archive(url)
+        return entry
+
+    def store(self, url, path, etag=None, last_modified=None):
+        """
+        Move a downloaded archive into the cache under url, then evict
+        least recently used archives beyond the size limit
+        Returns: the new entry (its path is where the archive now is)
+        """
+        sha256 = hash_file(path)
+        size = os.path.getsize(path)
+        cached_path = os.path.join(self.root, f"{sha256}.zip")
+        if os.path.exists(cached_path):
+            # Same archive as another URL (or an earlier version of this one)
+            os.remove(path)
+        else:
+            shutil.move(path, cached_path)
+        save_cached_archive(url, etag, last_modified, sha256, size, cached_path)
+        self.evict(keep={cached_path})
+        return self.lookup(url)
+
+    def usage(self):
+        """Bytes of archives in the cache"""
+        files = {entry['path']: entry['size'] for entry in list_cached_archives()}
+        return sum(files.values())
+
+    def evict(self, keep=()):
+        """
+        Delete least recently used archives until the cache fits in max_bytes
+        Archives in keep, and those of jobs not yet COMPLETED or FAILED, stay
+        Returns: bytes freed
+        """
+        entries = list_cached_archives()
+
+        # A file is as recent as the most recent URL that uses it
+        files = {}
+        for entry in entries:
+            files.setdefault(entry['path'], {'size': entry['size'], 'last_used_at': entry['last_used_at']})
+            files[entry['path']]['last_used_at'] = max(files[entry['path']]['last_used_at'], entry['last_used_at'])
+        used = sum(f['size'] for f in files.values())
+        if used <= self.max_bytes:
+            return 0
+
+        protected = set(keep) | get_active_archive_paths()
+        freed = 0
+        evicted = []
+        for path, info in sorted(files.items(), key=lambda item: item[1]['last_used_at']):
+            if used - freed <= self.max_bytes:
+                break
+            if path in protected:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            evicted.append(path)
+            freed += info['size']
+        delete_cached_archives(evicted)
+        if evicted:
+            print(f"↷ Evicted {len(evicted)} cached archives ({freed / (1024*1024):.0f} MB)")
+        return freed
+
+
+# Process-wide cache
+_cache = None
+
+def get_archive_cache():
+    """Get the process-wide ArchiveCache"""
+    global _cache
+    if _cache is None:
+        _cache = ArchiveCache()
+    return _cache
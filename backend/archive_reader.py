@@ -0,0 +1,182 @@
+"""
+Memory-mapped ZIP reader for parallel member decompression
+zipfile.ZipFile funnels every member read through one shared file handle
+(guarded by a lock), so threads inflating different members take turns.
+MappedArchive maps the archive once and gives every open member its own
+view into the mapping; zlib and crc32 release the GIL on large buffers, so
+members inflate on several cores at once
+"""
+import mmap
+import struct
+import zlib
+import zipfile
+
+# Local file header: signature, version, flags, method, time, date, crc,
+# compressed size, size, name length, extra length
+_LOCAL_HEADER = struct.Struct('<4s5HL2L2H')
+_LOCAL_HEADER_SIGNATURE = b'PK\003\004'
+
+_INPUT_CHUNK = 256 * 1024  # compressed bytes fed to zlib per step
+
+
+class MappedArchive:
+    """
+    Read-only ZIP archive backed by mmap
+    Mirrors the parts of the ZipFile API the ingest code uses
+    (infolist, getinfo, namelist, open), so it can be passed wherever a
+    ZipFile was. Stored and deflated members are read from the mapping;
+    other methods and encrypted members go through zipfile
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            # The central directory is parsed by zipfile; only member data
+            # is read from the mapping
+            self._zip = zipfile.ZipFile(self._file, 'r')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Unmap and close the archive"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._zip.close()
+        self._file.close()
+
+    def infolist(self):
+        return self._zip.infolist()
+
+    def namelist(self):
+        return self._zip.namelist()
+
+    def getinfo(self, name):
+        return self._zip.getinfo(name)
+
+    def open(self, member, mode='r'):
+        """
+        Open a member for reading (safe to call from several threads)
+        Returns: file-like object; the CRC-32 is checked when it is read to the end
+        """
+        if mode != 'r':
+            raise ValueError('MappedArchive is read-only')
+        info = member if isinstance(member, zipfile.ZipInfo) else self.getinfo(member)
+
+        supported = info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+        if not supported or info.flag_bits & 0x1:
+            return self._zip.open(info, 'r')
+        return MappedMember(self._map, info, self._data_offset(info))
+
+    def _data_offset(self, info):
+        """Offset of a member's compressed data (after its local header)"""
+        return local_data_offset(self._map, info, info.header_offset)
+
+
+def local_data_offset(buffer, info, header_offset):
+    """
+    Offset in buffer of a member's compressed data, given where its local
+    header starts in buffer (the archive mapping, or bytes fetched from it)
+    """
+    header = buffer[header_offset:header_offset + _LOCAL_HEADER.size]
+    if len(header) != _LOCAL_HEADER.size:
+        raise zipfile.BadZipFile(f"Truncated file header for {info.filename}")
+    fields = _LOCAL_HEADER.unpack(header)
+    if fields[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad magic number for file header of {info.filename}")
+    name_length, extra_length = fields[9], fields[10]
+    return header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+
+class MappedMember:
+    """
+    Streaming reader over one member's bytes in the mapping
+    Each instance keeps its own position and inflater, so any number can be
+    read concurrently
+    """
+
+    def __init__(self, mapping, info, offset):
+        self.name = info.filename
+        self._map = mapping
+        self._position = offset
+        self._end = offset + info.compress_size
+        if self._end > len(mapping):
+            raise zipfile.BadZipFile(f"Truncated data for {info.filename}")
+        self._expected_crc = info.CRC
+        self._expected_size = info.file_size
+        self._crc = 0
+        self._size = 0
+        self._inflater = zlib.decompressobj(-15) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        self._pending = b''
+        self._eof = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._map = None
+        self._inflater = None
+        self._pending = b''
+
+    def read(self, size=-1):
+        """Read up to size decompressed bytes (everything left if size < 0)"""
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(1024 * 1024)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+
+        while not self._eof and len(self._pending) < size:
+            self._fill(size - len(self._pending))
+
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _fill(self, wanted):
+        """Produce at most `wanted` more bytes into the pending buffer"""
+        if self._inflater is None:
+            # Stored member: the mapping slice is the data
+            data = self._map[self._position:min(self._position + wanted, self._end)]
+            self._position += len(data)
+        else:
+            # Leftover input from the last step goes first; it is already bounded
+            source = self._inflater.unconsumed_tail
+            if not source and self._position < self._end:
+                source = self._map[self._position:min(self._position + _INPUT_CHUNK, self._end)]
+                self._position += len(source)
+            data = self._inflater.decompress(source, wanted)
+            if not source and not data:
+                data = self._inflater.flush()
+
+        if data:
+            self._crc = zlib.crc32(data, self._crc)
+            self._size += len(data)
+            self._pending += data
+
+        finished = self._position >= self._end and (
+            self._inflater is None or (not self._inflater.unconsumed_tail and not data)
+        )
+        if finished:
+            self._eof = True
+            self._verify()
+
+    def _verify(self):
+        """Check size and CRC-32 once the member has been fully read"""
+        if self._size != self._expected_size:
+            raise zipfile.BadZipFile(f"Bad size for file {self.name!r}")
+        if self._crc != self._expected_crc:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {self.name!r}")
@@ -0,0 +1,137 @@
+"""
+Background Task - Runs a maintenance job on a daemon thread
+The job runs every interval_seconds (0: only when asked with run_now()),
+reports progress through a callback and can ask to run again sooner (a
+storage target that paused uploads). Used by storage sync and the
+storage scrubber. Heartbeat keeps leases alive while long work runs
+"""
+import time
+import threading
+
+
+class BackgroundTask:
+    """Thread that runs run_once() on a schedule or on request"""
+    name = 'task'
+
+    def __init__(self, interval_seconds=0):
+        self.interval_seconds = interval_seconds
+        self.progress = None
+        self.last_summary = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def run_once(self, progress_callback, stop_event):
+        """
+        Do the job once
+        progress_callback(done, total, bytes) reports progress; stop early
+        when stop_event is set
+        Returns: summary dict ('retry_after': run again after that many seconds)
+        """
+        raise NotImplementedError
+
+    def start(self):
+        """Start the thread (idempotent)"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        print(f"✓ {self.name} started (every {self.interval_seconds}s)" if self.interval_seconds
+              else f"✓ {self.name} started")
+
+    def stop(self, timeout=None):
+        """Stop the thread; a running job stops at its next check of the stop event"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def run_now(self):
+        """Run the job as soon as the current run (if any) finishes"""
+        self._wake.set()
+
+    def status(self):
+        """Snapshot of what the task is doing"""
+        with self._lock:
+            return {
+                'running': bool(self._thread) and not self._stop.is_set(),
+                'busy': self.progress is not None,
+                'progress': dict(self.progress) if self.progress else None,
+                'interval_seconds': self.interval_seconds,
+                'last_summary': self.last_summary,
+                'last_error': self.last_error,
+            }
+
+    def _on_progress(self, done, total, size):
+        with self._lock:
+            elapsed = time.time() - self.progress['started']
+            self.progress.update(done=done, total=total, bytes=size,
+                                 bytes_per_second=round(size / max(elapsed, 1e-6)))
+
+    def _run(self):
+        """Thread loop: run, then wait for the interval, a request or a retry"""
+        wait = None if not self.interval_seconds else 0
+        while not self._stop.is_set():
+            self._wake.wait(wait)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            with self._lock:
+                self.progress = {'started': time.time(), 'done': 0, 'total': None, 'bytes': 0}
+            summary = None
+            try:
+                summary = self.run_once(self._on_progress, self._stop)
+                error = None
+            except Exception as e:
+                print(f"❌ {self.name} failed: {e}")
+                error = str(e)
+            with self._lock:
+                self.progress = None
+                self.last_summary = summary or self.last_summary
+                self.last_error = error
+            wait = (summary or {}).get('retry_after') or self.interval_seconds or None
+
+
+class Heartbeat:
+    """
+    Calls renew() every interval_seconds on a daemon thread while a block runs
+    (keeps database leases alive through work that can outlast them);
+    lost is set once renew() returns False
+    Usage: with Heartbeat(renew, 100) as heartbeat: ... heartbeat.lost.is_set()
+    """
+
+    def __init__(self, renew, interval_seconds):
+        self.renew = renew
+        self.interval_seconds = interval_seconds
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='heartbeat', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                if not self.renew():
+                    self.lost.set()
+                    return
+            except Exception as e:
+                # A failed renewal is retried on the next beat; the lease outlasts a few
+                print(f"⚠️ Lease renewal failed: {e}")
@@ -2,10 +2,23 @@
 Batch Processor - Handles chunked processing of PDFs from uploaded ZIPs
 """
 import os
+import time
+import uuid
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from zip_processor import ZIPProcessor
-from database import update_job_progress, update_job_extract_path, get_upload_job, insert_pyq_file
-from config import UPLOAD_FOLDER
+from storage import StoragePaused
+from background_task import Heartbeat
+from database import (
+    update_job_progress, update_job_status, update_job_extract_path, get_upload_job, insert_pyq_files_bulk,
+    create_job_manifest, claim_pending_members, renew_member_leases, release_job_members, finish_job_members,
+    count_job_members, diff_against_history
+)
+from config import UPLOAD_FOLDER, INGEST_STREAMING, BATCH_IO_WORKERS, BATCH_BUDGET_SAFETY, MEMBER_LEASE_SECONDS
+
+class ArchiveNotReady(Exception):
+    """The job's ZIP is (being) downloaded - the job is FETCHING, retry once it is UPLOADED"""
+
 
 class BatchProcessor:
     """Processes PDFs in batches to avoid timeouts"""
@@ -19,39 +32,31 @@ class BatchProcessor:
         
         self.processor = None
         
+        # Remote archives are read from zip_url with range requests;
+        # fetch_job_zip checks the server supports them first
+        if self.job.get('remote'):
+            if self.job['status'] == 'FETCHING':
+                raise ArchiveNotReady(f"Remote archive for job {job_id} has not been checked yet")
+            self.processor = ZIPProcessor(
+                self.job['zip_path'],
+                self.job['exam_type'],
+                self.job['exam_year'],
+                archive_url=self.job['zip_url']
+            )
+            return
+        
         # Check if ZIP exists
         zip_path = self.job['zip_path']
         if not zip_path or not os.path.exists(zip_path):
-            print(f"⚠️ ZIP not found at '{zip_path}'. Attempting to re-download...")
-            
-            if self.job.get('zip_url'):
-                try:
-                    from zip_fetcher import fetch_zip_from_url
-                    from database import Session, UploadJob
-                    
-                    filename = self.job['filename']
-                    print(f"⬇️ Re-downloading {filename} from {self.job['zip_url']}...")
-                    zip_path, _ = fetch_zip_from_url(self.job['zip_url'], filename)
-                    
-                    # Update job in DB with new path
-                    session = Session()
-                    try:
-                        job = session.query(UploadJob).filter(UploadJob.id == self.job_id).first()
-                        if job:
-                            job.zip_path = zip_path
-                            session.commit()
-                    finally:
-                        session.close()
-                    
-                    # Update local job reference
-                    self.job['zip_path'] = zip_path
-                    print(f"✓ Re-download successful: {zip_path}")
-                    
-                except Exception as e:
-                    print(f"❌ Re-download failed: {e}")
-                    raise ValueError(f"ZIP file missing and re-download failed: {e}")
-            else:
+            if not self.job.get('zip_url'):
                 raise ValueError("ZIP file missing and no URL provided for re-download")
+            
+            # Hand the (re-)download to whoever fetches FETCHING jobs (the
+            # ingest worker or fetch_job_zip); it resumes any partial file
+            if self.job['status'] != 'FETCHING':
+                print(f"⚠️ ZIP not found at '{zip_path}'. Job {job_id} goes back to FETCHING")
+                update_job_status(job_id, 'FETCHING')
+            raise ArchiveNotReady(f"ZIP for job {job_id} is being downloaded")
                 
         self.processor = ZIPProcessor(
             self.job['zip_path'],
@@ -59,6 +64,56 @@ class BatchProcessor:
             self.job['exam_year']
         )
     
+    def prepare_work_list(self, ingested=None):
+        """
+        Write the job's member manifest from the archive's central directory
+        (runs once, when the job is created). Only accepted members are
+        PENDING work; rejected ones are recorded but never decompressed.
+        Members already ingested for this session with the same size and
+        CRC32 are marked UNCHANGED and skipped as well
+        ingested: {member_name: {'file_size', 'crc', 'status', 'error'}} of
+                  members the download pipeline already stored; those that
+                  match the central directory keep their result instead of
+                  being scheduled (see _merge_ingested)
+        Returns: number of members to process
+        """
+        entries = self.processor.build_manifest()
+        self.change_summary = diff_against_history(self.job['exam_type'], self.job['exam_year'], entries)
+        print(f"✓ {self.change_summary['new']} new / {self.change_summary['unchanged']} unchanged / "
+              f"{self.change_summary['changed']} changed")
+        if ingested:
+            self._merge_ingested(entries, ingested)
+        total = create_job_manifest(self.job_id, entries)
+        ingested_count = sum(1 for entry in entries if entry['status'] in ('DONE', 'SKIPPED'))
+        self.job['total_pdfs'] = total + ingested_count
+        self.job['processed_pdfs'] = ingested_count
+        
+        if total == 0:
+            update_job_progress(self.job_id, ingested_count, 'COMPLETED')
+            self.job['status'] = 'COMPLETED'
+        
+        return total
+    
+    def _merge_ingested(self, entries, ingested):
+        """
+        Record members the download pipeline stored as processed, when the
+        central directory agrees on their size and CRC32. Failed members stay
+        PENDING (a batch retries them), and so do changed members the
+        pipeline skipped as duplicates - a batch replaces the old paper
+        """
+        merged = 0
+        for entry in entries:
+            result = ingested.get(entry['member_name'])
+            if entry['status'] != 'PENDING' or not result:
+                continue
+            if (result['file_size'], result['crc']) != (entry['file_size'], entry['crc']):
+                continue
+            if result['status'] == 'DONE' or (result['status'] == 'SKIPPED' and entry['change_type'] == 'NEW'):
+                entry['status'] = result['status']
+                entry['error'] = result['error']
+                merged += 1
+        print(f"✓ {merged} members already ingested while downloading")
+    
     def extract_zip_if_needed(self):
         """Extract ZIP if not already extracted"""
         if self.job['extract_path'] and os.path.exists(self.job['extract_path']):
@@ -67,115 +122,171 @@ class BatchProcessor:
         # Extract ZIP
         extract_path = self.processor._extract_zip()
         
-        # Count total PDFs
-        pdf_files = self.processor._find_pdfs(extract_path)
-        total_pdfs = len(pdf_files)
-        
-        # Update job with extract path and total
+        # Update job with extract path
         update_job_extract_path(self.job_id, extract_path)
-        
-        # Also update total_pdfs if it was 0 (uploaded without extraction)
-        if self.job['total_pdfs'] == 0:
-            from database import Session, UploadJob
-            session = Session()
-            try:
-                job = session.query(UploadJob).filter(UploadJob.id == self.job_id).first()
-                if job:
-                    job.total_pdfs = total_pdfs
-                    session.commit()
-            finally:
-                session.close()
-        
-        # Update job data
         self.job['extract_path'] = extract_path
-        self.job['total_pdfs'] = total_pdfs
         
         return extract_path
     
-    def process_batch(self, batch_size=15):
+    def _store_member(self, member, zip_ref, extract_path):
         """
-        Process next batch of PDFs
-        Returns: dict with progress info
+        Store one member's PDF (runs on the I/O thread pool)
+        Returns: (metadata with file_path, None) or (None, error); the error
+                 is the StoragePaused exception when storage is paused
         """
+        member_name = member['member_name']
         try:
-            # Ensure ZIP is extracted
-            extract_path = self.extract_zip_if_needed()
-            print(f"DEBUG: Extract path: {extract_path}")
-            print(f"DEBUG: Extract path exists: {os.path.exists(extract_path)}")
+            # Metadata was parsed when the job was created
+            metadata = self.processor._member_metadata(member)
             
-            # Get all PDFs
-            all_pdfs = self.processor._find_pdfs(extract_path)
-            print(f"DEBUG: Found {len(all_pdfs)} PDFs")
-            if len(all_pdfs) > 0:
-                print(f"DEBUG: First PDF: {all_pdfs[0]}")
+            # Stream or copy to storage
+            if zip_ref is not None:
+                info = zip_ref.getinfo(member_name)
+                new_path = self.processor._stream_to_storage(zip_ref, info, metadata)
+            else:
+                pdf_path = self.processor._extracted_path(extract_path, member_name)
+                new_path = self.processor._copy_to_storage(pdf_path, metadata)
             
-            # Get already processed count
-            processed_count = self.job['processed_pdfs']
-            total_count = len(all_pdfs)
-            print(f"DEBUG: Processed: {processed_count}, Total: {total_count}")
+            if not new_path:
+                return None, 'Failed to store PDF'
+            metadata['file_path'] = new_path
+            # A changed member replaces the paper stored from its old version
+            metadata['replace'] = member.get('change_type') == 'CHANGED'
+            return metadata, None
+        except StoragePaused as e:
+            return None, e
+        except Exception as e:
+            return None, str(e)
+    
+    def process_batch(self, batch_size=15, streaming=None, workers=None, budget_ms=None):
+        """
+        Process next batch of PDFs from the job's work list
+        With streaming=True (default from INGEST_STREAMING) members are read
+        straight from the ZIP instead of an extracted copy on disk (always,
+        for remote archives)
+        Storage I/O runs on a pool of `workers` threads (default
+        BATCH_IO_WORKERS); results are committed in manifest order
+        With budget_ms the batch is sized by wall-clock time instead: members
+        are claimed in rounds of up to batch_size, each round only as many as
+        the cost observed so far predicts will fit in what is left of the
+        budget (see _fit_to_budget)
+        Members are leased to this call while it works on them, so
+        overlapping calls for the same job (other threads, processes or
+        servers) process disjoint members
+        Returns: dict with progress info and observed throughput
+        """
+        if streaming is None:
+            streaming = INGEST_STREAMING
+        if workers is None:
+            workers = BATCH_IO_WORKERS
+        
+        started = time.perf_counter()
+        owner = uuid.uuid4().hex
+        deadline = started + budget_ms * BATCH_BUDGET_SAFETY / 1000 if budget_ms else None
+        zip_ref = None
+        extract_path = None
+        # Members stay leased to this call however long storing them takes
+        # (slow remote storage, retries, breaker pauses)
+        heartbeat = Heartbeat(lambda: renew_member_leases(self.job_id, owner, MEMBER_LEASE_SECONDS) >= 0,
+                              MEMBER_LEASE_SECONDS / 3).start()
+        try:
+            # Jobs created before the manifest existed get one now
+            if self.job['status'] != 'COMPLETED' and count_job_members(self.job_id) == 0:
+                self.prepare_work_list()
             
-            # Check if already completed
-            if processed_count >= total_count:
+            # Lease the next pending manifest rows
+            batch_members = claim_pending_members(self.job_id, batch_size, owner, MEMBER_LEASE_SECONDS)
+            
+            # Check if already completed (or the rest is leased to other calls)
+            if not batch_members:
+                progress = finish_job_members(self.job_id, [])
+                completed = progress['status'] == 'COMPLETED'
                 return {
                     'success': True,
                     'job_id': self.job_id,
-                    'processed': processed_count,
-                    'total': total_count,
-                    'percentage': 100,
-                    'status': 'COMPLETED',
-                    'message': 'All PDFs already processed'
+                    'processed': progress['processed'],
+                    'total': progress['total'],
+                    'percentage': 100 if completed else int(progress['processed'] / max(progress['total'], 1) * 100),
+                    'status': progress['status'],
+                    'message': 'All PDFs already processed' if completed else
+                               'Remaining PDFs are being processed by another worker'
+                               if progress['status'] == 'PROCESSING' else f"Job is {progress['status']}"
                 }
             
-            # Get next batch of PDFs to process
-            batch_pdfs = all_pdfs[processed_count:processed_count + batch_size]
+            if streaming or self.processor.archive_url:
+                # Read members through the central directory, nothing is extracted
+                # (memory-mapped by default, so the pool inflates members in parallel)
+                zip_ref = self.processor.open_archive()
+            else:
+                # Ensure ZIP is extracted
+                extract_path = self.extract_zip_if_needed()
+                print(f"DEBUG: Extract path: {extract_path}")
             
-            # Process each PDF in batch
             successfully_processed = 0
-            for pdf_path in batch_pdfs:
-                try:
-                    # Parse metadata
-                    metadata = self.processor._parse_filename(os.path.basename(pdf_path))
-                    
-                    if metadata:
-                        # Add exam_type and exam_year from job
-                        metadata['exam_type'] = self.job['exam_type']
-                        metadata['exam_year'] = self.job['exam_year']
-                        
-                        # Copy to storage
-                        new_path = self.processor._copy_to_storage(pdf_path, metadata)
-                        
-                        if new_path:
-                            metadata['file_path'] = new_path
-                            
-                            # Insert to database
-                            insert_pyq_file(metadata)
-                            successfully_processed += 1
-                            print(f"✓ Successfully processed: {os.path.basename(pdf_path)}")
-                            
-                except Exception as e:
-                    print(f"Error processing {pdf_path}: {e}")
-                    continue
-            
-            # Update progress - count ALL attempted PDFs, not just successful ones
-            # This ensures we move forward even if some PDFs are rejected
-            batch_attempted = len(batch_pdfs)
-            new_processed_count = processed_count + batch_attempted
-            new_status = 'COMPLETED' if new_processed_count >= total_count else 'PROCESSING'
-            
-            update_job_progress(self.job_id, new_processed_count, new_status)
+            members_done = 0
+            bytes_done = 0
+            work_seconds = 0.0
+            rounds = 0
+            while batch_members:
+                if deadline is not None:
+                    claimed = batch_members
+                    if rounds == 0:
+                        # Nothing measured yet - probe with one member per thread
+                        batch_members = batch_members[:max(1, workers)]
+                    else:
+                        batch_members = self._fit_to_budget(
+                            batch_members, deadline - time.perf_counter(),
+                            work_seconds / members_done, work_seconds / max(1, bytes_done)
+                        )
+                    # Hand back what doesn't fit for other calls to take
+                    release_job_members(self.job_id, owner, [member['id'] for member in claimed[len(batch_members):]])
+                    if not batch_members:
+                        break
+                
+                round_started = time.perf_counter()
+                processed, progress, paused_for = self._process_members(
+                    batch_members, zip_ref, extract_path, workers, owner
+                )
+                work_seconds += time.perf_counter() - round_started
+                successfully_processed += processed
+                members_done += len(batch_members)
+                bytes_done += sum(member['file_size'] or 0 for member in batch_members)
+                rounds += 1
+                
+                if deadline is None or progress['status'] != 'PROCESSING' or paused_for:
+                    break
+                batch_members = claim_pending_members(self.job_id, batch_size, owner, MEMBER_LEASE_SECONDS)
             
             # Calculate percentage
+            total_count = progress['total']
+            new_processed_count = progress['processed']
             percentage = int((new_processed_count / total_count) * 100) if total_count > 0 else 0
             
-            return {
+            # Observed throughput, for the admin UI's ETA
+            elapsed = time.perf_counter() - started
+            members_per_second = members_done / elapsed if elapsed > 0 else 0
+            remaining = total_count - new_processed_count
+            
+            result = {
                 'success': True,
                 'job_id': self.job_id,
                 'processed': new_processed_count,
                 'total': total_count,
                 'percentage': percentage,
-                'status': new_status,
-                'batch_processed': successfully_processed
+                'status': progress['status'],
+                'batch_processed': successfully_processed,
+                'batch_members': members_done,
+                'batch_rounds': rounds,
+                'elapsed_ms': int(elapsed * 1000),
+                'members_per_second': round(members_per_second, 2),
+                'mb_per_second': round(bytes_done / (1024 * 1024) / elapsed, 2) if elapsed > 0 else 0,
+                'eta_seconds': int(remaining / members_per_second) if members_per_second > 0 else None
             }
+            if paused_for:
+                # Unstored members went back to PENDING; the job resumes after the pause
+                result['paused_for'] = round(paused_for, 1)
+                result['message'] = f"Storage is paused after repeated failures; retrying in {paused_for:.0f}s"
+            return result
         except Exception as e:
             print(f"ERROR in process_batch: {e}")
             import traceback
@@ -189,3 +300,88 @@ class BatchProcessor:
                 'percentage': 0,
                 'status': 'FAILED'
             }
+        finally:
+            heartbeat.stop()
+            if zip_ref:
+                zip_ref.close()
+            # Members still leased after a failure go back to PENDING now
+            # rather than when the lease expires
+            try:
+                release_job_members(self.job_id, owner)
+            except Exception as e:
+                print(f"⚠️ Could not release claimed members: {e}")
+    
+    def _fit_to_budget(self, members, seconds_left, seconds_per_member, seconds_per_byte):
+        """
+        Longest prefix of members whose predicted cost fits in seconds_left
+        A member is predicted to cost an even blend of the average member
+        and its size at the observed byte rate, so large PDFs count for more
+        """
+        fitted = []
+        predicted = 0.0
+        for member in members:
+            predicted += 0.5 * seconds_per_member + 0.5 * seconds_per_byte * (member['file_size'] or 0)
+            if predicted > seconds_left:
+                break
+            fitted.append(member)
+        return fitted
+    
+    def _process_members(self, batch_members, zip_ref, extract_path, workers, owner=None):
+        """
+        Store claimed members, insert their papers and record the results
+        (under owner's lease). Members storage refused while paused get no
+        result; they stay leased until process_batch releases them
+        Returns: (number of papers inserted, job progress from finish_job_members,
+                  seconds storage is paused for or 0)
+        """
+        # Store PDFs in parallel; map() yields results in manifest order
+        def store(member):
+            return self._store_member(member, zip_ref, extract_path)
+        
+        if workers > 1 and len(batch_members) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(batch_members))) as pool:
+                stored = list(pool.map(store, batch_members))
+        else:
+            stored = [store(member) for member in batch_members]
+        
+        # Insert the whole batch to database in one transaction, in order
+        papers = [metadata for metadata, _ in stored if metadata]
+        conflicts = {}
+        insert_error = None
+        try:
+            bulk = insert_pyq_files_bulk(papers)
+            conflicts = {c['index']: c for c in bulk['conflicts']}
+        except Exception as e:
+            insert_error = str(e)
+        
+        successfully_processed = 0
+        results = []
+        paper_index = 0
+        paused_for = 0
+        for member, (metadata, error) in zip(batch_members, stored):
+            member_name = member['member_name']
+            if isinstance(error, StoragePaused):
+                paused_for = max(paused_for, error.retry_after)
+                continue
+            if metadata:
+                conflict = conflicts.get(paper_index)
+                paper_index += 1
+                if insert_error:
+                    error = insert_error
+                elif conflict:
+                    results.append((member['id'], 'SKIPPED', f"Paper {conflict['reason']}"))
+                    print(f"↷ Skipped {os.path.basename(member_name)}: {conflict['reason']}")
+                    continue
+                else:
+                    successfully_processed += 1
+                    results.append((member['id'], 'DONE', None))
+                    print(f"✓ Successfully processed: {os.path.basename(member_name)}")
+                    continue
+            print(f"Error processing {member_name}: {error}")
+            results.append((member['id'], 'FAILED', error))
+        
+        # Record results - SKIPPED and FAILED members count as processed so
+        # the job moves forward; their reasons stay in the manifest
+        if paused_for:
+            print(f"⚠️ Storage paused; {sum(1 for _, e in stored if isinstance(e, StoragePaused))} members left for later")
+        return successfully_processed, finish_job_members(self.job_id, results, owner), paused_for
@@ -0,0 +1,104 @@
+"""
+Content-addressed PDF storage
+Each distinct PDF is stored once under a sharded SHA-256 path:
+    PDF_STORAGE_PATH/ab/cd/abcd...ef.pdf
+so identical papers from different dumps or sessions share one file
+"""
+import os
+import hashlib
+import tempfile
+from config import PDF_STORAGE_PATH, STREAM_CHUNK_SIZE
+
+class BlobStore:
+    """Write-once PDF blobs addressed by their SHA-256"""
+    
+    def __init__(self, root=PDF_STORAGE_PATH, chunk_size=STREAM_CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+    
+    @staticmethod
+    def relative_path(content_hash):
+        """Storage path of a blob relative to the root (stored in pyq_files.file_path)"""
+        return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.pdf"
+    
+    def absolute_path(self, content_hash):
+        """Absolute path of a blob"""
+        return os.path.join(self.root, *self.relative_path(content_hash).split('/'))
+    
+    def exists(self, content_hash):
+        """Check whether a blob is already stored"""
+        return os.path.exists(self.absolute_path(content_hash))
+    
+    def hash_stream(self, source):
+        """
+        Hash a stream without writing it anywhere
+        Returns: (content_hash, size)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = source.read(self.chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+        return digest.hexdigest(), size
+    
+    def write_stream(self, source):
+        """
+        Store a stream, hashing it while it is written
+        The data goes to a temp file first and is renamed into place, so
+        readers never see a partial blob; if the blob already exists the
+        temp file is simply dropped
+        Returns: (content_hash, relative_path, size, created)
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as target:
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    target.write(chunk)
+                    size += len(chunk)
+            
+            content_hash = digest.hexdigest()
+            destination = self.absolute_path(content_hash)
+            if os.path.exists(destination):
+                os.remove(temp_path)
+                return content_hash, self.relative_path(content_hash), size, False
+            
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(temp_path, destination)
+            return content_hash, self.relative_path(content_hash), size, True
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    
+    def adopt_file(self, path):
+        """
+        Add an existing file to the store without moving it (used by the
+        storage migration, which removes the source once rows point at the blob)
+        Hard-links when possible so nothing is copied
+        Returns: (content_hash, relative_path, size, created)
+        """
+        with open(path, 'rb') as source:
+            content_hash, size = self.hash_stream(source)
+        
+        destination = self.absolute_path(content_hash)
+        if os.path.exists(destination):
+            return content_hash, self.relative_path(content_hash), size, False
+        
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(path, destination)
+        except OSError:
+            # Filesystem without hard links - fall back to a copy
+            with open(path, 'rb') as source:
+                self.write_stream(source)
+        return content_hash, self.relative_path(content_hash), size, True
@@ -1,46 +1,384 @@
+"""
+Cloud Uploader - Uploads PDFs to Cloudinary
+Uploads are signed and posted to Cloudinary's upload API directly, over one
+keep-alive requests.Session whose connection pool is shared by all threads
+(CLOUDINARY_UPLOAD_URL can point at a local stand-in). upload_many() runs
+a bulk upload on a bounded thread pool:
+- timeouts, connection errors, 429 and 5xx are retried with exponential
+  backoff and full jitter (a Retry-After header wins and holds every thread)
+- requests are spaced to UPLOAD_RATE_LIMIT per second across threads
+- a run of consecutive failed requests opens a circuit breaker: files not
+  uploaded yet come back PAUSED rather than each failing in turn, and after
+  a cooldown one trial request decides whether uploads resume
+"""
 import os
-import cloudinary
-import cloudinary.uploader
-from config import CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET
+import time
+import random
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET, CLOUDINARY_UPLOAD_URL,
+    CLOUDINARY_DELIVERY_URL, CLOUDINARY_CHUNK_SIZE,
+    UPLOAD_WORKERS, UPLOAD_TIMEOUT, UPLOAD_RETRIES, UPLOAD_BACKOFF_SECONDS, UPLOAD_BACKOFF_MAX_SECONDS,
+    UPLOAD_RATE_LIMIT, UPLOAD_BREAKER_THRESHOLD, UPLOAD_BREAKER_COOLDOWN
+)
+
+FOLDER = 'pyq_pdfs'
+
+
+class UploadError(Exception):
+    """An upload failed (after its retries, if it was worth retrying)"""
+
+    def __init__(self, message, retryable=False, retry_after=None, counts=True):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.counts = counts  # a failure of the service, not of this one file
+
+
+class UploadsPaused(Exception):
+    """The circuit breaker is open; uploads can resume after retry_after seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Cloudinary uploads paused for {retry_after:.0f}s after repeated failures")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failures; once cooldown seconds have
+    passed one trial call is allowed through, and its outcome closes or
+    re-opens the breaker (other callers wait for it, at most cooldown
+    seconds before they are refused as if it were open)
+    """
+
+    def __init__(self, threshold=UPLOAD_BREAKER_THRESHOLD, cooldown=UPLOAD_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None  # thread making the trial call
+        self._lock = threading.Condition()
+
+    @property
+    def state(self):
+        """'closed', 'open' or 'half-open'"""
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        with self._lock:
+            while True:
+                if self.opened_at is None:
+                    return True
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                if self._trial is None:
+                    self._trial = threading.get_ident()
+                    return True
+                if not self._lock.wait(self.cooldown):
+                    return False
+
+    def retry_after(self):
+        """Seconds until a trial call will be allowed (a cooldown while one is under way)"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            if self._trial is not None:
+                return self.cooldown
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+            self._lock.notify_all()
+
+    def release(self):
+        """The calling thread's call said nothing about the service; another may make the trial"""
+        with self._lock:
+            if self._trial == threading.get_ident():
+                self._trial = None
+                self._lock.notify_all()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial is not None or (self.opened_at is None and self.failures >= self.threshold):
+                print(f"⚠️ Upload circuit breaker open after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self._trial = None
+                self._lock.notify_all()
+
+
+class RateLimiter:
+    """Spaces calls at most rate per second apart, across threads (rate 0: no limit)"""
+
+    def __init__(self, rate=UPLOAD_RATE_LIMIT):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until this call's slot"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def hold(self, seconds):
+        """Let no call through for the next seconds (a server's Retry-After)"""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
 
 class CloudUploader:
     """Handles file uploads to Cloudinary"""
-    
-    def __init__(self):
-        # Configure Cloudinary
-        cloudinary.config(
-            cloud_name=CLOUDINARY_CLOUD_NAME,
-            api_key=CLOUDINARY_API_KEY,
-            api_secret=CLOUDINARY_API_SECRET
-        )
-        print(f"✓ Cloudinary configured: {CLOUDINARY_CLOUD_NAME}")
-    
+
+    def __init__(self, cloud_name=None, api_key=None, api_secret=None, upload_url=None, workers=None,
+                 retries=UPLOAD_RETRIES, rate_limit=UPLOAD_RATE_LIMIT, breaker=None, delivery_url=None):
+        self.cloud_name = cloud_name or CLOUDINARY_CLOUD_NAME
+        self.api_key = api_key or CLOUDINARY_API_KEY
+        self.api_secret = api_secret or CLOUDINARY_API_SECRET
+        self.endpoint = f"{(upload_url or CLOUDINARY_UPLOAD_URL).rstrip('/')}/{self.cloud_name}/raw/upload"
+        self.delivery = (delivery_url or CLOUDINARY_DELIVERY_URL).rstrip('/')
+        self.workers = max(1, workers or UPLOAD_WORKERS)
+        self.retries = retries
+        self.limiter = RateLimiter(rate_limit)
+        self.breaker = breaker or CircuitBreaker()
+
+        # One pool of keep-alive connections, as large as the worker pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        print(f"✓ Cloudinary configured: {self.cloud_name}")
+
+    def close(self):
+        self.session.close()
+
     def upload_file(self, file_path, filename, folder_id=None):
         """
-        Upload a file to Cloudinary
+        Upload a file to Cloudinary, retrying transient failures
         Returns: secure_url for both view and download
+        Raises: UploadError, or UploadsPaused while the circuit breaker is open
         """
         try:
-            # Remove .pdf extension from filename for public_id
-            public_id = filename.replace('.pdf', '')
-            
-            # Upload to Cloudinary as raw file (for PDFs)
-            result = cloudinary.uploader.upload(
-                file_path,
-                resource_type="raw",  # PDFs must use 'raw' type
-                public_id=public_id,
-                folder="pyq_pdfs",
-                overwrite=True,
-                timeout=60  # 60 second timeout per file
-            )
-            
-            print(f"✓ Uploaded to Cloudinary: {result['secure_url']}")
-            
-            return {
-                'file_id': result['public_id'],
-                'view_link': result['secure_url'],
-                'download_link': result['secure_url']
-            }
-        except Exception as e:
+            result = self._upload(file_path, filename)
+        except UploadsPaused as e:
+            print(f"⚠️ {e}")
+            raise
+        except UploadError as e:
             print(f"ERROR uploading to Cloudinary: {e}")
             raise
+        print(f"✓ Uploaded to Cloudinary: {result['view_link']}")
+        return result
+
+    def upload_many(self, files, progress_callback=None):
+        """
+        Upload many files on the worker pool
+        files: iterable of (file_path, filename)
+        progress_callback(done, total) is called as files finish
+        Returns: one result per file, in order: {'filename', 'status' ('DONE',
+                 'FAILED' or 'PAUSED'), 'file_id', 'view_link', 'download_link',
+                 'error', 'retry_after' (PAUSED only)}
+        """
+        files = list(files)
+        results = [None] * len(files)
+        done = [0]
+        lock = threading.Lock()
+
+        def run(index):
+            file_path, filename = files[index]
+            result = {'filename': filename, 'status': 'DONE', 'error': None}
+            try:
+                result.update(self._upload(file_path, filename))
+            except UploadsPaused as e:
+                result.update(status='PAUSED', error=str(e), retry_after=e.retry_after)
+            except UploadError as e:
+                result.update(status='FAILED', error=str(e))
+            except Exception as e:
+                # Fails this file only, never the whole batch
+                result.update(status='FAILED', error=f"{filename}: {e}")
+            results[index] = result
+            if progress_callback:
+                with lock:
+                    done[0] += 1
+                    progress_callback(done[0], len(files))
+
+        if files:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(files))) as pool:
+                list(pool.map(run, range(len(files))))
+
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        print(f"✓ Cloudinary bulk upload: {counts.get('DONE', 0)} uploaded, {counts.get('FAILED', 0)} failed, "
+              f"{counts.get('PAUSED', 0)} paused")
+        return results
+
+    def upload_stream(self, source, public_id):
+        """
+        Upload a stream; streams over CLOUDINARY_CHUNK_SIZE go up in chunks
+        (Content-Range requests sharing an X-Unique-Upload-Id), each chunk
+        retried on its own, so no more than two chunks are held in memory
+        Returns: same as upload_file
+        """
+        chunk = source.read(CLOUDINARY_CHUNK_SIZE)
+        following = source.read(CLOUDINARY_CHUNK_SIZE) if len(chunk) == CLOUDINARY_CHUNK_SIZE else b''
+        if not following:
+            return self._retrying(lambda: self._post(public_id, chunk))
+
+        upload_id = uuid.uuid4().hex
+        start = 0
+        while True:
+            end = start + len(chunk) - 1
+            # The total is only known with the last chunk
+            headers = {
+                'X-Unique-Upload-Id': upload_id,
+                'Content-Range': f"bytes {start}-{end}/{end + 1 if not following else -1}",
+            }
+            result = self._retrying(lambda: self._post(public_id, chunk, headers))
+            if not following:
+                return result
+            start = end + 1
+            chunk, following = following, source.read(CLOUDINARY_CHUNK_SIZE)
+
+    def destroy(self, public_id):
+        """
+        Delete an uploaded file (public_id as returned in file_id)
+        Returns: True if it existed
+        """
+        params = {'public_id': public_id, 'timestamp': str(int(time.time()))}
+        data = dict(params, api_key=self.api_key, signature=self._sign(params))
+        try:
+            response = self.session.post(self.endpoint.rsplit('/', 1)[0] + '/destroy', data=data,
+                                         timeout=(10, UPLOAD_TIMEOUT))
+        except requests.RequestException as e:
+            raise UploadError(f"{public_id}: {e}", retryable=_transient(e))
+        if response.status_code != 200:
+            raise UploadError(f"{public_id}: HTTP {response.status_code} {response.text[:200]}")
+        try:
+            return response.json().get('result') == 'ok'
+        except (ValueError, AttributeError) as e:
+            raise UploadError(f"{public_id}: unreadable response ({e})", retryable=True)
+
+    def delivery_url(self, public_id):
+        """Public URL of an uploaded raw file"""
+        return f"{self.delivery}/{self.cloud_name}/raw/upload/{public_id}"
+
+    def _upload(self, file_path, filename):
+        """One file, with retries; returns the upload_file result"""
+        def send():
+            try:
+                with open(file_path, 'rb') as f:
+                    # Remove .pdf extension from filename for public_id
+                    return self._post(filename.replace('.pdf', ''), f)
+            except OSError as e:
+                raise UploadError(f"{filename}: {e}", counts=False)
+        return self._retrying(send)
+
+    def _retrying(self, send):
+        """Run one request through the breaker and rate limit, retrying transient failures"""
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise UploadsPaused(self.breaker.retry_after())
+            self.limiter.wait()
+            try:
+                result = send()
+                self.breaker.record_success()
+                return result
+            except UploadError as e:
+                if e.counts:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+                if not e.retryable or attempt >= self.retries:
+                    raise
+                if e.retry_after:
+                    self.limiter.hold(e.retry_after)
+                    delay = e.retry_after
+                else:
+                    # Full jitter keeps retrying threads from moving in lockstep
+                    delay = random.uniform(0, min(UPLOAD_BACKOFF_MAX_SECONDS, UPLOAD_BACKOFF_SECONDS * 2 ** attempt))
+                attempt += 1
+                time.sleep(delay)
+            finally:
+                # Whatever send() raised, a trial this thread holds is never left taken
+                self.breaker.release()
+
+    def _sign(self, params):
+        """Cloudinary API signature: SHA-1 of the sorted parameters and the secret"""
+        payload = '&'.join(f"{key}={params[key]}" for key in sorted(params))
+        return hashlib.sha1((payload + self.api_secret).encode()).hexdigest()
+
+    def _post(self, public_id, content, headers=None):
+        """One upload request of content (bytes or a file); raises UploadError"""
+        params = {
+            'folder': FOLDER,
+            'overwrite': 'true',
+            'public_id': public_id,
+            'timestamp': str(int(time.time())),
+        }
+        data = dict(params, api_key=self.api_key, signature=self._sign(params))
+        name = f"{os.path.basename(public_id)}.pdf"
+        try:
+            response = self.session.post(
+                self.endpoint, data=data, files={'file': (name, content, 'application/pdf')},
+                headers=headers, timeout=(10, UPLOAD_TIMEOUT)
+            )
+        except requests.RequestException as e:
+            raise UploadError(f"{name}: {e}", retryable=_transient(e))
+
+        if response.status_code == 200:
+            try:
+                result = response.json()
+                return {
+                    'file_id': result.get('public_id'),
+                    'view_link': result.get('secure_url'),
+                    'download_link': result.get('secure_url')
+                }
+            except (ValueError, AttributeError) as e:
+                raise UploadError(f"{name}: unreadable response ({e})", retryable=True)
+
+        try:
+            message = response.json()['error']['message']
+        except (ValueError, KeyError, TypeError):
+            message = response.text[:200]
+        status = response.status_code
+        retryable = status in (408, 429) or status >= 500
+        retry_after = response.headers.get('Retry-After')
+        raise UploadError(
+            f"{name}: HTTP {status} {message}",
+            retryable=retryable,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            # A bad file is its own problem; bad credentials or an outage are everyone's
+            counts=retryable or status in (401, 403)
+        )
+
+
+def _transient(error):
+    """Whether a requests error is worth retrying (connection trouble, not a bad request)"""
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+# Process-wide uploader, so every job shares its connections and circuit breaker
+_uploader = None
+
+def get_cloud_uploader():
+    """Get the process-wide CloudUploader"""
+    global _uploader
+    if _uploader is None:
+        _uploader = CloudUploader()
+    return _uploader
@@ -16,22 +16,146 @@ if RAILWAY_VOLUME:
     print(f"✓ Using Railway volume: {RAILWAY_VOLUME}")
     UPLOAD_FOLDER = os.path.join(RAILWAY_VOLUME, 'uploads', 'temp')
     PDF_STORAGE_PATH = os.path.join(RAILWAY_VOLUME, 'uploads', 'pdfs')
+    ARCHIVE_CACHE_PATH = os.path.join(RAILWAY_VOLUME, 'uploads', 'archives')
+    QUARANTINE_PATH = os.path.join(RAILWAY_VOLUME, 'uploads', 'quarantine')
     DATABASE_PATH = os.path.join(RAILWAY_VOLUME, 'pyq_system.db')
 else:
     # Development: Use local paths
     print("✓ Using local storage paths")
     UPLOAD_FOLDER = os.path.join(PROJECT_ROOT, 'uploads', 'temp')
     PDF_STORAGE_PATH = os.path.join(PROJECT_ROOT, 'uploads', 'pdfs')
+    ARCHIVE_CACHE_PATH = os.path.join(PROJECT_ROOT, 'uploads', 'archives')
+    QUARANTINE_PATH = os.path.join(PROJECT_ROOT, 'uploads', 'quarantine')
     DATABASE_PATH = os.path.join(BASE_DIR, 'pyq_system.db')
 
 # Cloudinary Configuration (for PDF storage)
 CLOUDINARY_CLOUD_NAME = os.environ.get('CLOUDINARY_CLOUD_NAME', '')
 CLOUDINARY_API_KEY = os.environ.get('CLOUDINARY_API_KEY', '')
 CLOUDINARY_API_SECRET = os.environ.get('CLOUDINARY_API_SECRET', '')
+CLOUDINARY_UPLOAD_URL = os.environ.get('CLOUDINARY_UPLOAD_URL', 'https://api.cloudinary.com/v1_1')
+CLOUDINARY_DELIVERY_URL = os.environ.get('CLOUDINARY_DELIVERY_URL', 'https://res.cloudinary.com')
+CLOUDINARY_CHUNK_SIZE = 20 * 1024 * 1024  # larger files are uploaded in chunks
+
+# Bulk uploads to Cloudinary run on a pool of keep-alive connections; each
+# file is retried with exponential backoff, and a run of consecutive
+# failures opens a circuit breaker that pauses the rest of the upload
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '8'))
+UPLOAD_TIMEOUT = 60  # seconds per request
+UPLOAD_RETRIES = 4  # per file, after the first attempt
+UPLOAD_BACKOFF_SECONDS = 0.5  # first retry waits up to this, doubling each time
+UPLOAD_BACKOFF_MAX_SECONDS = 30
+UPLOAD_RATE_LIMIT = float(os.environ.get('UPLOAD_RATE_LIMIT', '0'))  # requests/second, 0 = unlimited
+UPLOAD_BREAKER_THRESHOLD = 5  # consecutive failed requests that open the breaker
+UPLOAD_BREAKER_COOLDOWN = 60  # seconds before a trial request is let through
+UPLOAD_PAUSE_MAX_WAIT = 600  # seconds a whole-archive upload waits out paused storage before it stops (resumable)
+
+# Where PDFs are stored: 'local' (PDF_STORAGE_PATH), 's3' (any S3-compatible
+# store), 'cloudinary' or 'drive' (see storage.py)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').lower()
+
+# S3-compatible object storage (AWS S3, MinIO, R2...), addressed path-style
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://s3.amazonaws.com')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY', '')
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL', '')  # public bucket URL; empty = presigned links
+S3_URL_EXPIRES = 3600  # seconds a presigned link stays valid
+S3_PART_SIZE = 8 * 1024 * 1024  # larger objects are multipart uploads
+S3_RETRIES = 3
+
+# Google Drive (see drive_uploader.py)
+GOOGLE_CREDENTIALS_PATH = os.environ.get('GOOGLE_CREDENTIALS_PATH', os.path.join(PROJECT_ROOT, 'google-credentials.json'))
+DRIVE_FOLDER_ID = os.environ.get('DRIVE_FOLDER_ID', '')
+DRIVE_CHUNK_SIZE = 8 * 1024 * 1024  # resumable upload chunks (a multiple of 256KB); smaller files go up in one request
+DRIVE_API_ENDPOINT = os.environ.get('DRIVE_API_ENDPOINT', 'https://www.googleapis.com')
+# Bulk uploads run on a pool of threads; files are made public by the folder's
+# own 'anyone with the link' permission (DRIVE_PUBLIC_FOLDER) or by
+# permission requests sent DRIVE_BATCH_SIZE to a batch request
+DRIVE_UPLOAD_WORKERS = int(os.environ.get('DRIVE_UPLOAD_WORKERS', '8'))
+DRIVE_PUBLIC_FOLDER = os.environ.get('DRIVE_PUBLIC_FOLDER', 'false').lower() == 'true'
+DRIVE_BATCH_SIZE = 100  # Drive's limit per batch request
+DRIVE_RETRIES = 3  # per request, on 429 / 5xx / rate limit 403s
+DRIVE_TIMEOUT = 60  # seconds per request
 
 # File upload settings
 ALLOWED_EXTENSIONS = {'zip'}
 MAX_FILE_SIZE = 1024 * 1024 * 1024  # 1GB
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB reads for server-side ZIP downloads
+# Large downloads from servers with Accept-Ranges run as concurrent byte ranges
+DOWNLOAD_SEGMENTS = int(os.environ.get('DOWNLOAD_SEGMENTS', '4'))
+DOWNLOAD_SEGMENT_MIN_SIZE = 32 * 1024 * 1024  # 32MB - smaller archives use one stream
+DOWNLOAD_SEGMENT_RETRIES = 3  # per range, before the download fails (and can be resumed)
+# Fetched archives are kept by URL (with ETag / Last-Modified and SHA-256) so a
+# re-fetch is a conditional request; least recently used ones go past the limit
+ARCHIVE_CACHE_ENABLED = os.environ.get('ARCHIVE_CACHE_ENABLED', 'true').lower() == 'true'
+ARCHIVE_CACHE_MAX_BYTES = int(float(os.environ.get('ARCHIVE_CACHE_MAX_GB', '5')) * 1024 * 1024 * 1024)
+
+# Ingest settings
+# Streaming mode decompresses accepted ZIP members straight into PDF_STORAGE_PATH
+# instead of extracting the whole archive to UPLOAD_FOLDER first
+INGEST_STREAMING = os.environ.get('INGEST_STREAMING', 'true').lower() == 'true'
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB buffer per member copy
+# Read members through a memory-mapped view of the ZIP so several threads
+# can inflate at once (zipfile serializes reads on one shared handle)
+ARCHIVE_MMAP = os.environ.get('ARCHIVE_MMAP', 'true').lower() == 'true'
+# Store accepted members while a fetch-zip download is still running
+# (download_pipeline.py); the queue bounds how many wait in memory for storage
+INGEST_PIPELINE = os.environ.get('INGEST_PIPELINE', 'true').lower() == 'true'
+PIPELINE_QUEUE_SIZE = 16
+
+# Parallelism inside a single batch / job
+BATCH_IO_WORKERS = int(os.environ.get('BATCH_IO_WORKERS', '4'))  # threads storing PDFs
+CLASSIFY_PROCESSES = int(os.environ.get('CLASSIFY_PROCESSES', '0'))  # 0 = parse names inline
+
+# Time-budgeted batches (process-batch?budget_ms=...): share of the budget
+# planned for work, the rest is headroom for the last round and the response
+BATCH_BUDGET_SAFETY = 0.8
+BATCH_MAX_MEMBERS = 500  # most members one round of a budgeted batch may claim
+
+# Subject code index (code -> branch, name, semesters of stored papers);
+# the filename parser fills in a branch or name the filename doesn't state
+SUBJECT_INDEX_ENABLED = os.environ.get('SUBJECT_INDEX_ENABLED', 'true').lower() == 'true'
+
+# Reclassification of stored papers (rows per classify chunk / update transaction)
+RECLASSIFY_CHUNK_SIZE = int(os.environ.get('RECLASSIFY_CHUNK_SIZE', '2000'))
+
+# Storage sync (storage_sync.py): copies the blobs pyq_files refers to into
+# SYNC_TARGET and points the rows at the copies; the background task runs
+# it every SYNC_INTERVAL_SECONDS
+SYNC_TARGET = os.environ.get('SYNC_TARGET', '').lower()  # '' = STORAGE_BACKEND
+SYNC_ENABLED = os.environ.get('SYNC_ENABLED', 'false').lower() == 'true'
+SYNC_INTERVAL_SECONDS = int(os.environ.get('SYNC_INTERVAL_SECONDS', '3600'))
+SYNC_WORKERS = int(os.environ.get('SYNC_WORKERS', '8'))  # blobs transferred at once
+SYNC_CHUNK_SIZE = 1000  # rows per read page / update transaction, blobs per checkpoint
+
+# Storage scrubber (storage_scrubber.py): checks every pyq_files row against
+# STORAGE_BACKEND (size, and the content hash with SCRUB_VERIFY_HASHES),
+# lists blobs no row refers to, and repairs broken blobs from another copy;
+# corrupt and orphaned blobs are moved to QUARANTINE_PATH. Scrub threads run
+# at a lower CPU priority and hash reads are rate-limited, so requests are
+# still served quickly while a scrub runs
+SCRUB_ENABLED = os.environ.get('SCRUB_ENABLED', 'false').lower() == 'true'
+SCRUB_INTERVAL_SECONDS = int(os.environ.get('SCRUB_INTERVAL_SECONDS', '86400'))
+SCRUB_WORKERS = int(os.environ.get('SCRUB_WORKERS', '8'))  # blobs checked at once
+SCRUB_VERIFY_HASHES = os.environ.get('SCRUB_VERIFY_HASHES', 'false').lower() == 'true'
+SCRUB_REPAIR = os.environ.get('SCRUB_REPAIR', 'true').lower() == 'true'
+SCRUB_QUARANTINE = os.environ.get('SCRUB_QUARANTINE', 'true').lower() == 'true'
+SCRUB_MAX_BYTES_PER_SECOND = int(float(os.environ.get('SCRUB_MAX_MB_PER_SECOND', '200')) * 1024 * 1024)  # 0 = unlimited
+SCRUB_CHUNK_SIZE = 1000  # rows per read page / update transaction, blobs per round of checks
+SCRUB_ORPHAN_GRACE_SECONDS = 3600  # younger unreferenced blobs may belong to an ingest in progress
+SCRUB_NICE = 10  # added to scrub threads' niceness
+
+# Background ingest worker (processes UPLOADED/PROCESSING jobs server-side);
+# started by the server entry point (wsgi.py), not by importing the app
+INGEST_WORKER_ENABLED = os.environ.get('INGEST_WORKER_ENABLED', 'true').lower() == 'true'
+INGEST_WORKER_CONCURRENCY = int(os.environ.get('INGEST_WORKER_CONCURRENCY', '2'))  # jobs at once
+INGEST_WORKER_BATCH_SIZE = int(os.environ.get('INGEST_WORKER_BATCH_SIZE', '50'))
+INGEST_WORKER_POLL_SECONDS = 5
+# Leases are renewed every third of their length while work runs, so they
+# only bound how long a crashed worker's work waits to be picked up again
+JOB_LEASE_SECONDS = 300  # a crashed worker's jobs are picked up after this
+MEMBER_LEASE_SECONDS = 300  # members claimed by a crashed batch call are retried after this
 
 # Supported branches
 BRANCHES = ['CSE', 'IT', 'ME', 'CE', 'EE', 'ECE']
@@ -47,6 +171,8 @@ def ensure_directories():
     try:
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(PDF_STORAGE_PATH, exist_ok=True)
+        os.makedirs(ARCHIVE_CACHE_PATH, exist_ok=True)
+        os.makedirs(QUARANTINE_PATH, exist_ok=True)
         print(f"✓ Created directories: {UPLOAD_FOLDER}, {PDF_STORAGE_PATH}")
     except Exception as e:
         print(f"⚠️ Could not create directories: {e}")
@@ -3,11 +3,13 @@ Database initialization and helper functions using SQLAlchemy
 Supports both PostgreSQL (production) and SQLite (development)
 """
 import os
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Index
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, Column, Integer, BigInteger, Boolean, String, Text, DateTime, Index, insert, update, select, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.sql import func
+from config import MEMBER_LEASE_SECONDS
 
 # Detect database URL from environment
 DATABASE_URL = os.getenv('DATABASE_URL')
@@ -29,6 +31,8 @@ engine = create_engine(
     DATABASE_URL,
     echo=False,  # Set to True for SQL debugging
     pool_pre_ping=True,  # Verify connections before using
+    # SQLite: wait for concurrent writers (parallel batch workers) instead of failing
+    connect_args={'timeout': 30} if DATABASE_URL.startswith('sqlite') else {},
 )
 
 # Create session factory
@@ -52,12 +56,45 @@ class PyqFile(Base):
     exam_type = Column(String(50), nullable=False)
     exam_year = Column(Integer, nullable=False)
     file_path = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    member_name = Column(Text, nullable=True)  # archive member the paper came from (for reclassification)
+    inferred = Column(String(100), nullable=True)  # fields the filename didn't state (see filename_classifier.parse_inferred)
     created_at = Column(DateTime, default=func.now())
     
     # Indexes for faster queries
     __table_args__ = (
         Index('idx_exam_session', 'exam_type', 'exam_year'),
         Index('idx_branch_semester', 'branch', 'semester'),
+        Index('idx_pyq_content_hash', 'content_hash'),
+    )
+
+class PdfBlob(Base):
+    """Model for a content-addressed PDF in local storage"""
+    __tablename__ = 'pdf_blobs'
+    
+    content_hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    crc32 = Column(Integer, nullable=True)
+    storage_path = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index('idx_blob_crc_size', 'crc32', 'size'),
+    )
+
+class BlobReplica(Base):
+    """Model for a copy of a PDF blob in a storage backend (written by storage sync)"""
+    __tablename__ = 'blob_replicas'
+    
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False)
+    backend = Column(String(255), nullable=False)  # store id, e.g. 's3:<endpoint>/<bucket>'
+    location = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=True)
+    synced_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index('idx_replica_backend_hash', 'backend', 'content_hash', unique=True),
     )
 
 class UploadJob(Base):
@@ -68,15 +105,78 @@ class UploadJob(Base):
     filename = Column(String(255), nullable=False)
     zip_path = Column(Text, nullable=False)
     zip_url = Column(Text, nullable=True)
+    remote = Column(Boolean, default=False)  # members are read from zip_url with range requests, nothing is stored
     extract_path = Column(Text, nullable=True)
     exam_type = Column(String(50), nullable=False)
     exam_year = Column(Integer, nullable=False)
     total_pdfs = Column(Integer, default=0)
     processed_pdfs = Column(Integer, default=0)
-    status = Column(String(50), default='UPLOADED')
+    status = Column(String(50), default='UPLOADED')  # FETCHING, UPLOADED, PROCESSING, COMPLETED, FAILED
+    download_bytes = Column(BigInteger, nullable=True)  # FETCHING progress, persisted so a restart can resume
+    download_total = Column(BigInteger, nullable=True)
+    archive_hash = Column(String(64), nullable=True)  # SHA-256 of the fetched archive
+    worker_id = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+class JobMember(Base):
+    """Model for one PDF member in an upload job's manifest"""
+    __tablename__ = 'job_members'
+    
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)
+    member_name = Column(Text, nullable=False)
+    file_size = Column(Integer, default=0)
+    crc = Column(Integer, nullable=True)
+    status = Column(String(20), default='PENDING')  # PENDING, CLAIMED, DONE, SKIPPED, FAILED, REJECTED, UNCHANGED
+    claimed_by = Column(String(100), nullable=True)  # batch call holding the CLAIMED lease
+    lease_expires_at = Column(DateTime, nullable=True)
+    change_type = Column(String(10), nullable=True)  # NEW, CHANGED, UNCHANGED vs ingest history
+    degree = Column(String(50), nullable=True)
+    branch = Column(String(50), nullable=True)
+    semester = Column(Integer, nullable=True)
+    subject_code = Column(String(50), nullable=True)
+    subject_name = Column(String(255), nullable=True)
+    inferred = Column(String(100), nullable=True)
+    error = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_job_member_status', 'job_id', 'status', 'position'),
+    )
+
+class IngestHistory(Base):
+    """Model for archive members already ingested for an exam session"""
+    __tablename__ = 'ingest_history'
+    
+    id = Column(Integer, primary_key=True)
+    exam_type = Column(String(50), nullable=False)
+    exam_year = Column(Integer, nullable=False)
+    member_name = Column(Text, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    crc = Column(Integer, nullable=True)
+    job_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('idx_history_session', 'exam_type', 'exam_year'),
+    )
+
+class CachedArchive(Base):
+    """Model for a downloaded ZIP kept in the archive cache, by source URL"""
+    __tablename__ = 'cached_archives'
+    
+    id = Column(Integer, primary_key=True)
+    url = Column(Text, nullable=False, unique=True)
+    etag = Column(Text, nullable=True)
+    last_modified = Column(String(100), nullable=True)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    path = Column(Text, nullable=False)  # <sha256>.zip, shared by URLs serving the same archive
+    last_used_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now())
+
 class AdminUser(Base):
     """Model for admin user authentication"""
     __tablename__ = 'admin_users'
@@ -122,11 +222,14 @@ def insert_pyq_file(data):
             subject_name=data['subject_name'],
             exam_type=data['exam_type'],
             exam_year=data['exam_year'],
-            file_path=data['file_path']
+            file_path=data['file_path'],
+            member_name=data.get('member_name'),
+            inferred=data.get('inferred')
         )
         session.add(pyq_file)
         session.commit()
         file_id = pyq_file.id
+        _note_subject_codes([data])
         return file_id
     except Exception as e:
         session.rollback()
@@ -134,6 +237,328 @@ def insert_pyq_file(data):
     finally:
         session.close()
 
+def _paper_key(data):
+    """
+    Identity of a paper: one file per subject (code and name) per semester,
+    branch and session - distinct subjects that share a code are kept apart
+    """
+    return (data['exam_type'], int(data['exam_year']), data['branch'], int(data['semester']),
+            data['subject_code'], data['subject_name'])
+
+def insert_pyq_files_bulk(papers):
+    """
+    Insert a batch of PYQ file records in one transaction
+    Papers that already exist (same session, branch, semester, subject code
+    and name) or repeat earlier in the batch are not inserted but reported,
+    unless the paper has 'replace' set (its archive member changed since the
+    last ingest) - then the row stored from that member (else the existing
+    paper) is pointed at the new file and takes its new classification
+    Returns: dict with
+        ids       - row id per paper (None for conflicts), in input order
+        inserted  - number of rows inserted
+        replaced  - number of existing rows updated
+        conflicts - list of {'index', 'subject_code', 'reason', 'existing_id'}
+    """
+    ids = [None] * len(papers)
+    conflicts = []
+    if not papers:
+        return {'ids': ids, 'inserted': 0, 'replaced': 0, 'conflicts': conflicts}
+    
+    session = Session()
+    try:
+        # One query for every existing paper this batch could collide with
+        existing = {}
+        by_member = {}
+        members = {p['member_name'] for p in papers if p.get('replace') and p.get('member_name')}
+        rows = session.query(
+            PyqFile.id, PyqFile.exam_type, PyqFile.exam_year,
+            PyqFile.branch, PyqFile.semester, PyqFile.subject_code,
+            PyqFile.subject_name, PyqFile.inferred, PyqFile.member_name
+        ).filter(
+            PyqFile.exam_type.in_({p['exam_type'] for p in papers}),
+            PyqFile.exam_year.in_({int(p['exam_year']) for p in papers}),
+            or_(PyqFile.subject_code.in_({p['subject_code'] for p in papers}), PyqFile.member_name.in_(members))
+        ).all()
+        for row in rows:
+            existing[_paper_key(row._asdict())] = row
+            if row.member_name in members:
+                by_member[(row.exam_type, row.exam_year, row.member_name)] = row
+        
+        to_insert = []
+        positions = []
+        seen = {}
+        replaced = []
+        # Replaced rows before and after, for the subject index
+        replaced_rows = []
+        rewritten_rows = []
+        for index, paper in enumerate(papers):
+            key = _paper_key(paper)
+            row = None
+            if paper.get('replace') and key not in seen:
+                row = by_member.get((paper['exam_type'], int(paper['exam_year']), paper.get('member_name')))
+                if row is None:
+                    row = existing.get(key)
+                elif existing.get(key, row).id != row.id:
+                    # The member now reads as a paper another row already holds
+                    row = None
+            if row is not None:
+                seen[key] = index
+                ids[index] = row.id
+                replaced.append({
+                    'id': row.id,
+                    'degree': paper['degree'],
+                    'branch': paper['branch'],
+                    'semester': int(paper['semester']),
+                    'subject_code': paper['subject_code'],
+                    'subject_name': paper['subject_name'],
+                    'file_path': paper['file_path'],
+                    'content_hash': paper.get('content_hash'),
+                    'member_name': paper.get('member_name'),
+                    'inferred': paper.get('inferred')
+                })
+                replaced_rows.append({'subject_code': row.subject_code, 'branch': row.branch, 'semester': row.semester,
+                                      'subject_name': row.subject_name, 'inferred': row.inferred})
+                rewritten_rows.append({'subject_code': paper['subject_code'], 'branch': paper['branch'],
+                                       'semester': int(paper['semester']), 'subject_name': paper['subject_name'],
+                                       'inferred': paper.get('inferred')})
+                continue
+            if key in existing:
+                conflicts.append({'index': index, 'subject_code': paper['subject_code'],
+                                  'reason': 'already exists', 'existing_id': existing[key].id})
+                continue
+            if key in seen:
+                conflicts.append({'index': index, 'subject_code': paper['subject_code'],
+                                  'reason': 'duplicate in batch', 'existing_id': None})
+                continue
+            seen[key] = index
+            positions.append(index)
+            to_insert.append({
+                'degree': paper['degree'],
+                'branch': paper['branch'],
+                'semester': int(paper['semester']),
+                'subject_code': paper['subject_code'],
+                'subject_name': paper['subject_name'],
+                'exam_type': paper['exam_type'],
+                'exam_year': int(paper['exam_year']),
+                'file_path': paper['file_path'],
+                'content_hash': paper.get('content_hash'),
+                'member_name': paper.get('member_name'),
+                'inferred': paper.get('inferred')
+            })
+        
+        if to_insert:
+            # executemany / multi-row VALUES with RETURNING, in parameter order
+            result = session.execute(
+                insert(PyqFile).returning(PyqFile.id, sort_by_parameter_order=True),
+                to_insert
+            )
+            for index, new_id in zip(positions, result.scalars().all()):
+                ids[index] = new_id
+        if replaced:
+            # Bulk UPDATE by primary key
+            session.execute(update(PyqFile), replaced)
+        session.commit()
+        _note_subject_codes(to_insert + rewritten_rows, replaced_rows)
+        
+        return {'ids': ids, 'inserted': len(to_insert), 'replaced': len(replaced), 'conflicts': conflicts}
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def get_pyq_file_keys(after_id=0, limit=5000):
+    """
+    Get the next page of PYQ file rows by id (keyset pagination), with the
+    fields the classifier decides, which of them were inferred and the
+    archive member name
+    """
+    session = Session()
+    try:
+        results = session.query(
+            PyqFile.id, PyqFile.exam_type, PyqFile.exam_year, PyqFile.degree, PyqFile.branch,
+            PyqFile.semester, PyqFile.subject_code, PyqFile.subject_name, PyqFile.inferred,
+            PyqFile.member_name
+        ).filter(PyqFile.id > after_id).order_by(PyqFile.id).limit(limit).all()
+        
+        return [r._asdict() for r in results]
+    finally:
+        session.close()
+
+def update_pyq_files_bulk(changes):
+    """
+    Update PYQ file rows in one transaction
+    changes: list of dicts with 'id' and the columns to set
+    Returns: number of rows updated
+    """
+    if not changes:
+        return 0
+    session = Session()
+    try:
+        # Bulk UPDATE by primary key
+        session.execute(update(PyqFile), changes)
+        session.commit()
+        return len(changes)
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+# ==================== PDF BLOB FUNCTIONS ====================
+
+def get_pyq_file_locations(after_id=0, limit=5000):
+    """Get the next page of PYQ file rows by id: {'id', 'file_path', 'content_hash'}"""
+    session = Session()
+    try:
+        results = session.query(
+            PyqFile.id, PyqFile.file_path, PyqFile.content_hash
+        ).filter(PyqFile.id > after_id).order_by(PyqFile.id).limit(limit).all()
+        
+        return [r._asdict() for r in results]
+    finally:
+        session.close()
+
+def get_referenced_locations(locations):
+    """Get which of the given locations some PYQ file row points at"""
+    if not locations:
+        return set()
+    session = Session()
+    try:
+        return {path for (path,) in session.query(PyqFile.file_path).filter(
+            PyqFile.file_path.in_(list(locations))
+        ).distinct()}
+    finally:
+        session.close()
+
+def find_blob_candidates(crc32, size):
+    """Get stored blobs with a given CRC32 and size (possible duplicates)"""
+    session = Session()
+    try:
+        blobs = session.query(PdfBlob).filter(
+            PdfBlob.crc32 == crc32,
+            PdfBlob.size == size
+        ).all()
+        return [{'content_hash': b.content_hash, 'storage_path': b.storage_path} for b in blobs]
+    finally:
+        session.close()
+
+def register_blob(content_hash, size, crc32, storage_path):
+    """Record a stored blob (a known blob only has its location updated, if storage moved)"""
+    session = Session()
+    try:
+        blob = session.query(PdfBlob).filter(PdfBlob.content_hash == content_hash).first()
+        if blob:
+            if blob.storage_path != storage_path:
+                blob.storage_path = storage_path
+                session.commit()
+            return
+        session.add(PdfBlob(content_hash=content_hash, size=size, crc32=crc32, storage_path=storage_path))
+        session.commit()
+    except IntegrityError:
+        # Registered concurrently by another worker
+        session.rollback()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def update_blob_locations(locations):
+    """
+    Point known blobs at a new storage location in one transaction
+    locations: dict of content_hash -> location
+    """
+    if not locations:
+        return
+    session = Session()
+    try:
+        known = {h for (h,) in session.query(PdfBlob.content_hash).filter(
+            PdfBlob.content_hash.in_(list(locations))
+        )}
+        changes = [{'content_hash': h, 'storage_path': locations[h]} for h in known]
+        if changes:
+            session.execute(update(PdfBlob), changes)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def get_blob_sizes(content_hashes):
+    """Get the recorded sizes of known blobs: {content_hash: size}"""
+    if not content_hashes:
+        return {}
+    session = Session()
+    try:
+        rows = session.query(PdfBlob.content_hash, PdfBlob.size).filter(
+            PdfBlob.content_hash.in_(list(content_hashes))
+        ).all()
+        return {r.content_hash: r.size for r in rows}
+    finally:
+        session.close()
+
+# ==================== BLOB REPLICA FUNCTIONS ====================
+
+def get_blob_replicas(backend):
+    """Get the blobs copied to a store (backend store id): {content_hash: {'location', 'size'}}"""
+    session = Session()
+    try:
+        rows = session.query(BlobReplica.content_hash, BlobReplica.location, BlobReplica.size).filter(
+            BlobReplica.backend == backend
+        ).all()
+        return {r.content_hash: {'location': r.location, 'size': r.size} for r in rows}
+    finally:
+        session.close()
+
+def record_blob_replicas(backend, replicas):
+    """
+    Record copies of blobs in a backend in one transaction (known copies
+    have their location and size updated)
+    replicas: list of dicts with 'content_hash', 'location' and 'size'
+    """
+    if not replicas:
+        return
+    session = Session()
+    try:
+        hashes = [r['content_hash'] for r in replicas]
+        existing = {
+            r.content_hash: r.id for r in session.query(BlobReplica.id, BlobReplica.content_hash).filter(
+                BlobReplica.backend == backend, BlobReplica.content_hash.in_(hashes)
+            )
+        }
+        now = datetime.now()
+        new = [dict(r, backend=backend, synced_at=now) for r in replicas if r['content_hash'] not in existing]
+        known = [{'id': existing[r['content_hash']], 'location': r['location'], 'size': r['size'], 'synced_at': now}
+                 for r in replicas if r['content_hash'] in existing]
+        if new:
+            session.execute(insert(BlobReplica), new)
+        if known:
+            session.execute(update(BlobReplica), known)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def get_blob_copies(content_hashes):
+    """Get the recorded copies of blobs in any store: {content_hash: [{'backend', 'location'}]}"""
+    if not content_hashes:
+        return {}
+    session = Session()
+    try:
+        rows = session.query(BlobReplica.content_hash, BlobReplica.backend, BlobReplica.location).filter(
+            BlobReplica.content_hash.in_(list(content_hashes))
+        ).all()
+        copies = {}
+        for r in rows:
+            copies.setdefault(r.content_hash, []).append({'backend': r.backend, 'location': r.location})
+        return copies
+    finally:
+        session.close()
+
 def get_exam_sessions():
     """Get all unique exam sessions (type + year)"""
     session = Session()
@@ -204,12 +629,34 @@ def get_paper_details(exam_type, exam_year, branch, semester, subject_code):
                 'exam_type': paper.exam_type,
                 'exam_year': paper.exam_year,
                 'file_path': paper.file_path,
+                'content_hash': paper.content_hash,
                 'created_at': paper.created_at
             }
         return None
     finally:
         session.close()
 
+def get_subject_code_rows():
+    """Get (subject_code, branch, semester, subject_name, inferred) of every stored paper, for the subject index"""
+    session = Session()
+    try:
+        results = session.query(
+            PyqFile.subject_code,
+            PyqFile.branch,
+            PyqFile.semester,
+            PyqFile.subject_name,
+            PyqFile.inferred
+        ).all()
+        
+        return [tuple(r) for r in results]
+    finally:
+        session.close()
+
+def _note_subject_codes(rows, replaced=()):
+    """Add freshly inserted or rewritten papers to the in-memory subject index (if one is loaded)"""
+    from subject_index import note_papers
+    note_papers(rows, replaced)
+
 def get_file_by_id(file_id):
     """Get file details by ID"""
     session = Session()
@@ -227,6 +674,7 @@ def get_file_by_id(file_id):
                 'exam_type': file_data.exam_type,
                 'exam_year': file_data.exam_year,
                 'file_path': file_data.file_path,
+                'content_hash': file_data.content_hash,
                 'created_at': file_data.created_at
             }
         return None
@@ -235,7 +683,8 @@ def get_file_by_id(file_id):
 
 # ==================== UPLOAD JOBS FUNCTIONS ====================
 
-def create_upload_job(filename, zip_path, exam_type, exam_year, total_pdfs, zip_url=None, status='UPLOADED'):
+def create_upload_job(filename, zip_path, exam_type, exam_year, total_pdfs, zip_url=None, status='UPLOADED',
+                      remote=False):
     """Create a new upload job record"""
     session = Session()
     try:
@@ -243,6 +692,7 @@ def create_upload_job(filename, zip_path, exam_type, exam_year, total_pdfs, zip_
             filename=filename,
             zip_path=zip_path,
             zip_url=zip_url,
+            remote=remote,
             exam_type=exam_type,
             exam_year=exam_year,
             total_pdfs=total_pdfs,
@@ -270,12 +720,16 @@ def get_upload_job(job_id):
                 'filename': job.filename,
                 'zip_path': job.zip_path,
                 'zip_url': job.zip_url,
+                'remote': bool(job.remote),
                 'extract_path': job.extract_path,
                 'exam_type': job.exam_type,
                 'exam_year': job.exam_year,
                 'total_pdfs': job.total_pdfs,
                 'processed_pdfs': job.processed_pdfs,
                 'status': job.status,
+                'download_bytes': job.download_bytes,
+                'download_total': job.download_total,
+                'archive_hash': job.archive_hash,
                 'created_at': job.created_at,
                 'updated_at': job.updated_at
             }
@@ -283,6 +737,100 @@ def get_upload_job(job_id):
     finally:
         session.close()
 
+def update_job_download(job_id, downloaded, total):
+    """Record how much of a FETCHING job's archive has been downloaded"""
+    session = Session()
+    try:
+        session.query(UploadJob).filter(UploadJob.id == job_id).update({
+            'download_bytes': downloaded,
+            'download_total': total,
+            'updated_at': func.now()
+        }, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def update_job_zip_path(job_id, zip_path):
+    """Update where a job's archive is stored"""
+    session = Session()
+    try:
+        session.query(UploadJob).filter(UploadJob.id == job_id).update({
+            'zip_path': zip_path,
+            'updated_at': func.now()
+        }, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def update_job_archive_hash(job_id, archive_hash):
+    """Record the SHA-256 of a job's fetched archive"""
+    session = Session()
+    try:
+        session.query(UploadJob).filter(UploadJob.id == job_id).update({
+            'archive_hash': archive_hash,
+            'updated_at': func.now()
+        }, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def find_job_by_archive_hash(archive_hash, exam_type, exam_year, exclude_id=None):
+    """
+    Latest job of an exam session that fetched the same archive and
+    didn't fail (it is done, or being worked on)
+    Returns: job dict (see get_upload_job) or None
+    """
+    session = Session()
+    try:
+        query = session.query(UploadJob.id).filter(
+            UploadJob.archive_hash == archive_hash,
+            UploadJob.exam_type == exam_type,
+            UploadJob.exam_year == exam_year,
+            UploadJob.status != 'FAILED'
+        )
+        if exclude_id is not None:
+            query = query.filter(UploadJob.id != exclude_id)
+        row = query.order_by(UploadJob.id.desc()).first()
+    finally:
+        session.close()
+    return get_upload_job(row.id) if row else None
+
+def get_active_archive_paths():
+    """Archive paths of jobs that still need them (not COMPLETED or FAILED)"""
+    session = Session()
+    try:
+        return {
+            path for (path,) in session.query(UploadJob.zip_path).filter(
+                UploadJob.status.notin_(['COMPLETED', 'FAILED'])
+            ) if path
+        }
+    finally:
+        session.close()
+
+def update_job_remote(job_id, remote):
+    """Switch a job between reading its archive remotely and downloading it"""
+    session = Session()
+    try:
+        session.query(UploadJob).filter(UploadJob.id == job_id).update({
+            'remote': remote,
+            'updated_at': func.now()
+        }, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
 def update_job_progress(job_id, processed_pdfs, status='PROCESSING'):
     """Update job progress"""
     session = Session()
@@ -299,6 +847,21 @@ def update_job_progress(job_id, processed_pdfs, status='PROCESSING'):
     finally:
         session.close()
 
+def update_job_status(job_id, status):
+    """Update job status only"""
+    session = Session()
+    try:
+        job = session.query(UploadJob).filter(UploadJob.id == job_id).first()
+        if job:
+            job.status = status
+            job.updated_at = func.now()
+            session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
 def update_job_extract_path(job_id, extract_path):
     """Update job extract path"""
     session = Session()
@@ -325,6 +888,7 @@ def get_all_upload_jobs():
             'filename': job.filename,
             'zip_path': job.zip_path,
             'zip_url': job.zip_url,
+            'remote': bool(job.remote),
             'extract_path': job.extract_path,
             'exam_type': job.exam_type,
             'exam_year': job.exam_year,
@@ -337,6 +901,477 @@ def get_all_upload_jobs():
     finally:
         session.close()
 
+def claim_upload_job(worker_id, lease_seconds, statuses=('FETCHING', 'UPLOADED', 'PROCESSING')):
+    """
+    Lease the oldest runnable job for a background worker
+    A job is runnable when it is in one of statuses and has no live lease
+    (expired leases are taken over, so jobs resume after a restart)
+    Returns: job_id or None
+    """
+    session = Session()
+    try:
+        now = datetime.utcnow()
+        candidates = session.query(UploadJob.id).filter(
+            UploadJob.status.in_(statuses),
+            (UploadJob.lease_expires_at == None) | (UploadJob.lease_expires_at < now)
+        ).order_by(UploadJob.created_at, UploadJob.id).limit(5).all()
+        
+        for (job_id,) in candidates:
+            # Conditional update so two workers can't claim the same job
+            claimed = session.query(UploadJob).filter(
+                UploadJob.id == job_id,
+                (UploadJob.lease_expires_at == None) | (UploadJob.lease_expires_at < now)
+            ).update({
+                'worker_id': worker_id,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds)
+            }, synchronize_session=False)
+            session.commit()
+            if claimed:
+                return job_id
+        return None
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def renew_job_lease(job_id, worker_id, lease_seconds):
+    """Extend a worker's lease on a job. Returns False if the lease was lost"""
+    session = Session()
+    try:
+        renewed = session.query(UploadJob).filter(
+            UploadJob.id == job_id,
+            UploadJob.worker_id == worker_id
+        ).update({
+            'lease_expires_at': datetime.utcnow() + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        session.commit()
+        return bool(renewed)
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def release_upload_job(job_id, worker_id):
+    """Drop a worker's lease on a job"""
+    session = Session()
+    try:
+        session.query(UploadJob).filter(
+            UploadJob.id == job_id,
+            UploadJob.worker_id == worker_id
+        ).update({
+            'worker_id': None,
+            'lease_expires_at': None
+        }, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+# ==================== JOB MANIFEST FUNCTIONS ====================
+
+def _job_member_to_dict(member):
+    """Convert a JobMember row to a dict"""
+    return {
+        'id': member.id,
+        'position': member.position,
+        'member_name': member.member_name,
+        'file_size': member.file_size,
+        'crc': member.crc,
+        'status': member.status,
+        'degree': member.degree,
+        'branch': member.branch,
+        'semester': member.semester,
+        'subject_code': member.subject_code,
+        'subject_name': member.subject_name,
+        'inferred': member.inferred,
+        'change_type': member.change_type,
+        'error': member.error
+    }
+
+def create_job_manifest(job_id, entries):
+    """
+    Write a job's member manifest (once, when the job is created)
+    entries: list of dicts, one per PDF member in archive order, with
+             member_name, file_size, crc, status and parsed metadata
+             (entries already ingested - DONE or SKIPPED, with an optional
+             error - go into the ingest history too)
+    Also sets the job's total_pdfs to the number of accepted members
+    (pending plus already ingested) and processed_pdfs to the ingested ones
+    Returns: number of accepted (PENDING) members
+    """
+    session = Session()
+    try:
+        session.query(JobMember).filter(JobMember.job_id == job_id).delete()
+        members = [
+            JobMember(
+                job_id=job_id,
+                position=position,
+                member_name=entry['member_name'],
+                file_size=entry['file_size'],
+                crc=entry['crc'],
+                status=entry['status'],
+                degree=entry.get('degree'),
+                branch=entry.get('branch'),
+                semester=entry.get('semester'),
+                subject_code=entry.get('subject_code'),
+                subject_name=entry.get('subject_name'),
+                inferred=entry.get('inferred'),
+                change_type=entry.get('change_type'),
+                error=entry.get('error')
+            )
+            for position, entry in enumerate(entries)
+        ]
+        session.add_all(members)
+        ingested = [member for member in members if member.status in ('DONE', 'SKIPPED')]
+        if ingested:
+            session.flush()  # assigns the ids
+            _record_ingest_history(session, job_id, [member.id for member in ingested])
+        accepted = sum(1 for entry in entries if entry['status'] == 'PENDING')
+        job = session.query(UploadJob).filter(UploadJob.id == job_id).first()
+        if job:
+            job.total_pdfs = accepted + len(ingested)
+            job.processed_pdfs = len(ingested)
+            job.updated_at = func.now()
+        session.commit()
+        return accepted
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def claim_pending_members(job_id, limit, owner=None, lease_seconds=MEMBER_LEASE_SECONDS):
+    """
+    Lease the next pending manifest rows of a job, in archive order
+    Claimed rows become CLAIMED by owner until the lease expires (then they
+    are claimable again), so concurrent batch calls get disjoint members.
+    PostgreSQL locks the candidate rows with FOR UPDATE SKIP LOCKED; SQLite
+    claims them in a single UPDATE, which runs under its database write lock
+    Without owner the rows are only read, not claimed
+    Returns: list of member dicts
+    """
+    session = Session()
+    try:
+        now = datetime.utcnow()
+        claimable = select(JobMember.id).where(
+            JobMember.job_id == job_id,
+            (JobMember.status == 'PENDING') |
+            ((JobMember.status == 'CLAIMED') & (JobMember.lease_expires_at < now))
+        ).order_by(JobMember.position).limit(limit)
+        
+        if owner is None:
+            ids = session.execute(claimable).scalars().all()
+        else:
+            lease = {'status': 'CLAIMED', 'claimed_by': owner,
+                     'lease_expires_at': now + timedelta(seconds=lease_seconds)}
+            if engine.dialect.name == 'postgresql':
+                ids = session.execute(claimable.with_for_update(skip_locked=True)).scalars().all()
+                if ids:
+                    session.query(JobMember).filter(JobMember.id.in_(ids)).update(
+                        lease, synchronize_session=False
+                    )
+            else:
+                session.query(JobMember).filter(JobMember.id.in_(claimable)).update(
+                    lease, synchronize_session=False
+                )
+                ids = session.execute(select(JobMember.id).where(
+                    JobMember.job_id == job_id,
+                    JobMember.status == 'CLAIMED',
+                    JobMember.claimed_by == owner
+                )).scalars().all()
+            session.commit()
+        
+        if not ids:
+            return []
+        members = session.query(JobMember).filter(JobMember.id.in_(ids)).order_by(JobMember.position).all()
+        return [_job_member_to_dict(m) for m in members]
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def renew_member_leases(job_id, owner, lease_seconds=MEMBER_LEASE_SECONDS):
+    """Extend the lease on a job's members claimed by owner. Returns how many are still held"""
+    session = Session()
+    try:
+        renewed = session.query(JobMember).filter(
+            JobMember.job_id == job_id,
+            JobMember.status == 'CLAIMED',
+            JobMember.claimed_by == owner
+        ).update({
+            'lease_expires_at': datetime.utcnow() + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        session.commit()
+        return renewed
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def release_job_members(job_id, owner, member_ids=None):
+    """Hand members of a job claimed by owner back (PENDING) without processing them (default: all of them)"""
+    if member_ids is not None and not member_ids:
+        return
+    session = Session()
+    try:
+        query = session.query(JobMember).filter(
+            JobMember.job_id == job_id,
+            JobMember.status == 'CLAIMED',
+            JobMember.claimed_by == owner
+        )
+        if member_ids is not None:
+            query = query.filter(JobMember.id.in_(member_ids))
+        query.update({'status': 'PENDING', 'claimed_by': None, 'lease_expires_at': None},
+                     synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def finish_job_members(job_id, results, owner=None):
+    """
+    Record batch results in the manifest and refresh job progress
+    results: list of (member_id, status, error) tuples; with none, the
+             job's progress is only read
+    owner: claim owner; results for members whose lease was lost to
+           another claim are dropped
+    The job's status only moves forward from UPLOADED / PROCESSING, so a
+    late batch can't revive a job that failed or was cancelled meanwhile
+    Returns: dict with processed, total and status of the job
+    """
+    session = Session()
+    try:
+        recorded = []
+        for member_id, status, error in results:
+            query = session.query(JobMember).filter(JobMember.id == member_id)
+            if owner is not None:
+                query = query.filter(JobMember.claimed_by == owner)
+            if query.update({'status': status, 'error': error, 'claimed_by': None, 'lease_expires_at': None},
+                            synchronize_session=False):
+                recorded.append((member_id, status))
+        
+        # Members whose paper is now stored go into the ingest history
+        ingested_ids = [member_id for member_id, status in recorded if status in ('DONE', 'SKIPPED')]
+        if ingested_ids:
+            _record_ingest_history(session, job_id, ingested_ids)
+        
+        counts = dict(session.query(JobMember.status, func.count(JobMember.id)).filter(
+            JobMember.job_id == job_id
+        ).group_by(JobMember.status).all())
+        pending = counts.get('PENDING', 0) + counts.get('CLAIMED', 0)
+        processed = counts.get('DONE', 0) + counts.get('SKIPPED', 0) + counts.get('FAILED', 0)
+        total = processed + pending
+        
+        job = session.query(UploadJob).filter(UploadJob.id == job_id).first()
+        status = job.status if job else None
+        if job and recorded:
+            job.processed_pdfs = processed
+            job.total_pdfs = total
+            if job.status in ('UPLOADED', 'PROCESSING'):
+                job.status = status = 'COMPLETED' if pending == 0 else 'PROCESSING'
+            job.updated_at = func.now()
+        session.commit()
+        
+        return {'processed': processed, 'total': total, 'status': status}
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+# ==================== INGEST HISTORY FUNCTIONS ====================
+
+def diff_against_history(exam_type, exam_year, entries):
+    """
+    Compare accepted manifest entries with what was already ingested for a session
+    A member is UNCHANGED when name, size and CRC32 all match the history,
+    CHANGED when only the name matches, NEW otherwise. Unchanged members
+    become status UNCHANGED so they are never scheduled
+    Modifies entries in place; returns {'new': N, 'unchanged': M, 'changed': K}
+    """
+    history = get_ingest_history(exam_type, exam_year)
+    summary = {'new': 0, 'unchanged': 0, 'changed': 0}
+    for entry in entries:
+        if entry['status'] != 'PENDING':
+            continue
+        entry['change_type'] = classify_change(history, entry['member_name'], entry['file_size'], entry['crc'])
+        if entry['change_type'] == 'UNCHANGED':
+            entry['status'] = 'UNCHANGED'
+        summary[entry['change_type'].lower()] += 1
+    return summary
+
+def get_ingest_history(exam_type, exam_year):
+    """Get what was already ingested for a session: {member_name: (file_size, crc)}"""
+    session = Session()
+    try:
+        return {
+            row.member_name: (row.file_size, row.crc)
+            for row in session.query(
+                IngestHistory.member_name, IngestHistory.file_size, IngestHistory.crc
+            ).filter(
+                IngestHistory.exam_type == exam_type,
+                IngestHistory.exam_year == exam_year
+            )
+        }
+    finally:
+        session.close()
+
+def classify_change(history, member_name, file_size, crc):
+    """NEW, UNCHANGED or CHANGED for a member against get_ingest_history()"""
+    known = history.get(member_name)
+    if known is None:
+        return 'NEW'
+    return 'UNCHANGED' if known == (file_size, crc) else 'CHANGED'
+
+def _record_ingest_history(session, job_id, member_ids):
+    """Upsert ingest history rows for processed members (caller commits)"""
+    job = session.query(UploadJob).filter(UploadJob.id == job_id).first()
+    if not job:
+        return
+    
+    members = session.query(JobMember).filter(JobMember.id.in_(member_ids)).all()
+    existing = {
+        row.member_name: row
+        for row in session.query(IngestHistory).filter(
+            IngestHistory.exam_type == job.exam_type,
+            IngestHistory.exam_year == job.exam_year,
+            IngestHistory.member_name.in_([m.member_name for m in members])
+        )
+    }
+    for member in members:
+        row = existing.get(member.member_name)
+        if row:
+            row.file_size = member.file_size
+            row.crc = member.crc
+            row.job_id = job_id
+        else:
+            session.add(IngestHistory(
+                exam_type=job.exam_type,
+                exam_year=job.exam_year,
+                member_name=member.member_name,
+                file_size=member.file_size,
+                crc=member.crc,
+                job_id=job_id
+            ))
+
+def get_job_change_summary(job_id):
+    """Get the new / unchanged / changed member counts of a job"""
+    session = Session()
+    try:
+        counts = dict(session.query(JobMember.change_type, func.count(JobMember.id)).filter(
+            JobMember.job_id == job_id,
+            JobMember.change_type != None
+        ).group_by(JobMember.change_type).all())
+        return {
+            'new': counts.get('NEW', 0),
+            'unchanged': counts.get('UNCHANGED', 0),
+            'changed': counts.get('CHANGED', 0)
+        }
+    finally:
+        session.close()
+
+def count_job_members(job_id, status=None):
+    """Count manifest rows of a job, optionally by status"""
+    session = Session()
+    try:
+        query = session.query(JobMember).filter(JobMember.job_id == job_id)
+        if status is not None:
+            query = query.filter(JobMember.status == status)
+        return query.count()
+    finally:
+        session.close()
+
+# ==================== ARCHIVE CACHE FUNCTIONS ====================
+
+def _cached_archive_to_dict(entry):
+    return {
+        'url': entry.url,
+        'etag': entry.etag,
+        'last_modified': entry.last_modified,
+        'sha256': entry.sha256,
+        'size': entry.size,
+        'path': entry.path,
+        'last_used_at': entry.last_used_at
+    }
+
+def get_cached_archive(url):
+    """Get the archive cache entry of a URL, or None"""
+    session = Session()
+    try:
+        entry = session.query(CachedArchive).filter(CachedArchive.url == url).first()
+        return _cached_archive_to_dict(entry) if entry else None
+    finally:
+        session.close()
+
+def save_cached_archive(url, etag, last_modified, sha256, size, path):
+    """Create or replace the archive cache entry of a URL"""
+    session = Session()
+    try:
+        entry = session.query(CachedArchive).filter(CachedArchive.url == url).first()
+        if entry is None:
+            entry = CachedArchive(url=url)
+            session.add(entry)
+        entry.etag = etag
+        entry.last_modified = last_modified
+        entry.sha256 = sha256
+        entry.size = size
+        entry.path = path
+        entry.last_used_at = func.now()
+        session.commit()
+    except IntegrityError:
+        # Cached concurrently by another worker; theirs is as good
+        session.rollback()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def touch_cached_archive(url):
+    """Mark a URL's cached archive as just used (for LRU eviction)"""
+    session = Session()
+    try:
+        session.query(CachedArchive).filter(CachedArchive.url == url).update(
+            {'last_used_at': func.now()}, synchronize_session=False
+        )
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def list_cached_archives():
+    """Get all archive cache entries, least recently used first"""
+    session = Session()
+    try:
+        entries = session.query(CachedArchive).order_by(CachedArchive.last_used_at, CachedArchive.id).all()
+        return [_cached_archive_to_dict(entry) for entry in entries]
+    finally:
+        session.close()
+
+def delete_cached_archives(paths):
+    """Remove the archive cache entries of evicted (or vanished) files"""
+    if not paths:
+        return
+    session = Session()
+    try:
+        session.query(CachedArchive).filter(CachedArchive.path.in_(list(paths))).delete(synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
 if __name__ == '__main__':
     # Initialize database when run directly
     init_database()
@@ -0,0 +1,389 @@
+"""
+Download Pipeline - Ingests a ZIP while it is still downloading
+Every member's local file header comes right before its data, so members
+can be classified and stored as soon as their bytes are on disk, long
+before the central directory at the end of the archive arrives.
+DownloadPipeline follows the partial file as download_zip reports its
+complete prefix: a reader thread walks the local headers, skips rejected
+members and hands accepted ones (still compressed) through a bounded
+queue to storage threads, which inflate, verify, store and insert each
+paper right away. Members the session's ingest history already has
+unchanged are skipped without being read, changed ones replace their old
+paper (as batches do), and once storage pauses uploads the rest is left
+to batches, which wait for it. When the download is done, prepare_work_list reconciles
+the results with the central directory: members stored here with the
+same size and CRC-32 are recorded as done, everything else is left to
+batches as usual. The reader stops at anything it can't follow (a stored
+member with a data descriptor, a download that starts over)
+"""
+import time
+import queue
+import struct
+import threading
+import zipfile
+import zlib
+from archive_reader import MappedMember
+from database import insert_pyq_files_bulk, get_ingest_history, classify_change
+from storage import StoragePaused
+from filename_classifier import get_classifier
+from zip_processor import ZIPProcessor
+from config import BATCH_IO_WORKERS, PIPELINE_QUEUE_SIZE
+
+# Local file header: signature, version, flags, method, time, date, crc,
+# compressed size, size, name length, extra length
+_LOCAL_HEADER = struct.Struct('<4s5HL2L2H')
+_LOCAL_HEADER_SIGNATURE = b'PK\003\004'
+_DESCRIPTOR_SIGNATURE = b'PK\007\010'
+_ZIP64_EXTRA = 0x0001
+_READ_SIZE = 256 * 1024
+
+
+class _Restarted(Exception):
+    """The download started over; bytes already read may be from another version"""
+
+
+class _FollowedFile:
+    """
+    Reads a file that is still being written, in order
+    Reads wait until the bytes they need are inside the complete prefix
+    reported with advance(), or return short once close() says no more is coming
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._available = 0
+        self._position = 0
+        self._pushback = b''
+        self._closed = False
+        self._restarted = False
+        self._condition = threading.Condition()
+
+    def advance(self, length):
+        """
+        The first length bytes are on disk (download_zip's prefix_callback);
+        0 after bytes were reported means the download started over, any
+        other shorter length is a late report and is ignored
+        """
+        with self._condition:
+            if length == 0 and self._available:
+                self._restarted = True
+            elif length <= self._available:
+                return
+            elif self._file is None:
+                # Opened while the partial file exists; the handle survives the rename
+                self._file = open(self.path, 'rb')
+            self._available = length
+            self._condition.notify_all()
+
+    def close(self):
+        """No more bytes are coming; waiting reads return what there is"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _wait(self, size):
+        """Wait for size bytes past the position; returns how many can be read"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._available >= self._position + size or self._closed or self._restarted
+            )
+            if self._restarted:
+                raise _Restarted()
+            return max(0, min(size, self._available - self._position))
+
+    def read(self, size):
+        """Exactly size bytes, or fewer at the end of the download"""
+        data, self._pushback = self._pushback[:size], self._pushback[size:]
+        wanted = size - len(data)
+        if wanted:
+            count = self._wait(wanted)
+            if count:
+                self._file.seek(self._position)
+                data += self._file.read(count)
+                self._position += count
+        return data
+
+    def read_some(self, size):
+        """At least one and up to size bytes (empty at the end of the download)"""
+        if self._pushback:
+            data, self._pushback = self._pushback[:size], self._pushback[size:]
+            return data
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._available > self._position or self._closed or self._restarted
+            )
+            if self._restarted:
+                raise _Restarted()
+            count = max(0, min(size, self._available - self._position))
+        return self.read(count) if count else b''
+
+    def unread(self, data):
+        """Put bytes back in front of the next read"""
+        self._pushback = data + self._pushback
+
+    def skip(self, size):
+        """Skip size bytes; returns False if the download ended first"""
+        buffered = min(size, len(self._pushback))
+        self._pushback = self._pushback[buffered:]
+        size -= buffered
+        count = self._wait(size) if size else 0
+        self._position += count
+        return count == size
+
+
+class _BufferedMember:
+    """One member's compressed bytes, opened the way ZIPProcessor._stream_to_storage opens archives"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def open(self, info, mode='r'):
+        return MappedMember(self._data, info, 0)
+
+
+class DownloadPipeline:
+    """
+    Classifies and stores a job's accepted members while its ZIP downloads
+    Usage: pipeline.start(), pass pipeline.advance to download_zip as
+    prefix_callback, then pipeline.finish() once the download returns
+    (or fails) for the results
+    ingested: results of an earlier, failed attempt at the download; those
+              members aren't stored again unless they failed
+    """
+
+    def __init__(self, job, zip_path, ingested=None, workers=None, queue_size=None):
+        self.job_id = job['id']
+        self.job = job
+        self.processor = ZIPProcessor(zip_path, job['exam_type'], job['exam_year'])
+        self.workers = max(1, workers or BATCH_IO_WORKERS)
+        self.results = dict(ingested or {})  # member name -> {'file_size', 'crc', 'status', 'error'}
+        self.first_paper_seconds = None
+        self.stopped_reason = None
+        self.unchanged = 0
+        self._history = {}
+        self._paused = threading.Event()
+        self._source = _FollowedFile(zip_path + '.part')
+        self._queue = queue.Queue(maxsize=queue_size or PIPELINE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = None
+
+    def start(self):
+        """Start the reader and storage threads"""
+        self._started = time.monotonic()
+        self._history = get_ingest_history(self.job['exam_type'], self.job['exam_year'])
+        self._threads = [threading.Thread(target=self._read, daemon=True)]
+        self._threads += [threading.Thread(target=self._store, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def advance(self, length):
+        """download_zip prefix_callback: the first length bytes of the partial file are complete"""
+        self._source.advance(length)
+
+    def finish(self):
+        """
+        Wait for the members already on disk to be stored
+        Returns: results by member name, for BatchProcessor.prepare_work_list
+        """
+        self._source.close()
+        for thread in self._threads:
+            thread.join()
+        self._source.release()
+        stored = sum(1 for result in self.results.values() if result['status'] == 'DONE')
+        if self.unchanged:
+            print(f"✓ Pipeline skipped {self.unchanged} members unchanged since the last ingest")
+        if self.results:
+            print(f"✓ Pipeline stored {stored} of {len(self.results)} accepted members during the download "
+                  f"(first after {self.first_paper_seconds or 0:.1f}s)")
+        if self.stopped_reason:
+            print(f"⚠️ Pipeline stopped early: {self.stopped_reason}; batches take the rest")
+        return self.results
+
+    def _read(self):
+        """Reader thread: walk local headers and queue accepted members"""
+        try:
+            while not self._paused.is_set():
+                member = self._next_member()
+                if member is None:
+                    break
+                if member[3] is not None:
+                    self._queue.put(member)
+        except _Restarted:
+            self.stopped_reason = 'the download started over'
+        except Exception as e:
+            self.stopped_reason = str(e)
+        finally:
+            for _ in range(self.workers):
+                self._queue.put(None)
+
+    def _next_member(self):
+        """
+        Read the next member from the followed file
+        Returns: (info, compressed bytes or None, descriptor, metadata or None),
+                 or None at the central directory or end of the download
+        """
+        source = self._source
+        header = source.read(_LOCAL_HEADER.size)
+        if len(header) < _LOCAL_HEADER.size or header[:4] != _LOCAL_HEADER_SIGNATURE:
+            return None  # the central directory (or the end of what was downloaded)
+        _, _, flags, method, _, _, crc, compress_size, file_size, name_length, extra_length = \
+            _LOCAL_HEADER.unpack(header)
+        raw_name = source.read(name_length)
+        extra = source.read(extra_length)
+        if len(extra) < extra_length:
+            return None
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+
+        zip64 = False
+        if compress_size == 0xFFFFFFFF or file_size == 0xFFFFFFFF:
+            zip64 = True
+            file_size, compress_size = self._zip64_sizes(extra, file_size, compress_size)
+
+        # Same filter as the manifest (ZIPProcessor._list_pdf_members)
+        metadata = None
+        readable = method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) and not flags & 0x1
+        if readable and not name.endswith('/') and name.lower().endswith('.pdf'):
+            metadata = get_classifier().classify(name)
+
+        descriptor = flags & 0x8
+        if not descriptor:
+            if metadata is not None and self._skip(name, file_size, crc, metadata):
+                metadata = None
+            if metadata is None:
+                return (None, None, False, None) if source.skip(compress_size) else None
+            data = source.read(compress_size)
+            if len(data) < compress_size:
+                return None
+        else:
+            # Sizes and CRC follow the data; only a deflate stream shows where it ends
+            if method != zipfile.ZIP_DEFLATED:
+                raise ValueError(f"can't find the end of {name} (stored with a data descriptor)")
+            data = self._read_deflate_stream(keep=metadata is not None)
+            if data is None:
+                return None
+            crc, compress_size, file_size = self._read_descriptor(zip64)
+            if metadata is not None and self._skip(name, file_size, crc, metadata):
+                metadata = data = None
+
+        info = zipfile.ZipInfo(name)
+        info.flag_bits = flags
+        info.compress_type = method
+        info.CRC = crc
+        info.compress_size = compress_size
+        info.file_size = file_size
+        return info, data, bool(descriptor), metadata
+
+    def _skip(self, name, file_size, crc, metadata):
+        """
+        Whether an accepted member needs no storing: an earlier attempt
+        already stored it, or it is UNCHANGED since the session's last
+        ingest. Sets metadata['change_type']
+        """
+        earlier = self.results.get(name)
+        if earlier and earlier['status'] != 'FAILED' and (earlier['file_size'], earlier['crc']) == (file_size, crc):
+            return True
+        metadata['change_type'] = classify_change(self._history, name, file_size, crc)
+        if metadata['change_type'] == 'UNCHANGED':
+            self.unchanged += 1
+            return True
+        return False
+
+    def _zip64_sizes(self, extra, file_size, compress_size):
+        """Sizes from a local header's ZIP64 extra field"""
+        position = 0
+        while position + 4 <= len(extra):
+            header_id, length = struct.unpack_from('<2H', extra, position)
+            if header_id == _ZIP64_EXTRA:
+                values = list(struct.unpack_from(f'<{length // 8}Q', extra, position + 4))
+                if file_size == 0xFFFFFFFF and values:
+                    file_size = values.pop(0)
+                if compress_size == 0xFFFFFFFF and values:
+                    compress_size = values.pop(0)
+                break
+            position += 4 + length
+        return file_size, compress_size
+
+    def _read_deflate_stream(self, keep):
+        """
+        Consume one raw deflate stream; returns its compressed bytes (b''
+        unless keep), or None if the download ended inside it
+        """
+        inflater = zlib.decompressobj(-15)
+        kept = []
+        while not inflater.eof:
+            chunk = self._source.read_some(_READ_SIZE)
+            if not chunk:
+                return None
+            inflater.decompress(chunk)  # output is checked by MappedMember later
+            used = len(chunk) - len(inflater.unused_data)
+            if keep:
+                kept.append(chunk[:used])
+            if inflater.unused_data:
+                self._source.unread(inflater.unused_data)
+        return b''.join(kept)
+
+    def _read_descriptor(self, zip64):
+        """Read a data descriptor; returns (crc, compressed size, size)"""
+        sizes = struct.Struct('<2Q' if zip64 else '<2L')
+        first = self._source.read(4)
+        if first == _DESCRIPTOR_SIGNATURE:
+            first = self._source.read(4)
+        rest = self._source.read(sizes.size)
+        if len(first) < 4 or len(rest) < sizes.size:
+            raise ValueError('download ended inside a data descriptor')
+        compress_size, file_size = sizes.unpack(rest)
+        return struct.unpack('<L', first)[0], compress_size, file_size
+
+    def _store(self):
+        """Storage thread: inflate, store and insert queued members"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._paused.is_set():
+                continue  # left PENDING for batches
+            info, data, _, parsed = item
+            status, error = self._store_member(info, data, parsed)
+            if status is None:
+                continue
+            with self._lock:
+                self.results[info.filename] = {
+                    'file_size': info.file_size, 'crc': info.CRC, 'status': status, 'error': error
+                }
+                if status == 'DONE' and self.first_paper_seconds is None:
+                    self.first_paper_seconds = time.monotonic() - self._started
+
+    def _store_member(self, info, data, parsed):
+        """
+        Store one member and insert its paper
+        Returns: (status, error) as in the manifest, or (None, None) when
+                 storage is paused (the member stays PENDING)
+        """
+        try:
+            metadata = self.processor._member_metadata({'member_name': info.filename, **parsed})
+            new_path = self.processor._stream_to_storage(_BufferedMember(data), info, metadata)
+            if not new_path:
+                return 'FAILED', 'Failed to store PDF'
+            metadata['file_path'] = new_path
+            # A changed member replaces the paper stored from its old version
+            metadata['replace'] = parsed['change_type'] == 'CHANGED'
+            conflicts = insert_pyq_files_bulk([metadata])['conflicts']
+            if conflicts:
+                return 'SKIPPED', f"Paper {conflicts[0]['reason']}"
+            print(f"✓ Stored while downloading: {info.filename}")
+            return 'DONE', None
+        except StoragePaused as e:
+            with self._lock:
+                if not self._paused.is_set():
+                    self.stopped_reason = f"storage paused for {e.retry_after:.0f}s"
+                    self._paused.set()
+            return None, None
+        except Exception as e:
+            return 'FAILED', str(e)
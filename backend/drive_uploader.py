@@ -1,97 +1,317 @@
+"""
+Drive Uploader - Uploads PDFs to Google Drive
+The Drive client (credentials and the parsed discovery document) is built
+once per process and shared by every uploader; requests go out over one
+authorized connection per thread, since httplib2 connections can't be
+shared between threads (DRIVE_API_ENDPOINT can point at a local stand-in).
+Files up to DRIVE_CHUNK_SIZE are uploaded in a single multipart request,
+larger ones as resumable uploads. upload_many() runs a bulk upload on a
+bounded thread pool, and makes the files public without a request per
+file: either the folder is shared once and its files inherit that
+(DRIVE_PUBLIC_FOLDER), or the permissions go out DRIVE_BATCH_SIZE to a
+batch request once the uploads are done
+"""
 import os
-import io
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import google_auth_httplib2
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from config import GOOGLE_CREDENTIALS_PATH, DRIVE_FOLDER_ID
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload, build_http
+from config import (
+    GOOGLE_CREDENTIALS_PATH, DRIVE_FOLDER_ID, DRIVE_CHUNK_SIZE, DRIVE_API_ENDPOINT, DRIVE_UPLOAD_WORKERS,
+    DRIVE_PUBLIC_FOLDER, DRIVE_BATCH_SIZE, DRIVE_RETRIES, DRIVE_TIMEOUT
+)
+
+SCOPES = ['https://www.googleapis.com/auth/drive']
+PUBLIC = {'type': 'anyone', 'role': 'reader'}
+FILE_FIELDS = 'id, webViewLink, webContentLink'
+GOOGLE_APIS = 'https://www.googleapis.com'
+
+
+def load_credentials():
+    """Service account credentials from GOOGLE_CREDENTIALS (JSON) or GOOGLE_CREDENTIALS_PATH"""
+    creds = None
+
+    # Try to load from environment variable first (for Railway)
+    creds_json = os.environ.get('GOOGLE_CREDENTIALS')
+
+    if creds_json:
+        # Load from environment variable
+        try:
+            print("Loading credentials from GOOGLE_CREDENTIALS environment variable...")
+            creds_dict = json.loads(creds_json)
+            print(f"Credentials loaded. Service account: {creds_dict.get('client_email', 'unknown')}")
+            creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+            print("✓ Credentials authenticated successfully")
+        except json.JSONDecodeError as e:
+            print(f"ERROR: Failed to parse GOOGLE_CREDENTIALS JSON: {e}")
+            print("Make sure the environment variable contains valid JSON")
+        except Exception as e:
+            print(f"ERROR loading credentials from environment: {e}")
+    elif os.path.exists(GOOGLE_CREDENTIALS_PATH):
+        # Fall back to file (for local development)
+        print(f"Loading credentials from file: {GOOGLE_CREDENTIALS_PATH}")
+        creds = service_account.Credentials.from_service_account_file(GOOGLE_CREDENTIALS_PATH, scopes=SCOPES)
+        print("✓ Credentials loaded from file")
+
+    if not creds:
+        error_msg = "Google credentials not found! Set GOOGLE_CREDENTIALS environment variable or provide google-credentials.json file."
+        print(f"CRITICAL ERROR: {error_msg}")
+        raise Exception(error_msg)
+    return creds
+
+
+# Drive clients shared by every uploader: (credentials, endpoint) -> (credentials, service)
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_drive_client(credentials=None, endpoint=None):
+    """
+    Get the process-wide Drive client for credentials and endpoint
+    (credentials=None: the service account, see load_credentials)
+    Returns: (credentials, service)
+    """
+    endpoint = (endpoint or DRIVE_API_ENDPOINT).rstrip('/')
+    with _clients_lock:
+        key = (credentials, endpoint)
+        if key not in _clients:
+            creds = credentials or load_credentials()
+            if endpoint == GOOGLE_APIS:
+                service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+            else:
+                # Media uploads and batches go to the document's rootUrl, not the API endpoint
+                document = json.loads(get_static_doc('drive', 'v3'))
+                document['rootUrl'] = document['mtlsRootUrl'] = f"{endpoint}/"
+                service = build_from_document(document, credentials=creds)
+            _clients[key] = (creds, service)
+            print("✓ Google Drive service initialized")
+        return _clients[key]
+
+
+# Folders already shared with 'anyone with the link' by this process
+_public_folders = set()
+
 
 class DriveUploader:
     """Handles file uploads to Google Drive"""
-    
-    SCOPES = ['https://www.googleapis.com/auth/drive']
-    
-    def __init__(self):
-        self.creds = None
-        
-        # Try to load from environment variable first (for Railway)
-        import json
-        creds_json = os.environ.get('GOOGLE_CREDENTIALS')
-        
-        if creds_json:
-            # Load from environment variable
-            try:
-                print("Loading credentials from GOOGLE_CREDENTIALS environment variable...")
-                creds_dict = json.loads(creds_json)
-                print(f"Credentials loaded. Service account: {creds_dict.get('client_email', 'unknown')}")
-                self.creds = service_account.Credentials.from_service_account_info(
-                    creds_dict, scopes=self.SCOPES)
-                print("✓ Credentials authenticated successfully")
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Failed to parse GOOGLE_CREDENTIALS JSON: {e}")
-                print("Make sure the environment variable contains valid JSON")
-            except Exception as e:
-                print(f"ERROR loading credentials from environment: {e}")
-        elif os.path.exists(GOOGLE_CREDENTIALS_PATH):
-            # Fall back to file (for local development)
-            print(f"Loading credentials from file: {GOOGLE_CREDENTIALS_PATH}")
-            self.creds = service_account.Credentials.from_service_account_file(
-                GOOGLE_CREDENTIALS_PATH, scopes=self.SCOPES)
-            print("✓ Credentials loaded from file")
-        
-        if not self.creds:
-            error_msg = "Google credentials not found! Set GOOGLE_CREDENTIALS environment variable or provide google-credentials.json file."
-            print(f"CRITICAL ERROR: {error_msg}")
-            raise Exception(error_msg)
-            
-        self.service = build('drive', 'v3', credentials=self.creds)
-        print("✓ Google Drive service initialized")
-        
+
+    SCOPES = SCOPES
+
+    def __init__(self, credentials=None, endpoint=None, folder_id=None, workers=None, public_folder=None):
+        self.creds, self.service = get_drive_client(credentials, endpoint)
+        self.folder_id = folder_id or DRIVE_FOLDER_ID
+        self.workers = max(1, workers or DRIVE_UPLOAD_WORKERS)
+        self.public_folder = DRIVE_PUBLIC_FOLDER if public_folder is None else public_folder
+        self._local = threading.local()
+
+    def _http(self):
+        """This thread's authorized connection"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            # build_http() keeps 308 (resumable upload progress) from being followed as a redirect
+            connection = build_http()
+            connection.timeout = DRIVE_TIMEOUT
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=connection)
+            self._local.http = http
+        return http
+
     def upload_file(self, file_path, filename, folder_id=None):
         """
         Upload a file to Google Drive
         Returns: webViewLink (view) and webContentLink (download)
         """
-        if not folder_id:
-            folder_id = DRIVE_FOLDER_ID
-            
-        file_metadata = {
-            'name': filename,
-            'parents': [folder_id]
-        }
-        
-        media = MediaIoBaseUpload(
-            io.FileIO(file_path, 'rb'), 
-            mimetype='application/pdf',
-            resumable=True
-        )
-        
-        file = self.service.files().create(
-            body=file_metadata,
+        with open(file_path, 'rb') as source:
+            return self.upload_stream(source, filename, folder_id)
+
+    def upload_stream(self, source, filename, folder_id=None):
+        """
+        Upload a seekable stream and make it public
+        Returns: same as upload_file
+        """
+        folder_id = folder_id or self.folder_id
+        if self.public_folder:
+            self.share_folder(folder_id)
+            return self._create(source, filename, folder_id)
+        result = self._create(source, filename, folder_id)
+        # Make file public (optional, but good for easy access without auth issues for students)
+        self._make_file_public(result['file_id'])
+        return result
+
+    def upload_many(self, files, progress_callback=None, folder_id=None):
+        """
+        Upload many files on the worker pool, then make them public
+        files: iterable of (file_path, filename)
+        progress_callback(done, total) is called as files finish uploading
+        Returns: one result per file, in order: {'filename', 'status' ('DONE'
+                 or 'FAILED'), 'file_id', 'view_link', 'download_link',
+                 'public', 'error'}
+        """
+        files = list(files)
+        folder_id = folder_id or self.folder_id
+        results = [None] * len(files)
+        done = [0]
+        lock = threading.Lock()
+        if files and self.public_folder:
+            self.share_folder(folder_id)
+
+        def run(index):
+            file_path, filename = files[index]
+            result = {'filename': filename, 'status': 'DONE', 'public': self.public_folder, 'error': None}
+            try:
+                with open(file_path, 'rb') as source:
+                    result.update(self._create(source, filename, folder_id))
+            except Exception as e:
+                result.update(status='FAILED', error=str(e))
+            results[index] = result
+            if progress_callback:
+                with lock:
+                    done[0] += 1
+                    progress_callback(done[0], len(files))
+
+        if files:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(files))) as pool:
+                list(pool.map(run, range(len(files))))
+
+        if not self.public_folder:
+            uploaded = [result for result in results if result['status'] == 'DONE']
+            failed = self.make_public([result['file_id'] for result in uploaded])
+            for result in uploaded:
+                result['public'] = result['file_id'] not in failed
+
+        uploaded = sum(1 for result in results if result['status'] == 'DONE')
+        private = sum(1 for result in results if result['status'] == 'DONE' and not result['public'])
+        print(f"✓ Drive bulk upload: {uploaded} uploaded, {len(files) - uploaded} failed"
+              + (f", ⚠️ {private} not made public" if private else ""))
+        return results
+
+    def _create(self, source, filename, folder_id):
+        """Create a file from a seekable stream: one request, or a resumable upload if it's large"""
+        source.seek(0, os.SEEK_END)
+        resumable = source.tell() > DRIVE_CHUNK_SIZE
+        source.seek(0)
+        media = MediaIoBaseUpload(source, mimetype='application/pdf', chunksize=DRIVE_CHUNK_SIZE, resumable=resumable)
+        request = self.service.files().create(
+            body={'name': filename, 'parents': [folder_id]},
             media_body=media,
-            fields='id, webViewLink, webContentLink',
+            fields=FILE_FIELDS,
             supportsAllDrives=True
-        ).execute()
-        
-        # Make file public (optional, but good for easy access without auth issues for students)
-        self._make_file_public(file.get('id'))
-        
+        )
+        if resumable:
+            file = None
+            while file is None:
+                _, file = request.next_chunk(http=self._http(), num_retries=DRIVE_RETRIES)
+        else:
+            file = request.execute(http=self._http(), num_retries=DRIVE_RETRIES)
         return {
             'file_id': file.get('id'),
             'view_link': file.get('webViewLink'),
             'download_link': file.get('webContentLink')
         }
-    
+
+    def share_folder(self, folder_id=None):
+        """Share the folder with anyone with the link (once per process); its files inherit it"""
+        folder_id = folder_id or self.folder_id
+        if folder_id in _public_folders:
+            return
+        self.service.permissions().create(
+            fileId=folder_id, body=PUBLIC, fields='id', supportsAllDrives=True
+        ).execute(http=self._http(), num_retries=DRIVE_RETRIES)
+        _public_folders.add(folder_id)
+        print(f"✓ Drive folder {folder_id} shared: files in it are public")
+
+    def make_public(self, file_ids):
+        """
+        Make files publicly readable, DRIVE_BATCH_SIZE permission requests
+        per batch request; requests refused for rate limits or server errors
+        are sent again in the next round, up to DRIVE_RETRIES times
+        Returns: set of the file ids that couldn't be made public
+        """
+        pending = list(file_ids)
+        failed = set()
+        for attempt in range(DRIVE_RETRIES + 1):
+            retry = []
+
+            def callback(file_id, response, exception):
+                if exception is None:
+                    return
+                status = exception.resp.status if isinstance(exception, HttpError) else None
+                if status in (403, 429) or (status or 0) >= 500:
+                    retry.append(file_id)
+                else:
+                    failed.add(file_id)
+
+            for start in range(0, len(pending), DRIVE_BATCH_SIZE):
+                batch = self.service.new_batch_http_request(callback=callback)
+                for file_id in pending[start:start + DRIVE_BATCH_SIZE]:
+                    batch.add(self.service.permissions().create(
+                        fileId=file_id, body=PUBLIC, fields='id', supportsAllDrives=True
+                    ), request_id=file_id)
+                try:
+                    batch.execute(http=self._http())
+                except Exception as e:
+                    print(f"Error making files public: {e}")
+                    retry.extend(pending[start:start + DRIVE_BATCH_SIZE])
+            if not retry:
+                break
+            pending = retry
+            if attempt < DRIVE_RETRIES:
+                time.sleep(random.uniform(0, 2 ** attempt))
+        else:
+            failed.update(pending)
+        return failed
+
+    def find_file(self, filename, folder_id=None):
+        """
+        Look up a file by name in the folder
+        Returns: {'file_id', 'size', 'view_link', 'download_link'} or None
+        """
+        folder_id = folder_id or self.folder_id
+        escaped = filename.replace("\\", "\\\\").replace("'", "\\'")
+        result = self.service.files().list(
+            q=f"name = '{escaped}' and '{folder_id}' in parents and trashed = false",
+            fields='files(id, size, webViewLink, webContentLink)',
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            pageSize=1
+        ).execute(http=self._http(), num_retries=DRIVE_RETRIES)
+        files = result.get('files', [])
+        if not files:
+            return None
+        return {
+            'file_id': files[0]['id'],
+            'size': int(files[0].get('size', 0)),
+            'view_link': files[0].get('webViewLink'),
+            'download_link': files[0].get('webContentLink')
+        }
+
+    def download_to(self, file_id, target):
+        """Download a file's content into a writable stream, DRIVE_CHUNK_SIZE at a time"""
+        request = self.service.files().get_media(fileId=file_id, supportsAllDrives=True)
+        request.http = self._http()
+        downloader = MediaIoBaseDownload(target, request, chunksize=DRIVE_CHUNK_SIZE)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk(num_retries=DRIVE_RETRIES)
+
+    def delete_file(self, file_id):
+        """Delete a file"""
+        self.service.files().delete(fileId=file_id, supportsAllDrives=True).execute(
+            http=self._http(), num_retries=DRIVE_RETRIES)
+
     def _make_file_public(self, file_id):
         """Make the file publicly readable"""
         try:
-            permission = {
-                'type': 'anyone',
-                'role': 'reader',
-            }
             self.service.permissions().create(
                 fileId=file_id,
-                body=permission,
+                body=PUBLIC,
                 fields='id',
-            ).execute()
+                supportsAllDrives=True
+            ).execute(http=self._http(), num_retries=DRIVE_RETRIES)
         except Exception as e:
             print(f"Error making file public: {e}")
@@ -0,0 +1,401 @@
+"""
+Filename classification engine
+Resolves degree, semester, subject code, branch and subject name of a
+university PDF filename (see ZIPProcessor._parse_filename for the format).
+
+All patterns are compiled once per process. Each filename is lower-cased
+once and matched case-sensitively: IGNORECASE searches are several times
+slower, and for ASCII names they find the same matches. Patterns start
+with a literal so the regex engine can skip ahead to it, and the branch
+rules are one combined pattern scanned once per name. Results are
+identical to running every pattern over the original name (names with
+non-ASCII characters, whose case folding str.lower() does not mirror, run
+the original case-insensitive patterns)
+
+A branch or subject name the filename doesn't state is filled in from the
+subject index (subject_index.py) when it knows the code, else guessed
+(branch from the code, a generic name). Results say which fields were
+filled in and how ('inferred', see parse_inferred); a stated field always
+wins over the index
+"""
+import os
+import re
+import string
+from config import SEMESTER_MAPPING, SUBJECT_INDEX_ENABLED
+from subject_prefixes import get_prefix_registry
+
+# Branch rules in priority order (ties go to the earlier rule), written
+# for the lower-cased name: (branch, pattern)
+BRANCH_RULES = [
+    ('CSE', r'computer\s+science\s+(?:and\s+)?engineering'),
+    ('CSE', r'\bcomputer\s+science\b'),
+    ('CSE', r'\bcse\b'),
+    ('CSE', r'\bcs\b'),
+    ('IT', r'information\s+technology'),
+    ('IT', r'\bit\b'),
+    ('IT', r'\bi\.t\b'),
+    ('ME', r'mechanical\s+engineering'),
+    # Mechanical but not in "Mechanical Engineering (Model Curriculum)"
+    ('ME', r'\bmechanical\b(?!\s*engineering\s*\(model)'),
+    # ME but not ME-401 (subject code)
+    ('ME', r'\bme\b(?!\s*-)'),
+    ('CE', r'civil\s+engineering'),
+    ('CE', r'\bcivil\b'),
+    # CE but not CE-304 or CE701
+    ('CE', r'\bce\b(?![\d-])'),
+    ('EE', r'electrical\s+(?:electronics\s+and\s+power\s+)?engineering'),
+    ('EE', r'electrical\s+engineering'),
+    ('EE', r'\belectrical\b'),
+    ('EE', r'\bee\b'),
+    ('EE', r'electronics\s+and\s+power'),
+    ('ECE', r'electronics\s+and\s+(?:communication|telecommunication)'),
+    ('ECE', r'telecommunication\s+engineering'),
+    ('ECE', r'\belectronics\b(?!\s+and\s+power)'),
+    ('ECE', r'\bece\b'),
+    ('ECE', r'instrumentation\s+engineering'),
+]
+
+_BTECH = re.compile(r'\bB\.Tech\b', re.IGNORECASE)
+_BE = re.compile(r'\bB\.E\.?\b', re.IGNORECASE)
+_MODEL = re.compile(r'Model\s+Curriculum', re.IGNORECASE)
+_OTHER_DEGREE = re.compile(r'\b(B\.Sc|B\.Com|BCA|B\.C\.A|B\.Pharm|M\.Tech|M\.Sc|M\.Pharm|M\.C\.A)', re.IGNORECASE)
+_SEMESTER = re.compile(r'Semester[- ]?(I{1,3}|IV|V|VI{1,2}|VIII?)\b', re.IGNORECASE)
+# Patterns: BSC101, ESC-201, PCC-CE304, STBSC101, SE1BECS, SE2BICS, etc.
+# (\b[A-Z] written as [A-Z](?<!\w.) so the engine can skip ahead to capitals)
+_CODE = re.compile(r'([A-Z](?<!\w.)[A-Z]{1,5}[-]?[A-Z0-9]{1,8})\b')
+_ENGINEERING = re.compile(r'\bEngineering\b', re.IGNORECASE)
+_SEMESTER_WORD = re.compile(r'\bSemester\b', re.IGNORECASE)
+_PAPER_NUMBER = re.compile(r'\bPaper[-\s]?[IVX]+\b', re.IGNORECASE)
+_NAME_SEPARATORS = str.maketrans('_-', '  ')
+# Names given to papers whose filename has no (usable) subject name
+DEFAULT_SUBJECT_NAMES = ("Unknown Subject", "Engineering Subject")
+
+# The same patterns for lower-cased ASCII names
+_MODEL_LOWER = re.compile(r'model\s+curriculum')
+_OTHER_DEGREE_LOWER = re.compile(r'b(?<!\w.)(?:ca|\.(?:sc|com|c\.a|pharm))|m(?<!\w.)\.(?:tech|sc|pharm|c\.a)')
+_SEMESTER_LOWER = re.compile(r'semester[- ]?(i{1,3}|iv|v|vi{1,2}|viii?)\b')
+_PAPER_NUMBER_LOWER = re.compile(r'p(?<!\w.)aper[-\s]?[ivx]+\b')
+
+_WORD_CHARS = frozenset(string.ascii_lowercase + string.digits + '_')
+
+
+def parse_inferred(inferred):
+    """
+    Fields a result didn't take from the filename, as stored in 'inferred'
+    ("branch:index,subject_name:default" -> {'branch': 'index', ...});
+    sources: index (subject index), code (branch guessed from the subject
+    code), default (generic subject name)
+    """
+    return dict(item.split(':', 1) for item in inferred.split(',')) if inferred else {}
+
+
+def _find_word(text, word, start=0):
+    """
+    Position of the first `word` in text[start:] with a word boundary on
+    both sides (regex \bword\b on that slice, ASCII only), or -1
+    """
+    end = len(word)
+    i = text.find(word, start)
+    while i != -1:
+        if (i == start or text[i - 1] not in _WORD_CHARS) and \
+                (i + end == len(text) or text[i + end] not in _WORD_CHARS):
+            return i
+        i = text.find(word, i + 1)
+    return -1
+
+
+def _rule_parts(pattern):
+    """
+    Split a branch rule into the literal letters every match starts with
+    and the rest of the pattern (a leading \\b is checked as a lookbehind
+    once the letters have matched)
+    """
+    word_start = pattern.startswith(r'\b')
+    body = pattern[2:] if word_start else pattern
+    lead = re.match(r'[a-z]*', body).group()
+    rest = body[len(lead):]
+    if word_start:
+        rest = rf'(?<!\w.{{{len(lead)}}}){rest}'
+    return lead, rest
+
+
+def _branch_scan(rules):
+    """
+    One pattern for every branch rule: their literal leads merged into a
+    trie, so the engine skips to letters that start a lead and compares a
+    letter per step from there. Only the first letter is consumed (the
+    rest is a lookahead), keeping matches that start inside it in view.
+    The empty group r<i> is set when rule i is the one that matched
+    """
+    trie = {}
+    for i, (_, pattern) in enumerate(rules):
+        lead, rest = _rule_parts(pattern)
+        node = trie
+        for char in lead:
+            node = node.setdefault(char, {})
+        node.setdefault('', []).append(rf'{rest}(?P<r{i}>)')
+
+    def render(node):
+        alternatives = node.get('', []) + [
+            re.escape(char) + render(child) for char, child in node.items() if char
+        ]
+        return alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+
+    return re.compile('|'.join(f'{char}(?={render(child)})' for char, child in trie.items()))
+
+
+class FilenameClassifier:
+    """Precompiled classifier; build once (see get_classifier) and reuse"""
+
+    def __init__(self, subject_index=None):
+        self.branches = [branch for branch, _ in BRANCH_RULES]
+        self.branch_rules = [re.compile(pattern) for _, pattern in BRANCH_RULES]
+        self.branch_scan = _branch_scan(BRANCH_RULES)
+        self.branch_scan_rules = {group: int(name[1:]) for name, group in self.branch_scan.groupindex.items()}
+        # Other rules that can match where a rule does (one's lead starts the other's)
+        leads = [_rule_parts(pattern)[0] for _, pattern in BRANCH_RULES]
+        self.branch_siblings = [
+            [j for j, other in enumerate(leads) if j != i and (other.startswith(lead) or lead.startswith(other))]
+            for i, lead in enumerate(leads)
+        ]
+        # Case-insensitive originals for non-ASCII names
+        self.unicode_branch_rules = [
+            (branch, re.compile(pattern, re.IGNORECASE)) for branch, pattern in BRANCH_RULES
+        ]
+        self._name_patterns = {}
+        self._lower_name_patterns = {}
+        # Valid subject code prefixes (BSC, ESC, PCC, HSMC, ST, SE, TEE, BE, etc.)
+        self.prefixes = get_prefix_registry()
+        # Known subject codes (None: always use the patterns)
+        self.subject_index = subject_index
+
+    def classify_many(self, names):
+        """Classify many filenames, in order"""
+        classify = self.classify
+        return [classify(name) for name in names]
+
+    def classify(self, pdf_path):
+        """
+        Classify one filename
+        Returns: dict with degree, branch, semester, subject_code and
+                 subject_name, or None if it isn't a B.E./B.Tech paper
+        """
+        # Member names rarely have a folder to strip
+        filename = os.path.basename(pdf_path) if '/' in pdf_path or os.sep in pdf_path else pdf_path
+        if not filename.isascii():
+            return self._classify_unicode(filename)
+        lower = filename.lower()
+
+        # Degree: B.Tech or B.E ONLY (reject B.Sc, B.Com, BCA, B.Pharm, M.Tech, M.Sc, etc.)
+        # \bB\.E\.?\b is "b.e" followed by a non-word character
+        has_btech = 'b.tech' in lower and _find_word(lower, 'b.tech') != -1
+        has_be = 'b.e' in lower and _find_word(lower, 'b.e') != -1
+        if not (has_btech or has_be):
+            if 'curriculum' not in lower or not _MODEL_LOWER.search(lower):
+                return None
+            # Model Curriculum alone doesn't count if another degree is named
+            if _OTHER_DEGREE_LOWER.search(lower):
+                return None
+        degree = 'B.Tech' if has_btech or not has_be else 'B.E'
+
+        # Semester ("Semester-I", "Semester-III", "Semester I", etc.)
+        semester_match = _SEMESTER_LOWER.search(lower)
+        if not semester_match:
+            return None
+        semester = SEMESTER_MAPPING.get(semester_match.group(1).upper())
+        if not semester:
+            return None
+
+        subject_code = self._subject_code(filename)
+        if not subject_code:
+            return None
+        return self._result(degree, semester, subject_code,
+                            self._branch(lower), self._lower_subject_name(lower, subject_code))
+
+    def _branch(self, lower):
+        """
+        Branch rule whose first match is closest before the next
+        "Engineering" (else "Semester"); None if no rule matches
+        """
+        rules = self.branch_rules
+        siblings = self.branch_siblings
+        seen = set()
+        best_rule = None
+        best_distance = len(lower)
+        search = self.branch_scan.search
+        match = search(lower)
+        while match:
+            match_pos = match.start()
+            matched = self.branch_scan_rules[match.lastindex]
+            # Only a rule's first match counts; rules the scan didn't report
+            # may match here too, and be at their first match
+            rule = None if matched in seen else matched
+            seen.add(matched)
+            for other in siblings[matched]:
+                if other not in seen and rules[other].match(lower, match_pos):
+                    seen.add(other)
+                    if rule is None or other < rule:
+                        rule = other
+            match = search(lower, match_pos + 1)
+            if rule is None:
+                continue
+
+            # Distance from the match to the next "Engineering", else "Semester"
+            keyword_pos = _find_word(lower, 'engineering', match_pos)
+            if keyword_pos == -1:
+                keyword_pos = _find_word(lower, 'semester', match_pos)
+            distance = keyword_pos - match_pos if keyword_pos != -1 else match_pos
+            if distance < best_distance or distance == best_distance and rule < best_rule:
+                best_distance = distance
+                best_rule = rule
+        return self.branches[best_rule] if best_rule is not None else None
+
+    def _classify_unicode(self, filename):
+        """
+        Same rules for names with non-ASCII characters, where regex case
+        folding and \\w differ from str.lower() and the ASCII word set, so
+        every pattern runs case-insensitively on the original name
+        """
+        has_btech = _BTECH.search(filename)
+        has_be = _BE.search(filename)
+        if not (has_btech or has_be):
+            if not _MODEL.search(filename) or _OTHER_DEGREE.search(filename):
+                return None
+        degree = 'B.Tech' if has_btech or not has_be else 'B.E'
+
+        semester_match = _SEMESTER.search(filename)
+        if not semester_match:
+            return None
+        semester = SEMESTER_MAPPING.get(semester_match.group(1).upper())
+        if not semester:
+            return None
+
+        subject_code = self._subject_code(filename)
+        if not subject_code:
+            return None
+
+        branch = None
+        best_position = len(filename)
+        for br, pattern in self.unicode_branch_rules:
+            match = pattern.search(filename)
+            if match:
+                context = filename[match.start():]
+                keyword = _ENGINEERING.search(context) or _SEMESTER_WORD.search(context)
+                distance = keyword.start() if keyword else match.start()
+                if distance < best_position:
+                    best_position = distance
+                    branch = br
+
+        return self._result(degree, semester, subject_code, branch, self._subject_name(filename, subject_code))
+
+    def _subject_code(self, filename):
+        """First code-shaped token with a valid prefix, or None"""
+        match_prefix = self.prefixes.longest_match
+        for match in _CODE.finditer(filename):
+            code = match.group(1)
+            if match_prefix(code):
+                return code.upper()
+        return None
+
+    def _result(self, degree, semester, subject_code, branch, subject_name):
+        """
+        Result dict; a branch the filename didn't state (None) or a default
+        subject name comes from the subject index if it knows, else from
+        the fallbacks
+        """
+        inferred = []
+        named = subject_name not in DEFAULT_SUBJECT_NAMES
+        if branch is None or not named:
+            known = None
+            if self.subject_index is not None:
+                known = self.subject_index.lookup(subject_code, semester)
+            known_branch, known_name = known or (None, None)
+            if branch is None:
+                branch = known_branch or self._branch_from_code(subject_code)
+                inferred.append('branch:index' if known_branch else 'branch:code')
+            if not named:
+                subject_name = known_name or subject_name
+                inferred.append('subject_name:index' if known_name else 'subject_name:default')
+        return {
+            'degree': degree,
+            'branch': branch,
+            'semester': semester,
+            'subject_code': subject_code,
+            'subject_name': subject_name,
+            'inferred': ','.join(inferred)
+        }
+
+    def _branch_from_code(self, subject_code):
+        """Infer the branch from the subject code when the name has none"""
+        if 'CS' in subject_code or 'IT' in subject_code:
+            return 'CSE'
+        if 'ME' in subject_code or 'MED' in subject_code:
+            return 'ME'
+        if 'CE' in subject_code or 'CIV' in subject_code:
+            return 'CE'
+        if 'EE' in subject_code or 'EL' in subject_code or 'EP' in subject_code:
+            return 'EE'
+        if 'EC' in subject_code or 'ET' in subject_code or 'IN' in subject_code:
+            return 'ECE'
+        # Default to CSE if we can't determine
+        return 'CSE'
+
+    def _subject_name(self, filename, subject_code):
+        """Subject name: what follows "Subject - CODE -" (or "CODE -") up to .pdf"""
+        patterns = self._name_patterns.get(subject_code)
+        if patterns is None:
+            code = re.escape(subject_code)
+            patterns = self._name_patterns[subject_code] = (
+                re.compile(rf'Subject\s*-\s*{code}\s*-\s*(.+?)\.pdf', re.IGNORECASE),
+                re.compile(rf'{code}\s*-\s*(.+?)\.pdf', re.IGNORECASE)
+            )
+        name_match = patterns[0].search(filename) or patterns[1].search(filename)
+        subject_name = name_match.group(1) if name_match else "Unknown Subject"
+
+        # Clean up: separators to spaces, drop "Paper-I"/"Paper-II", collapse whitespace
+        subject_name = ' '.join(subject_name.translate(_NAME_SEPARATORS).split())
+        if 'paper' in subject_name.lower():
+            subject_name = ' '.join(_PAPER_NUMBER.sub('', subject_name).split())
+        return self._finish_name(subject_name)
+
+    def _lower_subject_name(self, lower, subject_code):
+        """_subject_name() of a lower-cased ASCII name (title() restores the case)"""
+        patterns = self._lower_name_patterns.get(subject_code)
+        if patterns is None:
+            code = re.escape(subject_code.lower())
+            patterns = self._lower_name_patterns[subject_code] = (
+                re.compile(rf'subject\s*-\s*{code}\s*-\s*(.+?)\.pdf'),
+                re.compile(rf'{code}\s*-\s*(.+?)\.pdf')
+            )
+        name_match = '.pdf' in lower and (patterns[0].search(lower) or patterns[1].search(lower))
+        subject_name = name_match.group(1) if name_match else "unknown subject"
+
+        subject_name = ' '.join(subject_name.translate(_NAME_SEPARATORS).split())
+        if 'paper' in subject_name:
+            subject_name = ' '.join(_PAPER_NUMBER_LOWER.sub('', subject_name).split())
+        return self._finish_name(subject_name)
+
+    @staticmethod
+    def _finish_name(subject_name):
+        if subject_name and len(subject_name) > 3:
+            return subject_name.title()
+        return "Engineering Subject"
+
+
+# Process-wide classifier (compiled on first use)
+_classifier = None
+
+def get_classifier():
+    """Get the process-wide FilenameClassifier (filling gaps from the subject index if SUBJECT_INDEX_ENABLED)"""
+    global _classifier
+    if _classifier is None:
+        subject_index = None
+        if SUBJECT_INDEX_ENABLED:
+            from subject_index import get_subject_index
+            subject_index = get_subject_index()
+        _classifier = FilenameClassifier(subject_index)
+    return _classifier
+
+def classify_many(names):
+    """Classify many filenames with the process-wide classifier (picklable for process pools)"""
+    return get_classifier().classify_many(names)
@@ -0,0 +1,155 @@
+"""
+Ingest Worker - Processes upload jobs server-side in background threads
+Jobs move forward without an admin keeping the dashboard open; progress
+lives in the database so a restarted server resumes where it stopped
+"""
+import os
+import socket
+import threading
+import uuid
+from database import claim_upload_job, renew_job_lease, release_upload_job, update_job_status
+from background_task import Heartbeat
+from config import (
+    INGEST_WORKER_CONCURRENCY, INGEST_WORKER_BATCH_SIZE,
+    INGEST_WORKER_POLL_SECONDS, JOB_LEASE_SECONDS
+)
+
+class IngestWorker:
+    """Pool of threads that lease runnable jobs and process them batch by batch"""
+    
+    def __init__(self, concurrency=INGEST_WORKER_CONCURRENCY, batch_size=INGEST_WORKER_BATCH_SIZE,
+                 poll_seconds=INGEST_WORKER_POLL_SECONDS, lease_seconds=JOB_LEASE_SECONDS):
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.active_jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+    
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        if self._threads:
+            return
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        print(f"✓ Ingest worker {self.worker_id} started ({self.concurrency} threads)")
+    
+    def stop(self, timeout=None):
+        """Ask the worker threads to stop after their current batch"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def status(self):
+        """Snapshot of what the worker is doing"""
+        with self._lock:
+            active = dict(self.active_jobs)
+        return {
+            'worker_id': self.worker_id,
+            'running': bool(self._threads) and not self._stop.is_set(),
+            'concurrency': self.concurrency,
+            'active_jobs': active
+        }
+    
+    def _run(self):
+        """Thread loop: lease a job, drain it, repeat"""
+        while not self._stop.is_set():
+            try:
+                job_id = claim_upload_job(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"⚠️ Ingest worker could not claim a job: {e}")
+                job_id = None
+            
+            if job_id is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+            
+            try:
+                self.process_job(job_id)
+            except Exception as e:
+                print(f"❌ Ingest worker failed on job {job_id}: {e}")
+                # Back off so a broken job isn't retried in a tight loop
+                self._stop.wait(self.poll_seconds)
+            finally:
+                with self._lock:
+                    self.active_jobs.pop(job_id, None)
+                try:
+                    release_upload_job(job_id, self.worker_id)
+                except Exception as e:
+                    print(f"⚠️ Could not release job {job_id}: {e}")
+    
+    def process_job(self, job_id):
+        """
+        Process a leased job until it completes, fails or the lease is lost
+        A FETCHING job's archive is downloaded (resumed) first. The lease is
+        renewed every third of its length while batches run, so a slow batch
+        can't outlive it
+        """
+        from batch_processor import BatchProcessor, ArchiveNotReady
+        from zip_fetcher import fetch_job_zip
+        
+        # One BatchProcessor per job, not per batch
+        try:
+            processor = BatchProcessor(job_id)
+        except ArchiveNotReady:
+            # Keep the lease alive through a long download
+            def renew(downloaded, total):
+                with self._lock:
+                    self.active_jobs[job_id] = {'downloaded': downloaded, 'download_total': total}
+                if not renew_job_lease(job_id, self.worker_id, self.lease_seconds):
+                    raise RuntimeError(f"Lost lease on job {job_id} while downloading")
+            
+            if fetch_job_zip(job_id, on_progress=renew) == 0:
+                return None
+            processor = BatchProcessor(job_id)
+        except ValueError:
+            # ZIP missing and not re-downloadable - retrying won't help
+            update_job_status(job_id, 'FAILED')
+            raise
+        print(f"⚙️ Ingest worker processing job {job_id}")
+        
+        renew = lambda: renew_job_lease(job_id, self.worker_id, self.lease_seconds)
+        with Heartbeat(renew, self.lease_seconds / 3) as heartbeat:
+            while not self._stop.is_set():
+                result = processor.process_batch(self.batch_size)
+                with self._lock:
+                    self.active_jobs[job_id] = {
+                        'processed': result.get('processed', 0),
+                        'total': result.get('total', 0)
+                    }
+                
+                if not result.get('success'):
+                    raise RuntimeError(result.get('error', 'Batch failed'))
+                if result['status'] != 'PROCESSING':
+                    print(f"✓ Ingest worker finished job {job_id}: {result['processed']}/{result['total']}")
+                    return result
+                if result.get('paused_for'):
+                    # Storage is refusing uploads; wait it out instead of failing the members
+                    print(f"↷ Storage paused, job {job_id} waits {result['paused_for']:.0f}s")
+                    self._stop.wait(result['paused_for'])
+                if heartbeat.lost.is_set():
+                    print(f"⚠️ Lost lease on job {job_id}, stopping")
+                    return result
+
+
+# Process-wide worker, started by the server (wsgi.py)
+_worker = None
+
+def get_ingest_worker():
+    """Get the process-wide ingest worker (None until started)"""
+    return _worker
+
+def start_ingest_worker():
+    """Start the process-wide ingest worker"""
+    global _worker
+    if _worker is None:
+        _worker = IngestWorker()
+        _worker.start()
+    return _worker
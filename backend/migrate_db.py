@@ -1,13 +1,42 @@
 """
-Database Migration: Add zip_url column to upload_jobs table
+Database Migration: Add new columns to existing tables
 Run this once to update existing databases
 """
 import sqlite3
 import os
+from config import DATABASE_PATH
+
+# (table, column, column definition) added after the table was first created
+MIGRATIONS = [
+    ('upload_jobs', 'zip_url', 'TEXT'),
+    ('pyq_files', 'content_hash', 'VARCHAR(64)'),
+    ('upload_jobs', 'worker_id', 'VARCHAR(100)'),
+    ('upload_jobs', 'lease_expires_at', 'DATETIME'),
+    ('job_members', 'file_size', 'INTEGER DEFAULT 0'),
+    ('job_members', 'crc', 'INTEGER'),
+    ('job_members', 'status', "VARCHAR(20) DEFAULT 'PENDING'"),
+    ('job_members', 'error', 'TEXT'),
+    ('job_members', 'change_type', 'VARCHAR(10)'),
+    ('pyq_files', 'member_name', 'TEXT'),
+    ('job_members', 'claimed_by', 'VARCHAR(100)'),
+    ('job_members', 'lease_expires_at', 'DATETIME'),
+    ('upload_jobs', 'download_bytes', 'BIGINT'),
+    ('upload_jobs', 'download_total', 'BIGINT'),
+    ('upload_jobs', 'remote', 'BOOLEAN DEFAULT 0'),
+    ('upload_jobs', 'archive_hash', 'VARCHAR(64)'),
+    ('pyq_files', 'inferred', 'VARCHAR(100)'),
+    ('job_members', 'inferred', 'VARCHAR(100)'),
+]
+
+# Indexes created by later versions of the models
+INDEXES = [
+    ('idx_pyq_content_hash', 'pyq_files', 'content_hash'),
+    ('idx_job_member_status', 'job_members', 'job_id, status, position'),
+]
 
 def migrate_database():
-    """Add zip_url column if it doesn't exist"""
-    db_path = os.path.join(os.path.dirname(__file__), 'pyq_database.db')
+    """Add missing columns and indexes"""
+    db_path = DATABASE_PATH
     
     if not os.path.exists(db_path):
         print("Database doesn't exist yet, skipping migration")
@@ -17,18 +46,27 @@ def migrate_database():
     cursor = conn.cursor()
     
     try:
-        # Check if column exists
-        cursor.execute("PRAGMA table_info(upload_jobs)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'zip_url' not in columns:
-            print("Adding zip_url column to upload_jobs table...")
-            cursor.execute('ALTER TABLE upload_jobs ADD COLUMN zip_url TEXT')
-            conn.commit()
-            print("✓ Migration complete: zip_url column added")
-        else:
-            print("✓ zip_url column already exists, no migration needed")
+        for table, column, definition in MIGRATIONS:
+            # Check if table and column exist
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [row[1] for row in cursor.fetchall()]
             
+            if not columns:
+                print(f"✓ {table} table doesn't exist yet, it will be created on startup")
+            elif column not in columns:
+                print(f"Adding {column} column to {table} table...")
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                print(f"✓ Migration complete: {table}.{column} column added")
+            else:
+                print(f"✓ {table}.{column} column already exists, no migration needed")
+        
+        for name, table, columns in INDEXES:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if cursor.fetchone():
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+        
+        conn.commit()
+    
     except Exception as e:
         print(f"Migration error: {e}")
         conn.rollback()
@@ -0,0 +1,96 @@
+"""
+Storage Migration: Convert flat PDF storage to content-addressed storage
+Moves every local PDF referenced by pyq_files from
+    PDF_STORAGE_PATH/<subject_code>_<subject_name>.pdf
+to its sharded SHA-256 path and points the rows at it. Byte-identical
+files collapse into one blob. Each file's rows and its pdf_blobs entry are
+committed together before the flat file is removed. Safe to re-run:
+converted rows are skipped, and blobs a crashed earlier run left
+unregistered are registered.
+
+Usage: python migrate_storage.py [--dry-run]
+"""
+import os
+import sys
+from collections import defaultdict
+from config import PDF_STORAGE_PATH
+from blob_store import BlobStore
+from database import Session, PyqFile, PdfBlob
+
+def migrate_storage(dry_run=False):
+    """Convert local storage in place. Returns a summary dict"""
+    store = BlobStore()
+    session = Session()
+    summary = {'files': 0, 'rows': 0, 'blobs_created': 0, 'duplicates': 0, 'missing': 0, 'blobs_registered': 0}
+    seen = set()  # blobs this run created or would create (dry run)
+    
+    try:
+        # Blobs of rows converted by a run that crashed before registering them
+        unregistered = session.query(PyqFile.content_hash, PyqFile.file_path).outerjoin(
+            PdfBlob, PdfBlob.content_hash == PyqFile.content_hash
+        ).filter(PyqFile.content_hash != None, PdfBlob.content_hash == None).distinct().all()
+        for content_hash, file_path in unregistered:
+            if content_hash in seen or file_path != store.relative_path(content_hash) or not store.exists(content_hash):
+                continue
+            seen.add(content_hash)
+            session.add(PdfBlob(content_hash=content_hash, size=os.path.getsize(store.absolute_path(content_hash)),
+                                crc32=None, storage_path=file_path))
+            summary['blobs_registered'] += 1
+        if dry_run:
+            session.rollback()
+        else:
+            session.commit()
+        
+        rows = session.query(PyqFile).filter(PyqFile.content_hash == None).all()
+        
+        # Rows that share one flat file (earlier uploads overwrote each other)
+        rows_by_path = defaultdict(list)
+        for row in rows:
+            if not row.file_path.startswith('http'):
+                rows_by_path[row.file_path].append(row)
+        
+        for file_path, path_rows in rows_by_path.items():
+            source = os.path.join(PDF_STORAGE_PATH, file_path)
+            if not os.path.exists(source):
+                print(f"⚠️ Missing on disk, left unchanged: {file_path}")
+                summary['missing'] += 1
+                continue
+            
+            summary['files'] += 1
+            if dry_run:
+                with open(source, 'rb') as f:
+                    content_hash, size = store.hash_stream(f)
+                created = content_hash not in seen and not store.exists(content_hash)
+                relative_path = store.relative_path(content_hash)
+                print(f"Would move {file_path} -> {relative_path}")
+            else:
+                content_hash, relative_path, size, created = store.adopt_file(source)
+            
+            summary['blobs_created' if created else 'duplicates'] += 1
+            for row in path_rows:
+                row.file_path = relative_path
+                row.content_hash = content_hash
+                summary['rows'] += 1
+            if content_hash not in seen and not session.get(PdfBlob, content_hash):
+                session.add(PdfBlob(content_hash=content_hash, size=size, crc32=None, storage_path=relative_path))
+            seen.add(content_hash)
+            
+            # Rows and blob entry are committed per file, so an interrupted run
+            # keeps its progress; the flat file is only removed after that
+            if dry_run:
+                session.rollback()
+            else:
+                session.commit()
+                os.remove(source)
+        
+        print(f"✓ Storage migration {'(dry run) ' if dry_run else ''}complete: {summary}")
+        return summary
+    except Exception as e:
+        session.rollback()
+        print(f"Migration error: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == '__main__':
+    migrate_storage(dry_run='--dry-run' in sys.argv)
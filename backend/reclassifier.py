@@ -0,0 +1,231 @@
+"""
+Reclassifier - Re-runs the current filename rules over stored papers
+Each pyq_files row keeps the archive member name it was ingested from.
+After a parser fix, reclassify() parses those names again, diffs the
+result against the stored branch, semester, subject code and name, and
+(unless dry_run) applies the changes in bulk transactions. A branch or
+name ingest filled in from the subject index is kept until the filename
+itself states it, so a fresh ingest reclassifies to no changes. PDF files
+are never read or moved. The admin endpoint runs it on a ReclassifyWorker
+so a large table never holds up a request
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import RECLASSIFY_CHUNK_SIZE, CLASSIFY_PROCESSES
+from database import get_pyq_file_keys, update_pyq_files_bulk
+from background_task import BackgroundTask
+from filename_classifier import FilenameClassifier, parse_inferred
+
+# Columns the classifier decides
+RECLASSIFIED_FIELDS = ('degree', 'branch', 'semester', 'subject_code', 'subject_name')
+
+# Rules-only classifier per process: the subject index is built from the
+# very rows being checked, so it must not answer for them
+_rules_classifier = None
+
+def classify_with_rules(names):
+    """Classify names with the filename rules alone (picklable for process pools)"""
+    global _rules_classifier
+    if _rules_classifier is None:
+        _rules_classifier = FilenameClassifier()
+    return _rules_classifier.classify_many(names)
+
+
+def _as_ingested(row, result):
+    """
+    The rules-only result with the fields the stored row took from the
+    subject index kept, unless the filename now states them
+    """
+    stored = parse_inferred(row['inferred'])
+    found = parse_inferred(result['inferred'])
+    result = dict(result)
+    inferred = []
+    for field in ('branch', 'subject_name'):
+        if field not in found:
+            continue
+        if stored.get(field) == 'index':
+            result[field] = row[field]
+            inferred.append(f'{field}:index')
+        else:
+            inferred.append(f'{field}:{found[field]}')
+    result['inferred'] = ','.join(inferred)
+    return result
+
+
+def _paper_key(row):
+    """Identity of a paper (see database._paper_key)"""
+    return (row['exam_type'], row['exam_year'], row['branch'], int(row['semester']),
+            row['subject_code'], row['subject_name'])
+
+
+def reclassify(dry_run=True, chunk_size=None, processes=None, progress_callback=None):
+    """
+    Reclassify every stored paper that has an archive member name
+    dry_run: only compute the diff
+    chunk_size: rows per read page, classify task and update transaction
+                (default RECLASSIFY_CHUNK_SIZE)
+    processes: classify in a process pool when > 1 (default CLASSIFY_PROCESSES)
+    Returns: dict with counts, the changes ({'id', 'member_name', 'old',
+             'new'} with only the fields that differ), rejected rows (names
+             the current rules no longer accept - left untouched), conflicts
+             (changes that would duplicate another paper - not applied) and
+             timings
+    """
+    if chunk_size is None:
+        chunk_size = RECLASSIFY_CHUNK_SIZE
+    if processes is None:
+        processes = CLASSIFY_PROCESSES
+    chunk_size = max(1, chunk_size)
+    started = time.time()
+
+    # Read every row once, by id
+    rows = []
+    after_id = 0
+    while True:
+        page = get_pyq_file_keys(after_id, chunk_size)
+        if not page:
+            break
+        rows.extend(page)
+        after_id = page[-1]['id']
+
+    named = [row for row in rows if row['member_name']]
+    chunks = [named[i:i + chunk_size] for i in range(0, len(named), chunk_size)]
+    name_chunks = [[row['member_name'] for row in chunk] for chunk in chunks]
+
+    # Parse names in chunks, in a process pool for large tables
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parsed_chunks = pool.map(classify_with_rules, name_chunks)
+            parsed = [result for chunk in parsed_chunks for result in chunk]
+    else:
+        parsed = [result for names in name_chunks for result in classify_with_rules(names)]
+    classified_at = time.time()
+
+    # Diff against the stored values
+    changes = []
+    rejected = []
+    for row, result in zip(named, parsed):
+        if result is None:
+            rejected.append({'id': row['id'], 'member_name': row['member_name']})
+            continue
+        result = _as_ingested(row, result)
+        differing = [field for field in RECLASSIFIED_FIELDS if result[field] != row[field]]
+        # Rows stored before 'inferred' was recorded get it with their next change
+        if (differing or row['inferred'] is not None) and result['inferred'] != (row['inferred'] or ''):
+            differing.append('inferred')
+        if differing:
+            changes.append({
+                'id': row['id'],
+                'member_name': row['member_name'],
+                'old': {field: row[field] for field in differing},
+                'new': {field: result[field] for field in differing}
+            })
+
+    # A change may not give a paper the identity of another stored paper
+    owners = {_paper_key(row): row['id'] for row in rows}
+    by_id = {row['id']: row for row in named}
+    applicable = []
+    conflicts = []
+    for change in changes:
+        row = by_id[change['id']]
+        old_key = _paper_key(row)
+        new_key = _paper_key({**row, **change['new']})
+        if new_key != old_key and new_key in owners:
+            conflicts.append({**change, 'existing_id': owners[new_key]})
+            continue
+        if owners.get(old_key) == row['id']:
+            del owners[old_key]
+        owners[new_key] = row['id']
+        applicable.append(change)
+
+    # Apply in bulk, one transaction per chunk
+    applied = 0
+    if not dry_run:
+        for i in range(0, len(applicable), chunk_size):
+            updates = [{'id': change['id'], **change['new']} for change in applicable[i:i + chunk_size]]
+            applied += update_pyq_files_bulk(updates)
+            if progress_callback:
+                progress_callback(min(i + chunk_size, len(applicable)), len(applicable))
+        if applied:
+            from subject_index import reset_subject_index
+            reset_subject_index()
+    finished = time.time()
+
+    classify_seconds = classified_at - started
+    return {
+        'dry_run': dry_run,
+        'total_rows': len(rows),
+        'classified_rows': len(named),
+        'without_member_name': len(rows) - len(named),
+        'unchanged': len(named) - len(changes) - len(rejected),
+        'changed': len(applicable),
+        'rejected': rejected,
+        'conflicts': conflicts,
+        'applied': applied,
+        'changes': applicable,
+        'seconds': round(finished - started, 3),
+        'rows_per_second': int(len(named) / classify_seconds) if classify_seconds > 0 else None
+    }
+
+
+class ReclassifyWorker(BackgroundTask):
+    """Runs reclassify() when asked; the summary lists at most `limit` of each kind of row"""
+    name = 'Reclassify'
+
+    def __init__(self):
+        super().__init__(interval_seconds=0)
+        self.dry_run = True
+        self.limit = 200
+
+    def request(self, dry_run=True, limit=200):
+        """Run once more (after the current run, if any) with these options"""
+        with self._lock:
+            self.dry_run = dry_run
+            self.limit = limit
+        self.run_now()
+
+    def run_once(self, progress_callback, stop_event):
+        with self._lock:
+            dry_run, limit = self.dry_run, self.limit
+        summary = reclassify(dry_run=dry_run,
+                             progress_callback=lambda done, total: progress_callback(done, total, 0))
+        for key in ('changes', 'rejected', 'conflicts'):
+            summary[f'{key}_total'] = len(summary[key])
+            summary[key] = summary[key][:limit]
+        return summary
+
+
+# Process-wide worker, started by the admin endpoint
+_worker = None
+
+def get_reclassify_worker():
+    """Get the process-wide reclassify worker (None until started)"""
+    return _worker
+
+def start_reclassify_worker():
+    """Start the process-wide reclassify worker"""
+    global _worker
+    if _worker is None:
+        _worker = ReclassifyWorker()
+        _worker.start()
+    return _worker
+
+
+if __name__ == '__main__':
+    import sys
+
+    apply_changes = '--apply' in sys.argv
+    summary = reclassify(dry_run=not apply_changes)
+    for change in summary['changes']:
+        print(f"#{change['id']} {change['member_name']}")
+        for field, new_value in change['new'].items():
+            print(f"    {field}: {change['old'][field]!r} -> {new_value!r}")
+    for conflict in summary['conflicts']:
+        print(f"↷ #{conflict['id']} would duplicate paper #{conflict['existing_id']}, not applied")
+    print(f"{summary['classified_rows']} rows reclassified ({summary['without_member_name']} without a member name): "
+          f"{summary['changed']} changed, {len(summary['rejected'])} no longer accepted, "
+          f"{len(summary['conflicts'])} conflicts - {summary['rows_per_second']} rows/s")
+    if apply_changes:
+        print(f"✓ Applied {summary['applied']} changes")
+    else:
+        print("Dry run - run with --apply to update the database")
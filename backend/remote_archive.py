@@ -0,0 +1,242 @@
+"""
+Remote ZIP reader over HTTP range requests
+RemoteArchive reads an archive's end-of-central-directory record and
+central directory straight from a server that supports byte ranges, and
+fetches member data only when a member is opened: one range request per
+member, covering its local header and compressed data. The archive itself
+is never stored. Members inflate through archive_reader.MappedMember (size
+and CRC-32 are checked), and RemoteArchive mirrors the same ZipFile API as
+MappedArchive, so it can be passed wherever a ZipFile was
+"""
+import time
+import bisect
+import zipfile
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from archive_reader import MappedMember, local_data_offset
+from zip_fetcher import probe_url
+from config import DOWNLOAD_SEGMENT_RETRIES, BATCH_IO_WORKERS
+
+_TAIL_SIZE = 64 * 1024 + 22  # end-of-central-directory record plus the longest comment
+_READ_AHEAD = 256 * 1024  # smallest range fetched for a central directory read
+
+# Central directories read in this process, by (url, validator, size)
+_directories = OrderedDict()
+_directories_lock = threading.Lock()
+_DIRECTORY_CACHE_SIZE = 4
+
+
+class RangeNotSupported(Exception):
+    """The server doesn't serve byte ranges of this URL (or doesn't say how big it is)"""
+
+
+class RemoteArchiveChanged(zipfile.BadZipFile):
+    """The remote file changed after its central directory was read"""
+
+
+class _RangeFile:
+    """
+    Seekable read-only file over HTTP ranges, for zipfile to parse the
+    central directory from. Fetched blocks are kept, so zipfile's small
+    seeks and reads around the end of the archive cost one request
+    """
+
+    def __init__(self, archive, size):
+        self._archive = archive
+        self._size = size
+        self._position = 0
+        self._blocks = []  # (start, bytes)
+        self._lock = threading.Lock()
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self._size
+        self._position = max(0, offset)
+        return self._position
+
+    def read(self, size=-1):
+        with self._lock:
+            left = max(0, self._size - self._position)
+            size = left if size is None or size < 0 else min(size, left)
+            if size == 0:
+                return b''
+            data = self._cached(self._position, size)
+            if data is None:
+                start = self._position
+                end = min(self._size, start + max(size, _READ_AHEAD))
+                block = self._archive._fetch(start, end - 1)
+                self._blocks.append((start, block))
+                data = block[:size]
+            self._position += len(data)
+            return data
+
+    def prefetch(self, start):
+        """Fetch everything from start to the end of the file in one request"""
+        with self._lock:
+            if start < self._size:
+                self._blocks.append((start, self._archive._fetch(start, self._size - 1)))
+
+    def _cached(self, position, size):
+        for start, block in self._blocks:
+            if start <= position and position + size <= start + len(block):
+                return block[position - start:position - start + size]
+        return None
+
+    def close(self):
+        self._blocks = []
+
+
+class RemoteArchive:
+    """
+    Read-only ZIP archive behind a URL, read with HTTP range requests
+    Raises RangeNotSupported from the constructor if the server can't
+    serve ranges; use a full download for those
+    Stored and deflated members are fetched with one range request each;
+    other methods and encrypted members are read through zipfile over the
+    same ranges (slower, but correct)
+    """
+
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+        self.requests_made = 0
+        self.bytes_fetched = 0
+        self._stats_lock = threading.Lock()
+        self._zip = None
+
+        probe = probe_url(url, timeout=min(timeout, 30))
+        if not probe['accepts_ranges'] or probe['size'] is None:
+            raise RangeNotSupported(f"{url} does not support range requests")
+        self.size = probe['size']
+        self.validator = probe['validator']
+
+        # One connection pool per archive, sized for the batch I/O threads
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, BATCH_IO_WORKERS))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        try:
+            self._infos, self._ends = self._read_directory()
+        except Exception:
+            self._session.close()
+            raise
+        self._by_name = {info.filename: info for info in self._infos}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the connection pool"""
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        self._session.close()
+
+    def _read_directory(self):
+        """
+        Parse the central directory (cached per URL and validator)
+        Returns: (infolist, {header_offset: offset where the member's bytes end})
+        """
+        key = (self.url, self.validator, self.size)
+        if self.validator:
+            with _directories_lock:
+                if key in _directories:
+                    _directories.move_to_end(key)
+                    return _directories[key]
+
+        # The tail holds the end-of-central-directory record, and for most
+        # archives it is the whole central directory
+        source = _RangeFile(self, self.size)
+        source.prefetch(max(0, self.size - _TAIL_SIZE))
+        with zipfile.ZipFile(source, 'r') as zip_ref:
+            infos = zip_ref.infolist()
+            directory_start = zip_ref.start_dir
+
+        # A member's bytes (local header, data, data descriptor) end where
+        # the next member, or the central directory, starts
+        offsets = sorted({info.header_offset for info in infos} | {directory_start})
+        ends = {offset: offsets[bisect.bisect_right(offsets, offset)] for offset in offsets[:-1]}
+
+        if self.validator:
+            with _directories_lock:
+                _directories[key] = (infos, ends)
+                while len(_directories) > _DIRECTORY_CACHE_SIZE:
+                    _directories.popitem(last=False)
+        return infos, ends
+
+    def _fetch(self, start, end):
+        """
+        Bytes start..end (inclusive) of the remote file, retried with backoff
+        Raises RemoteArchiveChanged if the server no longer has the version
+        the central directory came from
+        """
+        headers = {'Range': f'bytes={start}-{end}'}
+        if self.validator:
+            headers['If-Range'] = self.validator
+        attempt = 0
+        while True:
+            try:
+                with self._session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        # If-Range failed: the whole (new) file is on its way
+                        raise RemoteArchiveChanged(f"{self.url} changed since its central directory was read")
+                    data = response.content
+                if len(data) != end - start + 1:
+                    raise requests.RequestException(f"Range {start}-{end} returned {len(data)} bytes")
+                with self._stats_lock:
+                    self.requests_made += 1
+                    self.bytes_fetched += len(data)
+                return data
+            except requests.RequestException as e:
+                attempt += 1
+                if attempt > DOWNLOAD_SEGMENT_RETRIES:
+                    raise
+                print(f"↻ Retrying range {start}-{end} ({attempt}/{DOWNLOAD_SEGMENT_RETRIES}): {e}")
+                time.sleep(min(2 ** attempt, 30) * 0.25)
+
+    def infolist(self):
+        return list(self._infos)
+
+    def namelist(self):
+        return [info.filename for info in self._infos]
+
+    def getinfo(self, name):
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise KeyError(f"There is no item named {name!r} in the archive")
+
+    def open(self, member, mode='r'):
+        """
+        Open a member for reading (safe to call from several threads); its
+        bytes are fetched now, with one range request
+        Returns: file-like object; the CRC-32 is checked when it is read to the end
+        """
+        if mode != 'r':
+            raise ValueError('RemoteArchive is read-only')
+        info = member if isinstance(member, zipfile.ZipInfo) else self.getinfo(member)
+
+        supported = info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+        if not supported or info.flag_bits & 0x1:
+            with self._stats_lock:
+                if self._zip is None:
+                    self._zip = zipfile.ZipFile(_RangeFile(self, self.size), 'r')
+            return self._zip.open(info.filename, 'r')
+
+        data = self._fetch(info.header_offset, self._ends[info.header_offset] - 1)
+        return MappedMember(data, info, local_data_offset(data, info, 0))
@@ -0,0 +1,221 @@
+"""
+S3 Client - Minimal client for S3-compatible object stores (AWS, MinIO, R2)
+Requests are signed with AWS Signature Version 4 and sent path-style
+(ENDPOINT/bucket/key) over a pooled keep-alive session. Objects larger
+than one part are uploaded as multipart uploads, part by part from the
+stream, so nothing is spooled to disk; a failed multipart upload is aborted
+"""
+import time
+import hmac
+import hashlib
+import datetime
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    S3_ENDPOINT_URL, S3_BUCKET, S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY, S3_REGION, S3_PART_SIZE,
+    S3_RETRIES, UPLOAD_WORKERS
+)
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+_XMLNS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class S3Error(Exception):
+    """An S3 request failed"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def signing_key(secret_key, date, region, service='s3'):
+    """SigV4 signing key for a day (YYYYMMDD)"""
+    key = _hmac(('AWS4' + secret_key).encode(), date)
+    key = _hmac(key, region)
+    key = _hmac(key, service)
+    return _hmac(key, 'aws4_request')
+
+
+def canonical_query(params):
+    """Sorted, URI-encoded query string (a value of None encodes as 'key=')"""
+    return '&'.join(
+        f"{quote(str(key), safe='-_.~')}={quote('' if value is None else str(value), safe='-_.~')}"
+        for key, value in sorted(params.items())
+    )
+
+
+def signature(secret_key, region, method, path, params, headers, payload_hash, amz_date):
+    """
+    SigV4 signature of a request
+    headers: the headers to sign (lowercase names), host included
+    Returns: (signature, signed header names)
+    """
+    names = sorted(headers)
+    canonical_headers = ''.join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in names)
+    signed_headers = ';'.join(names)
+    canonical_request = '\n'.join([
+        method, quote(path, safe='/-_.~'), canonical_query(params), canonical_headers, signed_headers, payload_hash
+    ])
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+    key = signing_key(secret_key, amz_date[:8], region)
+    return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest(), signed_headers
+
+
+class S3Client:
+    """Objects in one bucket of an S3-compatible store"""
+
+    def __init__(self, endpoint=None, bucket=None, access_key=None, secret_key=None, region=None,
+                 part_size=None, retries=S3_RETRIES):
+        self.endpoint = (endpoint or S3_ENDPOINT_URL).rstrip('/')
+        self.bucket = bucket or S3_BUCKET
+        self.access_key = access_key or S3_ACCESS_KEY_ID
+        self.secret_key = secret_key or S3_SECRET_ACCESS_KEY
+        self.region = region or S3_REGION
+        self.part_size = max(5 * 1024 * 1024, part_size or S3_PART_SIZE)  # S3's smallest part
+        self.retries = retries
+        self.host = self.endpoint.split('://', 1)[-1]
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, UPLOAD_WORKERS), max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _path(self, key):
+        return f"/{self.bucket}/{key}"
+
+    def _request(self, method, key, params=None, data=b'', headers=None, stream=False, ok=(200,)):
+        """
+        Send a signed request, retrying connection errors and 5xx responses
+        Returns: the response (status in ok, or 404 if 404 is in ok)
+        """
+        params = params or {}
+        payload_hash = hashlib.sha256(data).hexdigest() if isinstance(data, bytes) else UNSIGNED_PAYLOAD
+        attempt = 0
+        while True:
+            amz_date = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+            signed = {'host': self.host, 'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash}
+            signed.update({name.lower(): value for name, value in (headers or {}).items()})
+            sig, signed_headers = signature(
+                self.secret_key, self.region, method, self._path(key), params, signed, payload_hash, amz_date
+            )
+            request_headers = {name: value for name, value in signed.items() if name != 'host'}
+            request_headers['Authorization'] = (
+                f"AWS4-HMAC-SHA256 Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, "
+                f"SignedHeaders={signed_headers}, Signature={sig}"
+            )
+            url = f"{self.endpoint}{quote(self._path(key), safe='/-_.~')}"
+            if params:
+                url += '?' + canonical_query(params)
+            try:
+                response = self.session.request(method, url, data=data, headers=request_headers,
+                                                stream=stream, timeout=(10, 120))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = S3Error(f"{method} {key}: {e}")
+            else:
+                if response.status_code in ok:
+                    return response
+                error = S3Error(f"{method} {key}: HTTP {response.status_code} {response.text[:200]}",
+                                response.status_code)
+                if response.status_code < 500:
+                    raise error
+            if attempt >= self.retries:
+                raise error
+            attempt += 1
+            time.sleep(0.5 * 2 ** attempt)
+
+    def put_object(self, key, source, content_type='application/pdf'):
+        """
+        Upload a stream, as a multipart upload when it is larger than one part
+        Returns: bytes uploaded
+        """
+        first = source.read(self.part_size)
+        following = source.read(self.part_size) if len(first) == self.part_size else b''
+        if not following:
+            self._request('PUT', key, data=first, headers={'Content-Type': content_type})
+            return len(first)
+
+        response = self._request('POST', key, params={'uploads': None}, headers={'Content-Type': content_type})
+        result = ET.fromstring(response.content)
+        upload_id = result.findtext(f'{_XMLNS}UploadId') or result.findtext('UploadId')
+        parts = []
+        size = 0
+        try:
+            part = first
+            while part:
+                number = len(parts) + 1
+                response = self._request('PUT', key, params={'partNumber': number, 'uploadId': upload_id}, data=part)
+                parts.append((number, response.headers['ETag']))
+                size += len(part)
+                part, following = following, (source.read(self.part_size) if following else b'')
+            body = '<CompleteMultipartUpload>' + ''.join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in parts
+            ) + '</CompleteMultipartUpload>'
+            self._request('POST', key, params={'uploadId': upload_id}, data=body.encode())
+        except Exception:
+            try:
+                self._request('DELETE', key, params={'uploadId': upload_id}, ok=(204, 200, 404))
+            except S3Error:
+                pass
+            raise
+        return size
+
+    def head_object(self, key):
+        """Returns: {'size', 'etag'} or None if there is no such object"""
+        response = self._request('HEAD', key, data=b'', ok=(200, 404))
+        if response.status_code == 404:
+            return None
+        return {'size': int(response.headers.get('Content-Length', 0)), 'etag': response.headers.get('ETag')}
+
+    def get_object(self, key):
+        """Returns: a readable stream of the object (close it when done)"""
+        response = self._request('GET', key, stream=True)
+        response.raw.decode_content = True
+        return response.raw
+
+    def delete_object(self, key):
+        self._request('DELETE', key, ok=(204, 200, 404))
+
+    def list_objects(self, prefix='', page_size=1000):
+        """
+        List the bucket's objects (ListObjectsV2), a page at a time
+        Yields: {'key', 'size', 'modified' (epoch seconds)}
+        """
+        token = None
+        while True:
+            params = {'list-type': '2', 'max-keys': str(page_size), 'prefix': prefix}
+            if token:
+                params['continuation-token'] = token
+            result = ET.fromstring(self._request('GET', '', params=params).content)
+            for item in result.iter(f'{_XMLNS}Contents'):
+                modified = datetime.datetime.strptime(
+                    item.findtext(f'{_XMLNS}LastModified')[:19], '%Y-%m-%dT%H:%M:%S'
+                ).replace(tzinfo=datetime.timezone.utc)
+                yield {'key': item.findtext(f'{_XMLNS}Key'), 'size': int(item.findtext(f'{_XMLNS}Size')),
+                       'modified': modified.timestamp()}
+            token = result.findtext(f'{_XMLNS}NextContinuationToken')
+            if result.findtext(f'{_XMLNS}IsTruncated') != 'true' or not token:
+                return
+
+    def presigned_url(self, key, expires=3600):
+        """URL anyone can GET the object with until it expires"""
+        amz_date = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        params = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        sig, _ = signature(self.secret_key, self.region, 'GET', self._path(key), params,
+                           {'host': self.host}, UNSIGNED_PAYLOAD, amz_date)
+        params['X-Amz-Signature'] = sig
+        return f"{self.endpoint}{quote(self._path(key), safe='/-_.~')}?{canonical_query(params)}"
@@ -0,0 +1,315 @@
+"""
+Storage - One interface over every place PDFs can be stored
+Blobs are addressed by the same key in every backend, their content-
+addressed path BlobStore.relative_path(content_hash) ('ab/cd/<sha256>.pdf'):
+- LocalBackend: PDF_STORAGE_PATH on the volume
+- S3Backend: an S3-compatible bucket, multipart uploads (s3_client.py)
+- CloudinaryBackend: raw uploads, chunked when large (cloud_uploader.py)
+- DriveBackend: a Drive folder, resumable chunked uploads (drive_uploader.py)
+put() returns the blob's location, which is what pyq_files.file_path
+holds: the key for local and S3 storage, a public link for Cloudinary and
+Drive (like older rows). Ingest writes to the STORAGE_BACKEND backend, so
+storage can move without touching the ingest code
+"""
+import os
+import shutil
+import tempfile
+from blob_store import BlobStore
+from config import STORAGE_BACKEND, PDF_STORAGE_PATH, STREAM_CHUNK_SIZE, S3_PUBLIC_URL, S3_URL_EXPIRES
+
+
+class StoragePaused(Exception):
+    """The backend refuses uploads for now (circuit breaker); retry after retry_after seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StorageBackend:
+    """Where PDF blobs live; every method takes a blob's key"""
+    name = None
+
+    def put(self, key, source):
+        """Store a stream under key; returns the blob's location"""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Readable stream of a blob (close it when done); FileNotFoundError if it isn't stored"""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Returns: {'size', 'location'} or None if the blob isn't stored"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove a blob (no-op if it isn't stored)"""
+        raise NotImplementedError
+
+    def list(self):
+        """
+        Every blob stored (NotImplementedError where the store can't be listed)
+        Yields: {'key', 'size', 'modified' (epoch seconds)}
+        """
+        raise NotImplementedError
+
+    @property
+    def store_id(self):
+        """Which store this is, e.g. 's3:<bucket>' (copies are recorded against it)"""
+        return self.name
+
+    def url(self, key):
+        """URL readers can be redirected to, or None if the app serves the blob"""
+        return None
+
+    def local_path(self, key):
+        """Path of the blob on this machine, or None"""
+        return None
+
+    def store(self, open_source, content_hash=None, size=None):
+        """
+        Store a blob, content-addressed, unless the backend already has it
+        open_source() returns a fresh stream of the content on each call:
+        one pass hashes it (skipped when content_hash and size are given),
+        another uploads it - nothing is written to disk on the way
+        Returns: (content_hash, location, size, created)
+        """
+        if content_hash is None:
+            with open_source() as source:
+                content_hash, size = BlobStore().hash_stream(source)
+        key = BlobStore.relative_path(content_hash)
+        existing = self.stat(key)
+        if existing:
+            return content_hash, existing['location'], size, False
+        with open_source() as source:
+            location = self.put(key, source)
+        return content_hash, location, size, True
+
+
+class LocalBackend(StorageBackend):
+    """Blobs under PDF_STORAGE_PATH (see blob_store.py)"""
+    name = 'local'
+
+    def __init__(self, root=None):
+        self.blobs = BlobStore(root or PDF_STORAGE_PATH)
+
+    def local_path(self, key):
+        return os.path.join(self.blobs.root, *key.split('/'))
+
+    def put(self, key, source):
+        # Written next to its final path and renamed, so readers never see a partial blob
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                shutil.copyfileobj(source, target, STREAM_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return key
+
+    def get(self, key):
+        return open(self.local_path(key), 'rb')
+
+    def stat(self, key):
+        try:
+            return {'size': os.stat(self.local_path(key)).st_size, 'location': key}
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self):
+        # Temp files of writes in progress ('.part') aren't blobs yet
+        root = self.blobs.root
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield {'key': os.path.relpath(path, root).replace(os.sep, '/'),
+                       'size': info.st_size, 'modified': info.st_mtime}
+
+    def store(self, open_source, content_hash=None, size=None):
+        # One pass: BlobStore hashes while it writes
+        if content_hash is not None and self.stat(BlobStore.relative_path(content_hash)):
+            return content_hash, BlobStore.relative_path(content_hash), size, False
+        with open_source() as source:
+            return self.blobs.write_stream(source)
+
+
+class S3Backend(StorageBackend):
+    """Blobs in an S3-compatible bucket; readers get a public or presigned URL"""
+    name = 's3'
+
+    def __init__(self, client=None, public_url=None):
+        from s3_client import S3Client
+        self.client = client or S3Client()
+        self.public_url = S3_PUBLIC_URL if public_url is None else public_url
+
+    @property
+    def store_id(self):
+        return f"s3:{self.client.endpoint.split('://', 1)[-1]}/{self.client.bucket}"
+
+    def put(self, key, source):
+        self.client.put_object(key, source)
+        return key
+
+    def get(self, key):
+        from s3_client import S3Error
+        try:
+            return self.client.get_object(key)
+        except S3Error as e:
+            if e.status == 404:
+                raise FileNotFoundError(key)
+            raise
+
+    def stat(self, key):
+        head = self.client.head_object(key)
+        return {'size': head['size'], 'location': key} if head else None
+
+    def delete(self, key):
+        self.client.delete_object(key)
+
+    def list(self):
+        return self.client.list_objects()
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{key}"
+        return self.client.presigned_url(key, S3_URL_EXPIRES)
+
+
+class CloudinaryBackend(StorageBackend):
+    """Blobs as Cloudinary raw files (public_id: the key without '.pdf')"""
+    name = 'cloudinary'
+
+    def __init__(self, uploader=None):
+        from cloud_uploader import get_cloud_uploader
+        self.uploader = uploader or get_cloud_uploader()
+
+    @property
+    def store_id(self):
+        return f"cloudinary:{self.uploader.cloud_name}"
+
+    @staticmethod
+    def _public_id(key):
+        return key[:-4] if key.endswith('.pdf') else key
+
+    def put(self, key, source):
+        from cloud_uploader import UploadsPaused
+        try:
+            return self.uploader.upload_stream(source, self._public_id(key))['view_link']
+        except UploadsPaused as e:
+            raise StoragePaused(str(e), e.retry_after)
+
+    def url(self, key):
+        from cloud_uploader import FOLDER
+        return self.uploader.delivery_url(f"{FOLDER}/{self._public_id(key)}")
+
+    def get(self, key):
+        response = self.uploader.session.get(self.url(key), stream=True, timeout=(10, 60))
+        if response.status_code == 404:
+            response.close()
+            raise FileNotFoundError(key)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw
+
+    def stat(self, key):
+        url = self.url(key)
+        response = self.uploader.session.head(url, allow_redirects=True, timeout=(10, 60))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return {'size': int(response.headers.get('Content-Length', 0)), 'location': url}
+
+    def delete(self, key):
+        from cloud_uploader import FOLDER
+        self.uploader.destroy(f"{FOLDER}/{self._public_id(key)}")
+
+
+class DriveBackend(StorageBackend):
+    """Blobs as files in the Drive folder, named by their key's file name"""
+    name = 'drive'
+
+    def __init__(self, uploader=None):
+        if uploader is None:
+            from drive_uploader import DriveUploader
+            uploader = DriveUploader()
+        self.uploader = uploader
+
+    @property
+    def store_id(self):
+        return f"drive:{self.uploader.folder_id}"
+
+    @staticmethod
+    def _name(key):
+        return key.rsplit('/', 1)[-1]
+
+    def put(self, key, source):
+        # Resumable uploads need a seekable stream; PDFs are spooled in memory
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spooled:
+            shutil.copyfileobj(source, spooled, STREAM_CHUNK_SIZE)
+            spooled.seek(0)
+            return self.uploader.upload_stream(spooled, self._name(key))['download_link']
+
+    def get(self, key):
+        found = self.uploader.find_file(self._name(key))
+        if not found:
+            raise FileNotFoundError(key)
+        target = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+        self.uploader.download_to(found['file_id'], target)
+        target.seek(0)
+        return target
+
+    def stat(self, key):
+        found = self.uploader.find_file(self._name(key))
+        return {'size': found['size'], 'location': found['download_link']} if found else None
+
+    def delete(self, key):
+        found = self.uploader.find_file(self._name(key))
+        if found:
+            self.uploader.delete_file(found['file_id'])
+
+    def url(self, key):
+        found = self.uploader.find_file(self._name(key))
+        return found['download_link'] if found else None
+
+
+BACKENDS = {
+    'local': LocalBackend,
+    's3': S3Backend,
+    'cloudinary': CloudinaryBackend,
+    'drive': DriveBackend,
+}
+
+
+def create_backend(name):
+    """Create a backend by name (see BACKENDS)"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+# Process-wide backend that ingest writes to
+_storage = None
+
+def get_storage():
+    """Get the process-wide STORAGE_BACKEND backend"""
+    global _storage
+    if _storage is None:
+        _storage = create_backend(STORAGE_BACKEND)
+        print(f"✓ PDF storage: {_storage.name}")
+    return _storage
@@ -0,0 +1,419 @@
+"""
+Storage Scrubber - Checks every stored paper against storage and repairs it
+pyq_files rows point at blobs in STORAGE_BACKEND (keys) or at links
+(Cloudinary, Drive uploads); a blob that was deleted or overwritten is a
+"PDF file not found on server" for students. scrub_storage():
+1. checks each distinct location on a thread pool: keys are stat'ed and
+   their size compared with pdf_blobs, links requested; with verify the
+   content is read (rate-limited) and its SHA-256 compared with the row's
+2. lists the backend (local, S3) for orphans: blobs no row points at,
+   older than SCRUB_ORPHAN_GRACE_SECONDS (younger ones may belong to an
+   ingest in progress)
+3. repairs missing and corrupt blobs from another copy of the same
+   content - a healthy location, a copy recorded in blob_replicas (storage
+   sync) or the local volume - verifying the hash of what is written, and
+   points the rows at it
+4. moves corrupt and orphaned blobs to QUARANTINE_PATH instead of deleting
+   them
+Scrub threads run at a lower CPU priority (SCRUB_NICE) and hash reads are
+limited to SCRUB_MAX_BYTES_PER_SECOND, so request threads aren't starved.
+Runs from the command line or in the background (ScrubWorker)
+
+Usage: python storage_scrubber.py [--workers=8] [--verify] [--no-repair] [--no-quarantine] [--report-only]
+"""
+import os
+import sys
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    QUARANTINE_PATH, STREAM_CHUNK_SIZE, SCRUB_INTERVAL_SECONDS, SCRUB_WORKERS, SCRUB_VERIFY_HASHES,
+    SCRUB_REPAIR, SCRUB_QUARANTINE, SCRUB_MAX_BYTES_PER_SECOND, SCRUB_CHUNK_SIZE,
+    SCRUB_ORPHAN_GRACE_SECONDS, SCRUB_NICE
+)
+from blob_store import BlobStore
+from background_task import BackgroundTask
+from storage import LocalBackend, get_storage
+from storage_sync import HashingReader
+from database import (
+    get_pyq_file_locations, update_pyq_files_bulk, update_blob_locations, get_blob_sizes, get_blob_copies,
+    get_referenced_locations
+)
+
+PROGRESS_SECONDS = 5  # how often a running scrub reports its rate
+
+
+class ReadLimiter:
+    """Spaces reads so they average at most bytes_per_second across threads (0: no limit)"""
+
+    def __init__(self, bytes_per_second=SCRUB_MAX_BYTES_PER_SECOND):
+        self.bytes_per_second = bytes_per_second
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, size):
+        """Block until size more bytes may be read"""
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + size / self.bytes_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _lower_priority():
+    """Pool initializer: make this thread yield the CPU to request threads (Linux; best effort)"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SCRUB_NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+def _hash(stream, limiter):
+    """Returns: (content_hash, size) of a stream, read at the limiter's pace"""
+    reader = HashingReader(stream)
+    while True:
+        chunk = reader.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return reader.hexdigest(), reader.size
+        limiter.wait(len(chunk))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _quarantine(backend, key, folder):
+    """Move a blob into the quarantine folder (downloaded first if it isn't local); returns its new path"""
+    target = os.path.join(folder, *key.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    path = backend.local_path(key)
+    if path:
+        shutil.move(path, target)
+        return target
+    with backend.get(key) as source, open(target, 'wb') as f:
+        shutil.copyfileobj(source, f, STREAM_CHUNK_SIZE)
+    backend.delete(key)
+    return target
+
+
+def scrub_storage(backend=None, verify_hashes=None, repair=None, quarantine=None, workers=None,
+                  progress_callback=None, stop_event=None):
+    """
+    Check every location pyq_files points at, find orphaned blobs, and
+    repair or quarantine what is broken
+    backend: where row keys are stored (default STORAGE_BACKEND)
+    verify_hashes: read blobs and compare content hashes (default SCRUB_VERIFY_HASHES)
+    repair: copy missing/corrupt blobs back from another copy (default SCRUB_REPAIR)
+    quarantine: move corrupt and orphaned blobs aside (default SCRUB_QUARANTINE)
+    workers: locations checked at once (default SCRUB_WORKERS)
+    progress_callback(done, total, bytes) is called as checks finish
+    stop_event: set it to stop early (nothing is repaired then)
+    Returns: summary dict with counts (rows, locations, checked, ok,
+             missing, corrupt, errors, orphans, repaired, rows_rewritten,
+             quarantined, unrecoverable), orphans_checked, bytes_hashed,
+             seconds, files_per_second, stopped and problems (one dict per
+             broken location or orphan: kind, location, rows,
+             content_hash, detail, action)
+    """
+    backend = backend or get_storage()
+    verify_hashes = SCRUB_VERIFY_HASHES if verify_hashes is None else verify_hashes
+    repair = SCRUB_REPAIR if repair is None else repair
+    quarantine = SCRUB_QUARANTINE if quarantine is None else quarantine
+    workers = max(1, workers or SCRUB_WORKERS)
+    stop_event = stop_event or threading.Event()
+    limiter = ReadLimiter()
+    local = LocalBackend()
+    folder = os.path.join(QUARANTINE_PATH, time.strftime('%Y%m%d-%H%M%S'))
+    started = time.time()
+    summary = {
+        'backend': backend.store_id, 'verify_hashes': verify_hashes, 'rows': 0, 'locations': 0, 'checked': 0,
+        'ok': 0, 'missing': 0, 'corrupt': 0, 'errors': 0, 'orphans': 0, 'orphans_checked': False,
+        'repaired': 0, 'rows_rewritten': 0, 'quarantined': 0, 'unrecoverable': 0,
+        'bytes_hashed': 0, 'seconds': 0, 'files_per_second': 0, 'stopped': False, 'problems': []
+    }
+
+    # Links are requested over one pool of keep-alive connections
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+
+    # Rows grouped by location: a blob shared by several papers is checked once
+    locations = {}
+    after_id = 0
+    while True:
+        page = get_pyq_file_locations(after_id, SCRUB_CHUNK_SIZE)
+        if not page:
+            break
+        for row in page:
+            entry = locations.setdefault(row['file_path'], {'rows': [], 'content_hash': None})
+            entry['rows'].append(row['id'])
+            entry['content_hash'] = entry['content_hash'] or row['content_hash']
+        summary['rows'] += len(page)
+        after_id = page[-1]['id']
+    summary['locations'] = len(locations)
+
+    hashes = list({entry['content_hash'] for entry in locations.values() if entry['content_hash']})
+    sizes = {}
+    for chunk in _chunks(hashes, SCRUB_CHUNK_SIZE):
+        sizes.update(get_blob_sizes(chunk))
+
+    # 1. Check each location
+    def check(location):
+        """Returns: (status 'ok' / 'missing' / 'corrupt' / 'error' / 'skipped', detail, bytes hashed)"""
+        if stop_event.is_set():
+            return 'skipped', None, 0
+        content_hash = locations[location]['content_hash']
+        try:
+            if location.startswith('http'):
+                with http.get(location, stream=True, timeout=(10, 60)) as response:
+                    if response.status_code in (404, 410):
+                        return 'missing', f"HTTP {response.status_code}", 0
+                    response.raise_for_status()
+                    if not (verify_hashes and content_hash):
+                        return 'ok', None, 0
+                    response.raw.decode_content = True
+                    found, size = _hash(response.raw, limiter)
+            else:
+                info = backend.stat(location)
+                if info is None:
+                    return 'missing', 'not in storage', 0
+                expected = sizes.get(content_hash)
+                if expected is not None and info['size'] != expected:
+                    return 'corrupt', f"size {info['size']}, expected {expected}", 0
+                if not (verify_hashes and content_hash):
+                    return 'ok', None, 0
+                with backend.get(location) as stream:
+                    found, size = _hash(stream, limiter)
+            if found != content_hash:
+                return 'corrupt', f"content hash {found}", size
+            return 'ok', None, size
+        except FileNotFoundError:
+            return 'missing', 'not in storage', 0
+        except Exception as e:
+            # A timeout or 5xx says nothing about the blob; it is checked again next time
+            return 'error', str(e), 0
+
+    results = {}
+    done = 0
+    reported = started
+    pending = list(locations)
+    with ThreadPoolExecutor(max_workers=workers, initializer=_lower_priority) as pool:
+        for chunk in _chunks(pending, SCRUB_CHUNK_SIZE):
+            for location, (status, detail, size) in zip(chunk, pool.map(check, chunk)):
+                done += 1
+                summary['bytes_hashed'] += size
+                if status == 'skipped':
+                    continue
+                summary['checked'] += 1
+                summary['errors' if status == 'error' else status] += 1
+                results[location] = status
+                if status != 'ok':
+                    summary['problems'].append({
+                        'kind': status, 'location': location, 'rows': locations[location]['rows'],
+                        'content_hash': locations[location]['content_hash'], 'detail': detail, 'action': None
+                    })
+            if progress_callback:
+                progress_callback(done, len(pending), summary['bytes_hashed'])
+            if time.time() - reported >= PROGRESS_SECONDS:
+                reported = time.time()
+                print(f"↻ Storage scrub: {done}/{len(pending)} locations, "
+                      f"{done / (reported - started):.0f} files/s")
+        summary['stopped'] = stop_event.is_set()
+
+        # 2. Orphans: listed blobs no row points at (a row's content stored
+        # under its own key, say next to a link, is a copy, not an orphan)
+        orphans = []
+        if not summary['stopped']:
+            try:
+                cutoff = time.time() - SCRUB_ORPHAN_GRACE_SECONDS
+                known = {BlobStore.relative_path(content_hash) for content_hash in hashes}
+                orphans = [blob for blob in backend.list() if blob['modified'] < cutoff
+                           and blob['key'] not in locations and blob['key'] not in known]
+                summary['orphans_checked'] = True
+            except NotImplementedError:
+                pass
+        # Papers stored while the scrub ran may have been deduplicated onto one
+        referenced = set()
+        for chunk in _chunks([blob['key'] for blob in orphans], SCRUB_CHUNK_SIZE):
+            referenced |= get_referenced_locations(chunk)
+        orphans = [blob for blob in orphans if blob['key'] not in referenced]
+        summary['orphans'] = len(orphans)
+        for blob in orphans:
+            problem = {'kind': 'orphan', 'location': blob['key'], 'rows': [], 'content_hash': None,
+                       'detail': f"{blob['size']} bytes, not referenced", 'action': None}
+            if quarantine:
+                try:
+                    _quarantine(backend, blob['key'], folder)
+                    problem['action'] = 'quarantined'
+                    summary['quarantined'] += 1
+                except Exception as e:
+                    problem['detail'] += f"; quarantine failed: {e}"
+            summary['problems'].append(problem)
+
+        # 3. Repair missing and corrupt blobs from another copy of their content
+        broken = [p for p in summary['problems'] if p['kind'] in ('missing', 'corrupt')]
+        healthy = {}
+        for location, status in results.items():
+            content_hash = locations[location]['content_hash']
+            if status == 'ok' and content_hash:
+                healthy.setdefault(content_hash, []).append(location)
+        copies = {}
+        broken_hashes = list({p['content_hash'] for p in broken if p['content_hash']})
+        for chunk in _chunks(broken_hashes, SCRUB_CHUNK_SIZE):
+            copies.update(get_blob_copies(chunk))
+
+        def sources(content_hash):
+            """Where intact content can be read from, best first: ('backend' | 'link' | 'local', ref)"""
+            found = []
+            for location in healthy.get(content_hash, []):
+                found.append(('link' if location.startswith('http') else 'backend', location))
+            for copy in copies.get(content_hash, []):
+                if copy['location'].startswith('http') and ('link', copy['location']) not in found:
+                    found.append(('link', copy['location']))
+            if backend.name != 'local':
+                path = local.local_path(BlobStore.relative_path(content_hash))
+                if os.path.exists(path):
+                    found.append(('local', path))
+            return found
+
+        def open_source(kind, ref):
+            if kind == 'backend':
+                return backend.get(ref)
+            if kind == 'local':
+                return open(ref, 'rb')
+            response = http.get(ref, stream=True, timeout=(10, 60))
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return response.raw
+
+        def fix(group):
+            """
+            Quarantine and repair the broken locations of one content hash
+            Returns: (location the rows should point at or None, detail)
+            """
+            content_hash = group[0]['content_hash']
+            for problem in group:
+                # Corrupt content is kept aside before its key is written again
+                if problem['kind'] == 'corrupt' and quarantine and not problem['location'].startswith('http'):
+                    _quarantine(backend, problem['location'], folder)
+                    problem['action'] = 'quarantined'
+            if not repair:
+                return None, None
+            if not content_hash:
+                return None, 'no content hash to find a copy by'
+            key = BlobStore.relative_path(content_hash)
+            # The content is intact at its key already: only the rows move
+            if key in healthy.get(content_hash, []):
+                return key, None
+            errors = []
+            for kind, ref in sources(content_hash):
+                try:
+                    with open_source(kind, ref) as stream:
+                        reader = HashingReader(stream)
+                        location = backend.put(key, reader)
+                    if reader.hexdigest() == content_hash:
+                        return location, None
+                    backend.delete(key)
+                    errors.append(f"{ref}: content doesn't match its hash")
+                except Exception as e:
+                    errors.append(f"{ref}: {e}")
+            return None, '; '.join(errors) or 'no other copy of the content'
+
+        def safe_fix(group):
+            try:
+                return fix(group)
+            except Exception as e:
+                return None, str(e)
+
+        if broken and (repair or quarantine) and not summary['stopped']:
+            # Locations sharing content are repaired together, with one copy
+            groups = {}
+            for problem in broken:
+                groups.setdefault(problem['content_hash'] or problem['location'], []).append(problem)
+            groups = list(groups.values())
+            changes = []
+            blob_locations = {}
+            for group, (location, detail) in zip(groups, pool.map(safe_fix, groups)):
+                for problem in group:
+                    summary['quarantined'] += problem['action'] == 'quarantined'
+                    if detail:
+                        problem['detail'] = f"{problem['detail']}; {detail}"
+                    if location:
+                        problem['action'] = 'repaired'
+                        summary['repaired'] += 1
+                        changes.extend({'id': row_id, 'file_path': location}
+                                       for row_id in problem['rows'] if problem['location'] != location)
+                    elif repair:
+                        problem['action'] = problem['action'] or 'unrecoverable'
+                        summary['unrecoverable'] += 1
+                if location:
+                    blob_locations[group[0]['content_hash']] = location
+            for chunk in _chunks(changes, SCRUB_CHUNK_SIZE):
+                update_pyq_files_bulk(chunk)
+            update_blob_locations(blob_locations)
+            summary['rows_rewritten'] = len(changes)
+
+    summary['seconds'] = round(time.time() - started, 3)
+    summary['files_per_second'] = round(summary['checked'] / max(summary['seconds'], 1e-6))
+    print(f"✓ Storage scrub of {backend.store_id} {'stopped' if summary['stopped'] else 'complete'}: "
+          f"{summary['checked']} locations checked ({summary['files_per_second']}/s), "
+          f"{summary['missing']} missing, {summary['corrupt']} corrupt, {summary['errors']} unreachable, "
+          f"{summary['orphans']} orphaned; {summary['repaired']} repaired, {summary['quarantined']} quarantined, "
+          f"{summary['unrecoverable']} unrecoverable in {summary['seconds']:.1f}s")
+    return summary
+
+
+class ScrubWorker(BackgroundTask):
+    """Runs scrub_storage every interval_seconds (0: only when asked)"""
+    name = 'Storage scrub'
+
+    def __init__(self, backend=None, interval_seconds=SCRUB_INTERVAL_SECONDS, workers=None):
+        super().__init__(interval_seconds)
+        self.backend = backend
+        self.workers = workers
+
+    def run_once(self, progress_callback, stop_event):
+        summary = scrub_storage(self.backend, workers=self.workers,
+                                progress_callback=progress_callback, stop_event=stop_event)
+        summary['problems'] = summary['problems'][:100]
+        return summary
+
+
+# Process-wide worker, started from app.py
+_worker = None
+
+def get_scrub_worker():
+    """Get the process-wide storage scrub worker (None until started)"""
+    return _worker
+
+def start_scrub_worker(interval_seconds=SCRUB_INTERVAL_SECONDS):
+    """Start the process-wide storage scrub worker"""
+    global _worker
+    if _worker is None:
+        _worker = ScrubWorker(interval_seconds=interval_seconds)
+        _worker.start()
+    return _worker
+
+
+if __name__ == '__main__':
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    report_only = 'report-only' in options
+    result = scrub_storage(
+        verify_hashes=True if 'verify' in options else None,
+        repair=False if report_only or 'no-repair' in options else None,
+        quarantine=False if report_only or 'no-quarantine' in options else None,
+        workers=int(options['workers']) if options.get('workers') else None,
+    )
+    for problem in result['problems'][:20]:
+        print(f"  ⚠️ {problem['kind']} {problem['location']} (rows {problem['rows'][:5]}): "
+              f"{problem['detail']}{' -> ' + problem['action'] if problem['action'] else ''}")
+    if len(result['problems']) > 20:
+        print(f"  ... and {len(result['problems']) - 20} more")
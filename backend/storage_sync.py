@@ -0,0 +1,318 @@
+"""
+Storage Sync - Reconciles stored papers with a storage backend
+pyq_files rows point at local blobs (PDF_STORAGE_PATH), older flat files
+or links (Cloudinary, Drive uploads). sync_storage() compares them with a
+target backend (SYNC_TARGET) by content hash:
+1. rows without a content hash are hashed (local file or download) and
+   the hashes saved
+2. each distinct blob not recorded in blob_replicas for the target's
+   store yet is looked up there and, when missing, uploaded from its
+   local copy or link on a thread pool; uploads are hashed on the way and
+   deleted again if they don't match
+3. copies are checkpointed in blob_replicas as they finish, so a stopped
+   or crashed sync resumes where it left off
+4. rows are pointed at their copies in bulk, when the app can serve them
+   from there: the copy is a link, or the target is STORAGE_BACKEND
+Runs from the command line or in the background (SyncWorker)
+
+Usage: python storage_sync.py [--target=s3] [--workers=8] [--dry-run]
+"""
+import os
+import sys
+import time
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    STORAGE_BACKEND, SYNC_TARGET, SYNC_WORKERS, SYNC_CHUNK_SIZE, SYNC_INTERVAL_SECONDS
+)
+from blob_store import BlobStore
+from background_task import BackgroundTask
+from storage import LocalBackend, StoragePaused, create_backend
+from database import (
+    get_pyq_file_locations, update_pyq_files_bulk, update_blob_locations, get_blob_replicas, record_blob_replicas
+)
+
+PROGRESS_SECONDS = 5  # how often a running sync reports its rate
+
+
+class HashingReader:
+    """Readable stream that hashes what is read through it"""
+
+    def __init__(self, source):
+        self.source = source
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def _source(location, content_hash, local):
+    """Where a blob can be read from: ('local', path), ('link', url) or None"""
+    if content_hash:
+        path = local.local_path(BlobStore.relative_path(content_hash))
+        if os.path.exists(path):
+            return 'local', path
+    if location.startswith('http'):
+        return 'link', location
+    # A content-addressed key or an older flat file name
+    path = local.local_path(location)
+    return ('local', path) if os.path.exists(path) else None
+
+
+def _open(source, http):
+    kind, ref = source
+    if kind == 'link':
+        response = http.get(ref, stream=True, timeout=(10, 60))
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw
+    return open(ref, 'rb')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _rate(size, seconds):
+    return f"{size / 1024 / 1024:.1f} MB at {size / 1024 / 1024 / max(seconds, 1e-6):.1f} MB/s"
+
+
+def sync_storage(target=None, dry_run=False, workers=None, progress_callback=None, stop_event=None):
+    """
+    Copy every blob pyq_files refers to into the target backend and point
+    the rows at the copies
+    target: backend or backend name (default SYNC_TARGET, else STORAGE_BACKEND)
+    dry_run: hash and look up, but upload and update nothing
+    workers: blobs transferred at once (default SYNC_WORKERS)
+    progress_callback(done, total, bytes) is called as blobs finish
+    stop_event: set it to stop early (finished blobs are kept)
+    Returns: summary dict with counts (rows, blobs, hashed, synced_before,
+             present, uploaded, failed, missing, rows_rewritten), bytes,
+             seconds and bytes_per_second of the transfer, stopped,
+             paused_for (the target refused uploads) and errors
+    """
+    if target is None or isinstance(target, str):
+        target = create_backend(target or SYNC_TARGET or STORAGE_BACKEND)
+    workers = max(1, workers or SYNC_WORKERS)
+    stop_event = stop_event or threading.Event()
+    local = LocalBackend()
+    started = time.time()
+    summary = {
+        'target': target.store_id, 'dry_run': dry_run, 'rows': 0, 'blobs': 0, 'hashed': 0, 'synced_before': 0,
+        'present': 0, 'uploaded': 0, 'failed': 0, 'missing': 0, 'rows_rewritten': 0,
+        'bytes': 0, 'seconds': 0, 'bytes_per_second': 0, 'stopped': False, 'paused_for': None, 'errors': []
+    }
+
+    # Links are downloaded over one pool of keep-alive connections
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+
+    # Read every row once, by id
+    rows = []
+    after_id = 0
+    while True:
+        page = get_pyq_file_locations(after_id, SYNC_CHUNK_SIZE)
+        if not page:
+            break
+        rows.extend(page)
+        after_id = page[-1]['id']
+    summary['rows'] = len(rows)
+
+    # 1. Hash rows stored before content hashes were kept (one read per location)
+    unhashed = defaultdict(list)
+    for row in rows:
+        if not row['content_hash']:
+            unhashed[row['file_path']].append(row)
+
+    def hash_location(location):
+        source = _source(location, None, local)
+        if source is None:
+            return location, None, 'no stored copy'
+        try:
+            with _open(source, http) as stream:
+                return location, BlobStore().hash_stream(stream)[0], None
+        except Exception as e:
+            return location, None, str(e)
+
+    if unhashed:
+        hashed = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for location, content_hash, error in pool.map(hash_location, unhashed):
+                if content_hash is None:
+                    summary['missing'] += 1
+                    summary['errors'].append({'location': location, 'error': error})
+                    continue
+                for row in unhashed[location]:
+                    row['content_hash'] = content_hash
+                    hashed.append({'id': row['id'], 'content_hash': content_hash})
+        if not dry_run:
+            for chunk in _chunks(hashed, SYNC_CHUNK_SIZE):
+                update_pyq_files_bulk(chunk)
+        summary['hashed'] = len(hashed)
+
+    # 2. Copy each distinct blob the target doesn't have yet
+    blobs = {}
+    for row in rows:
+        if row['content_hash']:
+            blob = blobs.setdefault(row['content_hash'], {'rows': [], 'source': None})
+            blob['rows'].append(row)
+            if blob['source'] is None:
+                blob['source'] = _source(row['file_path'], row['content_hash'], local)
+    summary['blobs'] = len(blobs)
+
+    replicas = get_blob_replicas(target.store_id)
+    pending = [content_hash for content_hash in blobs if content_hash not in replicas]
+    summary['synced_before'] = len(blobs) - len(pending)
+    paused = []
+
+    def transfer(content_hash):
+        """Returns: (outcome, location, size, error)"""
+        if stop_event.is_set() or paused:
+            return 'skipped', None, None, None
+        key = BlobStore.relative_path(content_hash)
+        try:
+            existing = target.stat(key)
+            if existing:
+                return 'present', existing['location'], existing['size'], None
+            source = blobs[content_hash]['source']
+            if source is None:
+                return 'missing', None, None, 'no stored copy to upload from'
+            if dry_run:
+                return 'uploaded', None, 0, None
+            with _open(source, http) as stream:
+                reader = HashingReader(stream)
+                location = target.put(key, reader)
+            if reader.hexdigest() != content_hash:
+                target.delete(key)
+                return 'failed', None, None, f"content doesn't match its hash (read {reader.hexdigest()})"
+            return 'uploaded', location, reader.size, None
+        except StoragePaused as e:
+            paused.append(e.retry_after)
+            return 'skipped', None, None, None
+        except Exception as e:
+            return 'failed', None, None, str(e)
+
+    transfer_started = time.time()
+    reported = transfer_started
+    checkpoint = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(transfer, content_hash): content_hash for content_hash in pending}
+        for future in as_completed(futures):
+            content_hash = futures[future]
+            outcome, location, size, error = future.result()
+            done += 1
+            if outcome in ('present', 'uploaded'):
+                summary[outcome] += 1
+                if outcome == 'uploaded':
+                    summary['bytes'] += size
+                if location:
+                    replicas[content_hash] = {'location': location, 'size': size}
+                    checkpoint.append({'content_hash': content_hash, 'location': location, 'size': size})
+            elif outcome in ('missing', 'failed'):
+                summary[outcome] += 1
+                summary['errors'].append({'content_hash': content_hash, 'error': error})
+
+            if not dry_run and (len(checkpoint) >= SYNC_CHUNK_SIZE or (checkpoint and done == len(pending))):
+                record_blob_replicas(target.store_id, checkpoint)
+                checkpoint = []
+            if progress_callback:
+                progress_callback(done, len(pending), summary['bytes'])
+            if time.time() - reported >= PROGRESS_SECONDS:
+                reported = time.time()
+                print(f"↻ Storage sync: {done}/{len(pending)} blobs, "
+                      f"{_rate(summary['bytes'], reported - transfer_started)}")
+    if not dry_run:
+        record_blob_replicas(target.store_id, checkpoint)
+    summary['seconds'] = round(time.time() - transfer_started, 3)
+    summary['bytes_per_second'] = round(summary['bytes'] / max(summary['seconds'], 1e-6))
+    summary['stopped'] = stop_event.is_set()
+    summary['paused_for'] = max(paused) if paused else None
+
+    # 3. Point rows (and the blob index) at the copies the app can serve
+    servable = target.name == STORAGE_BACKEND
+    changes = []
+    locations = {}
+    for content_hash, replica in replicas.items():
+        location = replica['location']
+        if content_hash not in blobs or not (servable or location.startswith('http')):
+            continue
+        locations[content_hash] = location
+        changes.extend({'id': row['id'], 'file_path': location}
+                       for row in blobs[content_hash]['rows'] if row['file_path'] != location)
+    summary['rows_rewritten'] = len(changes)
+    if not dry_run:
+        for chunk in _chunks(changes, SYNC_CHUNK_SIZE):
+            update_pyq_files_bulk(chunk)
+        hashes = list(locations)
+        for chunk in _chunks(hashes, SYNC_CHUNK_SIZE):
+            update_blob_locations({content_hash: locations[content_hash] for content_hash in chunk})
+
+    print(f"✓ Storage sync to {target.store_id} {'(dry run) ' if dry_run else ''}"
+          f"{'stopped' if summary['stopped'] else 'paused' if paused else 'complete'}: "
+          f"{summary['uploaded']} uploaded ({_rate(summary['bytes'], summary['seconds'])}), "
+          f"{summary['present'] + summary['synced_before']} already there, {summary['failed']} failed, "
+          f"{summary['missing']} missing, {summary['rows_rewritten']} rows updated "
+          f"in {time.time() - started:.1f}s")
+    return summary
+
+
+class SyncWorker(BackgroundTask):
+    """Runs sync_storage every interval_seconds (0: only when asked)"""
+    name = 'Storage sync'
+
+    def __init__(self, target=None, interval_seconds=SYNC_INTERVAL_SECONDS, workers=None):
+        super().__init__(interval_seconds)
+        self.target = target
+        self.workers = workers
+
+    def run_once(self, progress_callback, stop_event):
+        summary = sync_storage(self.target, workers=self.workers,
+                               progress_callback=progress_callback, stop_event=stop_event)
+        summary['errors'] = summary['errors'][:100]
+        # A target refusing uploads is tried again once it has had time to recover
+        summary['retry_after'] = summary['paused_for']
+        return summary
+
+
+# Process-wide worker, started from app.py
+_worker = None
+
+def get_sync_worker():
+    """Get the process-wide storage sync worker (None until started)"""
+    return _worker
+
+def start_sync_worker(interval_seconds=SYNC_INTERVAL_SECONDS):
+    """Start the process-wide storage sync worker"""
+    global _worker
+    if _worker is None:
+        _worker = SyncWorker(interval_seconds=interval_seconds)
+        _worker.start()
+    return _worker
+
+
+if __name__ == '__main__':
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    result = sync_storage(
+        target=options.get('target') or None,
+        dry_run='dry-run' in options,
+        workers=int(options['workers']) if options.get('workers') else None,
+    )
+    for error in result['errors'][:20]:
+        print(f"  ⚠️ {error.get('content_hash') or error.get('location')}: {error['error']}")
+    if len(result['errors']) > 20:
+        print(f"  ... and {len(result['errors']) - 20} more")
@@ -0,0 +1,145 @@
+"""
+Subject code knowledge index
+Maps normalized subject codes ("PCC-CE304" -> "PCCCE304") to the branch,
+subject name and semesters of the papers already stored under them. It is
+built from pyq_files once per process and kept current as papers are
+inserted or replaced, so the filename parser can fill in the branch or
+name a filename doesn't state. Only fields a stored paper's own filename
+stated are recorded (see filename_classifier.parse_inferred): values that
+were guessed, or filled in from the index, never feed it back
+"""
+import threading
+from collections import Counter
+from filename_classifier import parse_inferred
+
+
+def normalize_code(subject_code):
+    """Upper-case a subject code and drop separators ("pcc-ce 304" -> "PCCCE304")"""
+    return ''.join(char for char in subject_code.upper() if char.isalnum())
+
+
+class SubjectIndex:
+    """In-memory index of stored subject codes"""
+
+    def __init__(self, rows=()):
+        """rows: (subject_code, branch, semester, subject_name, inferred) tuples"""
+        self._codes = {}
+        self._lock = threading.Lock()
+        self.add_rows(rows)
+
+    @classmethod
+    def from_database(cls):
+        """Build the index from every paper in pyq_files"""
+        from database import get_subject_code_rows
+        return cls(get_subject_code_rows())
+
+    def add_rows(self, rows):
+        """Record (subject_code, branch, semester, subject_name, inferred) tuples"""
+        self._update(rows, 1)
+
+    def remove_rows(self, rows):
+        """Forget rows recorded earlier (papers replaced or rewritten since)"""
+        self._update(rows, -1)
+
+    def _update(self, rows, count):
+        with self._lock:
+            for subject_code, branch, semester, subject_name, inferred in rows:
+                code = normalize_code(subject_code)
+                inferred = parse_inferred(inferred)
+                if not code or ('branch' in inferred and 'subject_name' in inferred):
+                    continue
+                entry = self._codes.get(code)
+                if entry is None:
+                    entry = self._codes[code] = {'branches': Counter(), 'names': Counter(), 'semesters': Counter()}
+                if 'branch' not in inferred:
+                    entry['branches'][branch] += count
+                if 'subject_name' not in inferred:
+                    entry['names'][subject_name] += count
+                entry['semesters'][int(semester)] += count
+                if count < 0:
+                    # Drop what no stored paper supports any more
+                    for counter in entry.values():
+                        for key in [key for key, seen in counter.items() if seen <= 0]:
+                            del counter[key]
+                    if not entry['semesters']:
+                        del self._codes[code]
+
+    def get(self, subject_code):
+        """
+        What is known about a code
+        Returns: dict with branches, subject_name (most common stated name,
+                 or None) and semesters, or None for an unknown code
+        """
+        with self._lock:
+            entry = self._codes.get(normalize_code(subject_code))
+            if entry is None:
+                return None
+            return {
+                'branches': sorted(entry['branches']),
+                'subject_name': entry['names'].most_common(1)[0][0] if entry['names'] else None,
+                'semesters': sorted(entry['semesters'])
+            }
+
+    def lookup(self, subject_code, semester):
+        """
+        Branch and subject name for a paper whose filename lacks them, where
+        the index settles them: the code was already seen in this semester,
+        the branch when the code is stored under exactly one branch (shared
+        first-year codes have none), the name when one was ever stated
+        Returns: (branch or None, subject_name or None), or None for an
+                 unknown code or a new semester
+        """
+        with self._lock:
+            entry = self._codes.get(normalize_code(subject_code))
+            if entry is None or semester not in entry['semesters']:
+                return None
+            branches = entry['branches']
+            return (
+                next(iter(branches)) if len(branches) == 1 else None,
+                entry['names'].most_common(1)[0][0] if entry['names'] else None
+            )
+
+    def __len__(self):
+        return len(self._codes)
+
+
+# Process-wide index (built from the database on first use)
+_index = None
+_index_lock = threading.Lock()
+
+def get_subject_index():
+    """Get the process-wide SubjectIndex (an empty one if the database can't be read)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    index = SubjectIndex.from_database()
+                    print(f"✓ Subject index loaded: {len(index)} codes")
+                except Exception as e:
+                    print(f"⚠️ Could not load subject index: {e}")
+                    index = SubjectIndex()
+                _index = index
+    return _index
+
+def reset_subject_index():
+    """Rebuild the process-wide index (if loaded) after stored rows are rewritten"""
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index = SubjectIndex.from_database()
+
+def _paper_row(paper):
+    return (paper['subject_code'], paper['branch'], paper['semester'], paper['subject_name'], paper.get('inferred'))
+
+def note_papers(papers, replaced=()):
+    """
+    Keep the loaded index current after a commit
+    papers: inserted or rewritten papers (dicts with subject_code, branch,
+            semester, subject_name and inferred)
+    replaced: the stored values those rewrites replaced
+    """
+    if _index is None:
+        return
+    _index.remove_rows(_paper_row(paper) for paper in replaced)
+    _index.add_rows(_paper_row(paper) for paper in papers)
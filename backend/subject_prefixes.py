@@ -0,0 +1,83 @@
+"""
+Subject code prefix registry
+The prefixes a subject code may start with live in subject_prefixes.json
+(prefix -> category). They are compiled into a character trie, so finding
+the longest prefix of a code is a single left-to-right scan of the code,
+however many prefixes are registered. The filename parser and the prefix
+analysis scripts share the process-wide registry (get_prefix_registry)
+"""
+import os
+import json
+
+PREFIXES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subject_prefixes.json')
+
+# Key under which a trie node stores (prefix, category) when a prefix ends there
+_END = ''
+
+
+class PrefixRegistry:
+    """Subject code prefixes compiled into a trie"""
+
+    def __init__(self, prefixes):
+        """prefixes: mapping of prefix -> category (prefixes are upper-cased)"""
+        self.categories = {}
+        self._root = {}
+        for prefix, category in prefixes.items():
+            self.add(prefix, category)
+
+    @classmethod
+    def load(cls, path=PREFIXES_PATH):
+        """Build a registry from a JSON file with a "prefixes" object"""
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f)['prefixes'])
+
+    def add(self, prefix, category):
+        """Register one prefix (replacing its category if already present)"""
+        prefix = prefix.upper()
+        if not prefix:
+            raise ValueError("Empty subject code prefix")
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_END] = (prefix, category)
+        self.categories[prefix] = category
+
+    def longest_match(self, code):
+        """
+        Longest registered prefix of code (compared upper-case)
+        Returns: (prefix, category), or None if no prefix matches
+        """
+        node = self._root
+        match = None
+        for char in code.upper():
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(_END, match)
+        return match
+
+    def matches(self, code):
+        """Whether code starts with any registered prefix"""
+        return self.longest_match(code) is not None
+
+    @property
+    def prefixes(self):
+        """Registered prefixes, in registration order"""
+        return list(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def __contains__(self, prefix):
+        return prefix.upper() in self.categories
+
+
+# Process-wide registry (loaded on first use)
+_registry = None
+
+def get_prefix_registry():
+    """Get the process-wide PrefixRegistry loaded from subject_prefixes.json"""
+    global _registry
+    if _registry is None:
+        _registry = PrefixRegistry.load()
+    return _registry
@@ -0,0 +1,8 @@
+"""
+WSGI entry point for production servers (gunicorn / waitress: wsgi:app)
+Starts the background workers along with the app; importing app.py on
+its own (scripts, checks, serverless) starts no threads
+"""
+from app import app, start_background_workers
+
+start_background_workers()
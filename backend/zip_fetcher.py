@@ -1,58 +1,578 @@
 """
 ZIP Fetcher - Downloads ZIP files from URLs server-side
 Bypasses browser upload limitations by using server-to-server downloads
+
+Downloads are resumable: bytes go to "<zip>.part" next to a small
+"<zip>.part.json" record of the URL and validator (ETag / Last-Modified)
+they came from. A restarted download continues from the end of the
+partial file with an HTTP Range request, as long as the server supports
+ranges and the remote file hasn't changed. Large archives are fetched as
+several concurrent byte ranges, each resumed from where it stopped
 """
 import requests
 import os
-from config import UPLOAD_FOLDER
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    UPLOAD_FOLDER, MAX_FILE_SIZE, DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_SEGMENTS, DOWNLOAD_SEGMENT_MIN_SIZE, DOWNLOAD_SEGMENT_RETRIES, INGEST_PIPELINE,
+    ARCHIVE_CACHE_ENABLED
+)
+
+
+# Smaller reads while a reader follows the download, so it sees bytes sooner
+_FOLLOWED_CHUNK_SIZE = 512 * 1024
+
 
-def fetch_zip_from_url(url, filename, timeout=300):
+class ZipTooLargeError(Exception):
+    """The archive is larger than MAX_FILE_SIZE"""
+
+
+def probe_url(url, timeout=30):
     """
-    Download ZIP file from URL with streaming
-    
+    Ask the server about a download without fetching it (HEAD)
+    Returns: dict with size (Content-Length or None), accepts_ranges,
+             validator (ETag, else Last-Modified, else None), etag,
+             last_modified and final url
+    """
+    response = requests.head(url, timeout=timeout, allow_redirects=True)
+    if response.status_code >= 400:
+        # Some servers don't implement HEAD; the GET headers are checked instead
+        return {'size': None, 'accepts_ranges': False, 'validator': None, 'etag': None, 'last_modified': None,
+                'url': url}
+    length = response.headers.get('Content-Length')
+    return {
+        'size': int(length) if length and length.isdigit() else None,
+        'accepts_ranges': response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+        'validator': response.headers.get('ETag') or response.headers.get('Last-Modified'),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'url': response.url
+    }
+
+
+def _load_state(state_path):
+    """Read a partial download's record, or None"""
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state_path, state):
+    """Write a partial download's record"""
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+
+
+def download_zip(url, zip_path, progress_callback=None, timeout=300, chunk_size=None, max_size=None,
+                 segments=None, prefix_callback=None, validators=None):
+    """
+    Download url to zip_path, resuming an earlier partial download
+    Archives of at least DOWNLOAD_SEGMENT_MIN_SIZE from servers that accept
+    ranges are fetched as `segments` concurrent byte ranges (see
+    _download_segmented); otherwise, or if the server stops honouring
+    ranges, as a single stream
+
+    Args:
+        url: Direct download URL for ZIP file
+        zip_path: Where the finished file goes
+        progress_callback: called as progress_callback(downloaded, total)
+                           after each chunk (total is None if unknown;
+                           segmented downloads call it from their threads)
+        timeout: Connect/read timeout in seconds (default: 5 minutes)
+        chunk_size: Bytes per read (default DOWNLOAD_CHUNK_SIZE)
+        max_size: Largest accepted archive (default MAX_FILE_SIZE)
+        segments: Concurrent ranges for large archives (default DOWNLOAD_SEGMENTS)
+        prefix_callback: called as prefix_callback(length) whenever the
+                         complete leading part of "<zip>.part" grows (with
+                         0 when the download starts over), so a reader can
+                         follow the file while it downloads (see
+                         download_pipeline.py)
+        validators: optional dict, filled with the etag and last_modified
+                    of the version that was downloaded (for conditional
+                    re-fetches, see archive_cache.py)
+
+    Returns:
+        int: file size
+
+    Raises:
+        ZipTooLargeError: If Content-Length (checked before any body bytes
+                          are read) or the bytes received exceed max_size
+        requests.RequestException: If the download fails; the partial
+                                   file is kept for the next attempt
+    """
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
+    if prefix_callback:
+        chunk_size = min(chunk_size, _FOLLOWED_CHUNK_SIZE)
+    max_size = max_size or MAX_FILE_SIZE
+    segments = segments or DOWNLOAD_SEGMENTS
+    part_path = zip_path + '.part'
+    state_path = part_path + '.json'
+
+    probe = probe_url(url, timeout=min(timeout, 30))
+    if probe['size'] is not None and probe['size'] > max_size:
+        raise ZipTooLargeError(f"Archive is {probe['size'] / (1024*1024):.0f} MB, "
+                               f"the limit is {max_size / (1024*1024):.0f} MB")
+    if validators is not None:
+        validators.update(etag=probe['etag'], last_modified=probe['last_modified'])
+
+    # Continue the partial file only if it came from the same, unchanged URL
+    state = _load_state(state_path)
+    resumable = (
+        os.path.exists(part_path) and probe['accepts_ranges'] and probe['validator'] and state and
+        state.get('url') == url and state.get('validator') == probe['validator']
+    )
+
+    segmented = (
+        segments > 1 and probe['accepts_ranges'] and probe['validator'] and
+        probe['size'] is not None and probe['size'] >= DOWNLOAD_SEGMENT_MIN_SIZE
+    )
+    if resumable and state.get('segments'):
+        ranges = state['segments']
+    elif segmented and not (resumable and os.path.getsize(part_path) > 0):
+        ranges = _split_ranges(probe['size'], segments)
+    else:
+        ranges = None
+
+    if ranges:
+        state = {'url': url, 'validator': probe['validator'], 'size': probe['size'], 'segments': ranges}
+        try:
+            _download_segmented(url, part_path, state, state_path, progress_callback, timeout, chunk_size,
+                                prefix_callback)
+        except RangeNotHonoured as e:
+            print(f"⚠️ {e}; downloading as a single stream")
+            resumable = False
+            if prefix_callback:
+                prefix_callback(0)
+        else:
+            return _finish_download(part_path, state_path, probe['size'])
+
+    offset = os.path.getsize(part_path) if resumable else 0
+    if probe['size'] is not None and offset > probe['size']:
+        offset = 0
+    _save_state(state_path, {'url': url, 'validator': probe['validator'], 'size': probe['size']})
+
+    if probe['size'] is not None and offset == probe['size']:
+        response = None
+    else:
+        headers = {}
+        if offset:
+            # If-Range: the server sends the whole file (200) if it changed meanwhile
+            headers = {'Range': f'bytes={offset}-', 'If-Range': probe['validator']}
+        response = requests.get(url, headers=headers, stream=True, timeout=timeout, allow_redirects=True)
+        response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0
+
+    if prefix_callback:
+        prefix_callback(offset)
+
+    total = probe['size']
+    if response is not None:
+        try:
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit():
+                total = offset + int(length)
+                if total > max_size:
+                    raise ZipTooLargeError(f"Archive is {total / (1024*1024):.0f} MB, "
+                                           f"the limit is {max_size / (1024*1024):.0f} MB")
+            if offset:
+                print(f"↻ Resuming {os.path.basename(zip_path)} at {offset / (1024*1024):.1f} MB")
+
+            downloaded = offset
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    downloaded += len(chunk)
+                    if downloaded > max_size:
+                        raise ZipTooLargeError(f"Archive exceeds the {max_size / (1024*1024):.0f} MB limit")
+                    f.write(chunk)
+                    if prefix_callback:
+                        f.flush()
+                        prefix_callback(downloaded)
+                    if progress_callback:
+                        progress_callback(downloaded, total)
+        finally:
+            response.close()
+
+    return _finish_download(part_path, state_path, total)
+
+
+def _finish_download(part_path, state_path, total):
+    """Check the partial file is complete and move it into place; returns its size"""
+    file_size = os.path.getsize(part_path)
+    if total is not None and file_size != total:
+        raise requests.RequestException(f"Download incomplete: {file_size} of {total} bytes")
+
+    os.replace(part_path, part_path[:-len('.part')])
+    os.remove(state_path)
+    return file_size
+
+
+class RangeNotHonoured(Exception):
+    """The server answered a range request with something other than that range"""
+
+
+def _split_ranges(size, segments):
+    """Split [0, size) into `segments` [start, end, written] ranges (end inclusive)"""
+    step = -(-size // segments)
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+
+def _download_segmented(url, part_path, state, state_path, progress_callback, timeout, chunk_size,
+                        prefix_callback=None):
+    """
+    Download the byte ranges in state['segments'] concurrently into a
+    preallocated part file. Each range is [start, end, written]: a
+    resumed download continues every range from start + written, and
+    progress is saved to state_path at most once a second
+    A failing range is retried on its own (DOWNLOAD_SEGMENT_RETRIES times,
+    with backoff) while the others keep going; once it gives up, or
+    progress_callback raises, every range stops and the error is raised
+    prefix_callback gets the end of the complete leading ranges (the
+    first range, then the next once it is done, and so on), only when it
+    grows and in order
+    Raises RangeNotHonoured if the server ignores or changes the ranges
+    """
+    size = state['size']
+    ranges = state['segments']
+    lock = threading.Lock()
+    stop = threading.Event()
+    done = [sum(written for _, _, written in ranges)]
+    saved = [time.monotonic()]
+
+    def prefix():
+        for start, end, written in ranges:
+            if written < end - start + 1:
+                return start + written
+        return size
+
+    # Preallocate (sparse where the filesystem allows); segments write in place
+    with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+        f.truncate(size)
+    _save_state(state_path, state)
+    reported = [prefix()]
+    if prefix_callback:
+        prefix_callback(reported[0])
+
+    def fetch(segment):
+        try:
+            fetch_range(segment)
+        except BaseException:
+            stop.set()  # the download fails; the other ranges stop at their next chunk
+            raise
+
+    def fetch_range(segment):
+        start, end, _ = segment
+        attempt = 0
+        while segment[2] < end - start + 1 and not stop.is_set():
+            position = start + segment[2]
+            headers = {'Range': f'bytes={position}-{end}', 'If-Range': state['validator']}
+            try:
+                with requests.get(url, headers=headers, stream=True, timeout=timeout,
+                                  allow_redirects=True) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206 or \
+                            not response.headers.get('Content-Range', '').startswith(f'bytes {position}-'):
+                        raise RangeNotHonoured(f"Server ignored range {position}-{end} of {url}")
+                    with open(part_path, 'r+b') as f:
+                        f.seek(position)
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if stop.is_set():
+                                return
+                            if not chunk:
+                                continue
+                            chunk = chunk[:end - start + 1 - segment[2]]
+                            f.write(chunk)
+                            if prefix_callback:
+                                f.flush()
+                            with lock:
+                                segment[2] += len(chunk)
+                                done[0] += len(chunk)
+                                downloaded = done[0]
+                                if time.monotonic() - saved[0] >= 1:
+                                    saved[0] = time.monotonic()
+                                    f.flush()
+                                    _save_state(state_path, state)
+                                # Reported under the lock so the prefix never goes back
+                                complete = prefix()
+                                if prefix_callback and complete > reported[0]:
+                                    reported[0] = complete
+                                    prefix_callback(complete)
+                            if progress_callback:
+                                progress_callback(downloaded, size)
+                    if segment[2] < end - start + 1 and not stop.is_set():
+                        raise requests.RequestException(f"Range {position}-{end} ended early")
+            except (requests.RequestException, OSError) as e:
+                attempt += 1
+                if attempt > DOWNLOAD_SEGMENT_RETRIES:
+                    raise
+                print(f"↻ Retrying range {start + segment[2]}-{end} ({attempt}/{DOWNLOAD_SEGMENT_RETRIES}): {e}")
+                time.sleep(min(2 ** attempt, 30) * 0.25)
+
+    pending = [segment for segment in ranges if segment[2] < segment[1] - segment[0] + 1]
+    if done[0]:
+        print(f"↻ Resuming {os.path.basename(part_path)} at {done[0] / (1024*1024):.1f} MB "
+              f"({len(pending)} ranges left)")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+            for future in [pool.submit(fetch, segment) for segment in pending]:
+                future.result()
+    finally:
+        with lock:
+            _save_state(state_path, state)
+
+
+def discard_partial(zip_path):
+    """Remove a partial download and its record"""
+    for path in (zip_path + '.part', zip_path + '.part.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def fetch_zip_from_url(url, filename, timeout=300, progress_callback=None):
+    """
+    Download ZIP file from URL into UPLOAD_FOLDER, resuming a partial download
+
     Args:
         url: Direct download URL for ZIP file
         filename: Name to save the file as
         timeout: Request timeout in seconds (default: 5 minutes)
-    
+        progress_callback: see download_zip
+
     Returns:
         tuple: (zip_path, file_size)
-    
+
     Raises:
-        requests.RequestException: If download fails
+        ZipTooLargeError: If the archive exceeds MAX_FILE_SIZE
+        Exception: If download fails
     """
+    zip_path = os.path.join(UPLOAD_FOLDER, filename)
     try:
-        # Make streaming request
-        response = requests.get(url, stream=True, timeout=timeout, allow_redirects=True)
-        response.raise_for_status()
-        
-        # Prepare file path
-        zip_path = os.path.join(UPLOAD_FOLDER, filename)
-        
-        # Download with streaming (memory efficient)
-        total_size = 0
-        with open(zip_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    total_size += len(chunk)
-        
-        file_size = os.path.getsize(zip_path)
+        file_size = download_zip(url, zip_path, progress_callback, timeout=timeout)
         print(f"✓ Downloaded {filename}: {file_size / (1024*1024):.2f} MB")
-        
         return zip_path, file_size
-        
+
+    except ZipTooLargeError:
+        discard_partial(zip_path)
+        raise
     except requests.Timeout:
         raise Exception(f"Download timeout after {timeout} seconds")
     except requests.RequestException as e:
         raise Exception(f"Download failed: {str(e)}")
-    except Exception as e:
-        # Clean up partial download
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+    except OSError as e:
         raise Exception(f"Error saving file: {str(e)}")
 
 
+def fetch_job_zip(job_id, on_progress=None):
+    """
+    Download (or resume downloading) a FETCHING job's archive, then write
+    its member manifest and mark it UPLOADED (COMPLETED if nothing to
+    ingest), or PROCESSING if it already had a manifest
+    With INGEST_PIPELINE, a first download stores accepted members while it
+    runs (see download_pipeline.py) and the manifest records them as done
+    If a download fails, what the pipeline stored is kept in
+    "<zip>.pipeline.json"; the next attempt doesn't store those members
+    again and the manifest records them as done
+    With ARCHIVE_CACHE_ENABLED the archive is kept in the archive cache; a
+    cached one the server reports unchanged isn't downloaded again, and a
+    job whose archive (by SHA-256) another job of the session already
+    fetched completes with nothing to process
+    Before the download, the only duplicate check is the cache's. The hash
+    of a fresh download is known only once it is complete, so its pipeline
+    relies on the session's ingest history instead: an archive ingested
+    before has its unchanged members skipped without being read
+    Progress is stored on the job; on_progress(downloaded, total) is also
+    called for each stored update (the ingest worker renews its lease there)
+    A too-large archive or an HTTP 4xx marks the job FAILED; other errors
+    propagate and leave the job FETCHING for the next attempt
+    Remote jobs only have their central directory read (see
+    _prepare_remote_job); they fall back to a full download when the
+    server doesn't support range requests
+    Returns: number of members to process
+    """
+    from database import (
+        get_upload_job, update_job_download, update_job_zip_path, update_job_status, count_job_members,
+        update_job_remote, update_job_archive_hash, update_job_progress, find_job_by_archive_hash
+    )
+    from batch_processor import BatchProcessor
+    from remote_archive import RangeNotSupported
+    from archive_cache import get_archive_cache
+
+    job = get_upload_job(job_id)
+    if not job:
+        raise ValueError(f"Job {job_id} not found")
+
+    if job['remote']:
+        try:
+            return _prepare_remote_job(job)
+        except RangeNotSupported as e:
+            print(f"⚠️ {e}; job {job_id} downloads the whole archive instead")
+            update_job_remote(job_id, False)
+
+    last_update = [0.0]
+    update_lock = threading.Lock()  # segmented downloads report from several threads
+    def record(downloaded, total):
+        # At most one database write per second
+        with update_lock:
+            now = time.monotonic()
+            due = now - last_update[0] >= 1 or downloaded == total
+            if due:
+                last_update[0] = now
+        if due:
+            update_job_download(job_id, downloaded, total)
+            if on_progress:
+                on_progress(downloaded, total)
+
+    # Members the pipeline stored during earlier, failed attempts
+    results_path = _job_zip_path(job) + '.pipeline.json'
+    ingested = _load_state(results_path)
+
+    # An archive cached from this URL is only downloaded again if it changed
+    cache = get_archive_cache() if ARCHIVE_CACHE_ENABLED else None
+    cached = cache.revalidate(job['zip_url']) if cache else None
+    archive_hash = None
+    if cached:
+        zip_path, file_size, archive_hash = cached['path'], cached['size'], cached['sha256']
+        print(f"✓ {job['zip_url']} not modified, using the cached archive for job {job_id}")
+    else:
+        print(f"⬇️ Fetching {job['filename']} for job {job_id} from {job['zip_url']}")
+        zip_path = _job_zip_path(job)
+
+        # A first download stores accepted members as their bytes arrive
+        pipeline = None
+        if INGEST_PIPELINE and count_job_members(job_id) == 0:
+            from download_pipeline import DownloadPipeline
+            pipeline = DownloadPipeline(job, zip_path, ingested)
+            pipeline.start()
+
+        validators = {}
+        try:
+            file_size = download_zip(job['zip_url'], zip_path, record,
+                                     prefix_callback=pipeline.advance if pipeline else None,
+                                     validators=validators)
+        except ZipTooLargeError as e:
+            discard_partial(zip_path)
+            print(f"Job {job_id} failed: {e}")
+            update_job_status(job_id, 'FAILED')
+            raise
+        except requests.HTTPError as e:
+            # Client errors won't go away on retry (timeouts and rate limits might)
+            if 400 <= e.response.status_code < 500 and e.response.status_code not in (408, 429):
+                print(f"Job {job_id} failed: {e}")
+                update_job_status(job_id, 'FAILED')
+            raise
+        finally:
+            if pipeline:
+                # Papers stored so far stay; kept until the manifest records them
+                ingested = pipeline.finish()
+                if ingested:
+                    _save_state(results_path, ingested)
+
+        if cache:
+            entry = cache.store(job['zip_url'], zip_path, validators.get('etag'), validators.get('last_modified'))
+            zip_path, archive_hash = entry['path'], entry['sha256']
+
+    update_job_download(job_id, file_size, file_size)
+    update_job_zip_path(job_id, zip_path)
+    if archive_hash:
+        update_job_archive_hash(job_id, archive_hash)
+
+    # A re-download (the ZIP went missing mid-job) keeps the job's manifest
+    if count_job_members(job_id) > 0:
+        update_job_status(job_id, 'PROCESSING')
+        print(f"Job {job_id} archive restored: {file_size / (1024*1024):.2f} MB")
+        _discard_results(results_path)
+        return count_job_members(job_id, 'PENDING')
+
+    # The same archive fetched again for the session has nothing new
+    if archive_hash:
+        duplicate = find_job_by_archive_hash(archive_hash, job['exam_type'], job['exam_year'], exclude_id=job_id)
+        if duplicate:
+            update_job_progress(job_id, 0, 'COMPLETED')
+            print(f"↷ Job {job_id} fetched the same archive as job {duplicate['id']}, nothing to queue")
+            _discard_results(results_path)
+            return 0
+
+    # Pre-classify members (members unchanged since the last ingest of this
+    # session are left out), then hand the job to batch processing
+    total = BatchProcessor(job_id).prepare_work_list(ingested)
+    _discard_results(results_path)
+    if total > 0:
+        update_job_status(job_id, 'UPLOADED')
+    print(f"Job {job_id} download complete: {file_size / (1024*1024):.2f} MB")
+    return total
+
+
+def _job_zip_path(job):
+    """
+    Where a job's archive is downloaded to; keyed by job so jobs for the same
+    session never share a partial download or saved pipeline results
+    """
+    return os.path.join(UPLOAD_FOLDER, f"job{job['id']}_{job['filename']}")
+
+
+def _discard_results(results_path):
+    """Remove saved pipeline results once the manifest has them"""
+    if os.path.exists(results_path):
+        os.remove(results_path)
+
+
+def find_unchanged_job(url, exam_type, exam_year):
+    """
+    Find the job that already fetched url's archive for an exam session,
+    if the server reports the cached archive unchanged (so fetch-zip can
+    point at it instead of queueing the same archive again)
+    Returns: job dict (see get_upload_job) or None
+    """
+    if not ARCHIVE_CACHE_ENABLED:
+        return None
+    from archive_cache import get_archive_cache
+    from database import find_job_by_archive_hash
+
+    cached = get_archive_cache().revalidate(url)
+    if not cached:
+        return None
+    return find_job_by_archive_hash(cached['sha256'], exam_type, exam_year)
+
+
+def _prepare_remote_job(job):
+    """
+    Read a remote job's central directory over range requests, write its
+    member manifest and mark it UPLOADED; members are fetched one range
+    each as batches process them. Nothing is stored, so MAX_FILE_SIZE
+    doesn't apply
+    Raises RangeNotSupported if the server can't serve ranges
+    Returns: number of members to process
+    """
+    from database import update_job_download, update_job_status, count_job_members
+    from batch_processor import BatchProcessor
+    from remote_archive import RemoteArchive
+
+    job_id = job['id']
+    print(f"🔗 Reading the central directory of {job['zip_url']} for job {job_id}")
+    with RemoteArchive(job['zip_url']) as archive:
+        update_job_download(job_id, archive.bytes_fetched, archive.size)
+        print(f"✓ Central directory: {len(archive.infolist())} entries, "
+              f"{archive.bytes_fetched / 1024:.0f} KB in {archive.requests_made} requests")
+
+    # The job is ready for batches once the server is known to serve ranges
+    update_job_status(job_id, 'UPLOADED')
+    if count_job_members(job_id) > 0:
+        update_job_status(job_id, 'PROCESSING')
+        return count_job_members(job_id, 'PENDING')
+
+    # The central directory is cached, so this doesn't read it again
+    total = BatchProcessor(job_id).prepare_work_list()
+    print(f"Job {job_id} reads {total} members from the remote archive")
+    return total
+
+
 def validate_zip_url(url):
     """
     Validate that URL is a direct download link
@@ -2,23 +2,35 @@
 ZIP file processing and PDF metadata extraction
 """
 import os
-import re
 import shutil
 import zipfile
-from config import UPLOAD_FOLDER, PDF_STORAGE_PATH, SEMESTER_MAPPING, BRANCHES
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import (
+    UPLOAD_FOLDER, PDF_STORAGE_PATH, BRANCHES,
+    INGEST_STREAMING, CLASSIFY_PROCESSES, ARCHIVE_MMAP, BATCH_IO_WORKERS
+)
+from archive_reader import MappedArchive
+from remote_archive import RemoteArchive
+from filename_classifier import get_classifier, classify_many
+from blob_store import BlobStore
+from storage import get_storage, StoragePaused
+from database import find_blob_candidates, register_blob
 
 class ZIPProcessor:
     """
     Handles ZIP file extraction and PDF metadata parsing
+    With archive_url the archive is read over HTTP range requests instead
+    of from zip_path (see remote_archive.py); only streaming works then
     """
     
-    def __init__(self, zip_path, exam_type, exam_year):
+    def __init__(self, zip_path, exam_type, exam_year, archive_url=None):
         self.zip_path = zip_path
         self.exam_type = exam_type
         self.exam_year = exam_year
+        self.archive_url = archive_url
         self.extracted_files = []
     
-    def process(self, progress_callback=None):
+    def process(self, progress_callback=None, streaming=None, members=None):
         """
         Main processing method:
         1. Extract ZIP
@@ -27,7 +39,16 @@ class ZIPProcessor:
         4. Filter engineering papers only
         5. Copy valid PDFs to storage
         6. Return metadata list
+        
+        With streaming=True (default from INGEST_STREAMING) steps 1-5 run
+        directly against the ZIP central directory, see _process_streaming();
+        members limits that to the given member names (a retry of 'left')
         """
+        if streaming is None:
+            streaming = INGEST_STREAMING
+        if streaming:
+            return self._process_streaming(progress_callback, members)
+        
         try:
             # Extract ZIP file
             extract_path = self._extract_zip()
@@ -59,6 +80,7 @@ class ZIPProcessor:
                 
                 metadata = self._parse_filename(pdf_path)
                 if metadata:
+                    metadata['member_name'] = os.path.relpath(pdf_path, extract_path).replace(os.path.sep, '/')
                     # Copy PDF to permanent storage
                     new_path = self._copy_to_storage(pdf_path, metadata)
                     if new_path:
@@ -96,6 +118,248 @@ class ZIPProcessor:
                 'error': str(e)
             }
     
+    def _process_streaming(self, progress_callback=None, members=None):
+        """
+        Streaming variant of process():
+        1. Walk the ZIP central directory
+        2. Parse each member name
+        3. Decompress accepted members straight into storage
+        
+        Rejected members are never written to disk and nothing is
+        extracted to UPLOAD_FOLDER.
+        Once storage pauses uploads (StoragePaused) the remaining members
+        are not stored: the result lists them in 'left' with 'retry_after'
+        seconds, and the ZIP is kept for process(members=left)
+        """
+        try:
+            valid_papers = []
+            upload_errors = []
+            left = []
+            retry_after = []
+            
+            with self.open_archive() as zip_ref:
+                total_pdfs = len(self._list_pdf_members(zip_ref))
+                accepted = self.classify_members(zip_ref)
+                if members is not None:
+                    members = set(members)
+                    accepted = [member for member in accepted if member['member_name'] in members]
+                print(f"Streaming {len(accepted)} accepted members from {os.path.basename(self.zip_path)}")
+                
+                def store(member):
+                    metadata = self._member_metadata(member)
+                    info = zip_ref.getinfo(member['member_name'])
+                    if retry_after:
+                        return info, metadata, None, True
+                    try:
+                        return info, metadata, self._stream_to_storage(zip_ref, info, metadata), False
+                    except StoragePaused as e:
+                        retry_after.append(e.retry_after)
+                        return info, metadata, None, True
+                
+                # Members inflate in parallel; results come back in archive order
+                with ThreadPoolExecutor(max_workers=max(1, BATCH_IO_WORKERS)) as pool:
+                    for i, (info, metadata, new_path, paused) in enumerate(pool.map(store, accepted)):
+                        # Report progress
+                        if progress_callback and i % 10 == 0:
+                            progress_callback(i, len(accepted))
+                        
+                        if paused:
+                            left.append(info.filename)
+                        elif new_path:
+                            metadata['file_path'] = new_path
+                            valid_papers.append(metadata)
+                        else:
+                            upload_errors.append(f"Failed to store {os.path.basename(info.filename)}")
+            
+            # Final progress update
+            if progress_callback:
+                progress_callback(len(accepted), len(accepted))
+            
+            # Check for total failure
+            if not valid_papers and upload_errors:
+                return {
+                    'success': False,
+                    'error': f'All {len(upload_errors)} accepted PDFs failed to store. Check server logs.'
+                }
+            
+            if left:
+                print(f"⚠️ Storage paused; {len(left)} members left for a retry in {max(retry_after):.0f}s")
+                return {
+                    'success': True,
+                    'total_pdfs': total_pdfs,
+                    'valid_papers': len(valid_papers),
+                    'papers': valid_papers,
+                    'left': left,
+                    'retry_after': max(retry_after)
+                }
+            
+            # Remove uploaded ZIP file (nothing was extracted)
+            self._cleanup(None)
+            
+            return {
+                'success': True,
+                'total_pdfs': total_pdfs,
+                'valid_papers': len(valid_papers),
+                'papers': valid_papers
+            }
+        
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def open_archive(self, mapped=None):
+        """
+        Open the ZIP for reading members
+        With mapped=True (default from ARCHIVE_MMAP) members are read through
+        a memory-mapped view, so threads can inflate different members in
+        parallel; otherwise a plain ZipFile is returned
+        Remote archives are opened as a RemoteArchive
+        """
+        if self.archive_url:
+            return RemoteArchive(self.archive_url)
+        if mapped is None:
+            mapped = ARCHIVE_MMAP
+        if mapped:
+            return MappedArchive(self.zip_path)
+        return zipfile.ZipFile(self.zip_path, 'r')
+    
+    def _list_pdf_members(self, zip_ref):
+        """List PDF members of an open ZipFile in central-directory order"""
+        return [
+            info for info in zip_ref.infolist()
+            if not info.is_dir() and info.filename.lower().endswith('.pdf')
+        ]
+    
+    def build_manifest(self, zip_ref=None):
+        """
+        Classify every PDF member from the ZIP central directory alone
+        No member data is decompressed
+        Returns: list of manifest entries in archive order, each with
+                 member_name, file_size, crc, status (PENDING for accepted
+                 members, REJECTED otherwise) and parsed metadata
+        """
+        if zip_ref is None:
+            opened = self.open_archive() if self.archive_url else zipfile.ZipFile(self.zip_path, 'r')
+            with opened as zip_ref:
+                return self.build_manifest(zip_ref)
+        
+        members = self._list_pdf_members(zip_ref)
+        parsed = self.parse_many([info.filename for info in members])
+        
+        entries = []
+        total_bytes = 0
+        accepted_bytes = 0
+        for info, metadata in zip(members, parsed):
+            total_bytes += info.file_size
+            entry = {
+                'member_name': info.filename,
+                'file_size': info.file_size,
+                'crc': info.CRC,
+                'status': 'REJECTED'
+            }
+            if metadata:
+                entry.update(metadata)
+                entry['status'] = 'PENDING'
+                accepted_bytes += info.file_size
+            entries.append(entry)
+        
+        accepted = sum(1 for entry in entries if entry['status'] == 'PENDING')
+        print(f"✓ Pre-classified {len(entries)} PDFs: {accepted} accepted "
+              f"({accepted_bytes / (1024*1024):.1f} of {total_bytes / (1024*1024):.1f} MB to inflate)")
+        return entries
+    
+    def parse_many(self, names, processes=None):
+        """
+        Parse many member names, in order
+        Uses a process pool when processes > 1 (default CLASSIFY_PROCESSES);
+        the regex work is CPU-bound and holds the GIL
+        """
+        if processes is None:
+            processes = CLASSIFY_PROCESSES
+        if processes <= 1 or len(names) < 1000:
+            return get_classifier().classify_many(names)
+        
+        # Each worker process compiles its own classifier once
+        size = max(1, len(names) // (processes * 4))
+        chunks = [names[i:i + size] for i in range(0, len(names), size)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return [result for chunk in pool.map(classify_many, chunks) for result in chunk]
+    
+    def classify_members(self, zip_ref=None):
+        """
+        Pre-classify ZIP members from the central directory alone
+        Returns: accepted manifest entries (see build_manifest) in archive order
+        """
+        return [entry for entry in self.build_manifest(zip_ref) if entry['status'] == 'PENDING']
+    
+    def _member_metadata(self, member):
+        """Build paper metadata for a pre-classified member"""
+        return {
+            'degree': member['degree'],
+            'branch': member['branch'],
+            'semester': member['semester'],
+            'subject_code': member['subject_code'],
+            'subject_name': member['subject_name'],
+            'inferred': member.get('inferred'),
+            'exam_type': self.exam_type,
+            'exam_year': self.exam_year,
+            'member_name': member['member_name']
+        }
+    
+    def _extracted_path(self, extract_path, member_name):
+        """Path that extractall() wrote a member to (mirrors zipfile's sanitizing)"""
+        arcname = member_name.replace('/', os.path.sep)
+        if os.path.altsep:
+            arcname = arcname.replace(os.path.altsep, os.path.sep)
+        arcname = os.path.splitdrive(arcname)[1]
+        invalid_parts = ('', os.path.curdir, os.path.pardir)
+        arcname = os.path.sep.join(part for part in arcname.split(os.path.sep) if part not in invalid_parts)
+        return os.path.join(extract_path, arcname)
+    
+    def _stream_to_storage(self, zip_ref, info, metadata):
+        """
+        Decompress a single ZIP member directly into content-addressed storage
+        (the STORAGE_BACKEND backend, see storage.py)
+        zip_ref is a ZipFile or MappedArchive; either verifies the CRC-32, and
+        a corrupt member never reaches storage
+        The SHA-256 is computed while streaming with bounded buffers. When a
+        stored blob has the same CRC32 and size, the member is only hashed
+        and nothing is written if it turns out to be a duplicate
+        Sets metadata['content_hash']
+        Returns: file path (the blob's location)
+        Raises: StoragePaused when the backend is refusing uploads for now
+        """
+        try:
+            storage = get_storage()
+            
+            # Likely duplicate of a stored paper - confirm by hash, write nothing
+            content_hash = None
+            candidates = find_blob_candidates(info.CRC, info.file_size)
+            if candidates:
+                with zip_ref.open(info, 'r') as source:
+                    content_hash, _ = BlobStore().hash_stream(source)
+            
+            # Members are opened again for the upload rather than spooled to disk
+            content_hash, location, size, created = storage.store(
+                lambda: zip_ref.open(info, 'r'), content_hash, info.file_size if content_hash else None
+            )
+            register_blob(content_hash, size, info.CRC, location)
+            
+            metadata['content_hash'] = content_hash
+            if created:
+                print(f"✓ Streamed to {storage.name} storage: {location}")
+            else:
+                print(f"✓ Already stored: {os.path.basename(info.filename)}")
+            return location
+            
+        except StoragePaused:
+            raise
+        except Exception as e:
+            print(f"ERROR streaming {info.filename}: {e}")
+            return None
+    
     def _extract_zip(self):
         """Extract ZIP file to temporary directory"""
         extract_path = os.path.join(UPLOAD_FOLDER, f'extract_{self.exam_type}_{self.exam_year}')
@@ -122,7 +386,8 @@ class ZIPProcessor:
     
     def _parse_filename(self, pdf_path):
         """
-        Parse PDF filename to extract metadata
+        Parse PDF filename to extract metadata (see filename_classifier.py;
+        the patterns are compiled once per process)
         
         University filename format:
         "10632S - Year - B.Sc. - B.Com. - B.Sc. (Information Technology) - B.C.A.- I  (CBCS Pattern) Semester-I Subject - UCA1C02..."
@@ -134,243 +399,33 @@ class ZIPProcessor:
         - Subject Code: BSC, ESC, PCC, HSMC, MC, etc.
         - Branch: CSE, IT, ME, CE, EE, ECE (Computer, Electrical, Mechanical, Civil, Electronics)
         """
-        filename = os.path.basename(pdf_path)
-        
-        # CRITICAL: Check if it's B.Tech or B.E ONLY (reject B.Sc, B.Com, BCA, B.Pharm, M.Tech, M.Sc, etc.)
-        has_btech = re.search(r'\bB\.Tech\b', filename, re.IGNORECASE)
-        has_be = re.search(r'\bB\.E\.?\b', filename, re.IGNORECASE)
-        has_model = re.search(r'Model\s+Curriculum', filename, re.IGNORECASE)
-        
-        # Reject if it's NOT B.Tech/B.E
-        if not (has_btech or has_be or has_model):
-            return None
-        
-        # Additional rejection: if it contains other degrees, reject
-        if re.search(r'\b(B\.Sc|B\.Com|BCA|B\.C\.A|B\.Pharm|M\.Tech|M\.Sc|M\.Pharm|M\.C\.A)', filename, re.IGNORECASE):
-            # Only accept if it ALSO has B.Tech or B.E in the same filename
-            if not (has_btech or has_be):
-                return None
-        
-        # Determine degree
-        if has_btech:
-            degree = 'B.Tech'
-        elif has_be:
-            degree = 'B.E'
-        else:
-            degree = 'B.Tech'  # Default for Model Curriculum
-        
-        # Extract semester (look for "Semester-I", "Semester-II", etc.)
-        semester = None
-        # Pattern: "Semester-I" or "Semester-III" or "Semester I" etc.
-        semester_pattern = r'Semester[- ]?(I{1,3}|IV|V|VI{1,2}|VIII?)\b'
-        semester_match = re.search(semester_pattern, filename, re.IGNORECASE)
-        if semester_match:
-            roman = semester_match.group(1).upper()
-            semester = SEMESTER_MAPPING.get(roman)
-        
-        if not semester:
-            return None  # Skip if semester not found
-        
-        # Extract subject code - more flexible pattern
-        subject_code = None
-        # Patterns: BSC101, ESC-201, PCC-CE304, STBSC101, SE1BECS, SE2BICS, etc.
-        # Updated to handle codes with digits in the middle (SE1BECS) or at the end (BSC101)
-        code_pattern = r'\b([A-Z]{2,6}[-]?[A-Z0-9]{1,8})\b'
-        code_matches = re.findall(code_pattern, filename)
-        
-        # Filter to get valid subject codes (BSC, ESC, PCC, HSMC, MC, OEC, PEC, ST, SE, TEE, BE prefixes, etc.)
-        valid_prefixes = ['BSC', 'ESC', 'PCC', 'HSMC', 'MC', 'OEC', 'PEC', 'ST', 'SE', 'TEE', 'BE', 'UB', 'PS', 'US', 'MMCS', 'STUG', 'STPG', 'BP', 'MPG', 'MPH', 'MED', 'IN', 'ET', 'PSES', 'PEPS', 'PECS', 'PCSS']
-        
-        for code in code_matches:
-            # Check if code starts with any valid prefix
-            for prefix in valid_prefixes:
-                if code.upper().startswith(prefix):
-                    subject_code = code.upper()
-                    break
-            if subject_code:
-                break
-        
-        if not subject_code:
-            return None  # Skip if subject code not found
-        
-        # Extract branch - look for engineering branches
-        branch = None
-        
-        # IMPROVED: Look for branch name closest to "Engineering" keyword for better accuracy
-        # This handles cases like "B.E. Mechanical Engineering (Model Curriculum) Semester-VII Subject - PCC-2 - Irrigation engineering"
-        # where we want to extract the branch from "Civil Engineering" not just "Civil"
-        
-        branch_patterns = {
-            'CSE': [
-                r'Computer\s+Science\s+(?:and\s+)?Engineering',
-                r'\bComputer\s+Science\b',
-                r'\bCSE\b',
-                r'\bCS\b'
-            ],
-            'IT': [
-                r'Information\s+Technology',
-                r'\bIT\b',
-                r'\bI\.T\b'
-            ],
-            'ME': [
-                r'Mechanical\s+Engineering',
-                r'\bMechanical\b(?!\s*Engineering\s*\(Model)',  # Mechanical but not in "Mechanical Engineering (Model Curriculum)"
-                r'\bME\b(?!\s*-)'  # ME but not ME-401 (subject code)
-            ],
-            'CE': [
-                r'Civil\s+Engineering',
-                r'\bCivil\b',
-                r'\bCE\b(?![\d-])'  # CE but not CE-304 or CE701
-            ],
-            'EE': [
-                r'Electrical\s+(?:Electronics\s+and\s+Power\s+)?Engineering',
-                r'Electrical\s+Engineering',
-                r'\bElectrical\b',
-                r'\bEE\b',
-                r'Electronics\s+and\s+Power'
-            ],
-            'ECE': [
-                r'Electronics\s+and\s+(?:Communication|Telecommunication)',
-                r'Telecommunication\s+Engineering',
-                r'\bElectronics\b(?!\s+and\s+Power)',
-                r'\bECE\b',
-                r'Instrumentation\s+Engineering'
-            ]
-        }
-        
-        # Strategy: Find the branch name that appears closest to the word "Engineering" or "Semester"
-        # This helps disambiguate when multiple branch names appear
-        
-        best_match = None
-        best_position = len(filename)
-        
-        # DEBUG: Track all matches
-        all_matches = []
-        
-        for br, patterns in branch_patterns.items():
-            for pattern in patterns:
-                match = re.search(pattern, filename, re.IGNORECASE)
-                if match:
-                    all_matches.append((br, pattern, match.group(), match.start()))
-                    # Find position of this match
-                    match_pos = match.start()
-                    
-                    # Prefer matches that are:
-                    # 1. Closer to "Engineering" keyword
-                    # 2. Closer to "Semester" keyword
-                    # 3. Earlier in filename (as tiebreaker)
-                    
-                    # Look for "Engineering" or "Semester" after this match
-                    context = filename[match_pos:]
-                    eng_match = re.search(r'\bEngineering\b', context, re.IGNORECASE)
-                    sem_match = re.search(r'\bSemester\b', context, re.IGNORECASE)
-                    
-                    if eng_match:
-                        # Distance to "Engineering" keyword
-                        distance = eng_match.start()
-                    elif sem_match:
-                        # Distance to "Semester" keyword
-                        distance = sem_match.start()
-                    else:
-                        # No context keyword found, use position in filename
-                        distance = match_pos
-                    
-                    # Prefer closer matches
-                    if distance < best_position:
-                        best_position = distance
-                        best_match = br
-                        branch = br
-        
-        # DEBUG: Print branch detection results
-        if all_matches and not branch:
-            print(f"  ⚠️  Found matches but no branch selected: {all_matches}")
-        elif all_matches:
-            print(f"  ✓ Branch: {branch}, All matches: {all_matches[:3]}")
-        
-        # If no branch found, try to infer from subject code or use default
-        if not branch:
-            # Try to infer from subject code prefix or context
-            if 'CS' in subject_code or 'IT' in subject_code:
-                branch = 'CSE'
-            elif 'ME' in subject_code or 'MED' in subject_code:
-                branch = 'ME'
-            elif 'CE' in subject_code or 'CIV' in subject_code:
-                branch = 'CE'
-            elif 'EE' in subject_code or 'EL' in subject_code or 'EP' in subject_code:
-                branch = 'EE'
-            elif 'EC' in subject_code or 'ET' in subject_code or 'IN' in subject_code:
-                branch = 'ECE'
-            else:
-                # Default to CSE if we can't determine
-                branch = 'CSE'
-        
-        # Extract subject name - everything after "Subject -" or after subject code
-        subject_name = "Unknown Subject"
-        
-        # Try pattern: "Subject - CODE - Name.pdf"
-        name_pattern1 = rf'Subject\s*-\s*{re.escape(subject_code)}\s*-\s*(.+?)\.pdf'
-        name_match = re.search(name_pattern1, filename, re.IGNORECASE)
-        
-        if name_match:
-            subject_name = name_match.group(1)
-        else:
-            # Try pattern: "CODE - Name.pdf"
-            name_pattern2 = rf'{re.escape(subject_code)}\s*-\s*(.+?)\.pdf'
-            name_match = re.search(name_pattern2, filename, re.IGNORECASE)
-            if name_match:
-                subject_name = name_match.group(1)
-        
-        # Clean up subject name
-        subject_name = re.sub(r'[_-]', ' ', subject_name)
-        subject_name = re.sub(r'\s+', ' ', subject_name).strip()
-        # Remove paper numbers like "Paper-I", "Paper-II"
-        subject_name = re.sub(r'\bPaper[-\s]?[IVX]+\b', '', subject_name, flags=re.IGNORECASE)
-        subject_name = re.sub(r'\s+', ' ', subject_name).strip()
-        
-        if subject_name and len(subject_name) > 3:
-            subject_name = subject_name.title()
-        else:
-            subject_name = "Engineering Subject"
-        
-        return {
-            'degree': degree,
-            'branch': branch,
-            'semester': semester,
-            'subject_code': subject_code,
-            'subject_name': subject_name
-        }
+        return get_classifier().classify(pdf_path)
     
     def _copy_to_storage(self, source_path, metadata):
         """
-        Copy PDF to local storage on Railway
-        Returns: relative file path
+        Copy PDF to content-addressed storage (the STORAGE_BACKEND backend)
+        Sets metadata['content_hash']
+        Returns: file path (the blob's location)
+        Raises: StoragePaused when the backend is refusing uploads for now
         """
         try:
-            from config import PDF_STORAGE_PATH
-            import shutil
-            
-            # Generate filename: SubjectCode_SubjectName.pdf
-            filename = f"{metadata['subject_code']}_{metadata['subject_name'].replace(' ', '_')}.pdf"
-            
-            # Ensure storage directory exists
-            os.makedirs(PDF_STORAGE_PATH, exist_ok=True)
+            storage = get_storage()
+            content_hash, location, size, created = storage.store(lambda: open(source_path, 'rb'))
+            register_blob(content_hash, size, None, location)
             
-            # Copy to storage
-            destination = os.path.join(PDF_STORAGE_PATH, filename)
-            shutil.copy2(source_path, destination)
-            
-            print(f"✓ Copied to local storage: {filename}")
-            
-            # Return relative path (just the filename)
-            return filename
+            metadata['content_hash'] = content_hash
+            print(f"✓ {'Copied to' if created else 'Already in'} {storage.name} storage: {location}")
+            return location
             
+        except StoragePaused:
+            raise
         except Exception as e:
             print(f"ERROR copying file: {e}")
             return None
     
     def _cleanup(self, extract_path):
         """Remove temporary extraction directory"""
-        if os.path.exists(extract_path):
+        if extract_path and os.path.exists(extract_path):
             shutil.rmtree(extract_path)
         
         # Remove uploaded ZIP file
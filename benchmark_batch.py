@@ -0,0 +1,90 @@
+"""
+Batch throughput benchmark
+Builds a synthetic archive of accepted engineering papers and times
+BatchProcessor.process_batch() draining it at different I/O pool sizes,
+then with a wall-clock budget per batch instead of a fixed size
+
+Usage: python benchmark_batch.py [members] [member_kb] [budget_ms]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_bench_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from database import init_database, create_upload_job
+from batch_processor import BatchProcessor
+
+BRANCHES = [
+    'Computer Science and Engineering', 'Mechanical Engineering', 'Civil Engineering',
+    'Electrical Engineering', 'Electronics and Telecommunication Engineering'
+]
+SEMESTERS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII']
+
+def build_archive(path, members, member_kb):
+    """Write a ZIP of members accepted by the parser, each with a unique subject code"""
+    rng = random.Random(42)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(members):
+            name = (f"{10000 + i} - Year - B.E. {rng.choice(BRANCHES)} (Model Curriculum) "
+                    f"Semester-{rng.choice(SEMESTERS)} Subject - PCC{i:05d} - Subject Number {i}.pdf")
+            # Half random (incompressible) half text, like a scanned PDF
+            body = b'%PDF-1.4\n' + rng.randbytes(member_kb * 512) + b'BT /F1 12 Tf (text) Tj ET\n' * (member_kb * 20)
+            zf.writestr(name, body)
+
+def run(zip_path, workers, batch_size=50, budget_ms=None, exam_year=2025):
+    """
+    Drain one job and return (members, seconds, batch results)
+    Each run needs its own exam_year: members already ingested for a
+    session are skipped as unchanged
+    """
+    job_path = os.path.join(WORK_DIR, f'job_{exam_year}.zip')
+    shutil.copy(zip_path, job_path)
+    job_id = create_upload_job(os.path.basename(job_path), job_path, 'Summer', exam_year, 0)
+    
+    batches = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        processor = BatchProcessor(job_id)
+        total = processor.prepare_work_list()
+        start = time.perf_counter()
+        while True:
+            result = processor.process_batch(batch_size, streaming=True, workers=workers, budget_ms=budget_ms)
+            batches.append(result)
+            if result['status'] != 'PROCESSING':
+                break
+        elapsed = time.perf_counter() - start
+    
+    shutil.rmtree(os.path.join(WORK_DIR, 'uploads', 'pdfs'), ignore_errors=True)
+    return total, elapsed, batches
+
+if __name__ == '__main__':
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    member_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    budget_ms = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    
+    init_database()
+    zip_path = os.path.join(WORK_DIR, 'synthetic.zip')
+    build_archive(zip_path, members, member_kb)
+    print(f"Archive: {members} members, {os.path.getsize(zip_path) / (1024*1024):.1f} MB")
+    
+    try:
+        for workers in (1, 2, 4, 8):
+            total, elapsed, _ = run(zip_path, workers, exam_year=2000 + workers)
+            print(f"workers={workers}: {total} PDFs in {elapsed:.2f}s ({total / elapsed:.1f} PDFs/s)")
+        
+        total, elapsed, batches = run(zip_path, 4, batch_size=500, budget_ms=budget_ms, exam_year=2100)
+        longest = max(batch['elapsed_ms'] for batch in batches)
+        print(f"budget_ms={budget_ms}: {total} PDFs in {elapsed:.2f}s over {len(batches)} batches "
+              f"(longest {longest} ms, sizes {[batch['batch_members'] for batch in batches]})")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
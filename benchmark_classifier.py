@@ -0,0 +1,243 @@
+"""
+Filename classifier check and benchmark
+Verifies FilenameClassifier.classify_many() against the golden corpus in
+classifier_golden.json, then times it against the regex-per-rule parser
+the corpus was generated from (reference_parse below: ZIPProcessor._parse_filename
+as it was before the classifier, minus its debug prints)
+
+Usage: python benchmark_classifier.py [--write-golden] [repeat]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, 'backend')
+
+from config import SEMESTER_MAPPING
+from filename_classifier import FilenameClassifier
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier_golden.json')
+# Speedup over the reference parser the classifier was asked for
+TARGET_SPEEDUP = 10
+
+def reference_parse(pdf_path):
+    """The original per-call regex parser (reference for the golden corpus)"""
+    filename = os.path.basename(pdf_path)
+    has_btech = re.search(r'\bB\.Tech\b', filename, re.IGNORECASE)
+    has_be = re.search(r'\bB\.E\.?\b', filename, re.IGNORECASE)
+    has_model = re.search(r'Model\s+Curriculum', filename, re.IGNORECASE)
+    if not (has_btech or has_be or has_model):
+        return None
+    if re.search(r'\b(B\.Sc|B\.Com|BCA|B\.C\.A|B\.Pharm|M\.Tech|M\.Sc|M\.Pharm|M\.C\.A)', filename, re.IGNORECASE):
+        if not (has_btech or has_be):
+            return None
+    degree = 'B.Tech' if has_btech else 'B.E' if has_be else 'B.Tech'
+
+    semester = None
+    semester_match = re.search(r'Semester[- ]?(I{1,3}|IV|V|VI{1,2}|VIII?)\b', filename, re.IGNORECASE)
+    if semester_match:
+        semester = SEMESTER_MAPPING.get(semester_match.group(1).upper())
+    if not semester:
+        return None
+
+    subject_code = None
+    valid_prefixes = ['BSC', 'ESC', 'PCC', 'HSMC', 'MC', 'OEC', 'PEC', 'ST', 'SE', 'TEE', 'BE', 'UB', 'PS', 'US', 'MMCS', 'STUG', 'STPG', 'BP', 'MPG', 'MPH', 'MED', 'IN', 'ET', 'PSES', 'PEPS', 'PECS', 'PCSS']
+    for code in re.findall(r'\b([A-Z]{2,6}[-]?[A-Z0-9]{1,8})\b', filename):
+        for prefix in valid_prefixes:
+            if code.upper().startswith(prefix):
+                subject_code = code.upper()
+                break
+        if subject_code:
+            break
+    if not subject_code:
+        return None
+
+    branch_patterns = {
+        'CSE': [r'Computer\s+Science\s+(?:and\s+)?Engineering', r'\bComputer\s+Science\b', r'\bCSE\b', r'\bCS\b'],
+        'IT': [r'Information\s+Technology', r'\bIT\b', r'\bI\.T\b'],
+        'ME': [r'Mechanical\s+Engineering', r'\bMechanical\b(?!\s*Engineering\s*\(Model)', r'\bME\b(?!\s*-)'],
+        'CE': [r'Civil\s+Engineering', r'\bCivil\b', r'\bCE\b(?![\d-])'],
+        'EE': [r'Electrical\s+(?:Electronics\s+and\s+Power\s+)?Engineering', r'Electrical\s+Engineering',
+               r'\bElectrical\b', r'\bEE\b', r'Electronics\s+and\s+Power'],
+        'ECE': [r'Electronics\s+and\s+(?:Communication|Telecommunication)', r'Telecommunication\s+Engineering',
+                r'\bElectronics\b(?!\s+and\s+Power)', r'\bECE\b', r'Instrumentation\s+Engineering']
+    }
+    branch = None
+    best_position = len(filename)
+    for br, patterns in branch_patterns.items():
+        for pattern in patterns:
+            match = re.search(pattern, filename, re.IGNORECASE)
+            if match:
+                match_pos = match.start()
+                context = filename[match_pos:]
+                eng_match = re.search(r'\bEngineering\b', context, re.IGNORECASE)
+                sem_match = re.search(r'\bSemester\b', context, re.IGNORECASE)
+                if eng_match:
+                    distance = eng_match.start()
+                elif sem_match:
+                    distance = sem_match.start()
+                else:
+                    distance = match_pos
+                if distance < best_position:
+                    best_position = distance
+                    branch = br
+    if not branch:
+        if 'CS' in subject_code or 'IT' in subject_code:
+            branch = 'CSE'
+        elif 'ME' in subject_code or 'MED' in subject_code:
+            branch = 'ME'
+        elif 'CE' in subject_code or 'CIV' in subject_code:
+            branch = 'CE'
+        elif 'EE' in subject_code or 'EL' in subject_code or 'EP' in subject_code:
+            branch = 'EE'
+        elif 'EC' in subject_code or 'ET' in subject_code or 'IN' in subject_code:
+            branch = 'ECE'
+        else:
+            branch = 'CSE'
+
+    subject_name = "Unknown Subject"
+    name_match = re.search(rf'Subject\s*-\s*{re.escape(subject_code)}\s*-\s*(.+?)\.pdf', filename, re.IGNORECASE)
+    if name_match:
+        subject_name = name_match.group(1)
+    else:
+        name_match = re.search(rf'{re.escape(subject_code)}\s*-\s*(.+?)\.pdf', filename, re.IGNORECASE)
+        if name_match:
+            subject_name = name_match.group(1)
+    subject_name = re.sub(r'[_-]', ' ', subject_name)
+    subject_name = re.sub(r'\s+', ' ', subject_name).strip()
+    subject_name = re.sub(r'\bPaper[-\s]?[IVX]+\b', '', subject_name, flags=re.IGNORECASE)
+    subject_name = re.sub(r'\s+', ' ', subject_name).strip()
+    if subject_name and len(subject_name) > 3:
+        subject_name = subject_name.title()
+    else:
+        subject_name = "Engineering Subject"
+
+    return {'degree': degree, 'branch': branch, 'semester': semester,
+            'subject_code': subject_code, 'subject_name': subject_name}
+
+# ==================== CORPUS ====================
+
+DEGREES = ['B.E.', 'B.Tech.', 'B.E. - B.Tech.', 'B.E', 'b.tech', '', 'B.Sc.', 'B.Sc. - B.Com.', 'M.Tech.',
+           'B.C.A.-', 'B.Pharm', 'M.Sc. Second Year', 'B.Ed.', 'BE']
+BRANCH_TEXT = [
+    'Computer Science and Engineering', 'Computer Science Engineering', 'Computer Science', 'CSE', 'CS',
+    'Information Technology', 'IT', 'I.T', 'Mechanical Engineering', 'Mechanical', 'ME', 'Civil Engineering',
+    'Civil', 'CE', 'Electrical Engineering', 'Electrical Electronics and Power Engineering', 'Electrical',
+    'EE', 'Electronics and Power', 'Electronics and Telecommunication Engineering',
+    'Electronics and Communication', 'Telecommunication Engineering', 'Electronics', 'ECE',
+    'Instrumentation Engineering', 'Chemical Engineering', '(Information Technology)', ''
+]
+CURRICULUM = ['(Model Curriculum)', '(CBCS Pattern)', '(New CBCS Pattern)', '', '(Model Curriculum) ']
+SEMESTERS = ['Semester-I', 'Semester-II', 'Semester-III', 'Semester-IV', 'Semester-V', 'Semester-VI',
+             'Semester-VII', 'Semester-VIII', 'Semester-I and II', 'Semester I', 'semester-iii',
+             'SemesterIV', 'Semester - V', 'Semester-IX', 'Sem-V', '']
+CODES = ['BSC101', 'ESC-201', 'PCC-CE304', 'STBSC101', 'SE1BECS', 'SE2BICS', 'HSMC-3', 'MC', 'OEC-4011',
+         'PEC-MEL', 'TEE101CS', 'BE101EC', 'UB202', 'PS1', 'US3', 'MMCS1', 'STUGX', 'STPG2', 'BP201',
+         'MPG1', 'MPH2', 'MED301', 'IN301', 'ET501M3', 'PSES4', 'PEPS5', 'PECS6', 'PCSS7', 'PCC-ME302',
+         'ME-401', 'CE701', 'UCA1C02', 'PSCMTH2', 'PCC-2', 'XYZ123', 'bsc101', 'PCC-ME_401', 'PCC-']
+SUBJECTS = ['Physics', 'Applied Mathematics-III', 'Design of Machine Elements', 'Transportation Engineering I',
+            'Power Systems', 'VLSI Design', 'Paper-II Data Structures', 'Mathematics Paper-I', 'AI',
+            'Engineering_Graphics_and_Design', 'Fluid  Mechanics', 'Irrigation engineering', 'Mechanical Drives',
+            'Electronics and Power Lab', '', 'Computer Science Fundamentals', 'Civil Engineering Materials']
+
+def build_corpus(size=4000, seed=2024):
+    """Deterministic mix of archive-style, underscore-style and mangled filenames"""
+    rng = random.Random(seed)
+    names = []
+
+    # Hand-picked names from TEST_DATA.md and the analysis scripts
+    names += [
+        "B.Tech_CSE_III_Sem_BSC301_Data_Structures.pdf",
+        "B.Tech_IT_V_Semester_PCC501_Database_Management_Systems.pdf",
+        "B.E._ME_VII_ESC701_Thermodynamics.pdf",
+        "B.E_EE_II_HSMC201_Engineering_Mathematics.pdf",
+        "Model_Curriculum_ECE_IV_PCC401_Digital_Electronics.pdf",
+        "B.Tech_CE_VI_MC601_Environmental_Engineering.pdf",
+        "B.Tech_CSE_VIII_OEC801_Machine_Learning.pdf",
+        "B.E._IT_I_BSC101_Programming_in_C.pdf",
+        "B.Sc_Physics_III_Sem_PHY301_Quantum_Mechanics.pdf",
+        "BCA_II_Sem_CS201_Data_Structures.pdf",
+        "M.Tech_CSE_I_Sem_Advanced_Algorithms.pdf",
+        "13801 - Year - B.E. - B.Tech. Computer Science and Engineering (Model Curriculum) Semester-III Subject - SE1BECS - Applied Mathematics-III.pdf",
+        "13165 - Year - B.Tech. (Model Curriculum) Semester-I and II Subject - BSC101 - Physics.pdf",
+        "13756 - Year - M.Sc. Second Year (Mathematics) (New CBCS Pattern) Semester-III Subject - PSCMTH2 - Functional Analysis.pdf",
+        "10632S - Year - B.Sc. - B.Com. - B.Sc. (Information Technology) - B.C.A.- I  (CBCS Pattern) Semester-I Subject - UCA1C02.pdf",
+        "B.E. Mechanical Engineering (Model Curriculum) Semester-VII Subject - PCC-2 - Irrigation engineering.pdf",
+    ]
+
+    while len(names) < size:
+        number = f"{rng.randint(10000, 19999)}{rng.choice(['', '', 'S'])}"
+        parts = [rng.choice(DEGREES), rng.choice(BRANCH_TEXT), rng.choice(CURRICULUM), rng.choice(SEMESTERS)]
+        code = rng.choice(CODES)
+        subject = rng.choice(SUBJECTS)
+        style = rng.random()
+        if style < 0.6:
+            name = f"{number} - Year - {' '.join(parts)} Subject - {code} - {subject}.pdf"
+        elif style < 0.8:
+            name = '_'.join(p for p in parts + [code, subject] if p) + rng.choice(['.pdf', '.PDF'])
+        else:
+            name = f"{' '.join(parts)} {code} - {subject}.pdf"
+
+        # Mangle some names: case flips, separators, folders, stray unicode
+        roll = rng.random()
+        if roll < 0.05:
+            name = name.upper()
+        elif roll < 0.1:
+            name = name.replace(' - ', '-')
+        elif roll < 0.13:
+            name = name.replace(' ', '  ')
+        elif roll < 0.16:
+            name = f"dump/{rng.randint(1, 9)}/" + name
+        elif roll < 0.18:
+            name = name.replace('Engineering', 'Engineéring')
+        elif roll < 0.2:
+            name = name.replace('Subject', 'Ｓubject ſ')
+        names.append(name)
+    return names
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    repeat = int(args[0]) if args else 5
+
+    if '--write-golden' in sys.argv:
+        corpus = build_corpus()
+        golden = [{'name': name, 'expected': reference_parse(name)} for name in corpus]
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump(golden, f, indent=0, ensure_ascii=False)
+        print(f"✓ Wrote {len(golden)} golden entries to {GOLDEN_PATH}")
+
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+    names = [entry['name'] for entry in golden]
+
+    classifier = FilenameClassifier()
+    # The corpus records the classified fields, not which ones were inferred
+    results = [result and {field: value for field, value in result.items() if field != 'inferred'}
+               for result in classifier.classify_many(names)]
+    mismatches = [(entry, got) for entry, got in zip(golden, results) if got != entry['expected']]
+    accepted = sum(1 for entry in golden if entry['expected'])
+    print(f"Golden corpus: {len(golden)} names ({accepted} accepted), {len(mismatches)} mismatches")
+    for entry, got in mismatches[:10]:
+        print(f"  ✗ {entry['name']}\n    expected {entry['expected']}\n    got      {got}")
+
+    def best_of(func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    reference = best_of(lambda: [reference_parse(name) for name in names])
+    compiled = best_of(lambda: classifier.classify_many(names))
+    per_name = lambda seconds: seconds / len(names) * 1e6
+    print(f"reference parser: {per_name(reference):6.1f} µs/name")
+    print(f"classify_many:    {per_name(compiled):6.1f} µs/name ({reference / compiled:.1f}x faster)")
+    if reference / compiled < TARGET_SPEEDUP:
+        print(f"⚠️ Below the {TARGET_SPEEDUP}x target")
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,87 @@
+"""
+Member decompression benchmark
+Builds a synthetic deflated archive (~500 MB by default) and times
+    - zipfile extractall() to a directory (the old extract mode)
+    - a ZipFile shared by a thread pool (one handle, reads serialized)
+    - MappedArchive with a thread pool (independent views, parallel inflate)
+each writing into content-addressed storage with CRC verification
+
+Usage: python benchmark_decompress.py [archive_mb] [member_kb]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Point storage at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_bench_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+sys.path.insert(0, 'backend')
+
+from archive_reader import MappedArchive
+from blob_store import BlobStore
+
+def build_archive(path, archive_mb, member_kb):
+    """Write deflated PDF-like members until the archive reaches archive_mb"""
+    rng = random.Random(42)
+    target = archive_mb * 1024 * 1024
+    members = 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        while zf.fp.tell() < target:
+            # Half random (incompressible) half text, like a scanned PDF
+            body = b'%PDF-1.4\n' + rng.randbytes(member_kb * 512) + b'BT /F1 12 Tf (text) Tj ET\n' * (member_kb * 20)
+            zf.writestr(f"papers/{members:05d}.pdf", body)
+            members += 1
+    return members
+
+def run_extractall(zip_path):
+    """Baseline: extract everything to disk"""
+    target = os.path.join(WORK_DIR, 'extract')
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        zf.extractall(target)
+    shutil.rmtree(target)
+
+def run_pool(archive, workers):
+    """Stream every member into storage from a pool of threads"""
+    store = BlobStore(os.path.join(WORK_DIR, 'pdfs'))
+
+    def store_member(info):
+        with archive.open(info, 'r') as source:
+            store.write_stream(source)
+
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(store_member, members))
+    shutil.rmtree(store.root)
+
+def timed(label, size_mb, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:7.2f}s  ({size_mb / elapsed:7.1f} MB/s inflated)")
+
+if __name__ == '__main__':
+    archive_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    member_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    zip_path = os.path.join(WORK_DIR, 'synthetic.zip')
+    try:
+        members = build_archive(zip_path, archive_mb, member_kb)
+        with zipfile.ZipFile(zip_path) as zf:
+            inflated_mb = sum(info.file_size for info in zf.infolist()) / (1024 * 1024)
+        print(f"Archive: {members} members, {os.path.getsize(zip_path) / (1024*1024):.1f} MB "
+              f"({inflated_mb:.1f} MB inflated), {os.cpu_count()} CPUs")
+
+        timed('extractall', inflated_mb, run_extractall, zip_path)
+        for workers in (1, 2, 4, 8):
+            with zipfile.ZipFile(zip_path, 'r') as zf:
+                timed(f'ZipFile pool workers={workers}', inflated_mb, run_pool, zf, workers)
+            with MappedArchive(zip_path) as archive:
+                timed(f'mmap pool workers={workers}', inflated_mb, run_pool, archive, workers)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
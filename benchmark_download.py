@@ -0,0 +1,57 @@
+"""
+Segmented download benchmark
+Serves an archive from a local HTTP server that throttles every connection
+(like the university's server does) and times download_zip as a single
+stream and with several concurrent byte ranges
+
+Usage: python benchmark_download.py [size_mb] [mb_per_second_per_connection] [segments]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import contextlib
+
+# Point storage at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_download_bench_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+import zip_fetcher
+from zip_fetcher import download_zip
+from range_server import serve
+
+if __name__ == '__main__':
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    rate_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+    max_segments = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    try:
+        data = random.Random(5).randbytes(size_mb * 1024 * 1024)
+        dest = os.path.join(WORK_DIR, 'bench.zip')
+        # Time the splitting itself, not the minimum size that switches it on
+        zip_fetcher.DOWNLOAD_SEGMENT_MIN_SIZE = 0
+        print(f"Archive: {size_mb} MB, server limit {rate_mb:g} MB/s per connection")
+
+        with serve(throttle=int(rate_mb * 1024 * 1024)) as server:
+            server.files['/dump.zip'] = (data, '"bench"')
+            baseline = None
+            segments = 1
+            while segments <= max_segments:
+                start = time.perf_counter()
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    size = download_zip(server.url('/dump.zip'), dest, segments=segments)
+                elapsed = time.perf_counter() - start
+                with open(dest, 'rb') as f:
+                    assert size == len(data) and f.read() == data, 'downloaded file differs'
+                os.remove(dest)
+                baseline = baseline or elapsed
+                label = 'single stream' if segments == 1 else f'{segments} segments'
+                print(f"{label}: {elapsed:.2f}s ({size / (1024*1024) / elapsed:.1f} MB/s, "
+                      f"{baseline / elapsed:.1f}x)")
+                segments *= 2
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
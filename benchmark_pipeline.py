@@ -0,0 +1,139 @@
+"""
+Download pipeline benchmark
+Serves a dump from a local HTTP server throttled like the university's and
+times a fetch-zip job from start to its first searchable paper and to its
+last, downloading first and processing batches afterwards versus storing
+members while the download runs (INGEST_PIPELINE). Also checks a dump
+written as a stream (every member with a data descriptor) ingests fully
+
+Usage: python benchmark_pipeline.py [size_mb] [mb_per_second]
+"""
+import io
+import os
+import sys
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+import threading
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_pipeline_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'pipeline.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+os.environ['ARCHIVE_CACHE_ENABLED'] = 'false'  # both runs fetch the same URL
+sys.path.insert(0, 'backend')
+
+import zip_fetcher
+from config import ensure_directories
+from database import init_database, create_upload_job, get_upload_job, count_job_members, Session, PyqFile
+from batch_processor import BatchProcessor
+from range_server import serve
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream; zipfile writes data descriptors to these"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def build_archive(size_mb, streamed=False):
+    """ZIP bytes with one accepted member in ten; returns (bytes, accepted count)"""
+    rng = random.Random(17)
+    target = Unseekable() if streamed else io.BytesIO()
+    accepted = 0
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zf:
+        i = 0
+        while (target.buffer if streamed else target).tell() < size_mb * 1024 * 1024:
+            if i % 10 == 3:
+                name = (f"{60000 + i} - Year - B.E. Civil Engineering (Model Curriculum) "
+                        f"Semester-VII Subject - PCC-CE{i:04d} - Subject {i}.pdf")
+                accepted += 1
+            else:
+                name = f"{70000 + i} - Year - B.Com. Semester-III Subject - UCOM{i:04d} - Other.pdf"
+            pdf = b'%PDF-1.4\n' + rng.randbytes(192 * 1024)
+            if streamed:
+                with zf.open(name, 'w') as member:
+                    member.write(pdf)
+            else:
+                zf.writestr(name, pdf)
+            i += 1
+    return (target.buffer if streamed else target).getvalue(), accepted
+
+
+def paper_count(exam_year):
+    session = Session()
+    try:
+        return session.query(PyqFile).filter(PyqFile.exam_year == exam_year).count()
+    finally:
+        session.close()
+
+
+def run(url, exam_year, pipelined):
+    """Fetch and process a job to the end; returns (first paper seconds, all papers seconds, papers)"""
+    zip_fetcher.INGEST_PIPELINE = pipelined
+    job_id = create_upload_job(f'bench_{exam_year}.zip', '', 'Summer', exam_year, 0, zip_url=url, status='FETCHING')
+    first = []
+    done = threading.Event()
+
+    def watch():
+        while not done.is_set():
+            if paper_count(exam_year):
+                first.append(time.perf_counter() - start)
+                return
+            time.sleep(0.05)
+
+    start = time.perf_counter()
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        zip_fetcher.fetch_job_zip(job_id)
+        processor = BatchProcessor(job_id)
+        while get_upload_job(job_id)['status'] not in ('COMPLETED', 'FAILED'):
+            processor.process_batch(50)
+    elapsed = time.perf_counter() - start
+    done.set()
+    watcher.join()
+    assert count_job_members(job_id, 'PENDING') == 0
+    return (first[0] if first else elapsed), elapsed, paper_count(exam_year)
+
+
+if __name__ == '__main__':
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    rate_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ensure_directories()
+            init_database()
+        archive, accepted = build_archive(size_mb)
+        print(f"Archive: {len(archive) / (1024*1024):.0f} MB, {accepted} accepted members, "
+              f"server limit {rate_mb:g} MB/s")
+
+        with serve(throttle=int(rate_mb * 1024 * 1024)) as server:
+            server.files['/dump.zip'] = (archive, '"bench"')
+            for exam_year, pipelined in ((2001, False), (2002, True)):
+                first, total, papers = run(server.url('/dump.zip'), exam_year, pipelined)
+                assert papers == accepted, f'{papers} of {accepted} papers stored'
+                label = 'pipelined' if pipelined else 'download, then batches'
+                print(f"{label}: first paper searchable after {first:.1f}s, all {papers} after {total:.1f}s")
+
+        # Members with data descriptors are followed through their deflate streams
+        streamed, accepted = build_archive(4, streamed=True)
+        with serve() as server:
+            server.files['/streamed.zip'] = (streamed, '"streamed"')
+            _, _, papers = run(server.url('/streamed.zip'), 2003, True)
+            assert papers == accepted, f'{papers} of {accepted} papers stored'
+            print(f"✓ Streamed dump (data descriptors): all {papers} papers stored")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,72 @@
+"""
+Reclassification throughput benchmark
+Fills a scratch database with synthetic papers (a share of them stored
+with a stale branch, as an older parser would have left them) and times
+reclassify() as a dry run and applied, inline and with a process pool
+
+Usage: python benchmark_reclassify.py [rows] [processes]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_reclassify_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from database import init_database, insert_pyq_files_bulk
+from reclassifier import reclassify, classify_with_rules
+
+BRANCHES = [
+    'Computer Science and Engineering', 'Mechanical Engineering', 'Civil Engineering',
+    'Electrical Engineering', 'Electronics and Telecommunication Engineering'
+]
+SEMESTERS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII']
+
+def fill(rows, stale_share=0.1, batch=5000):
+    """Insert rows papers with member names; stale_share of them with a wrong branch"""
+    rng = random.Random(42)
+    for start in range(0, rows, batch):
+        names = [
+            f"{10000 + i} - Year - B.E. {rng.choice(BRANCHES)} (Model Curriculum) "
+            f"Semester-{rng.choice(SEMESTERS)} Subject - PCC{i:06d} - Subject Number {i}.pdf"
+            for i in range(start, min(start + batch, rows))
+        ]
+        papers = []
+        for name, metadata in zip(names, classify_with_rules(names)):
+            if rng.random() < stale_share:
+                metadata['branch'] = 'CSE' if metadata['branch'] != 'CSE' else 'IT'
+            metadata.update(exam_type='Summer', exam_year=2025, file_path='pdfs/bench.pdf', member_name=name)
+            papers.append(metadata)
+        insert_pyq_files_bulk(papers)
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            init_database()
+            fill(rows)
+        print(f"Database: {rows} papers")
+
+        for label, kwargs in (('dry run, inline', {'processes': 1}),
+                              (f'dry run, {processes} processes', {'processes': processes}),
+                              (f'apply, {processes} processes', {'processes': processes, 'dry_run': False})):
+            start = time.perf_counter()
+            summary = reclassify(**kwargs)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {summary['classified_rows']} rows, {summary['changed']} changed, "
+                  f"{summary['applied']} applied in {elapsed:.2f}s ({summary['classified_rows'] / elapsed:.0f} rows/s)")
+
+        summary = reclassify(processes=1)
+        print(f"after apply: {summary['changed']} changed, {len(summary['conflicts'])} conflicts")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,184 @@
+"""
+Archive cache check
+Serves a dump from a local HTTP server (ETag, If-None-Match) and checks the
+archive cache against fetch-zip jobs: a re-fetch of an unchanged URL is a
+conditional GET answered 304 with no body, the same archive for the same
+exam session is recognised by SHA-256 and not queued again, a job whose
+temp ZIP went missing is restored from the cache, a changed archive is
+downloaded again, and eviction keeps the cache within its size limit
+(least recently used first) without touching archives of running jobs
+
+Usage: python check_archive_cache.py
+"""
+import os
+import sys
+import random
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_cache_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'cache.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from config import ensure_directories
+from database import (
+    init_database, create_upload_job, get_upload_job, update_job_status, update_job_zip_path,
+    list_cached_archives
+)
+from batch_processor import BatchProcessor, ArchiveNotReady
+from zip_fetcher import fetch_job_zip, find_unchanged_job
+from archive_cache import ArchiveCache, get_archive_cache, hash_file
+from range_server import serve
+
+
+def build_archive(seed, members=12):
+    """ZIP bytes with accepted engineering papers"""
+    rng = random.Random(seed)
+    path = os.path.join(WORK_DIR, 'source.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for i in range(members):
+            name = (f"{seed}{i:04d} - Year - B.E. Mechanical Engineering (Model Curriculum) "
+                    f"Semester-V Subject - PCC-ME{i:03d} - Subject {i}.pdf")
+            zf.writestr(name, b'%PDF-1.4\n' + rng.randbytes(32 * 1024))
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def new_job(url, exam_year):
+    return create_upload_job('cache.zip', '', 'Summer', exam_year, 0, zip_url=url, status='FETCHING')
+
+
+def run_job(job_id):
+    """Fetch a job and process it to the end; returns the job"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        fetch_job_zip(job_id)
+        processor = BatchProcessor(job_id)
+        while get_upload_job(job_id)['status'] not in ('COMPLETED', 'FAILED'):
+            processor.process_batch(8)
+    return get_upload_job(job_id)
+
+
+def body_gets(server):
+    """Paths of GETs without a Range header (downloads and revalidations)"""
+    return [path for method, path, r in server.requests if method == 'GET' and not r]
+
+
+if __name__ == '__main__':
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ensure_directories()
+            init_database()
+        archive = build_archive(1)
+
+        with serve() as server:
+            server.files['/dump.zip'] = (archive, '"v1"')
+            url = server.url('/dump.zip')
+
+            # 1. A first fetch downloads the archive into the cache
+            job = run_job(new_job(url, 2023))
+            entry = get_archive_cache().lookup(url)
+            check(job['status'] == 'COMPLETED' and entry and entry['etag'] == '"v1"',
+                  f"job {job['id']} completed, archive cached with its ETag")
+            check(job['zip_path'] == entry['path'] and job['archive_hash'] == hash_file(entry['path']),
+                  "job points at the cached file, named by its SHA-256")
+
+            # 2. The same URL for the same session is the earlier job
+            server.bytes_sent = 0
+            existing = find_unchanged_job(url, 'Summer', 2023)
+            check(existing and existing['id'] == job['id'], f"re-submitted URL recognised as job {job['id']}")
+            check(server.bytes_sent == 0, "revalidation answered 304 with no body")
+
+            # 3. Another session fetches it again without downloading it
+            server.bytes_sent = 0
+            other = run_job(new_job(url, 2024))
+            check(other['status'] == 'COMPLETED' and other['total_pdfs'] == 12,
+                  f"job {other['id']} for another session processed from the cache")
+            check(server.bytes_sent == 0, "no archive bytes downloaded for it")
+
+            # 4. A second job for the same session with the same archive has nothing to do
+            duplicate_id = new_job(url, 2023)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                pending = fetch_job_zip(duplicate_id)
+            duplicate = get_upload_job(duplicate_id)
+            check(pending == 0 and duplicate['status'] == 'COMPLETED' and duplicate['total_pdfs'] == 0,
+                  f"duplicate job {duplicate_id} completed without queueing members")
+
+            # 5. A job whose ZIP went missing is restored from the cache
+            restored_id = new_job(url, 2025)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                fetch_job_zip(restored_id)
+            os.remove(get_upload_job(restored_id)['zip_path'])
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    BatchProcessor(restored_id)
+                raise AssertionError("missing ZIP not noticed")
+            except ArchiveNotReady:
+                pass
+            server.requests.clear()
+            restored = run_job(restored_id)
+            check(restored['status'] == 'COMPLETED' and os.path.exists(restored['zip_path']),
+                  f"job {restored_id} re-fetched its missing ZIP and completed")
+            check(len(body_gets(server)) == 1, "lost file downloaded once more")
+
+            # 6. A changed archive behind the same URL is downloaded again
+            changed = build_archive(2)
+            server.files['/dump.zip'] = (changed, '"v2"')
+            server.bytes_sent = 0
+            check(find_unchanged_job(url, 'Summer', 2023) is None, "changed archive not taken as a duplicate")
+            job = run_job(new_job(url, 2023))
+            check(job['status'] == 'COMPLETED' and server.bytes_sent >= len(changed)
+                  and get_archive_cache().lookup(url)['etag'] == '"v2"',
+                  f"job {job['id']} downloaded the new version")
+
+        # 7. Eviction: least recently used first, never an archive a job still needs
+        with serve() as server:
+            sizes = {}
+            for seed in (3, 4, 5):
+                data = build_archive(seed)
+                server.files[f'/{seed}.zip'] = (data, f'"{seed}"')
+                sizes[seed] = len(data)
+            limit = sizes[3] + sizes[4] + sizes[5] - 1
+            cache = ArchiveCache(max_bytes=limit)
+            paths = {}
+            for seed in (3, 4):
+                path = os.path.join(WORK_DIR, f'{seed}.zip')
+                with open(path, 'wb') as f:
+                    f.write(server.files[f'/{seed}.zip'][0])
+                paths[seed] = cache.store(server.url(f'/{seed}.zip'), path, f'"{seed}"')['path']
+
+            # The oldest archive belongs to a job that isn't done yet
+            running_id = new_job(server.url('/3.zip'), 2030)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                update_job_zip_path(running_id, paths[3])
+                update_job_status(running_id, 'PROCESSING')
+
+            path = os.path.join(WORK_DIR, '5.zip')
+            with open(path, 'wb') as f:
+                f.write(server.files['/5.zip'][0])
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                cache.store(server.url('/5.zip'), path, '"5"')
+            check(os.path.exists(paths[3]), "archive of a running job kept")
+            check(not os.path.exists(paths[4]) and cache.lookup(server.url('/4.zip')) is None,
+                  "least recently used idle archive evicted")
+            check(cache.usage() <= limit, f"cache within its limit ({cache.usage()} of {limit} bytes)")
+
+            update_job_status(running_id, 'COMPLETED')
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                cache.max_bytes = sizes[5]
+                cache.evict()
+            check([entry['url'] for entry in list_cached_archives()][-1] == server.url('/5.zip')
+                  and not os.path.exists(paths[3]),
+                  "finished job's archive evicted once over the limit")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
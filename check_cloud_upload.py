@@ -0,0 +1,188 @@
+"""
+Cloudinary bulk upload check
+Runs CloudUploader against a local stand-in for the upload API and checks
+that a bulk upload reuses a few keep-alive connections and beats uploading
+one file at a time, transient failures (503, 429 with Retry-After,
+dropped connections) are retried, a bad file fails alone without retries,
+an outage opens the circuit breaker so the remaining files come back PAUSED
+after a handful of requests, a trial request after the cooldown resumes
+them, and the rate limit spaces requests. A garbled 200 is retried, an
+unexpected error fails its file alone and never leaves the breaker's
+trial taken, and waiting for a trial that never reports is refused
+after the cooldown
+
+Usage: python check_cloud_upload.py
+"""
+import os
+import sys
+import time
+import random
+import threading
+import shutil
+import tempfile
+import contextlib
+
+sys.path.insert(0, 'backend')
+
+import cloud_uploader
+from cloud_uploader import CloudUploader, CircuitBreaker, UploadError
+from cloudinary_server import serve
+
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_upload_')
+SECRET = 'check-secret'
+
+
+def make_files(count, prefix):
+    """count PDFs on disk; returns [(path, filename)]"""
+    rng = random.Random(count)
+    files = []
+    for i in range(count):
+        filename = f"{prefix}_{i:03d}.pdf"
+        path = os.path.join(WORK_DIR, filename)
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n' + rng.randbytes(16 * 1024))
+        files.append((path, filename))
+    return files
+
+
+def uploader(server, **kwargs):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return CloudUploader('demo', 'key', SECRET, upload_url=server.url(), **kwargs)
+
+
+def upload(client, files):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return client.upload_many(files)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def stored(server, path, filename):
+    with open(path, 'rb') as f:
+        return server.uploads.get(f"pyq_pdfs/{filename[:-4]}") == f.read()
+
+
+if __name__ == '__main__':
+    # Retries in this check shouldn't wait real backoff times
+    cloud_uploader.UPLOAD_BACKOFF_SECONDS = 0.01
+    try:
+        with serve(SECRET, latency=0.05) as server:
+            # 1. A bulk upload runs on a few reused connections, faster than one by one
+            files = make_files(48, 'bulk')
+            started = time.perf_counter()
+            results = upload(uploader(server, workers=1), files[:16])
+            one_by_one = (time.perf_counter() - started) / 16
+            server.requests.clear()
+            client = uploader(server, workers=8)
+            started = time.perf_counter()
+            results = upload(client, files[16:])
+            pooled = (time.perf_counter() - started) / 32
+            check(all(r['status'] == 'DONE' for r in results) and all(stored(server, *f) for f in files),
+                  "all files uploaded intact")
+            check(server.connections() <= 8, f"32 uploads over {server.connections()} keep-alive connections")
+            check(pooled * 3 < one_by_one,
+                  f"{1 / pooled:.0f} files/s pooled vs {1 / one_by_one:.0f} files/s one at a time "
+                  f"({one_by_one / pooled:.1f}x)")
+
+            # 2. Transient failures are retried
+            server.requests.clear()
+            server.failures = [503, 500, 429, 503]
+            server.retry_after = 1
+            started = time.perf_counter()
+            results = upload(client, make_files(8, 'flaky'))
+            check(all(r['status'] == 'DONE' for r in results) and len(server.requests) == 12,
+                  "503/500/429 answers retried, every file uploaded")
+            check(time.perf_counter() - started >= 1, "Retry-After honoured")
+
+            # 3. A file that can't be uploaded fails alone, without retries
+            server.requests.clear()
+            files = make_files(4, 'bad')
+            server.failures = [400]
+            results = upload(client, files + [(os.path.join(WORK_DIR, 'missing.pdf'), 'missing.pdf')])
+            statuses = [r['status'] for r in results]
+            check(statuses.count('FAILED') == 2 and statuses.count('DONE') == 3 and len(server.requests) == 4,
+                  "rejected and unreadable files failed without retries")
+            check(client.breaker.state == 'closed', "bad files don't trip the circuit breaker")
+
+        # 4. An outage opens the breaker and pauses the rest of the upload
+        with serve(SECRET, latency=0.01) as server:
+            breaker = CircuitBreaker(threshold=5, cooldown=0.5)
+            client = uploader(server, workers=4, breaker=breaker)
+            server.outage = 503
+            files = make_files(60, 'outage')
+            results = upload(client, files)
+            paused = [files[i] for i, r in enumerate(results) if r['status'] == 'PAUSED']
+            check(breaker.state == 'open' and len(paused) >= 50,
+                  f"outage opened the breaker: {len(paused)} of 60 files paused")
+            check(len(server.requests) <= 12, f"only {len(server.requests)} requests sent during the outage")
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    client.upload_file(*files[0])
+                raise AssertionError("upload went through an open breaker")
+            except cloud_uploader.UploadsPaused as e:
+                check(0 < e.retry_after <= 0.5, "single uploads refused while the breaker is open")
+
+            # 5. After the cooldown a trial request closes it again
+            server.outage = None
+            time.sleep(0.5)
+            results = upload(client, paused)
+            check(all(r['status'] == 'DONE' for r in results) and breaker.state == 'closed',
+                  f"after the cooldown all {len(paused)} paused files uploaded")
+
+            # A failed trial re-opens it
+            server.outage = 503
+            breaker.opened_at = time.monotonic() - 1
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    client.upload_file(*files[0])
+            except (UploadError, cloud_uploader.UploadsPaused):
+                pass
+            check(breaker.state == 'open', "failed trial re-opened the breaker")
+            server.outage = None
+
+            # 6. The rate limit spaces requests across threads
+            client = uploader(server, workers=8, rate_limit=20)
+            started = time.perf_counter()
+            results = upload(client, make_files(21, 'limited'))
+            elapsed = time.perf_counter() - started
+            check(all(r['status'] == 'DONE' for r in results) and elapsed >= 0.95,
+                  f"21 uploads at 20/s took {elapsed:.2f}s")
+
+            # 7. Unexpected errors: a 200 that isn't JSON is retried ...
+            client = uploader(server, workers=4)
+            server.failures = ['garbled']
+            results = upload(client, make_files(2, 'garbled'))
+            check(all(r['status'] == 'DONE' for r in results), "unreadable 200 response retried")
+
+            # ... anything else fails its file alone and frees the trial
+            breaker = CircuitBreaker(threshold=1, cooldown=0.2)
+            client = uploader(server, workers=4, breaker=breaker)
+            breaker.record_failure()
+            time.sleep(0.2)
+            real_post = client.session.post
+            def broken_post(*args, **kwargs):
+                raise RuntimeError('unexpected')
+            client.session.post = broken_post
+            results = upload(client, make_files(4, 'broken'))
+            check(all(r['status'] == 'FAILED' for r in results) and breaker._trial is None,
+                  "unexpected errors fail their files and release the breaker trial")
+            client.session.post = real_post
+            results = upload(client, make_files(4, 'recovered'))
+            check(all(r['status'] == 'DONE' for r in results) and breaker.state == 'closed',
+                  "next trial goes ahead and closes the breaker")
+
+            # ... and a trial that never reports doesn't block the others for good
+            breaker.record_failure()
+            time.sleep(0.2)
+            holder = threading.Thread(target=breaker.allow)
+            holder.start()
+            holder.join()
+            started = time.perf_counter()
+            allowed = breaker.allow()
+            check(not allowed and time.perf_counter() - started < 1, "wait for a stuck trial ends after the cooldown")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
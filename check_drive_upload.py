@@ -0,0 +1,188 @@
+"""
+Google Drive bulk upload check
+Runs DriveUploader against a local stand-in for the Drive API and compares
+throughput with the old upload path (a new client per uploader, a
+resumable upload and a separate permission request per file, one file at
+a time). Checks that uploaders share one client, a bulk upload runs on
+the pool and makes its files public with one batch request per 100 files
+(or not at all, through a shared folder), every file is stored intact and
+readable at its link, failed uploads and refused batch items are retried,
+an unreadable file fails alone, large files go up as resumable uploads,
+and the storage layer's Drive backend round-trips a blob
+
+Usage: python check_drive_upload.py
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import contextlib
+
+sys.path.insert(0, 'backend')
+
+import requests
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import MediaIoBaseUpload
+import drive_uploader
+from drive_uploader import DriveUploader
+from storage import DriveBackend
+from drive_server import serve
+
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_drive_')
+TOKEN = 'check-token'
+CREDENTIALS = Credentials(TOKEN)
+
+
+def make_files(count, prefix, size=16 * 1024):
+    """count PDFs on disk; returns [(path, filename)]"""
+    rng = random.Random(count)
+    files = []
+    for i in range(count):
+        filename = f"{prefix}_{i:03d}.pdf"
+        path = os.path.join(WORK_DIR, filename)
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n' + rng.randbytes(size))
+        files.append((path, filename))
+    return files
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def legacy_upload_file(server, file_path, filename, folder_id):
+    """The old path: a new client, a resumable upload, then a permission request"""
+    document = json.loads(get_static_doc('drive', 'v3'))
+    document['rootUrl'] = document['mtlsRootUrl'] = f"{server.url()}/"
+    service = build_from_document(document, credentials=CREDENTIALS)
+    media = MediaIoBaseUpload(io.FileIO(file_path, 'rb'), mimetype='application/pdf', resumable=True)
+    file = service.files().create(body={'name': filename, 'parents': [folder_id]}, media_body=media,
+                                  fields='id, webViewLink, webContentLink', supportsAllDrives=True).execute()
+    service.permissions().create(fileId=file['id'], body={'type': 'anyone', 'role': 'reader'},
+                                 fields='id').execute()
+    return file['id']
+
+
+def readable(server, result, path):
+    with open(path, 'rb') as f, requests.get(result['download_link']) as response:
+        return response.status_code == 200 and response.content == f.read()
+
+
+def uploader(server, folder_id, **kwargs):
+    with quiet():
+        return DriveUploader(CREDENTIALS, endpoint=server.url(), folder_id=folder_id, **kwargs)
+
+
+def upload(client, files):
+    with quiet():
+        return client.upload_many(files)
+
+
+if __name__ == '__main__':
+    try:
+        with serve(TOKEN, latency=0.05) as server:
+            for folder in ('legacy', 'batched', 'shared', 'misc'):
+                server.add_folder(folder)
+
+            # 1. Throughput: the old path vs upload_file vs bulk uploads
+            files = make_files(16, 'legacy')
+            started = time.perf_counter()
+            for path, filename in files:
+                legacy_upload_file(server, path, filename, 'legacy')
+            legacy = 16 / (time.perf_counter() - started)
+
+            client = uploader(server, 'batched', workers=8, public_folder=False)
+            files = make_files(16, 'single')
+            started = time.perf_counter()
+            with quiet():
+                for path, filename in files:
+                    client.upload_file(path, filename)
+            single = 16 / (time.perf_counter() - started)
+
+            files = make_files(120, 'batched')
+            server.requests.clear()
+            started = time.perf_counter()
+            results = upload(client, files)
+            batched = 120 / (time.perf_counter() - started)
+            sent = list(server.requests)
+            check(all(r['status'] == 'DONE' and r['public'] for r in results)
+                  and all(readable(server, r, f[0]) for r, f in zip(results, files)),
+                  "bulk upload: all 120 files stored intact and readable at their links")
+            batches = [r for r in sent if r[1] == '/batch/drive/v3']
+            check(len(sent) == 122 and len(batches) == 2,
+                  f"120 uploads made public by {len(batches)} batch requests (100 + 20 permissions)")
+
+            shared = uploader(server, 'shared', workers=8, public_folder=True)
+            files = make_files(120, 'shared')
+            server.requests.clear()
+            started = time.perf_counter()
+            results = upload(shared, files)
+            folder = 120 / (time.perf_counter() - started)
+            check(all(r['status'] == 'DONE' for r in results) and len(server.requests) == 121
+                  and all(readable(server, r, f[0]) for r, f in zip(results, files)),
+                  "shared folder: one folder permission, files public by inheritance")
+            print(f"  old path (new client, resumable, permission)  {legacy:6.1f} files/s")
+            print(f"  upload_file, one at a time                    {single:6.1f} files/s")
+            print(f"  upload_many, batched permissions              {batched:6.1f} files/s")
+            print(f"  upload_many, shared folder                    {folder:6.1f} files/s")
+            check(batched > 4 * legacy and folder > 4 * legacy,
+                  f"bulk uploads {batched / legacy:.1f}x / {folder / legacy:.1f}x the old path's throughput")
+
+            # 2. Uploaders share one client
+            started = time.perf_counter()
+            another = uploader(server, 'misc', public_folder=False)
+            check(another.service is client.service and time.perf_counter() - started < 0.01,
+                  "a new uploader reuses the process's Drive client")
+
+            # 3. Failed uploads and refused batch items are retried
+            server.latency = 0.0
+            files = make_files(6, 'flaky')
+            server.failures = [503, 500]
+            server.batch_failures = [403, 429, 503]
+            results = upload(another, files)
+            check(all(r['status'] == 'DONE' and r['public'] for r in results)
+                  and all(readable(server, r, f[0]) for r, f in zip(results, files)),
+                  "503/500 uploads and rate-limited permission requests retried, every file public")
+
+            # 4. An unreadable file fails alone
+            files = make_files(3, 'bad') + [(os.path.join(WORK_DIR, 'missing.pdf'), 'missing.pdf')]
+            results = upload(another, files)
+            check([r['status'] for r in results] == ['DONE', 'DONE', 'DONE', 'FAILED'],
+                  "a missing file failed, the others uploaded")
+
+            # 5. Large files go up as resumable uploads
+            drive_uploader.DRIVE_CHUNK_SIZE = 256 * 1024
+            path, filename = make_files(1, 'large', size=700 * 1024)[0]
+            server.requests.clear()
+            with quiet():
+                result = another.upload_file(path, filename)
+            puts = [r for r in server.requests if r[0] == 'PUT']
+            check(len(puts) == 3 and readable(server, result, path),
+                  f"700 KB file uploaded as a resumable upload in {len(puts)} chunks")
+            drive_uploader.DRIVE_CHUNK_SIZE = 8 * 1024 * 1024
+
+            # 6. The storage layer's Drive backend
+            backend = DriveBackend(another)
+            data = b'%PDF-1.4\n' + random.Random(9).randbytes(32 * 1024)
+            content_hash, location, size, created = backend.store(lambda: io.BytesIO(data))
+            key = f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.pdf"
+            with backend.get(key) as f:
+                check(created and f.read() == data and backend.stat(key)['size'] == size
+                      and not backend.store(lambda: io.BytesIO(data))[3],
+                      "drive backend: store, get, stat and dedup round-trip")
+            backend.delete(key)
+            check(backend.stat(key) is None, "drive backend: delete")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
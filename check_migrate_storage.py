@@ -0,0 +1,127 @@
+"""
+Storage migration check
+Lays out flat storage (two byte-identical files, a shared flat path, a
+missing file), checks a dry run counts each new blob once and changes
+nothing, then interrupts a migration after its first file and checks the
+re-run leaves every row on a registered blob with no flat file left
+
+Usage: python check_migrate_storage.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_migrate_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'migrate.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from config import PDF_STORAGE_PATH, ensure_directories
+from database import init_database, Session, PyqFile, PdfBlob
+import migrate_storage
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def add_row(code, file_path):
+    session = Session()
+    session.add(PyqFile(degree='B.E.', branch='CSE', semester=3, subject_code=code,
+                        subject_name=code, exam_type='SUMMER', exam_year=2024, file_path=file_path))
+    session.commit()
+    session.close()
+
+
+def lay_out_flat_storage():
+    files = {'A_a.pdf': b'%PDF same', 'B_b.pdf': b'%PDF same', 'C_c.pdf': b'%PDF other'}
+    for name, data in files.items():
+        with open(os.path.join(PDF_STORAGE_PATH, name), 'wb') as f:
+            f.write(data)
+    add_row('A', 'A_a.pdf')
+    add_row('A2', 'A_a.pdf')  # overwritten flat path shared by two rows
+    add_row('B', 'B_b.pdf')
+    add_row('C', 'C_c.pdf')
+    add_row('D', 'D_d.pdf')  # missing on disk
+
+
+def main():
+    ensure_directories()
+    with quiet():
+        init_database()
+    lay_out_flat_storage()
+
+    with quiet():
+        summary = migrate_storage.migrate_storage(dry_run=True)
+    check(summary['blobs_created'] == 2 and summary['duplicates'] == 1,
+          f"Dry run counts identical files as one blob ({summary['blobs_created']} created, {summary['duplicates']} duplicate)")
+    session = Session()
+    check(session.query(PyqFile).filter(PyqFile.content_hash != None).count() == 0
+          and session.query(PdfBlob).count() == 0, "Dry run changes no rows and registers no blobs")
+    session.close()
+
+    # Crash after the first file has been moved
+    real_remove, removed = os.remove, []
+    def remove_then_crash(path):
+        real_remove(path)
+        removed.append(path)
+        raise KeyboardInterrupt('simulated crash')
+    migrate_storage.os.remove = remove_then_crash
+    try:
+        with quiet():
+            migrate_storage.migrate_storage()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        migrate_storage.os.remove = real_remove
+    check(len(removed) == 1, "Interrupted migration removed one flat file")
+
+    session = Session()
+    converted = session.query(PyqFile).filter(PyqFile.content_hash != None).all()
+    check(converted and all(session.get(PdfBlob, row.content_hash) for row in converted),
+          "Rows converted before the crash point at registered blobs")
+    session.close()
+
+    with quiet():
+        summary = migrate_storage.migrate_storage()
+    session = Session()
+    rows = session.query(PyqFile).all()
+    stored = [row for row in rows if row.content_hash]
+    check(len(stored) == 4 and all(session.get(PdfBlob, row.content_hash) for row in stored),
+          "Re-run leaves every stored row on a registered blob")
+    check(session.query(PdfBlob).count() == 2, "Identical files share one registered blob")
+    check(all(os.path.exists(os.path.join(PDF_STORAGE_PATH, row.file_path)) for row in stored),
+          "Every registered blob is on disk")
+    check(not any(os.path.exists(os.path.join(PDF_STORAGE_PATH, name)) for name in ('A_a.pdf', 'B_b.pdf', 'C_c.pdf')),
+          "No flat file is left behind")
+    check(summary['missing'] == 1, "Missing file is reported and left unchanged")
+
+    # A blob converted by an older run that never registered it
+    session.query(PdfBlob).filter(PdfBlob.content_hash == stored[0].content_hash).delete()
+    session.commit()
+    session.close()
+    with quiet():
+        summary = migrate_storage.migrate_storage()
+    session = Session()
+    check(summary['blobs_registered'] == 1 and session.query(PdfBlob).count() == 2,
+          "Re-run registers a converted blob with no pdf_blobs entry")
+    session.close()
+
+    print("\n✓ Storage migration checks passed")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
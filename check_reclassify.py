@@ -0,0 +1,123 @@
+"""
+Reclassification check
+Ingests two archives through ZIPProcessor and insert_pyq_files_bulk: the
+second holds a paper whose filename states no branch, which ingest fills
+in from the subject index. Checks reclassify() right after ingest finds
+nothing to change, that a branch the filename does state still replaces
+a stale stored one, and that subjects sharing a code are stored apart.
+The admin endpoint answers at once and runs the reclassification in the
+background; its status endpoint reports the result
+
+Usage: python check_reclassify.py
+"""
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_reclassify_check_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'reclassify.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from config import ensure_directories
+from database import init_database, insert_pyq_files_bulk, update_pyq_files_bulk, get_pyq_file_keys
+from zip_processor import ZIPProcessor
+from reclassifier import reclassify
+
+STATED = ("13001 - Year - B.E. - B.Tech. Civil Engineering (Model Curriculum) Semester-VII "
+          "Subject - PEC-1 - Irrigation Engineering.pdf")
+UNSTATED = "13002 - Year - B.E. (Model Curriculum) Semester-VII Subject - PEC-1 - Water Resources.pdf"
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def ingest(name, exam_year):
+    """Ingest a one-paper archive the way an upload does"""
+    zip_path = os.path.join(WORK_DIR, f'{exam_year}.zip')
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.writestr(name, b'%PDF-1.4 ' + name.encode())
+    with quiet():
+        result = ZIPProcessor(zip_path, 'SUMMER', exam_year).process(streaming=True)
+        insert_pyq_files_bulk(result['papers'])
+    return result['papers']
+
+
+def main():
+    ensure_directories()
+    with quiet():
+        init_database()
+
+    ingest(STATED, 2023)
+    papers = ingest(UNSTATED, 2024)
+    check(papers[0]['branch'] == 'CE' and papers[0]['inferred'] == 'branch:index',
+          "Ingest fills the missing branch from the subject index")
+
+    with quiet():
+        summary = reclassify(processes=1)
+    check(summary['classified_rows'] == 2 and not summary['changes'] and not summary['conflicts'],
+          "Reclassifying right after ingest changes nothing")
+
+    # A stale branch on the paper whose filename states it
+    stated = next(row for row in get_pyq_file_keys() if row['member_name'] == STATED)
+    update_pyq_files_bulk([{'id': stated['id'], 'branch': 'ME'}])
+    with quiet():
+        summary = reclassify(dry_run=False, processes=1)
+    check([change['new'] for change in summary['changes']] == [{'branch': 'CE'}] and summary['applied'] == 1,
+          "A branch the filename states replaces a stale stored one")
+    with quiet():
+        summary = reclassify(processes=1)
+    check(not summary['changes'], "Nothing left to change after applying")
+
+    # Distinct subjects that share a code are both stored; a true repeat is not
+    elective = {'degree': 'B.E.', 'branch': 'CE', 'semester': 7, 'subject_code': 'PEC-2',
+                'exam_type': 'WINTER', 'exam_year': 2024}
+    with quiet():
+        result = insert_pyq_files_bulk([
+            {**elective, 'subject_name': 'Bridge Engineering', 'file_path': 'a.pdf', 'member_name': 'a.pdf'},
+            {**elective, 'subject_name': 'Coastal Engineering', 'file_path': 'b.pdf', 'member_name': 'b.pdf'}])
+        again = insert_pyq_files_bulk([
+            {**elective, 'subject_name': 'Coastal Engineering', 'file_path': 'c.pdf', 'member_name': 'c.pdf'}])
+    check(result['inserted'] == 2 and not result['conflicts'], "Two subjects sharing a code are both stored")
+    check(again['inserted'] == 0 and [c['reason'] for c in again['conflicts']] == ['already exists'],
+          "A paper repeating a stored subject is still reported")
+
+    # The admin endpoint runs in the background and reports through its status
+    update_pyq_files_bulk([{'id': stated['id'], 'branch': 'ME'}])
+    with quiet():
+        from app import app
+        from security import generate_jwt_token
+    headers = {'Authorization': f"Bearer {generate_jwt_token('admin')}"}
+    with app.test_client() as web:
+        with quiet():
+            started = web.post('/api/admin/reclassify?apply=true&limit=0', headers=headers)
+            deadline = time.time() + 30
+            status = web.get('/api/admin/reclassify-status', headers=headers).get_json()
+            while status['reclassify']['last_summary'] is None and time.time() < deadline:
+                time.sleep(0.05)
+                status = web.get('/api/admin/reclassify-status', headers=headers).get_json()
+    summary = status['reclassify']['last_summary']
+    check(started.status_code == 202 and summary['applied'] == 1 and summary['changes_total'] == 1
+          and summary['changes'] == [], "Admin endpoint reclassifies in the background and reports the result")
+
+    print("\n✓ Reclassification checks passed")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
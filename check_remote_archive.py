@@ -0,0 +1,134 @@
+"""
+Remote selective ingest check
+Serves a dump from a local HTTP server (mostly non-engineering PDFs, as the
+university's are) and checks a remote fetch-zip job against it: only the
+central directory and the accepted members' byte ranges are fetched, the
+archive is never stored, every accepted member is ingested intact, and a
+server without range support falls back to a full download
+
+Usage: python check_remote_archive.py
+"""
+import os
+import sys
+import random
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_remote_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'remote.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from config import UPLOAD_FOLDER, PDF_STORAGE_PATH, ensure_directories
+from database import init_database, create_upload_job, get_upload_job, count_job_members, Session, PyqFile
+from batch_processor import BatchProcessor
+from zip_fetcher import fetch_job_zip
+from remote_archive import RemoteArchive
+from range_server import serve
+
+ACCEPTED = 30
+OTHERS = 270
+
+
+def build_archive():
+    """ZIP bytes: ACCEPTED engineering papers among OTHERS B.Sc. ones; returns (bytes, {name: pdf})"""
+    rng = random.Random(11)
+    path = os.path.join(WORK_DIR, 'source.zip')
+    papers = {}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        names = [
+            f"{40000 + i} - Year - B.E. Electrical Engineering (Model Curriculum) "
+            f"Semester-VI Subject - PCC-EE{i:03d} - Subject {i}.pdf" for i in range(ACCEPTED)
+        ] + [
+            f"{50000 + i} - Year - B.Sc. (Information Technology) Semester-II Subject - USIT{i:03d} - Other.pdf"
+            for i in range(OTHERS)
+        ]
+        rng.shuffle(names)
+        for name in names:
+            pdf = b'%PDF-1.4\n' + rng.randbytes(48 * 1024)
+            zf.writestr(name, pdf)
+            if 'B.E.' in name:
+                papers[name] = pdf
+    with open(path, 'rb') as f:
+        return f.read(), papers
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def run_job(url, remote):
+    """Create a fetch-zip job, fetch it and process it to the end; returns the job"""
+    job_id = create_upload_job('remote.zip', '', 'Winter', 2024, 0, zip_url=url, status='FETCHING', remote=remote)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        fetch_job_zip(job_id)
+        processor = BatchProcessor(job_id)
+        while processor.process_batch(8)['status'] not in ('COMPLETED', 'FAILED'):
+            pass
+    return get_upload_job(job_id)
+
+
+def stored_papers():
+    """Stored member name -> PDF bytes"""
+    session = Session()
+    try:
+        rows = session.query(PyqFile.member_name, PyqFile.file_path).all()
+    finally:
+        session.close()
+    papers = {}
+    for member_name, file_path in rows:
+        with open(os.path.join(PDF_STORAGE_PATH, file_path), 'rb') as f:
+            papers[member_name] = f.read()
+    return papers
+
+
+if __name__ == '__main__':
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ensure_directories()
+            init_database()
+        archive, papers = build_archive()
+        accepted_bytes = sum(len(pdf) for pdf in papers.values())
+
+        with serve() as server:
+            server.files['/dump.zip'] = (archive, '"v1"')
+
+            # 1. The reader mirrors zipfile and fetches one range per member
+            with RemoteArchive(server.url('/dump.zip')) as remote, \
+                    zipfile.ZipFile(os.path.join(WORK_DIR, 'source.zip')) as local:
+                check(remote.namelist() == local.namelist(), "central directory matches zipfile's")
+                name = next(iter(papers))
+                before = remote.requests_made
+                with remote.open(name) as member:
+                    check(member.read() == papers[name] and remote.requests_made == before + 1,
+                          "member read with one range request")
+
+            # 2. A remote job fetches the directory and the accepted members only
+            server.bytes_sent = 0
+            job = run_job(server.url('/dump.zip'), remote=True)
+            check(job['status'] == 'COMPLETED' and job['remote'], f"remote job {job['id']} completed")
+            check(stored_papers() == papers, f"all {ACCEPTED} accepted members stored intact")
+            check(count_job_members(job['id'], 'REJECTED') == OTHERS, f"{OTHERS} rejected members never fetched")
+            check(not os.listdir(UPLOAD_FOLDER), "no archive stored")
+            check(server.bytes_sent < accepted_bytes * 1.2,
+                  f"{server.bytes_sent / 1024:.0f} KB fetched of a {len(archive) / 1024:.0f} KB archive "
+                  f"({accepted_bytes / 1024:.0f} KB accepted)")
+            gets = [r for method, _, r in server.requests if method == 'GET']
+            check(all(gets), f"{len(gets)} GETs, all range requests")
+
+        # 3. Without range support the job downloads the whole archive
+        with serve() as server:
+            server.files['/dump.zip'] = (archive, '"v1"')
+            server.ranges = False
+            job = run_job(server.url('/dump.zip'), remote=True)
+            check(job['status'] == 'COMPLETED' and not job['remote'],
+                  f"server without ranges: job {job['id']} fell back to a full download")
+            check(server.bytes_sent >= len(archive), "whole archive downloaded")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
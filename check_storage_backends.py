@@ -0,0 +1,199 @@
+"""
+Storage backend check
+Runs the storage interface against each backend - local disk, an
+S3-compatible store (local MinIO-style stand-in) and Cloudinary (local
+stand-in) - and checks put/get/stat/url/delete, content-addressed store()
+dedup, multipart (S3) and chunked (Cloudinary) uploads of a large blob,
+and the SigV4 signer against AWS's published example. Then ingests a job
+into S3 without writing a PDF to disk, serves a paper through the PDF
+endpoint's redirect, and checks that a Cloudinary outage pauses a batch
+(members back to PENDING) instead of failing it
+
+Usage: python check_storage_backends.py
+"""
+import os
+import io
+import sys
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_storage_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'storage.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+import requests
+import storage
+import cloud_uploader
+from config import PDF_STORAGE_PATH, ensure_directories
+from database import init_database, create_upload_job, count_job_members, Session, PyqFile
+from batch_processor import BatchProcessor
+from blob_store import BlobStore
+from s3_client import S3Client, signature, EMPTY_SHA256
+from cloud_uploader import CloudUploader, CircuitBreaker
+from storage import LocalBackend, S3Backend, CloudinaryBackend
+import s3_server
+import cloudinary_server
+
+MB = 1024 * 1024
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def exercise(backend, large):
+    """Round-trip small and large blobs through a backend"""
+    data = b'%PDF-1.4\n' + random.Random(1).randbytes(64 * 1024)
+    content_hash, location, size, created = backend.store(lambda: io.BytesIO(data))
+    key = BlobStore.relative_path(content_hash)
+    with backend.get(key) as f:
+        read = f.read()
+    check(created and read == data and backend.stat(key)['size'] == len(data),
+          f"{backend.name}: put, get and stat round-trip")
+    check(backend.store(lambda: io.BytesIO(data))[1:] == (location, size, False),
+          f"{backend.name}: storing the same content again uploads nothing")
+
+    content_hash, _, _, _ = backend.store(lambda: io.BytesIO(large))
+    large_key = BlobStore.relative_path(content_hash)
+    with backend.get(large_key) as f:
+        check(f.read() == large, f"{backend.name}: {len(large) // MB} MB blob stored intact")
+
+    backend.delete(key)
+    check(backend.stat(key) is None, f"{backend.name}: delete")
+    try:
+        backend.get(key).close()
+        raise AssertionError("get of a deleted blob succeeded")
+    except FileNotFoundError:
+        pass
+    return large_key
+
+
+def build_archive(path, members):
+    rng = random.Random(5)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(members):
+            name = (f"{30000 + i} - Year - B.E. Computer Engineering (Model Curriculum) "
+                    f"Semester-III Subject - PCC-CS{i:03d} - Subject {i}.pdf")
+            zf.writestr(name, b'%PDF-1.4\n' + rng.randbytes(24 * 1024))
+
+
+def run_job(zip_path, exam_year):
+    with quiet():
+        job_id = create_upload_job(os.path.basename(zip_path), zip_path, 'Winter', exam_year, 0)
+        processor = BatchProcessor(job_id)
+        processor.prepare_work_list()
+    return job_id, processor
+
+
+if __name__ == '__main__':
+    try:
+        with quiet():
+            ensure_directories()
+            init_database()
+        large = random.Random(2).randbytes(12 * MB)
+
+        # 1. The signer matches AWS's SigV4 example (GET Object with a Range header)
+        sig, _ = signature(
+            'wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY', 'us-east-1', 'GET', '/test.txt', {},
+            {'host': 'examplebucket.s3.amazonaws.com', 'range': 'bytes=0-9',
+             'x-amz-content-sha256': EMPTY_SHA256, 'x-amz-date': '20130524T000000Z'},
+            EMPTY_SHA256, '20130524T000000Z'
+        )
+        check(sig == 'f0e8bdb87c964420e857bd35b5d6ed310bd44f0170aba48dd91039c6036bdb41',
+              "SigV4 signature matches AWS's example")
+
+        # 2. Local disk
+        local = LocalBackend()
+        exercise(local, large)
+        check(local.url('x') is None and local.local_path('ab/cd/x.pdf').startswith(PDF_STORAGE_PATH),
+              "local: served by the app from the volume")
+
+        with s3_server.serve('minio', 'minio-secret') as s3:
+            # 3. S3-compatible store
+            client = S3Client(s3.url(), 'papers', 'minio', 'minio-secret', part_size=5 * MB)
+            s3_backend = S3Backend(client, public_url='')
+            key = exercise(s3_backend, large)
+            parts = [q for method, _, q in s3.requests if method == 'PUT' and 'partNumber' in q]
+            check(len(parts) == 3, f"s3: 12 MB blob uploaded as a {len(parts)}-part multipart upload")
+            with requests.get(s3_backend.url(key)) as response:
+                check(response.status_code == 200 and response.content == large, "s3: presigned URL serves the blob")
+            bad = S3Client(s3.url(), 'papers', 'minio', 'wrong-secret')
+            try:
+                bad.head_object(key)
+                raise AssertionError("bad signature accepted")
+            except Exception as e:
+                check('403' in str(e), "s3: requests with a bad signature are refused")
+
+            # 4. Ingest into S3: nothing is written under PDF_STORAGE_PATH
+            shutil.rmtree(PDF_STORAGE_PATH)
+            os.makedirs(PDF_STORAGE_PATH)
+            storage._storage = s3_backend
+            zip_path = os.path.join(WORK_DIR, 's3.zip')
+            build_archive(zip_path, 20)
+            job_id, processor = run_job(zip_path, 2031)
+            with quiet():
+                while processor.process_batch(8)['status'] == 'PROCESSING':
+                    pass
+            session = Session()
+            rows = session.query(PyqFile).filter(PyqFile.exam_year == 2031).all()
+            session.close()
+            check(len(rows) == 20 and all(('papers', row.file_path) in s3.objects for row in rows),
+                  "job ingested into S3, file_path holds the object keys")
+            check(not any(files for _, _, files in os.walk(PDF_STORAGE_PATH)), "no PDF written to local disk")
+
+            with quiet():
+                from app import app
+            with app.test_client() as web:
+                response = web.get(f'/api/pdf/view/{rows[0].id}')
+                with requests.get(response.headers['Location']) as pdf:
+                    check(response.status_code == 302 and pdf.content == s3.objects[('papers', rows[0].file_path)],
+                          "PDF endpoint redirects to a presigned URL that serves the paper")
+
+        with cloudinary_server.serve('cloud-secret') as cloud:
+            # 5. Cloudinary
+            cloud_uploader.CLOUDINARY_CHUNK_SIZE = 5 * MB
+            with quiet():
+                uploader = CloudUploader('demo', 'key', 'cloud-secret', upload_url=cloud.url(),
+                                         delivery_url=cloud.url(), breaker=CircuitBreaker(threshold=3, cooldown=0.5))
+            cloudinary = CloudinaryBackend(uploader)
+            key = exercise(cloudinary, large)
+            chunked = [r for r in cloud.requests if r[1].endswith(key[:-4])]
+            check(len(chunked) == 3, f"cloudinary: 12 MB blob uploaded in {len(chunked)} chunks")
+
+            # 6. An outage pauses the batch; its members wait in PENDING
+            storage._storage = cloudinary
+            zip_path = os.path.join(WORK_DIR, 'cloud.zip')
+            build_archive(zip_path, 12)
+            job_id, processor = run_job(zip_path, 2032)
+            cloud.outage = 503
+            cloud_uploader.UPLOAD_BACKOFF_SECONDS = 0.01
+            with quiet():
+                result = processor.process_batch(12)
+            check(result['success'] and result.get('paused_for') and count_job_members(job_id, 'PENDING') == 12
+                  and count_job_members(job_id, 'FAILED') == 0,
+                  f"outage paused the batch for {result.get('paused_for')}s, all 12 members still pending")
+            cloud.outage = None
+            time.sleep(0.5)
+            with quiet():
+                result = processor.process_batch(12)
+            check(result['status'] == 'COMPLETED' and count_job_members(job_id, 'DONE') == 12,
+                  "after the pause the batch stored every member")
+            session = Session()
+            rows = session.query(PyqFile).filter(PyqFile.exam_year == 2032).all()
+            session.close()
+            check(all(row.file_path.startswith(cloud.url()) for row in rows), "file_path holds Cloudinary links")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,341 @@
+"""
+Storage scrub check
+Builds a library with the ways stored papers break - a deleted blob, a
+blob overwritten with content of another size, one overwritten with the
+same size (only a hash check tells), a blob with no other copy anywhere, a
+dead link - next to blobs no row refers to, and scrubs it. Checks a
+report-only scrub changes nothing, a stat-only scrub misses only the
+same-size overwrite, a verifying scrub repairs everything that has another
+copy (another row, a blob_replicas copy, the local volume), quarantines
+corrupt and orphaned blobs (not fresh ones or writes in progress) and a
+re-run finds only the unrecoverable, the app serves the repaired papers,
+a scrub of many files is timed while measuring how long requests take
+meanwhile, and the same works against an S3-compatible store (local
+stand-in)
+
+Usage: python check_storage_scrub.py [files for the timed scrub, default 100000]
+"""
+import io
+import os
+import sys
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import threading
+import statistics
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_scrub_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'scrub.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from sqlalchemy import insert
+import storage
+from config import PDF_STORAGE_PATH, QUARANTINE_PATH, ensure_directories
+from database import (
+    init_database, Session, PyqFile, PdfBlob, register_blob, record_blob_replicas
+)
+from blob_store import BlobStore
+from s3_client import S3Client
+from storage import LocalBackend, S3Backend
+from storage_scrubber import scrub_storage, ScrubWorker
+import s3_server
+import cloudinary_server
+
+OLD = time.time() - 2 * 86400
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def scrub(**kwargs):
+    with quiet():
+        return scrub_storage(**kwargs)
+
+
+def add_rows(paths):
+    """One pyq_files row per (file_path, content_hash); returns their ids"""
+    session = Session()
+    rows = [PyqFile(degree='B.E.', branch='CSE', semester=3, subject_code=f"PCC-CS{i:03d}",
+                    subject_name=f"Subject {i}", exam_type='Winter', exam_year=2031,
+                    file_path=file_path, content_hash=content_hash)
+            for i, (file_path, content_hash) in enumerate(paths)]
+    session.add_all(rows)
+    session.commit()
+    ids = [row.id for row in rows]
+    session.close()
+    return ids
+
+
+def file_path_of(row_id):
+    session = Session()
+    path = session.get(PyqFile, row_id).file_path
+    session.close()
+    return path
+
+
+def stored(rng, size=32 * 1024):
+    """Write a blob to the volume and register it; returns (content, content_hash, key)"""
+    content = b'%PDF-1.4\n' + rng.randbytes(size)
+    content_hash, key, size, _ = BlobStore(PDF_STORAGE_PATH).write_stream(io.BytesIO(content))
+    register_blob(content_hash, size, None, key)
+    return content, content_hash, key
+
+
+def overwrite(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def quarantined():
+    """Quarantined files by name: {file name: content}"""
+    found = {}
+    for directory, _, names in os.walk(QUARANTINE_PATH):
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                found[name] = f.read()
+    return found
+
+
+def local_library(cloud):
+    """Returns: {name: (row id, content, content_hash, key)} of the interesting papers, healthy row ids"""
+    rng = random.Random(11)
+    local = LocalBackend()
+    papers = {}
+    healthy = []
+    for _ in range(20):
+        _, content_hash, key = stored(rng)
+        healthy += add_rows([(key, content_hash)])
+
+    # A blob that was deleted; another row links to the same content
+    content, content_hash, key = stored(rng)
+    cloud.uploads['pyq_pdfs/shared'] = content
+    row_id, _ = add_rows([(key, content_hash), (f"{cloud.url()}/demo/raw/upload/pyq_pdfs/shared", content_hash)])
+    os.remove(local.local_path(key))
+    papers['deleted'] = (row_id, content, content_hash, key)
+
+    # Overwritten with content of another size / of the same size; sync had copied both to Cloudinary
+    for name, replacement in (('resized', b'%PDF-1.4 truncated'), ('same_size', None)):
+        content, content_hash, key = stored(rng)
+        row_id, = add_rows([(key, content_hash)])
+        cloud.uploads[f"pyq_pdfs/{name}"] = content
+        record_blob_replicas('cloudinary:demo', [{'content_hash': content_hash, 'size': len(content),
+                                                  'location': f"{cloud.url()}/demo/raw/upload/pyq_pdfs/{name}"}])
+        overwrite(local.local_path(key), replacement or rng.randbytes(len(content)))
+        papers[name] = (row_id, content, content_hash, key)
+
+    # Deleted with no other copy anywhere; a link that no longer resolves
+    content, content_hash, key = stored(rng)
+    row_id, = add_rows([(key, content_hash)])
+    os.remove(local.local_path(key))
+    papers['lost'] = (row_id, content, content_hash, key)
+    row_id, = add_rows([(f"{cloud.url()}/demo/raw/upload/pyq_pdfs/gone", None)])
+    papers['dead_link'] = (row_id, None, None, None)
+
+    # A flat file from before content hashing
+    overwrite(os.path.join(PDF_STORAGE_PATH, 'PCC-CS500_Old.pdf'), b'%PDF-1.4 flat')
+    healthy += add_rows([('PCC-CS500_Old.pdf', None)])
+
+    # Blobs no row refers to: an old one, a fresh one, and an old write in progress
+    for name in ('orphan', 'fresh'):
+        content, content_hash, key = stored(rng)
+        if name == 'orphan':
+            os.utime(local.local_path(key), (OLD, OLD))
+        papers[name] = (None, content, content_hash, key)
+    overwrite(os.path.join(PDF_STORAGE_PATH, 'tmpabc.part'), b'partial')
+    os.utime(os.path.join(PDF_STORAGE_PATH, 'tmpabc.part'), (OLD, OLD))
+    return papers, healthy
+
+
+def snapshot():
+    files = {}
+    for directory, _, names in os.walk(PDF_STORAGE_PATH):
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                files[name] = f.read()
+    return files
+
+
+def bulk_library(count):
+    """count small healthy blobs, rows and pdf_blobs entries, written directly"""
+    blobs = BlobStore(PDF_STORAGE_PATH)
+    rows, entries = [], []
+    for i in range(count):
+        content = b'%PDF-1.4\n' + i.to_bytes(8, 'big') * 256
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = blobs.absolute_path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        key = BlobStore.relative_path(content_hash)
+        rows.append({'degree': 'B.E.', 'branch': 'IT', 'semester': 5, 'subject_code': f"PCC-IT{i}",
+                     'subject_name': 'Bulk', 'exam_type': 'Summer', 'exam_year': 2032,
+                     'file_path': key, 'content_hash': content_hash})
+        entries.append({'content_hash': content_hash, 'size': len(content), 'storage_path': key})
+    session = Session()
+    for start in range(0, count, 5000):
+        session.execute(insert(PyqFile), rows[start:start + 5000])
+        session.execute(insert(PdfBlob), entries[start:start + 5000])
+    session.commit()
+    session.close()
+
+
+def request_times(app, row_id, seconds, stop=None):
+    """Times GET /api/pdf/view/<row_id> repeatedly; returns seconds per request"""
+    times = []
+    deadline = time.time() + seconds
+    with app.test_client() as web:
+        while (time.time() < deadline and not (stop and stop.is_set())) or len(times) < 20:
+            started = time.perf_counter()
+            response = web.get(f'/api/pdf/view/{row_id}')
+            response.close()
+            times.append(time.perf_counter() - started)
+            time.sleep(0.005)
+    return times
+
+
+def p95(times):
+    return statistics.quantiles(times, n=20)[-1]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    try:
+        with quiet():
+            ensure_directories()
+            init_database()
+        local = LocalBackend()
+        storage._storage = local
+
+        with cloudinary_server.serve('cloud-secret') as cloud:
+            papers, healthy = local_library(cloud)
+            before = snapshot()
+
+            # 1. Report only: problems found, nothing touched
+            summary = scrub(backend=local, repair=False, quarantine=False)
+            kinds = {p['location']: p['kind'] for p in summary['problems']}
+            check(summary['missing'] == 3 and summary['corrupt'] == 1 and summary['orphans'] == 1
+                  and summary['checked'] == summary['locations'] == 27 and summary['orphans_checked'],
+                  "report only: 3 missing (deleted, lost, dead link), 1 corrupt by size, 1 old orphan")
+            check(kinds[papers['resized'][3]] == 'corrupt' and kinds[papers['orphan'][3]] == 'orphan'
+                  and papers['same_size'][3] not in kinds and papers['fresh'][3] not in kinds
+                  and 'tmpabc.part' not in kinds,
+                  "stat only: a same-size overwrite, a fresh blob and a write in progress pass")
+            check(snapshot() == before and not quarantined(), "report-only scrub changed nothing")
+
+            # 2. Verify and repair
+            summary = scrub(backend=local, verify_hashes=True, workers=4)
+            actions = {p['location']: p['action'] for p in summary['problems']}
+            check(summary['corrupt'] == 2 and actions[papers['same_size'][3]] == 'repaired'
+                  and summary['bytes_hashed'] > 20 * 32 * 1024,
+                  "verifying scrub caught the same-size overwrite by its hash")
+            check(summary['repaired'] == 3 and all(
+                local.get(papers[name][3]).read() == papers[name][1] for name in ('deleted', 'resized', 'same_size')
+            ), "deleted blob restored from the other row's link, overwritten ones from their synced copies")
+            check(summary['unrecoverable'] == 2 and actions[papers['lost'][3]] == 'unrecoverable'
+                  and file_path_of(papers['lost'][0]) == papers['lost'][3],
+                  "a blob with no other copy and a dead link reported unrecoverable, rows left as they were")
+            held = quarantined()
+            check(summary['quarantined'] == 3 and held[os.path.basename(papers['resized'][3])] == b'%PDF-1.4 truncated'
+                  and os.path.basename(papers['orphan'][3]) in held
+                  and not os.path.exists(local.local_path(papers['orphan'][3]))
+                  and os.path.exists(local.local_path(papers['fresh'][3])),
+                  "corrupt blobs and the old orphan moved to quarantine, the fresh blob kept")
+
+            # 3. A re-run finds only what can't be repaired
+            summary = scrub(backend=local, verify_hashes=True)
+            check(summary['missing'] == 2 and summary['corrupt'] == 0 and summary['orphans'] == 0
+                  and summary['repaired'] == 0 and summary['quarantined'] == 0,
+                  "re-run: only the 2 unrecoverable papers are reported")
+
+            # 4. The app serves the repaired papers again
+            with quiet():
+                from app import app
+            with app.test_client() as web:
+                served = [web.get(f"/api/pdf/view/{papers[name][0]}") for name in ('deleted', 'same_size')]
+                check(all(r.status_code == 200 and r.data == papers[name][1]
+                          for r, name in zip(served, ('deleted', 'same_size'))),
+                      "repaired papers are served again")
+                for r in served:
+                    r.close()
+
+            # 5. The background worker scrubs on request
+            worker = ScrubWorker(backend=local, interval_seconds=0)
+            with quiet():
+                worker.start()
+                worker.run_now()
+                deadline = time.time() + 30
+                while worker.status()['last_summary'] is None and time.time() < deadline:
+                    time.sleep(0.05)
+                worker.stop(5)
+            status = worker.status()
+            check(status['last_summary']['missing'] == 2 and not status['busy'],
+                  "background scrub ran on request and reported the 2 missing papers")
+
+        # 6. Timed scrub of many files, with requests served meanwhile
+        started = time.time()
+        bulk_library(count)
+        print(f"  {count} files written in {time.time() - started:.0f}s")
+        row_id = healthy[0]
+        idle = request_times(app, row_id, 2)
+        for verify in (False, True):
+            done = threading.Event()
+            during = []
+            probe = threading.Thread(target=lambda: during.extend(request_times(app, row_id, 600, done)))
+            probe.start()
+            summary = scrub(backend=local, verify_hashes=verify, repair=False, quarantine=False)
+            done.set()
+            probe.join()
+            hashed = f", {summary['bytes_hashed'] / summary['seconds'] / 1048576:.0f} MB/s hashed" if verify else ''
+            # The Cloudinary stand-in is gone by now: its links are unreachable, not missing
+            check(summary['checked'] >= count and summary['missing'] == 1 and summary['errors'] == 2
+                  and summary['corrupt'] == 0,
+                  f"{'verify' if verify else 'stat only'}: {summary['checked']} locations in "
+                  f"{summary['seconds']:.1f}s ({summary['files_per_second']}/s{hashed})")
+            print(f"  /api/pdf/view p50 {statistics.median(during) * 1000:.1f} ms, p95 {p95(during) * 1000:.1f} ms "
+                  f"during the scrub vs p50 {statistics.median(idle) * 1000:.1f} ms, "
+                  f"p95 {p95(idle) * 1000:.1f} ms idle ({len(during)} requests)")
+            check(summary['seconds'] < 300 and p95(during) < 0.25,
+                  "scrub finished in minutes and requests kept being served quickly")
+
+        # 7. An S3-compatible store (its own rows): repaired from the volume, orphans quarantined from the bucket
+        with s3_server.serve('minio', 'minio-secret') as s3:
+            backend = S3Backend(S3Client(s3.url(), 'papers', 'minio', 'minio-secret'), public_url='')
+            session = Session()
+            session.query(PyqFile).delete()
+            session.commit()
+            session.close()
+            rng = random.Random(5)
+            keys = []
+            for i in range(30):
+                content, content_hash, key = stored(rng)
+                backend.put(key, io.BytesIO(content))
+                keys.append((key, content_hash, content))
+            add_rows([(key, content_hash) for key, content_hash, _ in keys])
+            backend.delete(keys[0][0])
+            backend.put(keys[1][0], io.BytesIO(b'%PDF-1.4 truncated'))
+            backend.put('aa/bb/stray.pdf', io.BytesIO(b'%PDF-1.4 stray'))
+            s3.modified[('papers', 'aa/bb/stray.pdf')] = OLD
+            summary = scrub(backend=backend, workers=8)
+            check(summary['missing'] == 1 and summary['corrupt'] == 1 and summary['repaired'] == 2
+                  and s3.objects[('papers', keys[0][0])] == keys[0][2]
+                  and s3.objects[('papers', keys[1][0])] == keys[1][2],
+                  "s3: missing and corrupt objects re-uploaded from the volume's copies")
+            check(summary['orphans'] == 1 and ('papers', 'aa/bb/stray.pdf') not in s3.objects
+                  and quarantined().get('stray.pdf') == b'%PDF-1.4 stray',
+                  "s3: the stray object listed as an orphan, downloaded to quarantine and deleted")
+
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,225 @@
+"""
+Storage sync check
+Builds a library the way older deployments have it - content-addressed
+local blobs, flat files from before content hashing, Cloudinary links, a
+paper whose file is gone and a blob whose content no longer matches its
+hash - and syncs it into an S3-compatible store (local stand-in). Checks
+the dry run changes nothing, an interrupted sync resumes from its
+checkpoint without re-uploading, a re-run transfers nothing, every row
+ends up pointing at an intact copy the app serves, the corrupt and
+missing blobs are reported, transfers run in parallel (bytes/s vs one at
+a time) and the background worker runs a sync on request
+
+Usage: python check_storage_sync.py
+"""
+import io
+import os
+import sys
+import time
+import random
+import hashlib
+import shutil
+import tempfile
+import contextlib
+import threading
+
+# Point storage and database at a scratch directory before importing backend;
+# the app serves from S3, so synced rows are pointed at their S3 copies
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_sync_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'sync.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+os.environ['STORAGE_BACKEND'] = 's3'
+sys.path.insert(0, 'backend')
+
+import requests
+import storage
+from config import PDF_STORAGE_PATH, ensure_directories
+from database import init_database, Session, PyqFile, get_blob_replicas
+from blob_store import BlobStore
+from s3_client import S3Client
+from storage import S3Backend
+from storage_sync import sync_storage, SyncWorker
+import s3_server
+import cloudinary_server
+
+MB = 1024 * 1024
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def pdf(rng):
+    return b'%PDF-1.4\n' + rng.randbytes(64 * 1024)
+
+
+def add_rows(paths):
+    """One pyq_files row per (file_path, content_hash); returns their ids"""
+    session = Session()
+    rows = [PyqFile(degree='B.E.', branch='CSE', semester=3, subject_code=f"PCC-CS{i:03d}",
+                    subject_name=f"Subject {i}", exam_type='Winter', exam_year=2030,
+                    file_path=file_path, content_hash=content_hash)
+            for i, (file_path, content_hash) in enumerate(paths)]
+    session.add_all(rows)
+    session.commit()
+    ids = [row.id for row in rows]
+    session.close()
+    return ids
+
+
+def rows_by_id():
+    session = Session()
+    rows = {row.id: (row.file_path, row.content_hash) for row in session.query(PyqFile).all()}
+    session.close()
+    return rows
+
+
+def build_library(cloud):
+    """Returns: {row id: expected content}, id of the row with no file, hash of the corrupt blob"""
+    rng = random.Random(7)
+    blobs = BlobStore(PDF_STORAGE_PATH)
+    expected = {}
+
+    # 60 content-addressed blobs, two of them shared by a second row
+    paths, contents = [], []
+    for i in range(60):
+        content = pdf(rng)
+        content_hash, key, _, _ = blobs.write_stream(io.BytesIO(content))
+        paths.append((key, content_hash))
+        contents.append(content)
+    paths += paths[:2]
+    contents += contents[:2]
+
+    # 10 flat files from before content hashing
+    for i in range(10):
+        content = pdf(rng)
+        name = f"PCC-CS{100 + i}_Old Subject.pdf"
+        with open(os.path.join(PDF_STORAGE_PATH, name), 'wb') as f:
+            f.write(content)
+        paths.append((name, None))
+        contents.append(content)
+
+    # 8 Cloudinary links
+    for i in range(8):
+        content = pdf(rng)
+        cloud.uploads[f"pyq_pdfs/old_{i}"] = content
+        paths.append((f"{cloud.url()}/demo/raw/upload/pyq_pdfs/old_{i}", None))
+        contents.append(content)
+
+    ids = add_rows(paths)
+    expected.update(zip(ids, contents))
+
+    # A row whose file is gone, and a blob overwritten with other content
+    missing_id, = add_rows([('PCC-CS999_Gone.pdf', None)])
+    corrupt_hash = hashlib.sha256(b'original content').hexdigest()
+    os.makedirs(os.path.dirname(blobs.absolute_path(corrupt_hash)), exist_ok=True)
+    with open(blobs.absolute_path(corrupt_hash), 'wb') as f:
+        f.write(b'%PDF-1.4 overwritten')
+    add_rows([(BlobStore.relative_path(corrupt_hash), corrupt_hash)])
+    return expected, missing_id, corrupt_hash
+
+
+def s3_backend(server, bucket):
+    return S3Backend(S3Client(server.url(), bucket, 'minio', 'minio-secret'), public_url='')
+
+
+def sync(target, **kwargs):
+    with quiet():
+        return sync_storage(target, **kwargs)
+
+
+if __name__ == '__main__':
+    try:
+        with quiet():
+            ensure_directories()
+            init_database()
+
+        with s3_server.serve('minio', 'minio-secret') as s3, cloudinary_server.serve('cloud-secret') as cloud:
+            expected, missing_id, corrupt_hash = build_library(cloud)
+            target = s3_backend(s3, 'papers')
+            before = rows_by_id()
+
+            # 1. Dry run: everything is hashed and looked up, nothing changes
+            summary = sync(target, dry_run=True)
+            check(summary['uploaded'] == 79 and summary['hashed'] == 18 and summary['missing'] == 1
+                  and not s3.objects and rows_by_id() == before,
+                  "dry run: 79 blobs to upload, 18 rows to hash, 1 missing - nothing written")
+
+            # 2. A sync stopped part-way keeps what it finished
+            stop = threading.Event()
+            summary = sync(target, workers=4, stop_event=stop,
+                           progress_callback=lambda done, total, size: done >= 30 and stop.set())
+            checkpointed = len(get_blob_replicas(target.store_id))
+            check(summary['stopped'] and 30 <= checkpointed < 79 and len(s3.objects) == checkpointed,
+                  f"interrupted sync checkpointed {checkpointed} uploaded blobs")
+
+            # 3. The next run resumes: only the rest is uploaded
+            puts = sum(1 for method, _, _ in s3.requests if method == 'PUT')
+            summary = sync(target, workers=4)
+            new_puts = sum(1 for method, _, _ in s3.requests if method == 'PUT') - puts
+            check(summary['synced_before'] == checkpointed and summary['uploaded'] == 78 - checkpointed
+                  and new_puts == 79 - checkpointed,
+                  f"resumed sync uploaded the remaining {summary['uploaded']} (+1 corrupt, refused)")
+            check(summary['failed'] == 1 and "doesn't match" in str(summary['errors'])
+                  and ('papers', BlobStore.relative_path(corrupt_hash)) not in s3.objects,
+                  "blob whose content doesn't match its hash reported and removed from the target")
+            check(summary['missing'] == 1 and summary['rows_rewritten'] > 0,
+                  f"missing file reported, {summary['rows_rewritten']} rows pointed at their S3 copies")
+            print(f"  {summary['bytes'] / MB:.1f} MB at {summary['bytes_per_second'] / MB:.1f} MB/s")
+
+            # 4. Every row now points at an intact copy; a re-run transfers nothing
+            rows = rows_by_id()
+            check(all(rows[i][0] == BlobStore.relative_path(hashlib.sha256(c).hexdigest())
+                      and s3.objects[('papers', rows[i][0])] == c for i, c in expected.items()),
+                  "all 80 rows (local, flat, linked) point at their content in S3, hashes filled in")
+            check(rows[missing_id] == before[missing_id], "the row with no file is left as it was")
+            s3.requests.clear()
+            summary = sync(target)
+            puts = [path for method, path, _ in s3.requests if method == 'PUT']
+            check(summary['uploaded'] == 0 and summary['synced_before'] == 78 and summary['rows_rewritten'] == 0
+                  and puts == [f"/papers/{BlobStore.relative_path(corrupt_hash)}"],
+                  "re-run: all 78 blobs checkpointed, only the corrupt one is tried again")
+
+            # 5. The app serves a formerly linked paper from S3
+            storage._storage = target
+            with quiet():
+                from app import app
+            linked = [i for i in expected if before[i][0].startswith('http')][0]
+            with app.test_client() as web:
+                response = web.get(f'/api/pdf/view/{linked}')
+                with requests.get(response.headers['Location']) as served:
+                    check(response.status_code == 302 and served.content == expected[linked],
+                          "a paper that was a Cloudinary link is served from its S3 copy")
+
+        # 6. Transfers run in parallel
+        with s3_server.serve('minio', 'minio-secret', latency=0.02) as s3:
+            rates = {}
+            for workers in (1, 8):
+                summary = sync(s3_backend(s3, f"papers-{workers}"), workers=workers)
+                rates[workers] = summary['bytes_per_second']
+                check(summary['uploaded'] == 60, f"{workers} worker(s): {summary['uploaded']} local blobs uploaded "
+                                                   f"at {summary['bytes_per_second'] / MB:.1f} MB/s")
+            check(rates[8] > 3 * rates[1], f"8 workers {rates[8] / rates[1]:.1f}x the throughput of one")
+
+            # 7. The background worker syncs on request and reports progress
+            worker = SyncWorker(target=s3_backend(s3, 'papers-bg'), interval_seconds=0)
+            with quiet():
+                worker.start()
+                worker.run_now()
+                deadline = time.time() + 30
+                while worker.status()['last_summary'] is None and time.time() < deadline:
+                    time.sleep(0.05)
+                worker.stop(5)
+            status = worker.status()
+            check(status['last_summary']['uploaded'] == 60 and status['last_summary']['bytes_per_second'] > 0
+                  and not status['busy'],
+                  f"background sync uploaded {status['last_summary']['uploaded']} blobs on request")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,141 @@
+"""
+Subject index check
+Stores papers through insert_pyq_files_bulk and classifies new member
+names with the index-backed classifier. Checks a branch or name the
+filename states wins over the index, the index only fills what a filename
+lacks, guessed or index-filled fields never feed the index, replacing a
+paper updates what the index knows, and readers see a consistent index
+while papers are noted from other threads
+
+Usage: python check_subject_index.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_subject_index_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'index.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from database import init_database, insert_pyq_files_bulk
+from filename_classifier import FilenameClassifier, parse_inferred
+from subject_index import SubjectIndex, get_subject_index
+
+CE_IRRIGATION = ("13001 - Year - B.E. - B.Tech. Civil Engineering (Model Curriculum) Semester-VII "
+                 "Subject - PEC-1 - Irrigation Engineering.pdf")
+ECE_WATER = ("13002 - Year - B.E. - B.Tech. Electronics and Communication (Model Curriculum) Semester-VII "
+             "Subject - PEC-1 - Water Resources.pdf")
+NO_BRANCH_WATER = "13003 - Year - B.E. (Model Curriculum) Semester-VII Subject - PEC-1 - Water Resources.pdf"
+NO_BRANCH_NO_NAME = "13004 - Year - B.E. (Model Curriculum) Semester-VII Subject - PEC-1.pdf"
+GUESSED_ONLY = "13005 - Year - B.E. (Model Curriculum) Semester-V Subject - PCC-501 - Signals.pdf"
+GUESSED_AGAIN = "13006 - Year - B.E. (Model Curriculum) Semester-V Subject - PCC-501.pdf"
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+def quiet():
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def store(classifier, name, exam_year=2024, replace=False, member_name=None):
+    """Classify a member name and store it as a paper; returns the classification"""
+    paper = classifier.classify(name)
+    with quiet():
+        insert_pyq_files_bulk([{**paper, 'exam_type': 'SUMMER', 'exam_year': exam_year,
+                                'file_path': f'{exam_year}/{name}', 'member_name': member_name or name, 'replace': replace}])
+    return paper
+
+
+def main():
+    with quiet():
+        init_database()
+        classifier = FilenameClassifier(get_subject_index())
+
+    first = store(classifier, CE_IRRIGATION)
+    check(first['branch'] == 'CE' and first['inferred'] == '', "A paper stating its branch and name infers nothing")
+
+    stated = classifier.classify(ECE_WATER)
+    check((stated['branch'], stated['subject_name']) == ('ECE', 'Water Resources') and stated['inferred'] == '',
+          "Branch and name the filename states win over the index")
+
+    filled = classifier.classify(NO_BRANCH_WATER)
+    check((filled['branch'], filled['subject_name']) == ('CE', 'Water Resources'),
+          "Index fills only the missing branch; the stated name is kept")
+    check(parse_inferred(filled['inferred']) == {'branch': 'index'}, "Result records the branch came from the index")
+
+    both = classifier.classify(NO_BRANCH_NO_NAME)
+    check((both['branch'], both['subject_name']) == ('CE', 'Irrigation Engineering')
+          and parse_inferred(both['inferred']) == {'branch': 'index', 'subject_name': 'index'},
+          "Index fills branch and name when the filename states neither")
+
+    guessed = store(classifier, GUESSED_ONLY)
+    check(parse_inferred(guessed['inferred']) == {'branch': 'code'}, "Branch guessed from the code is recorded as such")
+    again = classifier.classify(GUESSED_AGAIN)
+    check(parse_inferred(again['inferred']) == {'branch': 'code', 'subject_name': 'index'},
+          "A guessed branch never feeds the index (the stated name does)")
+
+    # The member changed and now names a different subject
+    store(classifier, CE_IRRIGATION.replace('Irrigation Engineering', 'Hydraulic Structures'), replace=True,
+          member_name=CE_IRRIGATION)
+    check(get_subject_index().lookup('PEC-1', 7) == ('CE', 'Hydraulic Structures'),
+          "Replacing a paper swaps its old name out of the index")
+
+    store(classifier, NO_BRANCH_WATER, exam_year=2023)
+    index = SubjectIndex([('PEC-1', 'CE', 7, 'Hydraulic Structures', ''),
+                          ('PEC-1', 'CE', 7, 'Water Resources', 'branch:index')])
+    index.remove_rows([('PEC-1', 'CE', 7, 'Hydraulic Structures', '')])
+    check(index.get('PEC-1') == {'branches': [], 'subject_name': 'Water Resources', 'semesters': [7]},
+          "Index-filled fields are not counted when stored; stated ones are")
+    rebuilt = SubjectIndex.from_database()
+    check(rebuilt.get('PEC-1') == get_subject_index().get('PEC-1')
+          and rebuilt.get('PCC-501') == get_subject_index().get('PCC-501'),
+          "Index kept current matches one rebuilt from the database")
+
+    # Readers while other threads note and replace papers
+    index = SubjectIndex()
+    errors = []
+    stop = threading.Event()
+    rows = [(f'PCC-{i}', 'CSE', 3, f'Subject {i}', '') for i in range(200)]
+
+    def writer():
+        while not stop.is_set():
+            index.add_rows(rows)
+            index.remove_rows(rows)
+
+    def reader():
+        try:
+            for _ in range(2000):
+                for i in (0, 99, 199):
+                    known = index.get(f'PCC-{i}')
+                    if known is not None and known['subject_name'] is None and known['branches']:
+                        errors.append(known)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads[1:]:
+        thread.join()
+    stop.set()
+    threads[0].join()
+    check(not errors, "Readers never see a half-updated entry")
+
+    print("\n✓ Subject index checks passed")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
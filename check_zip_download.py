@@ -0,0 +1,353 @@
+"""
+Resumable ZIP download check
+Serves archives from a local HTTP server (HEAD, Range, If-Range, ETag and
+an injected connection drop) and checks zip_fetcher against it:
+an interrupted download resumes with a Range request, a changed remote
+file restarts from zero, a segmented download retries a dropped range on
+its own and resumes from its saved ranges, an oversize archive is rejected
+before any body bytes are read, a FETCHING job ends up UPLOADED with its
+manifest, and with the download pipeline its members are already stored.
+A re-ingest through the pipeline skips unchanged members and replaces a
+changed one, and members storage refuses while paused stay pending (the
+whole-archive path leaves them for a retry instead). Members the pipeline
+stored before a download failed are recorded as done by the retry
+without being stored again, and an archive ingested before is not
+inflated again from another URL. A segmented download feeds the pipeline
+a prefix that only grows, however its range threads interleave, and
+two jobs saved under the same filename never share a partial download
+
+Usage: python check_zip_download.py
+"""
+import io
+import os
+import sys
+import random
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_download_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'download.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+import requests
+from config import UPLOAD_FOLDER, DOWNLOAD_SEGMENT_MIN_SIZE, ensure_directories
+from database import init_database, create_upload_job, get_upload_job, count_job_members, Session, JobMember
+from storage import StoragePaused
+from zip_processor import ZIPProcessor
+import zip_fetcher
+from zip_fetcher import download_zip, fetch_job_zip, ZipTooLargeError
+from range_server import serve
+from download_pipeline import DownloadPipeline
+
+
+def build_archive(members):
+    """ZIP bytes with accepted engineering papers"""
+    rng = random.Random(3)
+    path = os.path.join(WORK_DIR, 'source.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for i in range(members):
+            name = (f"{30000 + i} - Year - B.E. Mechanical Engineering (Model Curriculum) "
+                    f"Semester-IV Subject - PCC-ME{i:03d} - Subject {i}.pdf")
+            zf.writestr(name, b'%PDF-1.4\n' + rng.randbytes(64 * 1024))
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def revise_archive(archive):
+    """The archive with its first member's content changed and one member added"""
+    path = os.path.join(WORK_DIR, 'revised.zip')
+    with zipfile.ZipFile(io.BytesIO(archive)) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for i, info in enumerate(source.infolist()):
+            zf.writestr(info.filename, source.read(info) + (b'revised' if i == 0 else b''))
+        zf.writestr(info.filename.replace('PCC-ME039', 'PCC-ME040').replace('Subject 39', 'Subject 40'),
+                    b'%PDF-1.4\nadded')
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def pause_storage(after):
+    """
+    Make storage refuse uploads (StoragePaused) after `after` more stores
+    Returns: the member names stored until then
+    """
+    stored = []
+    def store(self, zip_ref, info, metadata):
+        if len(stored) >= after:
+            raise StoragePaused('uploads paused', 30)
+        stored.append(info.filename)
+        return real_stream_to_storage(self, zip_ref, info, metadata)
+    ZIPProcessor._stream_to_storage = store
+    return stored
+
+real_stream_to_storage = ZIPProcessor._stream_to_storage
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✓ {message}")
+
+
+if __name__ == '__main__':
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ensure_directories()
+            init_database()
+        archive = build_archive(40)
+        dest = os.path.join(UPLOAD_FOLDER, 'check.zip')
+
+        with serve() as server:
+            server.files['/a.zip'] = (archive, '"v1"')
+
+            # 1. Interrupted download resumes with a Range request
+            server.drop_after = len(archive) // 3
+            try:
+                download_zip(server.url('/a.zip'), dest, chunk_size=64 * 1024)
+                raise AssertionError('the dropped connection was not noticed')
+            except requests.RequestException:
+                pass
+            kept = os.path.getsize(dest + '.part')
+            check(kept > 0, f"partial file kept after the drop ({kept} bytes)")
+            server.requests.clear()
+            size = download_zip(server.url('/a.zip'), dest, chunk_size=64 * 1024)
+            ranges = [r for method, _, r in server.requests if method == 'GET']
+            check(ranges == [f'bytes={kept}-'], f"resumed with Range {ranges[0]}")
+            with open(dest, 'rb') as f:
+                check(size == len(archive) and f.read() == archive, "resumed file matches the archive")
+            check(not os.path.exists(dest + '.part.json'), "partial download record removed")
+            os.remove(dest)
+
+            # 2. A remote file that changed between attempts restarts from zero
+            server.drop_after = len(archive) // 2
+            with contextlib.suppress(requests.RequestException):
+                download_zip(server.url('/a.zip'), dest, chunk_size=64 * 1024)
+            changed = archive[::-1]
+            server.files['/a.zip'] = (changed, '"v2"')
+            server.requests.clear()
+            download_zip(server.url('/a.zip'), dest, chunk_size=64 * 1024)
+            ranges = [r for method, _, r in server.requests if method == 'GET']
+            with open(dest, 'rb') as f:
+                check(ranges == [None] and f.read() == changed, "changed remote file downloaded from zero")
+            os.remove(dest)
+
+            # 3. Segmented download: a dropped range is retried alone, and a
+            #    download stopped midway resumes every range where it stopped
+            zip_fetcher.DOWNLOAD_SEGMENT_MIN_SIZE = 0
+            server.files['/a.zip'] = (archive, '"v1"')
+            server.drop_after = 4096
+            server.requests.clear()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                size = download_zip(server.url('/a.zip'), dest, chunk_size=16 * 1024, segments=4)
+            ranges = [r for method, _, r in server.requests if method == 'GET']
+            with open(dest, 'rb') as f:
+                check(size == len(archive) and f.read() == archive,
+                      f"segmented download matches the archive ({len(ranges)} GETs for 4 ranges)")
+            ends = [r.rpartition('-')[2] for r in ranges]
+            check(len(ranges) == 5 and len(set(ends)) == 4, "only the dropped range was requested again")
+            os.remove(dest)
+
+            stopped = []
+            def stop_halfway(downloaded, total):
+                if downloaded > total // 2:
+                    stopped.append(downloaded)
+                    raise requests.RequestException('stopped')
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                    contextlib.suppress(requests.RequestException):
+                download_zip(server.url('/a.zip'), dest, stop_halfway, chunk_size=16 * 1024, segments=4)
+            saved = zip_fetcher._load_state(dest + '.part.json')['segments']
+            server.requests.clear()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                download_zip(server.url('/a.zip'), dest, chunk_size=16 * 1024, segments=4)
+            ranges = sorted(r for method, _, r in server.requests if method == 'GET')
+            expected = sorted(f'bytes={start + written}-{end}' for start, end, written in saved
+                              if written < end - start + 1)
+            with open(dest, 'rb') as f:
+                check(ranges == expected and f.read() == archive,
+                      f"stopped segmented download resumed {len(ranges)} ranges where they stopped")
+            os.remove(dest)
+            zip_fetcher.DOWNLOAD_SEGMENT_MIN_SIZE = DOWNLOAD_SEGMENT_MIN_SIZE
+
+            # 4. Oversize archives are rejected from the HEAD response alone
+            server.requests.clear()
+            try:
+                download_zip(server.url('/a.zip'), dest, max_size=len(changed) - 1)
+                raise AssertionError('oversize archive accepted')
+            except ZipTooLargeError:
+                pass
+            check([method for method, _, _ in server.requests] == ['HEAD'], "oversize archive rejected before GET")
+
+            # 5. A FETCHING job is downloaded, pre-classified and marked UPLOADED
+            server.files['/job.zip'] = (archive, '"v1"')
+            job_id = create_upload_job('job.zip', '', 'Summer', 2023, 0,
+                                       zip_url=server.url('/job.zip'), status='FETCHING')
+            zip_fetcher.INGEST_PIPELINE = False
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                total = fetch_job_zip(job_id)
+            job = get_upload_job(job_id)
+            check(job['status'] == 'UPLOADED' and total == 40 and count_job_members(job_id) == 40,
+                  f"job {job_id} is UPLOADED with {total} members to process")
+            check(job['download_bytes'] == job['download_total'] == len(archive), "download progress stored on the job")
+
+            # 6. With the pipeline, members are stored during the download and
+            #    the manifest records them as done
+            #    (another URL: the archive cache would answer for /job.zip)
+            zip_fetcher.INGEST_PIPELINE = True
+            server.files['/piped.zip'] = (archive, '"v1"')
+            job_id = create_upload_job('piped.zip', '', 'Summer', 2024, 0,
+                                       zip_url=server.url('/piped.zip'), status='FETCHING')
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                total = fetch_job_zip(job_id)
+            job = get_upload_job(job_id)
+            check(job['status'] == 'COMPLETED' and total == 0 and count_job_members(job_id, 'DONE') == 40 and
+                  job['processed_pdfs'] == job['total_pdfs'] == 40,
+                  f"pipelined job {job_id} stored all 40 members while downloading")
+
+            # 7. Re-ingesting the session: unchanged members are not inflated
+            #    again, the changed one replaces its paper, the new one is added
+            server.files['/revised.zip'] = (revise_archive(archive), '"v1"')
+            job_id = create_upload_job('revised.zip', '', 'Summer', 2024, 0,
+                                       zip_url=server.url('/revised.zip'), status='FETCHING')
+            inflated = pause_storage(after=len(archive))
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    total = fetch_job_zip(job_id)
+            finally:
+                ZIPProcessor._stream_to_storage = real_stream_to_storage
+            session = Session()
+            members = session.query(JobMember.status, JobMember.change_type).filter(JobMember.job_id == job_id).all()
+            session.close()
+            statuses = {status: sum(1 for m in members if m.status == status) for status in ('UNCHANGED', 'DONE')}
+            changed = [m.status for m in members if m.change_type == 'CHANGED']
+            check(total == 0 and statuses == {'UNCHANGED': 39, 'DONE': 2} and changed == ['DONE'] and len(inflated) == 2,
+                  "pipeline skips unchanged members and replaces the changed one while downloading")
+
+            # 8. Storage paused: pipelined members stay PENDING for batches
+            server.files['/paused.zip'] = (archive, '"v1"')
+            job_id = create_upload_job('paused.zip', '', 'Summer', 2025, 0,
+                                       zip_url=server.url('/paused.zip'), status='FETCHING')
+            pause_storage(after=5)
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    total = fetch_job_zip(job_id)
+            finally:
+                ZIPProcessor._stream_to_storage = real_stream_to_storage
+            check(count_job_members(job_id, 'FAILED') == 0 and count_job_members(job_id, 'DONE') == 5 and
+                  total == count_job_members(job_id, 'PENDING') == 35,
+                  "members refused while storage is paused stay PENDING")
+
+            # 9. The whole-archive path leaves them for a retry and keeps the ZIP
+            zip_path = os.path.join(UPLOAD_FOLDER, 'paused.zip')
+            with open(zip_path, 'wb') as f:
+                f.write(archive)
+            processor = ZIPProcessor(zip_path, 'Winter', 2025)
+            pause_storage(after=5)
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    result = processor.process(streaming=True)
+            finally:
+                ZIPProcessor._stream_to_storage = real_stream_to_storage
+            check(result['success'] and len(result['papers']) == 5 and len(result['left']) == 35
+                  and os.path.exists(zip_path), "paused whole-archive ingest lists what is left and keeps the ZIP")
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                retried = processor.process(streaming=True, members=result['left'])
+            check(retried['success'] and len(retried['papers']) == 35 and 'left' not in retried
+                  and not os.path.exists(zip_path), "retry stores the rest and removes the ZIP")
+
+            # 10. A pipelined download that fails midway keeps what it stored
+            server.files['/dropped.zip'] = (archive, '"v1"')
+            job_id = create_upload_job('dropped.zip', '', 'Summer', 2026, 0,
+                                       zip_url=server.url('/dropped.zip'), status='FETCHING')
+            server.drop_after = len(archive) // 2
+            first = pause_storage(after=len(archive))
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    fetch_job_zip(job_id)
+                raise AssertionError('the dropped connection was not noticed')
+            except requests.RequestException:
+                pass
+            finally:
+                ZIPProcessor._stream_to_storage = real_stream_to_storage
+            results_path = zip_fetcher._job_zip_path(get_upload_job(job_id)) + '.pipeline.json'
+            check(first and os.path.exists(results_path), f"failed download kept the {len(first)} members it stored")
+            retried = pause_storage(after=len(archive))
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    total = fetch_job_zip(job_id)
+            finally:
+                ZIPProcessor._stream_to_storage = real_stream_to_storage
+            check(total == 0 and count_job_members(job_id, 'DONE') == 40 and count_job_members(job_id, 'SKIPPED') == 0
+                  and len(first) + len(retried) == 40 and not os.path.exists(results_path),
+                  "retry stores only the rest and records every member as done")
+
+            # 11. The same archive from another URL: nothing is inflated again
+            server.files['/again.zip'] = (archive, '"v1"')
+            job_id = create_upload_job('again.zip', '', 'Summer', 2026, 0,
+                                       zip_url=server.url('/again.zip'), status='FETCHING')
+            inflated = pause_storage(after=len(archive))
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    total = fetch_job_zip(job_id)
+            finally:
+                ZIPProcessor._stream_to_storage = real_stream_to_storage
+            check(total == 0 and not inflated and get_upload_job(job_id)['status'] == 'COMPLETED',
+                  "an archive ingested before completes without inflating a member")
+
+            # 12. Segmented download through the pipeline, with range threads
+            #     switching as often as possible
+            zip_fetcher.DOWNLOAD_SEGMENT_MIN_SIZE = 0
+            zip_fetcher._FOLLOWED_CHUNK_SIZE = 4096
+            server.files['/segmented.zip'] = (archive, '"v1"')
+            job_id = create_upload_job('segmented.zip', '', 'Summer', 2027, 0,
+                                       zip_url=server.url('/segmented.zip'), status='FETCHING')
+            reported = []
+            real_advance = DownloadPipeline.advance
+            def advance(self, length):
+                reported.append(length)
+                real_advance(self, length)
+            DownloadPipeline.advance = advance
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    total = fetch_job_zip(job_id)
+            finally:
+                sys.setswitchinterval(switch_interval)
+                DownloadPipeline.advance = real_advance
+                zip_fetcher.DOWNLOAD_SEGMENT_MIN_SIZE = DOWNLOAD_SEGMENT_MIN_SIZE
+            check(len(reported) > 40 and reported == sorted(reported),
+                  f"segmented download reported {len(reported)} growing prefixes")
+            check(total == 0 and count_job_members(job_id, 'DONE') == 40,
+                  "pipeline stored every member of a segmented download while downloading")
+
+            # 13. Two jobs with the same filename keep their own partial downloads
+            server.files['/first.zip'] = (archive, '"v1"')
+            server.files['/second.zip'] = (archive, '"v1"')
+            first_id = create_upload_job('Summer_2028.zip', '', 'Summer', 2028, 0,
+                                         zip_url=server.url('/first.zip'), status='FETCHING')
+            second_id = create_upload_job('Summer_2028.zip', '', 'Winter', 2028, 0,
+                                          zip_url=server.url('/second.zip'), status='FETCHING')
+            first_path = zip_fetcher._job_zip_path(get_upload_job(first_id))
+            server.drop_after = len(archive) // 2
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    fetch_job_zip(first_id)
+                raise AssertionError('the dropped connection was not noticed')
+            except requests.RequestException:
+                pass
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                fetch_job_zip(second_id)
+            check(os.path.exists(first_path + '.part') and os.path.exists(first_path + '.pipeline.json'),
+                  "another job for the same filename leaves a partial download alone")
+            server.requests.clear()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                fetch_job_zip(first_id)
+            check(any(path == '/first.zip' and range_header for _, path, range_header in server.requests)
+                  and count_job_members(first_id, 'DONE') == 40 and count_job_members(second_id, 'DONE') == 40,
+                  "the interrupted job resumes its own download and both store every member")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
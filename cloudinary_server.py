@@ -0,0 +1,170 @@
+"""
+Local stand-in for Cloudinary's upload API, for the upload checks and benchmarks
+Accepts signed raw uploads (POST /<cloud>/raw/upload, multipart form,
+chunked with X-Unique-Upload-Id / Content-Range) and deletions (POST
+/<cloud>/raw/destroy), checks signatures, keeps the files in memory and
+serves them back (GET/HEAD /<cloud>/raw/upload/<public_id>). Latency per
+upload, queued failure responses and an outage mode can be injected;
+uploads and the connections they arrived on are logged
+
+Usage: with serve('secret', latency=0.05) as server: CloudUploader(upload_url=server.url(), ...)
+"""
+import json
+import time
+import hashlib
+import threading
+import contextlib
+from urllib.parse import parse_qsl
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class CloudinaryServer(ThreadingHTTPServer):
+    """Upload endpoint stand-in: uploads[public_id] = bytes"""
+    daemon_threads = True
+
+    def __init__(self, api_secret, latency=0.0):
+        super().__init__(('127.0.0.1', 0), UploadHandler)
+        self.api_secret = api_secret
+        self.latency = latency  # seconds per upload request
+        self.uploads = {}
+        self.chunks = {}  # X-Unique-Upload-Id -> chunks received so far
+        self.requests = []  # (client port, public_id, status)
+        self.failures = []  # statuses for the next requests, in order ('garbled': a 200 that isn't JSON)
+        self.outage = None  # status for every request while set
+        self.retry_after = None  # Retry-After sent with 429s
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass
+
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def connections(self):
+        """Distinct client connections that sent uploads"""
+        return len({port for port, _, _ in self.requests})
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _signed(self, fields):
+        signed = {k: v for k, v in fields.items() if k not in ('api_key', 'signature')}
+        payload = '&'.join(f"{k}={signed[k]}" for k in sorted(signed)) + self.server.api_secret
+        return hashlib.sha1(payload.encode()).hexdigest() == fields.get('signature')
+
+    def _delivered(self):
+        """Public id of a delivery URL, or None"""
+        parts = self.path.split('/raw/upload/', 1)
+        return parts[1] if len(parts) == 2 else None
+
+    def do_GET(self):
+        content = self.server.uploads.get(self._delivered())
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command == 'GET':
+            self.wfile.write(content)
+
+    do_HEAD = do_GET
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        fields, content = {}, None
+        if self.headers['Content-Type'].startswith('multipart/'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if name == 'file':
+                    content = part.get_payload(decode=True)
+                else:
+                    fields[name] = part.get_content().strip()
+        else:
+            fields = dict(parse_qsl(body.decode()))
+
+        server = self.server
+        if self.path.endswith('/raw/destroy'):
+            if not self._signed(fields):
+                self._reply(401, {'error': {'message': 'Invalid Signature'}})
+                return
+            with server.lock:
+                found = server.uploads.pop(fields.get('public_id'), None) is not None
+            self._reply(200, {'result': 'ok' if found else 'not found'})
+            return
+
+        time.sleep(server.latency)
+        with server.lock:
+            status = server.failures.pop(0) if server.failures else server.outage
+        public_id = f"{fields.get('folder')}/{fields.get('public_id')}"
+        if status is None and (not self._signed(fields) or content is None):
+            status = 401
+        with server.lock:
+            server.requests.append((self.client_address[1], public_id, status or 200))
+
+        if status == 'garbled':
+            self.send_response(200)
+            self.send_header('Content-Length', '6')
+            self.end_headers()
+            self.wfile.write(b'<html>')
+            return
+        if status:
+            headers = {'Retry-After': str(server.retry_after)} if status == 429 and server.retry_after else None
+            self._reply(status, {'error': {'message': f'Injected {status}' if status != 401 else 'Invalid Signature'}},
+                        headers)
+            return
+        upload_id = self.headers.get('X-Unique-Upload-Id')
+        if upload_id:
+            # Chunks arrive in order; the last one carries the total size
+            start, _, total = self.headers['Content-Range'].replace('bytes ', '').partition('/')
+            with server.lock:
+                chunks = server.chunks.setdefault(upload_id, [])
+                if int(start.partition('-')[0]) != sum(len(c) for c in chunks):
+                    self._reply(400, {'error': {'message': 'Chunk out of order'}})
+                    return
+                chunks.append(content)
+                if total == '-1':
+                    self._reply(200, {'done': False})
+                    return
+                content = b''.join(server.chunks.pop(upload_id))
+        with server.lock:
+            server.uploads[public_id] = content
+        cloud = self.path.strip('/').split('/')[0]
+        self._reply(200, {
+            'public_id': public_id,
+            'secure_url': f"{server.url()}/{cloud}/raw/upload/{public_id}",
+            'bytes': len(content),
+        })
+
+
+@contextlib.contextmanager
+def serve(api_secret, latency=0.0):
+    """Run a CloudinaryServer on a background thread"""
+    server = CloudinaryServer(api_secret, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
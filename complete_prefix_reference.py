@@ -2,6 +2,11 @@
 COMPLETE SUBJECT CODE PREFIX REFERENCE
 For all Engineering Branches in the PYQ System
 """
+import sys
+
+sys.path.insert(0, 'backend')
+
+from subject_prefixes import get_prefix_registry
 
 print("=" * 100)
 print(" " * 30 + "COMPLETE PREFIX REFERENCE")
@@ -58,9 +63,7 @@ print(f"\n{'=' * 100}")
 print("CURRENT VALID PREFIXES IN SYSTEM")
 print(f"{'=' * 100}")
 
-current_valid = ['BSC', 'ESC', 'PCC', 'HSMC', 'MC', 'OEC', 'PEC', 'ST', 'SE', 'TEE', 'BE', 
-                 'UB', 'PS', 'US', 'MMCS', 'STUG', 'STPG', 'BP', 'MPG', 'MPH', 'MED', 
-                 'IN', 'ET', 'PSES', 'PEPS', 'PECS', 'PCSS']
+current_valid = get_prefix_registry().prefixes
 
 print(f"\nTotal prefixes: {len(current_valid)}")
 print(f"\nPrefixes: {', '.join(current_valid)}")
@@ -69,7 +72,7 @@ print(f"\n{'=' * 100}")
 print("✅ COVERAGE STATUS")
 print(f"{'=' * 100}")
 print("""
-The current valid_prefixes list covers ALL branches because:
+The prefix registry (backend/subject_prefixes.json) covers ALL branches because:
 
 1. Base prefixes (BSC, ESC, PCC, OEC, PEC, HSMC) - ✅ Included
 2. Semester-specific (ST, SE, TEE, BE) - ✅ Included  
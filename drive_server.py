@@ -0,0 +1,277 @@
+"""
+Local stand-in for the Google Drive v3 API, for the Drive upload checks
+Implements what drive_uploader.py uses, the way googleapiclient talks to
+Drive: multipart and resumable uploads (POST /upload/drive/v3/files),
+files.list by name and parent, media downloads with Range, files.delete,
+permissions.create on files and folders, and HTTP batch requests (POST
+/batch/drive/v3, multipart/mixed of application/http parts). Requests
+need the bearer token; files keep their content in memory and are served
+at their webContentLink only once they or their folder are public.
+Latency per HTTP request, queued failure responses and failures of
+individual batch items can be injected; requests are logged
+
+Usage: with serve('token', latency=0.05) as server: DriveUploader(credentials, endpoint=server.url())
+"""
+import re
+import json
+import time
+import uuid
+import threading
+import contextlib
+from urllib.parse import urlsplit, parse_qsl
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REASONS = {200: 'OK', 204: 'No Content', 206: 'Partial Content', 308: 'Resume Incomplete', 400: 'Bad Request',
+           401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 429: 'Too Many Requests',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class DriveServer(ThreadingHTTPServer):
+    """Drive stand-in: files[id] = {'name', 'parents', 'content', 'public'}, folders[id] = {'public'}"""
+    daemon_threads = True
+
+    def __init__(self, token, latency=0.0):
+        super().__init__(('127.0.0.1', 0), DriveHandler)
+        self.token = token
+        self.latency = latency  # seconds per HTTP request (a batch is one)
+        self.files = {}
+        self.folders = {}
+        self.sessions = {}  # resumable upload id -> {'metadata', 'content'}
+        self.requests = []  # (method, path) of HTTP requests
+        self.batched = []  # (method, path) of requests inside batches
+        self.failures = []  # statuses for the next HTTP requests, in order
+        self.batch_failures = []  # statuses for the next batched requests, in order
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass
+
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_folder(self, folder_id):
+        self.folders[folder_id] = {'public': False}
+
+    def is_public(self, file_id):
+        file = self.files[file_id]
+        return file['public'] or any(self.folders.get(p, {}).get('public') for p in file['parents'])
+
+    def _resource(self, file_id):
+        file = self.files[file_id]
+        return {
+            'id': file_id,
+            'name': file['name'],
+            'size': str(len(file['content'])),
+            'webViewLink': f"{self.url()}/file/d/{file_id}/view",
+            'webContentLink': f"{self.url()}/uc?id={file_id}&export=download",
+        }
+
+    def _create(self, metadata, content):
+        parents = metadata.get('parents') or []
+        if any(p not in self.folders for p in parents):
+            return 404, {}, _error(404, 'File not found: parent folder')
+        file_id = uuid.uuid4().hex
+        with self.lock:
+            self.files[file_id] = {'name': metadata.get('name'), 'parents': parents, 'content': content,
+                                   'public': False}
+        return 200, {}, self._resource(file_id)
+
+    def dispatch(self, method, target, headers, body):
+        """
+        Handle one API request (also each request inside a batch)
+        Returns: (status, headers, JSON-able body or bytes)
+        """
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        path = url.path
+
+        if path == '/upload/drive/v3/files' and method == 'POST':
+            upload_type = query.get('uploadType')
+            if upload_type == 'multipart':
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + body
+                )
+                metadata, content = None, None
+                for part in message.iter_parts():
+                    if part.get_content_type() == 'application/json':
+                        metadata = json.loads(part.get_payload(decode=True))
+                    else:
+                        content = part.get_payload(decode=True)
+                return self._create(metadata or {}, content or b'')
+            if upload_type == 'resumable':
+                upload_id = uuid.uuid4().hex
+                with self.lock:
+                    self.sessions[upload_id] = {'metadata': json.loads(body or b'{}'), 'content': b''}
+                return 200, {'Location': f"{self.url()}/upload/drive/v3/files?uploadType=resumable"
+                                         f"&upload_id={upload_id}"}, {}
+            return 400, {}, _error(400, 'Bad uploadType')
+
+        if path == '/upload/drive/v3/files' and method == 'PUT':
+            session = self.sessions.get(query.get('upload_id'))
+            if session is None:
+                return 404, {}, _error(404, 'No such upload')
+            # Content-Range: bytes s-e/total (or */total when asking for the status)
+            span, _, total = headers.get('Content-Range', '').replace('bytes ', '').partition('/')
+            if span != '*':
+                start = int(span.partition('-')[0])
+                if start != len(session['content']):
+                    return 400, {}, _error(400, 'Chunk out of order')
+                session['content'] += body
+            if total != '*' and len(session['content']) == int(total):
+                with self.lock:
+                    self.sessions.pop(query['upload_id'], None)
+                return self._create(session['metadata'], session['content'])
+            return 308, {'Range': f"bytes=0-{len(session['content']) - 1}"} if session['content'] else {}, b''
+
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)/permissions', path)
+        if match and method == 'POST':
+            file_id = match.group(1)
+            permission = json.loads(body or b'{}')
+            if permission.get('type') != 'anyone':
+                return 400, {}, _error(400, 'Unsupported permission')
+            with self.lock:
+                if file_id in self.files:
+                    self.files[file_id]['public'] = True
+                elif file_id in self.folders:
+                    self.folders[file_id]['public'] = True
+                else:
+                    return 404, {}, _error(404, f'File not found: {file_id}')
+            return 200, {}, {'id': 'anyoneWithLink'}
+
+        if path == '/drive/v3/files' and method == 'GET':
+            q = query.get('q', '')
+            name = re.search(r"name = '((?:[^'\\]|\\.)*)'", q)
+            parent = re.search(r"'([^']*)' in parents", q)
+            name = re.sub(r"\\(.)", r"\1", name.group(1)) if name else None
+            found = [self._resource(file_id) for file_id, file in list(self.files.items())
+                     if (name is None or file['name'] == name) and (parent is None or parent.group(1) in file['parents'])]
+            return 200, {}, {'files': found[:int(query.get('pageSize', 100))]}
+
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)', path)
+        if match:
+            file = self.files.get(match.group(1))
+            if file is None:
+                return 404, {}, _error(404, f'File not found: {match.group(1)}')
+            if method == 'DELETE':
+                with self.lock:
+                    self.files.pop(match.group(1), None)
+                return 204, {}, b''
+            if method == 'GET' and query.get('alt') == 'media':
+                return _ranged(file['content'], headers.get('Range'))
+            if method == 'GET':
+                return 200, {}, self._resource(match.group(1))
+
+        if path == '/uc' and method == 'GET':
+            file_id = query.get('id')
+            if file_id not in self.files:
+                return 404, {}, b''
+            if not self.is_public(file_id):
+                return 403, {}, b''
+            return 200, {'Content-Type': 'application/pdf'}, self.files[file_id]['content']
+
+        return 404, {}, _error(404, 'Not found')
+
+
+def _error(status, message):
+    reason = 'rateLimitExceeded' if status in (403, 429) else 'backendError' if status >= 500 else 'invalid'
+    return {'error': {'code': status, 'message': message, 'errors': [{'reason': reason, 'message': message}]}}
+
+
+def _ranged(content, range_header):
+    if not range_header:
+        return 200, {'Content-Type': 'application/pdf'}, content
+    start, _, end = range_header.replace('bytes=', '').partition('-')
+    start, end = int(start), min(int(end or len(content) - 1), len(content) - 1)
+    return 206, {'Content-Type': 'application/pdf',
+                 'Content-Range': f"bytes {start}-{end}/{len(content)}"}, content[start:end + 1]
+
+
+def _encode(body):
+    return body if isinstance(body, bytes) else json.dumps(body).encode()
+
+
+class DriveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers, body):
+        data = _encode(body)
+        self.send_response(status, REASONS.get(status))
+        if not isinstance(body, bytes):
+            self.send_header('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _batch(self, body):
+        """Run each application/http part of a multipart/mixed batch; reply in kind"""
+        server = self.server
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        boundary = f"batch_{uuid.uuid4().hex}"
+        out = []
+        for part in message.iter_parts():
+            raw = part.get_payload(decode=True)
+            head, _, inner_body = raw.partition(b'\r\n\r\n') if b'\r\n\r\n' in raw else raw.partition(b'\n\n')
+            lines = head.decode().splitlines()
+            method, target, _ = lines[0].split(' ', 2)
+            inner_headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+            with server.lock:
+                server.batched.append((method, urlsplit(target).path))
+                injected = server.batch_failures.pop(0) if server.batch_failures else None
+            if injected:
+                status, headers, result = injected, {}, _error(injected, f'Injected {injected}')
+            else:
+                status, headers, result = server.dispatch(method, target, inner_headers, inner_body)
+            data = _encode(result)
+            response = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", 'Content-Type: application/json']
+            response += [f"{name}: {value}" for name, value in headers.items()]
+            content_id = part['Content-ID'].strip('<>')
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                + '\r\n'.join(response) + f"\r\nContent-Length: {len(data)}\r\n\r\n"
+            )
+            out[-1] = out[-1].encode() + data + b'\r\n'
+        payload = b''.join(out) + f"--{boundary}--\r\n".encode()
+        self._reply(200, {'Content-Type': f'multipart/mixed; boundary={boundary}'}, payload)
+
+    def _handle(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests.append((self.command, urlsplit(self.path).path))
+            injected = server.failures.pop(0) if server.failures else None
+        if injected:
+            self._reply(injected, {}, _error(injected, f'Injected {injected}'))
+            return
+        public = urlsplit(self.path).path == '/uc'
+        if not public and self.headers.get('Authorization') != f"Bearer {server.token}":
+            self._reply(401, {}, _error(401, 'Invalid Credentials'))
+            return
+        if self.command == 'POST' and urlsplit(self.path).path == '/batch/drive/v3':
+            self._batch(body)
+            return
+        self._reply(*server.dispatch(self.command, self.path, self.headers, body))
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+@contextlib.contextmanager
+def serve(token, latency=0.0):
+    """Run a DriveServer on a background thread"""
+    server = DriveServer(token, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -2,6 +2,11 @@
 Search for ALL possible Mechanical Engineering subject code prefixes
 Based on the pattern we found for CSE, ME should have similar patterns
 """
+import sys
+
+sys.path.insert(0, 'backend')
+
+from subject_prefixes import get_prefix_registry
 
 # Expected patterns based on CSE structure:
 # CSE had: SE1BECS, SE2BECS (Sem 3-4), TEE101CS (Sem 5-6), BE101CS (Sem 7-8)
@@ -63,7 +68,7 @@ print(f"ALL UNIQUE ME PREFIXES: {sorted(all_me_prefixes)}")
 print(f"Total: {len(all_me_prefixes)}")
 
 # Current valid prefixes
-current_valid = ['BSC', 'ESC', 'PCC', 'HSMC', 'MC', 'OEC', 'PEC', 'ST', 'SE', 'TEE', 'BE', 'UB', 'PS', 'US', 'MMCS', 'STUG', 'STPG', 'BP', 'MPG', 'MPH', 'MED', 'IN', 'ET', 'PSES', 'PEPS', 'PECS', 'PCSS']
+current_valid = get_prefix_registry()
 
 print("\n" + "=" * 80)
 print("COVERAGE CHECK")
@@ -78,14 +83,11 @@ for prefix in sorted(all_me_prefixes):
         print(f"✅ {prefix:15s} - Already in valid_prefixes")
     else:
         # Check if it starts with any valid prefix
-        is_covered = False
-        for valid in current_valid:
-            if prefix.startswith(valid):
-                covered.append(prefix)
-                print(f"✅ {prefix:15s} - Covered by '{valid}'")
-                is_covered = True
-                break
-        if not is_covered:
+        match = current_valid.longest_match(prefix)
+        if match:
+            covered.append(prefix)
+            print(f"✅ {prefix:15s} - Covered by '{match[0]}' ({match[1]})")
+        else:
             potentially_missing.append(prefix)
             print(f"⚠️  {prefix:15s} - NOT COVERED! Should add to valid_prefixes")
 
@@ -100,5 +102,5 @@ print("\n" + "=" * 80)
 print("RECOMMENDATION")
 print("=" * 80)
 print("\nTo ensure ALL Mechanical Engineering papers are captured,")
-print("the valid_prefixes list should include:")
+print("backend/subject_prefixes.json should include:")
 print(f"\n{sorted(all_me_prefixes)}")
@@ -1,5 +1,10 @@
 import os
 import re
+import sys
+
+sys.path.insert(0, 'backend')
+
+from subject_prefixes import get_prefix_registry
 
 # Search for all Mechanical Engineering PDFs
 pdf_dir = 'uploads/pdfs'
@@ -46,17 +51,9 @@ print(f"\n=== UNIQUE PREFIXES FOUND IN ME FILES ===")
 print(sorted(unique_prefixes))
 
 # Check which might be missing from valid list
-valid_prefixes = ['BSC', 'ESC', 'PCC', 'HSMC', 'MC', 'OEC', 'PEC', 'ST', 'SE', 'TEE', 'BE', 'UB', 'PS', 'US', 'MMCS', 'STUG', 'STPG', 'BP', 'MPG', 'MPH', 'MED', 'IN', 'ET', 'PSES', 'PEPS', 'PECS', 'PCSS']
+valid_prefixes = get_prefix_registry()
 
-missing = []
-for prefix in unique_prefixes:
-    found = False
-    for valid in valid_prefixes:
-        if prefix.startswith(valid):
-            found = True
-            break
-    if not found:
-        missing.append(prefix)
+missing = [prefix for prefix in unique_prefixes if not valid_prefixes.matches(prefix)]
 
 if missing:
     print(f"\n⚠️  MISSING PREFIXES (not in valid list): {sorted(missing)}")
@@ -8,11 +8,15 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
     ? 'http://localhost:5000/api'
     : `${window.location.origin}/api`;
 
+// Wall-clock budget per process-batch request (below the 30s gunicorn timeout)
+const BATCH_BUDGET_MS = 20000;
+
 // DOM Elements
 const uploadForm = document.getElementById('uploadForm');
 const examTypeSelect = document.getElementById('examType');
 const examYearInput = document.getElementById('examYear');
 const zipUrlInput = document.getElementById('zipUrl');
+const remoteArchiveInput = document.getElementById('remoteArchive');
 const uploadBtn = document.getElementById('uploadBtn');
 const downloadProgress = document.getElementById('downloadProgress');
 const downloadMessage = document.getElementById('downloadMessage');
@@ -34,11 +38,57 @@ const processingLog = document.getElementById('processingLog');
 let currentJobId = null;
 let isAutoProcessing = false;
 let statusPollInterval = null;
+let workerEnabled = false;
+let workerWatchInterval = null;
 
 // Initialize immediately (script is loaded after DOM is ready)
 setupEventListeners();
 setDefaultYear();
-loadRecentJob(); // Auto-load most recent job if exists
+checkWorker().then(loadRecentJob); // Auto-load most recent job if exists
+
+// Check whether the server-side ingest worker is running
+async function checkWorker() {
+    try {
+        const response = await Auth.fetch(`${API_BASE_URL}/admin/worker-status`);
+        const data = await response.json();
+        workerEnabled = data.success && data.enabled;
+    } catch (error) {
+        console.error('Error checking ingest worker:', error);
+    }
+}
+
+// Follow a job the server-side worker is processing (no batch calls needed)
+function watchJobProgress(jobId) {
+    if (!workerEnabled) {
+        return;
+    }
+
+    clearInterval(workerWatchInterval);
+    addLog('⚙️ Server is processing this job in the background (you can close this tab)');
+
+    workerWatchInterval = setInterval(async () => {
+        try {
+            const response = await Auth.fetch(`${API_BASE_URL}/admin/job-status/${jobId}`);
+            const data = await response.json();
+            if (!data.success) {
+                return;
+            }
+
+            updateProgress(data.processed, data.total, data.percentage);
+
+            if (data.status === 'COMPLETED' || data.status === 'FAILED') {
+                clearInterval(workerWatchInterval);
+                const message = data.status === 'COMPLETED'
+                    ? '✓ All PDFs processed successfully!'
+                    : 'Processing failed on server';
+                showAlert(message, data.status === 'COMPLETED' ? 'success' : 'error');
+                addLog(data.status === 'COMPLETED' ? '✓ Processing complete!' : '❌ Processing failed');
+            }
+        } catch (error) {
+            console.error('Error polling job progress:', error);
+        }
+    }, 5000);
+}
 
 // Load most recent job
 async function loadRecentJob() {
@@ -77,6 +127,7 @@ async function loadRecentJob() {
                 updateProgress(job.processed_pdfs, job.total_pdfs, percentage);
 
                 addLog(`✓ Resumed job: ${job.filename} (${job.processed_pdfs}/${job.total_pdfs})`);
+                watchJobProgress(job.id);
                 showAlert(`Resumed previous job: ${job.filename}`, 'info');
             } else {
                 console.log('Job already completed, not resuming');
@@ -138,7 +189,8 @@ async function handleFetchZip(event) {
             body: JSON.stringify({
                 url: zipUrl,
                 exam_type: examType,
-                exam_year: examYear
+                exam_year: examYear,
+                remote: remoteArchiveInput.checked
             })
         });
 
@@ -147,8 +199,15 @@ async function handleFetchZip(event) {
         if (data.success) {
             currentJobId = data.job_id;
 
+            // Same archive as an earlier job: follow that job instead
+            if (data.duplicate) {
+                showAlert(data.message, 'info');
+            }
+
             // Show download in progress
-            downloadMessage.textContent = 'Server is downloading the ZIP file in the background. Please wait...';
+            downloadMessage.textContent = data.remote
+                ? 'Server is reading the ZIP index in the background. Please wait...'
+                : 'Server is downloading the ZIP file in the background. Please wait...';
             downloadBar.textContent = 'Downloading...';
             downloadBar.style.width = '50%';
             downloadText.textContent = 'Download in progress (checking status every 5 seconds)';
@@ -181,7 +240,11 @@ function startStatusPolling(jobId, filename) {
 
             downloadText.textContent = `Checking status... (${attempts * 5} seconds elapsed)`;
 
-            if (data.status === 'UPLOADED') {
+            // The background worker may already have picked the job up
+            const downloaded = data.status === 'UPLOADED' || data.status === 'PROCESSING'
+                || (data.status === 'COMPLETED' && data.total > 0);
+
+            if (downloaded) {
                 // Download complete!
                 clearInterval(statusPollInterval);
 
@@ -198,19 +261,44 @@ function startStatusPolling(jobId, filename) {
                     updateProgress(0, data.total_pdfs || 1, 0);
                     batchProgressText.textContent = `Ready to process (click button to start)`;
                     addLog(`✓ Downloaded: ${filename}`);
+                    if (data.changes) {
+                        addLog(`✓ ${formatChanges(data.changes)}`);
+                    }
+                    watchJobProgress(jobId);
 
                     uploadBtn.disabled = false;
                     uploadBtn.textContent = '🔗 Fetch ZIP from Server';
 
-                    showAlert('Download complete! Click "Process Next 15 PDFs" to start.', 'success');
+                    showAlert('Download complete! Click "Process Next Batch" to start.', 'success');
                 }, 1000);
 
+            } else if (data.status === 'COMPLETED' && data.total === 0) {
+                // Pre-classification found no B.E./B.Tech papers in the archive
+                clearInterval(statusPollInterval);
+                downloadProgress.classList.add('hidden');
+                uploadBtn.disabled = false;
+                uploadBtn.textContent = '🔗 Fetch ZIP from Server';
+                if (data.changes && data.changes.unchanged > 0) {
+                    showAlert(`Download complete, nothing to ingest: ${formatChanges(data.changes)}.`, 'info');
+                } else {
+                    showAlert('Download complete, but the ZIP contains no engineering papers.', 'info');
+                }
+
             } else if (data.status === 'FAILED') {
                 clearInterval(statusPollInterval);
                 throw new Error('Download failed on server');
 
             } else if (data.status === 'FETCHING') {
-                // Still downloading, continue polling
+                // Still downloading (or resuming after a restart), continue polling
+                const download = data.download || {};
+                if (download.bytes && download.total) {
+                    const percent = Math.floor((download.bytes / download.total) * 100);
+                    downloadBar.style.width = `${percent}%`;
+                    downloadBar.textContent = `${percent}%`;
+                    downloadText.textContent = `Downloading... ${formatMegabytes(download.bytes)} of ${formatMegabytes(download.total)} MB`;
+                } else if (download.bytes) {
+                    downloadText.textContent = `Downloading... ${formatMegabytes(download.bytes)} MB`;
+                }
                 if (attempts >= maxAttempts) {
                     clearInterval(statusPollInterval);
                     throw new Error('Download timeout - file may be too large or server is slow');
@@ -237,14 +325,16 @@ async function processSingleBatch() {
     processBatchBtn.textContent = '⏳ Processing...';
 
     try {
-        const response = await Auth.fetch(`${API_BASE_URL}/admin/process-batch/${currentJobId}`, {
+        const response = await Auth.fetch(`${API_BASE_URL}/admin/process-batch/${currentJobId}?budget_ms=${BATCH_BUDGET_MS}`, {
             method: 'POST'
         });
 
         const data = await response.json();
 
-        if (data.success) {
-            updateProgress(data.processed, data.total, data.percentage);
+        if (data.success && data.status === 'FETCHING') {
+            addLog('⬇️ The ZIP is being downloaded again, try again shortly');
+        } else if (data.success) {
+            updateProgress(data.processed, data.total, data.percentage, data);
 
             const statusText = data.status === 'COMPLETED'
                 ? '✓ Complete!'
@@ -265,7 +355,7 @@ async function processSingleBatch() {
         addLog(`❌ Error: ${error.message}`);
     } finally {
         processBatchBtn.disabled = false;
-        processBatchBtn.textContent = '⚡ Process Next 15 PDFs';
+        processBatchBtn.textContent = '⚡ Process Next Batch';
     }
 }
 
@@ -295,15 +385,18 @@ async function toggleAutoProcess() {
 async function autoProcessLoop() {
     while (isAutoProcessing) {
         try {
-            const response = await Auth.fetch(`${API_BASE_URL}/admin/process-batch/${currentJobId}`, {
+            const response = await Auth.fetch(`${API_BASE_URL}/admin/process-batch/${currentJobId}?budget_ms=${BATCH_BUDGET_MS}`, {
                 method: 'POST'
             });
 
             const data = await response.json();
 
-            if (data.success) {
-                updateProgress(data.processed, data.total, data.percentage);
-                addLog(`Batch complete: ${data.processed}/${data.total} PDFs`);
+            if (data.success && data.status === 'FETCHING') {
+                addLog('⬇️ Waiting for the ZIP to be downloaded again...');
+                await new Promise(resolve => setTimeout(resolve, 5000));
+            } else if (data.success) {
+                updateProgress(data.processed, data.total, data.percentage, data);
+                addLog(`Batch complete: ${data.processed}/${data.total} PDFs (${formatThroughput(data)})`);
 
                 if (data.status === 'COMPLETED') {
                     isAutoProcessing = false;
@@ -335,11 +428,39 @@ async function autoProcessLoop() {
     }
 }
 
-// Update progress bar
-function updateProgress(processed, total, percentage) {
+// Update progress bar (batch: process-batch response with throughput, for the ETA)
+function updateProgress(processed, total, percentage, batch) {
     batchProgressBar.style.width = `${percentage}%`;
     batchProgressBar.textContent = `${percentage}%`;
-    batchProgressText.textContent = `${processed} / ${total} PDFs (${percentage}%)`;
+    let text = `${processed} / ${total} PDFs (${percentage}%)`;
+    if (batch && batch.eta_seconds && processed < total) {
+        text += ` - about ${formatDuration(batch.eta_seconds)} left`;
+    }
+    batchProgressText.textContent = text;
+}
+
+// Bytes as megabytes with one decimal
+function formatMegabytes(bytes) {
+    return (bytes / (1024 * 1024)).toFixed(1);
+}
+
+// Observed batch throughput
+function formatThroughput(batch) {
+    return `${batch.members_per_second} PDFs/s, ${batch.mb_per_second} MB/s`;
+}
+
+// Seconds as "1h 5m", "3m 20s" or "45s"
+function formatDuration(seconds) {
+    const hours = Math.floor(seconds / 3600);
+    const minutes = Math.floor((seconds % 3600) / 60);
+    if (hours > 0) return `${hours}h ${minutes}m`;
+    if (minutes > 0) return `${minutes}m ${seconds % 60}s`;
+    return `${seconds}s`;
+}
+
+// Summarize a job's archive members against earlier ingests
+function formatChanges(changes) {
+    return `${changes.new} new / ${changes.unchanged} unchanged / ${changes.changed} changed`;
 }
 
 // Add log entry
@@ -49,8 +49,11 @@ def generate_sql_import(zip_path, exam_type, exam_year, output_sql='import_paper
             file_path = paper['file_path'].replace("'", "''")
             degree = paper['degree'].replace("'", "''")
             
-            sql = f"""INSERT INTO pyq_files (exam_type, exam_year, branch, semester, subject_code, subject_name, file_path, degree)
-VALUES ('{paper['exam_type']}', {paper['exam_year']}, '{paper['branch']}', {paper['semester']}, '{paper['subject_code']}', '{subject_name}', '{file_path}', '{degree}');
+            content_hash = f"'{paper['content_hash']}'" if paper.get('content_hash') else 'NULL'
+            inferred = f"'{paper['inferred']}'" if paper.get('inferred') is not None else 'NULL'
+            
+            sql = f"""INSERT INTO pyq_files (exam_type, exam_year, branch, semester, subject_code, subject_name, file_path, degree, content_hash, inferred)
+VALUES ('{paper['exam_type']}', {paper['exam_year']}, '{paper['branch']}', {paper['semester']}, '{paper['subject_code']}', '{subject_name}', '{file_path}', '{degree}', {content_hash}, {inferred});
 """
             f.write(sql)
     
@@ -0,0 +1,132 @@
+"""
+Local HTTP server for the download checks and benchmarks
+Serves files from memory with HEAD, single byte ranges (Range, If-Range
+on ETag; can be switched off), conditional GETs (If-None-Match), an
+optional per-connection throttle and an injected connection drop, and logs every request and the body bytes sent
+
+Usage: with serve(throttle=2 * 1024 * 1024) as server: server.files['/a.zip'] = (data, '"v1"')
+"""
+import time
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class RangeServer(ThreadingHTTPServer):
+    """Serves files from memory: files[path] = (data, etag); logs each request"""
+    daemon_threads = True
+
+    def __init__(self, throttle=None):
+        super().__init__(('127.0.0.1', 0), RangeHandler)
+        self.files = {}
+        self.requests = []
+        self.throttle = throttle  # bytes per second per connection, None for unlimited
+        self.drop_after = None  # close the next GET after this many body bytes
+        self.ranges = True  # False: no Accept-Ranges, Range headers are ignored
+        self.bytes_sent = 0
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (dropped or cancelled downloads) are expected
+        pass
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """HEAD and GET with single byte ranges (RFC 7233, If-Range on ETag) and If-None-Match"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _target(self):
+        self.server.requests.append((self.command, self.path, self.headers.get('Range')))
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return None
+        return self.server.files[self.path]
+
+    def do_HEAD(self):
+        target = self._target()
+        if target:
+            data, etag = target
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            if self.server.ranges:
+                self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.end_headers()
+
+    def do_GET(self):
+        target = self._target()
+        if not target:
+            return
+        data, etag = target
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        start, end = 0, len(data) - 1
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        partial = self.server.ranges and bool(range_header) and (if_range is None or if_range == etag)
+        if partial:
+            first, _, last = range_header.replace('bytes=', '').partition('-')
+            start = int(first)
+            end = int(last) if last else end
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            end = min(end, len(data) - 1)
+        body = data[start:end + 1]
+
+        self.send_response(206 if partial else 200)
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        drop_after, self.server.drop_after = self.server.drop_after, None
+        if drop_after is not None:
+            self._send(body[:drop_after])
+            self.close_connection = True
+            return
+        self._send(body)
+
+    def _send(self, body):
+        """Write body, paced to the server's per-connection throttle"""
+        self.server.bytes_sent += len(body)
+        throttle = self.server.throttle
+        if not throttle:
+            self.wfile.write(body)
+            self.wfile.flush()
+            return
+        piece = max(1, throttle // 20)  # 50ms slices
+        started = time.monotonic()
+        for sent in range(0, len(body), piece):
+            self.wfile.write(body[sent:sent + piece])
+            ahead = (sent + piece) / throttle - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+        self.wfile.flush()
+
+
+@contextlib.contextmanager
+def serve(throttle=None):
+    """Run a RangeServer on a background thread"""
+    server = RangeServer(throttle)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
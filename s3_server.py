@@ -0,0 +1,234 @@
+"""
+Local stand-in for an S3-compatible object store (MinIO-style, path-style
+addressing), for the storage checks and benchmarks
+Keeps objects in memory and implements PUT/GET/HEAD/DELETE of objects,
+bucket listings (ListObjectsV2, paged) and multipart uploads (initiate, upload part, complete, abort; parts under
+5MB other than the last are refused like S3 does). Every request must
+carry a valid AWS Signature Version 4 (Authorization header or presigned
+query), verified here independently of the client. Failure responses can
+be queued and latency added; requests are logged
+
+Usage: with serve('key', 'secret') as server: S3Client(server.url(), 'bucket', 'key', 'secret')
+"""
+import hmac
+import time
+import hashlib
+import datetime
+import threading
+import contextlib
+import uuid
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit, parse_qsl, quote, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3Server(ThreadingHTTPServer):
+    """Object store stand-in: objects[(bucket, key)] = bytes"""
+    daemon_threads = True
+
+    def __init__(self, access_key, secret_key, region='us-east-1', latency=0.0):
+        super().__init__(('127.0.0.1', 0), S3Handler)
+        self.latency = latency  # seconds per request
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.objects = {}
+        self.modified = {}  # (bucket, key) -> epoch seconds of the last write
+        self.uploads = {}  # upload id -> {'key': (bucket, key), 'parts': {number: bytes}}
+        self.requests = []  # (method, path, query)
+        self.failures = []  # statuses for the next requests, in order
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass
+
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def _sign(secret_key, region, amz_date, canonical_request):
+    def step(key, message):
+        return hmac.new(key, message.encode(), hashlib.sha256).digest()
+    key = step(step(step(step(('AWS4' + secret_key).encode(), amz_date[:8]), region), 's3'), 'aws4_request')
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, f"{amz_date[:8]}/{region}/s3/aws4_request",
+        hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+    return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _error(self, status, code):
+        body = f"<Error><Code>{code}</Code></Error>".encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _authorized(self, path, query, body):
+        """Check the request's SigV4 signature (header or presigned query)"""
+        server = self.server
+        params = dict(query)
+        if 'X-Amz-Signature' in params:
+            given = params.pop('X-Amz-Signature')
+            amz_date = params['X-Amz-Date']
+            signed_names = params['X-Amz-SignedHeaders'].split(';')
+            expires = datetime.datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ').replace(tzinfo=datetime.timezone.utc)
+            if time.time() > expires.timestamp() + int(params['X-Amz-Expires']):
+                return False
+            payload_hash = 'UNSIGNED-PAYLOAD'
+        else:
+            authorization = self.headers.get('Authorization', '')
+            if not authorization.startswith('AWS4-HMAC-SHA256 '):
+                return False
+            fields = dict(part.strip().split('=', 1) for part in authorization[17:].split(','))
+            if not fields['Credential'].startswith(server.access_key + '/'):
+                return False
+            given = fields['Signature']
+            signed_names = fields['SignedHeaders'].split(';')
+            amz_date = self.headers['x-amz-date']
+            payload_hash = self.headers['x-amz-content-sha256']
+            if payload_hash != 'UNSIGNED-PAYLOAD' and payload_hash != hashlib.sha256(body).hexdigest():
+                return False
+        canonical_query = '&'.join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(params.items())
+        )
+        canonical_headers = ''.join(
+            f"{name}:{' '.join((self.headers.get(name) or '').split())}\n" for name in signed_names
+        )
+        canonical_request = '\n'.join([
+            self.command, path, canonical_query, canonical_headers, ';'.join(signed_names), payload_hash
+        ])
+        return hmac.compare_digest(_sign(server.secret_key, server.region, amz_date, canonical_request), given)
+
+    def _handle(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests.append((self.command, url.path, url.query))
+            injected = server.failures.pop(0) if server.failures else None
+        if injected:
+            self._error(injected, 'InjectedFailure')
+            return
+        if not self._authorized(url.path, query, body):
+            self._error(403, 'SignatureDoesNotMatch')
+            return
+
+        bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+        name = (bucket, key)
+        params = dict(query)
+        method = self.command
+
+        if method == 'POST' and 'uploads' in params:
+            upload_id = uuid.uuid4().hex
+            with server.lock:
+                server.uploads[upload_id] = {'key': name, 'parts': {}}
+            self._reply(200, (
+                '<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                f'<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>'
+                '</InitiateMultipartUploadResult>'
+            ).encode())
+        elif 'uploadId' in params:
+            upload = server.uploads.get(params['uploadId'])
+            if upload is None or upload['key'] != name:
+                self._error(404, 'NoSuchUpload')
+            elif method == 'PUT':
+                upload['parts'][int(params['partNumber'])] = body
+                self._reply(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+            elif method == 'DELETE':
+                with server.lock:
+                    server.uploads.pop(params['uploadId'], None)
+                self._reply(204)
+            else:
+                numbers = [int(part.findtext('PartNumber')) for part in ET.fromstring(body).iter('Part')]
+                parts = [upload['parts'].get(number) for number in numbers]
+                if None in parts:
+                    self._error(400, 'InvalidPart')
+                elif any(len(part) < MIN_PART_SIZE for part in parts[:-1]):
+                    self._error(400, 'EntityTooSmall')
+                else:
+                    with server.lock:
+                        server.objects[name] = b''.join(parts)
+                        server.modified[name] = time.time()
+                        server.uploads.pop(params['uploadId'], None)
+                    self._reply(200, b'<CompleteMultipartUploadResult/>')
+        elif method == 'PUT':
+            with server.lock:
+                server.objects[name] = body
+                server.modified[name] = time.time()
+            self._reply(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+        elif method == 'GET' and params.get('list-type') == '2':
+            self._reply(200, self._list(bucket, params), {'Content-Type': 'application/xml'})
+        elif method in ('GET', 'HEAD'):
+            data = server.objects.get(name)
+            if data is None:
+                self._error(404, 'NoSuchKey')
+            else:
+                self._reply(200, data, {'Content-Type': 'application/pdf',
+                                        'ETag': f'"{hashlib.md5(data).hexdigest()}"'})
+        elif method == 'DELETE':
+            with server.lock:
+                server.objects.pop(name, None)
+                server.modified.pop(name, None)
+            self._reply(204)
+        else:
+            self._error(405, 'MethodNotAllowed')
+
+    def _list(self, bucket, params):
+        """ListObjectsV2 result: keys after the continuation token (a key), in order"""
+        server = self.server
+        prefix = params.get('prefix', '')
+        limit = int(params.get('max-keys', 1000))
+        after = params.get('continuation-token', '')
+        with server.lock:
+            keys = sorted(key for b, key in server.objects if b == bucket and key.startswith(prefix) and key > after)
+            page = [(key, len(server.objects[(bucket, key)]), server.modified.get((bucket, key), 0))
+                    for key in keys[:limit]]
+        contents = ''.join(
+            f"<Contents><Key>{key}</Key><Size>{size}</Size><LastModified>"
+            f"{datetime.datetime.fromtimestamp(modified, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')}"
+            f"</LastModified></Contents>" for key, size, modified in page
+        )
+        truncated = len(keys) > limit
+        token = f"<NextContinuationToken>{page[-1][0]}</NextContinuationToken>" if truncated else ''
+        return (
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{bucket}</Name><KeyCount>{len(page)}</KeyCount>"
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}</ListBucketResult>"
+        ).encode()
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _handle
+
+
+@contextlib.contextmanager
+def serve(access_key, secret_key, region='us-east-1', latency=0.0):
+    """Run an S3Server on a background thread"""
+    server = S3Server(access_key, secret_key, region, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,181 @@
+"""
+Concurrent batch claim stress test
+Fires overlapping process-batch calls at one job - from threads and from
+separate processes, like a double click, manual plus auto mode, or several
+gunicorn workers - and checks the result: every accepted member stored as
+exactly one paper, no member left unprocessed, no member processed twice
+
+Usage: python stress_batch_claims.py [members] [threads] [processes]
+"""
+import os
+import sys
+import time
+import random
+import threading
+import shutil
+import zipfile
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# Point storage and database at a scratch directory before importing backend
+WORK_DIR = tempfile.mkdtemp(prefix='pyq_stress_')
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = WORK_DIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_DIR, 'stress.db')}"
+os.environ['INGEST_WORKER_ENABLED'] = 'false'
+sys.path.insert(0, 'backend')
+
+from sqlalchemy.sql import func
+from database import (
+    engine, init_database, create_upload_job, get_upload_job, update_job_status, claim_pending_members,
+    finish_job_members, Session, PyqFile, JobMember
+)
+from database import claim_upload_job
+from batch_processor import BatchProcessor
+from ingest_worker import IngestWorker
+import batch_processor
+
+def build_archive(path, members):
+    """Write a ZIP of accepted papers, each with a unique subject code"""
+    rng = random.Random(7)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(members):
+            name = (f"{20000 + i} - Year - B.E. Civil Engineering (Model Curriculum) "
+                    f"Semester-{rng.choice(['III', 'IV', 'V'])} Subject - PCC{i:05d} - Subject {i}.pdf")
+            zf.writestr(name, b'%PDF-1.4\n' + rng.randbytes(2048))
+        # Rejected members are never claimed
+        zf.writestr('notes/B.Sc. Semester-I Subject - XYZ101 - Other.pdf', b'%PDF-1.4\n')
+
+def hammer(job_id, calls):
+    """Make batch calls for a job until it has nothing left; returns calls made"""
+    made = 0
+    processor = BatchProcessor(job_id)
+    for _ in range(calls):
+        # Small batches and a mix of fixed and budgeted calls maximize overlap
+        budget_ms = 200 if made % 2 else None
+        result = processor.process_batch(random.choice([1, 3, 7]), workers=2, budget_ms=budget_ms)
+        made += 1
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        if result['status'] == 'COMPLETED':
+            break
+    return made
+
+def slow_job(name, members):
+    """A job whose members each take 0.3s to store; returns its BatchProcessor"""
+    zip_path = os.path.join(WORK_DIR, name)
+    with zipfile.ZipFile(zip_path, 'w') as zf:
+        for i in range(members):
+            zf.writestr(f"{name}/{30000 + i} - Year - B.E. Civil Engineering (Model Curriculum) "
+                        f"Semester-III Subject - PCC{90000 + i + len(name) * 100} - Slow {i}.pdf",
+                        b'%PDF-1.4\n' + name.encode() + bytes([i]) * 512)
+    job_id = create_upload_job(name, zip_path, 'Summer', 2024, 0)
+    processor = BatchProcessor(job_id)
+    processor.prepare_work_list()
+    store = processor._store_member
+    processor._store_member = lambda *args: (time.sleep(0.3), store(*args))[1]
+    return processor
+
+def outlasts_leases(work, rival_claim, seconds, held=lambda: True):
+    """Run work() on a thread while rival_claim() polls once held(); returns what the rival got"""
+    thread = threading.Thread(target=work)
+    thread.start()
+    while thread.is_alive() and not held():
+        time.sleep(0.01)
+    taken = []
+    deadline = time.time() + seconds
+    while thread.is_alive() and time.time() < deadline:
+        taken += [claim for claim in [rival_claim()] if claim]
+        time.sleep(0.1)
+    thread.join()
+    return taken
+
+def hammer_in_process(job_id, calls, threads):
+    """Child process: forget the parent's connections, then hammer from several threads"""
+    engine.dispose(close=False)
+    # stdout is process-wide, so it is silenced here rather than per thread
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            ThreadPoolExecutor(max_workers=threads) as pool:
+        return sum(pool.map(lambda _: hammer(job_id, calls), range(threads)))
+
+if __name__ == '__main__':
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            init_database()
+            zip_path = os.path.join(WORK_DIR, 'stress.zip')
+            build_archive(zip_path, members)
+            job_id = create_upload_job('stress.zip', zip_path, 'Winter', 2024, 0)
+            BatchProcessor(job_id).prepare_work_list()
+        engine.dispose()
+
+        calls = members  # upper bound per caller; callers stop once the job completes
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes) as pool:
+            pending = [pool.apply_async(hammer_in_process, (job_id, calls, threads)) for _ in range(processes)]
+            # The parent process takes part too
+            made = hammer_in_process(job_id, calls, threads)
+            made += sum(result.get() for result in pending)
+        print(f"{processes + 1} processes x {threads} threads made {made} batch calls")
+
+        session = Session()
+        try:
+            member_names = [name for (name,) in session.query(PyqFile.member_name)]
+            statuses = dict(session.query(JobMember.status, func.count(JobMember.id)).filter(
+                JobMember.job_id == job_id
+            ).group_by(JobMember.status).all())
+        finally:
+            session.close()
+        duplicates = len(member_names) - len(set(member_names))
+        print(f"papers: {len(member_names)} (expected {members}), duplicates: {duplicates}, members: {statuses}")
+        assert duplicates == 0, 'a member was stored twice'
+        assert len(member_names) == members, 'a member was never stored'
+        assert statuses.get('DONE') == members and set(statuses) <= {'DONE', 'REJECTED'}, 'a member was not processed'
+        print("✓ No duplicates and no gaps")
+
+        # Finished members hold no claim; a job failed while a batch ran stays failed
+        session = Session()
+        try:
+            claimed = session.query(JobMember).filter(JobMember.claimed_by.isnot(None)).count()
+            member = session.query(JobMember).filter(JobMember.job_id == job_id, JobMember.status == 'DONE').first()
+            member.status = 'PENDING'
+            session.commit()
+        finally:
+            session.close()
+        assert claimed == 0, 'a finished member still holds its claim'
+        late, = claim_pending_members(job_id, 1, owner='late-batch')
+        update_job_status(job_id, 'FAILED')
+        progress = finish_job_members(job_id, [(late['id'], 'DONE', None)], owner='late-batch')
+        assert progress['status'] == 'FAILED' and get_upload_job(job_id)['status'] == 'FAILED', \
+            'a late batch revived a failed job'
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = BatchProcessor(job_id).process_batch(5)
+        assert result['status'] == 'FAILED' and get_upload_job(job_id)['status'] == 'FAILED', \
+            'an empty claim rewrote the status of a failed job'
+        print("✓ Claims cleared, a failed job stays failed")
+
+        # A batch that outlasts its member lease (1s) keeps its members,
+        # and a worker on a job that outlasts its job lease keeps the job
+        batch_processor.MEMBER_LEASE_SECONDS = 1
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            processor = slow_job('slow-batch', 8)
+            taken = outlasts_leases(lambda: processor.process_batch(8, workers=1),
+                                    lambda: claim_pending_members(processor.job_id, 8, 'rival', 1), 10,
+                                    held=lambda: not claim_pending_members(processor.job_id, 1))
+        assert not taken and get_upload_job(processor.job_id)['status'] == 'COMPLETED', \
+            'members were claimed away from a slow batch'
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            processor = slow_job('slow-job', 8)
+            worker = IngestWorker(concurrency=1, batch_size=8, lease_seconds=1)
+            assert claim_upload_job(worker.worker_id, 1) == processor.job_id
+            taken = outlasts_leases(lambda: worker.process_job(processor.job_id),
+                                    lambda: claim_upload_job('rival', 1), 10)
+        assert not taken and get_upload_job(processor.job_id)['status'] == 'COMPLETED', \
+            'a slow job was claimed away from its worker'
+        print("✓ Leases held through batches that outlast them")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)